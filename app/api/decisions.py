@@ -0,0 +1,222 @@
+"""Decision core shared by /api/check and /api/enforce (single, batch and multi)."""
+
+import math
+from typing import Optional, Sequence
+
+from fastapi import Response
+
+from app.core import hotkeys, stages
+from app.core.config import settings
+from app.metrics import (
+    RATE_LIMIT_CHECKS_TOTAL,
+    RATE_LIMIT_DECISION_LATENCY_SECONDS,
+    RATE_LIMIT_PEEKS_TOTAL,
+    RATE_LIMIT_REDIS_ERRORS_TOTAL,
+    monotonic_s,
+)
+from app.ratelimit.policy import PolicyEngine
+from app.ratelimit.redis_bucket import BucketRequest, Decision
+
+
+def resolve_limits(
+    capacity: float | None, refill_rate_per_sec: float | None
+) -> tuple[float, float]:
+    """Per-call overrides, else defaults from settings."""
+    cap = capacity if capacity is not None else settings.BUCKET_CAPACITY
+    rate = (
+        refill_rate_per_sec
+        if refill_rate_per_sec is not None
+        else settings.BUCKET_REFILL_RATE_PER_SEC
+    )
+    return cap, rate
+
+
+def bucket_request(
+    key: str,
+    cost: float,
+    capacity: float | None,
+    refill_rate_per_sec: float | None,
+    policies: Optional[PolicyEngine] = None,
+) -> BucketRequest:
+    """Limits for `key`: per-call overrides, then the policy file, then settings."""
+    if policies is None:
+        cap, rate = resolve_limits(capacity, refill_rate_per_sec)
+        return BucketRequest(key, cap, rate, cost)
+
+    policy = policies.resolve(key)
+    if not settings.POLICY_ALLOW_OVERRIDES:
+        capacity = refill_rate_per_sec = None
+    return BucketRequest(
+        key,
+        capacity if capacity is not None else policy.capacity,
+        refill_rate_per_sec if refill_rate_per_sec is not None else policy.refill_rate_per_sec,
+        cost * policy.cost_multiplier,
+    )
+
+
+async def decide(limiter, q: BucketRequest) -> Decision:
+    """Run the Redis atomic decision (and measure it)."""
+    start = monotonic_s()
+    timing = settings.STAGE_TIMING_ENABLED
+    if timing:
+        stages.limiter_called(start)
+    try:
+        decision = await limiter.consume(q)
+    except Exception:
+        RATE_LIMIT_REDIS_ERRORS_TOTAL.inc()
+        raise
+    finally:
+        end = monotonic_s()
+        RATE_LIMIT_DECISION_LATENCY_SECONDS.observe(end - start)
+        if timing:
+            stages.limiter_answered(start, end)
+
+    record_result(q, decision)
+    tracker = hotkeys.tracker
+    if tracker is not None:
+        tracker.record(q.key, q.cost, decision.allowed, end)
+    return decision
+
+
+async def decide_many(limiter, qs: Sequence[BucketRequest]) -> list[Decision]:
+    """Same as `decide` for many items, in one Redis round trip."""
+    start = monotonic_s()
+    timing = settings.STAGE_TIMING_ENABLED
+    if timing:
+        stages.limiter_called(start)
+    try:
+        decisions = await limiter.consume_many(qs)
+    except Exception:
+        RATE_LIMIT_REDIS_ERRORS_TOTAL.inc()
+        raise
+    finally:
+        end = monotonic_s()
+        RATE_LIMIT_DECISION_LATENCY_SECONDS.observe(end - start)
+        if timing:
+            stages.limiter_answered(start, end)
+
+    for q, decision in zip(qs, decisions):
+        record_result(q, decision)
+    record_hot(qs, decisions, end)
+    return decisions
+
+
+async def decide_all(limiter, qs: Sequence[BucketRequest]) -> list[Decision]:
+    """Nested limits decided together: every cost is taken, or none (one Redis round trip)."""
+    start = monotonic_s()
+    timing = settings.STAGE_TIMING_ENABLED
+    if timing:
+        stages.limiter_called(start)
+    try:
+        decisions = await limiter.consume_all(qs)
+    except ValueError:
+        # Limits that cannot be decided in one script (different shards): not a Redis error
+        raise
+    except Exception:
+        RATE_LIMIT_REDIS_ERRORS_TOTAL.inc()
+        raise
+    finally:
+        end = monotonic_s()
+        RATE_LIMIT_DECISION_LATENCY_SECONDS.observe(end - start)
+        if timing:
+            stages.limiter_answered(start, end)
+
+    # One request, one result: counted under the limit that decided it
+    i = multi_binding_index(qs, decisions)
+    record_result(qs[i], decisions[i])
+    # Every limit was a bucket touched; all or nothing, so one denial means none was charged
+    tracker = hotkeys.tracker
+    if tracker is not None:
+        allowed = all(d.allowed for d in decisions)
+        for q in qs:
+            tracker.record(q.key, q.cost, allowed, end)
+    return decisions
+
+
+async def peek(limiter, qs: Sequence[BucketRequest]) -> list[Decision]:
+    """
+    What `decide_many` would answer, without taking anything: plain reads, served
+    by a replica when there is one. Not counted as checks.
+    """
+    try:
+        decisions = await limiter.peek_many(qs)
+    except Exception:
+        RATE_LIMIT_REDIS_ERRORS_TOTAL.inc()
+        raise
+    RATE_LIMIT_PEEKS_TOTAL.inc(len(qs))
+    return decisions
+
+
+def is_impossible(q: BucketRequest) -> bool:
+    return q.cost > q.capacity
+
+
+def record_result(q: BucketRequest, decision: Decision) -> None:
+    # Update counters (allowed/denied/impossible)
+    if is_impossible(q):
+        RATE_LIMIT_CHECKS_TOTAL.labels(result="impossible").inc()
+    elif decision.allowed:
+        RATE_LIMIT_CHECKS_TOTAL.labels(result="allowed").inc()
+    else:
+        RATE_LIMIT_CHECKS_TOTAL.labels(result="denied").inc()
+
+
+def record_hot(qs: Sequence[BucketRequest], decisions: Sequence[Decision], now: float) -> None:
+    # Feed the hot-keys tracker (app.core.hotkeys)
+    tracker = hotkeys.tracker
+    if tracker is not None:
+        for q, decision in zip(qs, decisions):
+            tracker.record(q.key, q.cost, decision.allowed, now)
+
+
+def set_rate_limit_headers(response: Response, capacity: float, decision: Decision) -> None:
+    # Standard-ish rate limit headers
+    response.headers["RateLimit-Limit"] = str(capacity)
+    remaining = max(0, int(math.floor(decision.remaining_tokens)))
+    response.headers["RateLimit-Remaining"] = str(remaining)
+
+    reset_s = 0
+    if (not decision.allowed) and decision.retry_after_s is not None:
+        reset_s = int(math.ceil(decision.retry_after_s))
+    response.headers["RateLimit-Reset"] = str(reset_s)
+
+    if not decision.allowed and decision.retry_after_s is not None:
+        response.headers["Retry-After"] = str(reset_s)
+
+
+def binding_index(decisions: Sequence[Decision]) -> int:
+    """
+    Index of the decision that should drive aggregate headers for a batch:
+    the denied item with the longest Retry-After, else the item with the fewest
+    remaining tokens.
+    """
+    denied = [i for i, d in enumerate(decisions) if not d.allowed]
+    if denied:
+        return max(denied, key=lambda i: decisions[i].retry_after_s or 0.0)
+    return min(range(len(decisions)), key=lambda i: decisions[i].remaining_tokens)
+
+
+def multi_binding_index(qs: Sequence[BucketRequest], decisions: Sequence[Decision]) -> int:
+    """
+    The limit that decided a multi check: an impossible limit (the call can never
+    pass), else the same choice as `binding_index`.
+    """
+    for i, q in enumerate(qs):
+        if is_impossible(q):
+            return i
+    return binding_index(decisions)
+
+
+def decision_body(q: BucketRequest, decision: Decision) -> dict:
+    if is_impossible(q):
+        # cost > capacity is impossible; we return retry_after_s=None for clarity
+        return {
+            "allowed": False,
+            "remaining_tokens": decision.remaining_tokens,
+            "retry_after_s": None,
+        }
+    return {
+        "allowed": decision.allowed,
+        "remaining_tokens": decision.remaining_tokens,
+        "retry_after_s": decision.retry_after_s,
+    }
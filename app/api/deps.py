@@ -1,5 +1,43 @@
-from fastapi import Request
+import hmac
+
+from fastapi import HTTPException, Request
+
+from app.core.config import settings
 
 
 def get_redis(request: Request):
     return request.app.state.redis
+
+
+def get_limiter(request: Request):
+    return request.app.state.limiter
+
+
+def get_redis_shards(request: Request):
+    return request.app.state.redis_shards
+
+
+def get_policies(request: Request):
+    """Policy engine snapshot for this request (None without a policy file)."""
+    store = request.app.state.policies
+    return store.engine if store is not None else None
+
+
+def get_policy_store(request: Request):
+    return request.app.state.policies
+
+
+def require_admin(request: Request) -> None:
+    """
+    Gate of /api/admin: off (404) without ADMIN_TOKEN or in proxy mode, whose
+    listener is public; otherwise `Authorization: Bearer <ADMIN_TOKEN>` (401).
+    """
+    if not settings.ADMIN_TOKEN or settings.PROXY_CONFIG_FILE:
+        raise HTTPException(status_code=404, detail="Not Found")
+    scheme, _, token = request.headers.get("authorization", "").partition(" ")
+    if scheme.lower() != "bearer" or not hmac.compare_digest(
+        token.encode(), settings.ADMIN_TOKEN.encode()
+    ):
+        raise HTTPException(
+            status_code=401, detail="admin token required", headers={"WWW-Authenticate": "Bearer"}
+        )
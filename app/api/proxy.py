@@ -0,0 +1,285 @@
+"""
+Reverse-proxy mode: enforce a limit, then forward the request to an upstream.
+
+Routes come from PROXY_CONFIG_FILE (YAML or JSON):
+
+    routes:
+      - name: orders
+        prefix: /orders                # longest matching prefix wins
+        upstream: http://orders:8080   # prefix is stripped unless strip_prefix: false
+        key: header:X-User-Id          # or api_key | path | client, or a list of them
+        cost: 1
+        cost_by_method: {POST: 5}
+        capacity: 20                   # defaults: BUCKET_CAPACITY / BUCKET_REFILL_RATE_PER_SEC
+        refill_rate_per_sec: 5
+
+The decision is the one /api/enforce makes, on bucket "proxy:<name>:<key>".
+Allowed requests are forwarded over a pooled keep-alive client with request and
+response bodies streamed through; denied ones get 429 with the RateLimit-* headers.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import math
+from typing import AsyncIterator, Optional
+
+import httpx
+import yaml
+from pydantic import BaseModel, Field, field_validator
+from starlette.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from starlette.types import Receive, Scope, Send
+
+from app.api.decisions import decide, decision_body, resolve_limits, set_rate_limit_headers
+from app.core.config import settings
+from app.metrics import (
+    RATE_LIMIT_PROXY_REQUESTS_TOTAL,
+    RATE_LIMIT_PROXY_UPSTREAM_LATENCY_SECONDS,
+    monotonic_s,
+)
+from app.ratelimit.redis_bucket import BucketRequest
+
+# Connection-level headers that must not be forwarded (RFC 9110 section 7.6.1)
+HOP_BY_HOP = frozenset(
+    {
+        "connection",
+        "keep-alive",
+        "proxy-authenticate",
+        "proxy-authorization",
+        "proxy-connection",
+        "te",
+        "trailer",
+        "transfer-encoding",
+        "upgrade",
+    }
+)
+
+
+class ProxyRoute(BaseModel):
+    name: str = Field(min_length=1)
+    prefix: str
+    upstream: str
+    strip_prefix: bool = True
+    key: list[str] = ["client"]
+    cost: float = Field(default=1.0, ge=0)
+    cost_by_method: dict[str, float] = {}
+    # Trusted callers only: lets the request state its own cost
+    cost_header: Optional[str] = None
+    capacity: float | None = Field(default=None, gt=0)
+    refill_rate_per_sec: float | None = Field(default=None, gt=0)
+
+    @field_validator("prefix")
+    @classmethod
+    def _normalize_prefix(cls, v: str) -> str:
+        if not v.startswith("/"):
+            raise ValueError("prefix must start with '/'")
+        return v.rstrip("/")
+
+    @field_validator("key", mode="before")
+    @classmethod
+    def _key_list(cls, v):
+        return [v] if isinstance(v, str) else v
+
+    @field_validator("key")
+    @classmethod
+    def _known_key_sources(cls, v: list[str]) -> list[str]:
+        for source in v:
+            if source not in ("api_key", "path", "client") and not source.startswith("header:"):
+                raise ValueError(f"unknown key source: {source}")
+        return v
+
+    @property
+    def path(self) -> str:
+        """Route template, used as the low-cardinality metrics label."""
+        return f"{self.prefix}/{{path:path}}"
+
+    def matches(self, path: str) -> bool:
+        return path == self.prefix or path.startswith(self.prefix + "/") or not self.prefix
+
+    def bucket_request(self, scope: Scope, headers: dict[str, str]) -> BucketRequest:
+        cap, rate = resolve_limits(self.capacity, self.refill_rate_per_sec)
+        parts = [_key_part(source, scope, headers) for source in self.key]
+        return BucketRequest(
+            f"proxy:{self.name}:{':'.join(parts)}", cap, rate, self._cost(scope, headers)
+        )
+
+    def _cost(self, scope: Scope, headers: dict[str, str]) -> float:
+        if self.cost_header is not None:
+            try:
+                cost = float(headers[self.cost_header.lower()])
+                if math.isfinite(cost) and cost >= 0:
+                    return cost
+            except (KeyError, ValueError):
+                pass
+        return self.cost_by_method.get(scope["method"], self.cost)
+
+
+class ProxyConfig(BaseModel):
+    routes: list[ProxyRoute] = []
+
+
+def load_proxy_routes(path: str) -> list[ProxyRoute]:
+    with open(path, encoding="utf-8") as f:
+        # YAML is a superset of JSON, so one loader reads both
+        config = ProxyConfig.model_validate(yaml.safe_load(f) or {})
+    # Longest prefix first, so the first match is the most specific
+    return sorted(config.routes, key=lambda r: len(r.prefix), reverse=True)
+
+
+def create_proxy_client() -> httpx.AsyncClient:
+    return httpx.AsyncClient(
+        limits=httpx.Limits(
+            max_connections=settings.PROXY_MAX_CONNECTIONS,
+            max_keepalive_connections=settings.PROXY_MAX_KEEPALIVE_CONNECTIONS,
+        ),
+        timeout=httpx.Timeout(settings.PROXY_TIMEOUT_MS / 1000),
+        follow_redirects=False,
+    )
+
+
+def _key_part(source: str, scope: Scope, headers: dict[str, str]) -> str:
+    client = scope.get("client")
+    client_host = client[0] if client else "unknown"
+    if source == "client":
+        return client_host
+    if source == "path":
+        return scope["path"]
+    if source == "api_key":
+        api_key = headers.get("x-api-key")
+        auth = headers.get("authorization", "")
+        if api_key is None and auth.lower().startswith("bearer "):
+            api_key = auth[7:].strip()
+        if not api_key:
+            return f"client={client_host}"
+        # Never put credentials into Redis key names
+        return "ak=" + hashlib.sha256(api_key.encode()).hexdigest()[:16]
+    value = headers.get(source[len("header:") :].lower())
+    # Missing identity: fall back to the caller's address rather than one shared bucket
+    return value if value else f"client={client_host}"
+
+
+async def _request_body(receive: Receive) -> AsyncIterator[bytes]:
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            return
+        body = message.get("body", b"")
+        if body:
+            yield body
+        if not message.get("more_body", False):
+            return
+
+
+def _forward_headers(scope: Scope) -> list[tuple[bytes, bytes]]:
+    raw = scope["headers"]
+    drop = set(HOP_BY_HOP)
+    drop.add("host")
+    for name, value in raw:
+        if name == b"connection":
+            drop.update(token.strip().lower() for token in value.decode("latin-1").split(","))
+    headers = [(k, v) for k, v in raw if k.decode("latin-1") not in drop]
+
+    client = scope.get("client")
+    host = next((v for k, v in raw if k == b"host"), b"")
+    if client:
+        prior = next((v for k, v in raw if k == b"x-forwarded-for"), None)
+        forwarded_for = client[0].encode() if prior is None else prior + b", " + client[0].encode()
+        headers = [(k, v) for k, v in headers if k != b"x-forwarded-for"]
+        headers.append((b"x-forwarded-for", forwarded_for))
+    headers.append((b"x-forwarded-proto", scope.get("scheme", "http").encode()))
+    if host:
+        headers.append((b"x-forwarded-host", host))
+    return headers
+
+
+class ProxyApp:
+    """ASGI app mounted after the API routes: every other path is looked up here."""
+
+    def __init__(self, routes: list[ProxyRoute]):
+        self.routes = routes
+
+    def match(self, path: str) -> Optional[ProxyRoute]:
+        for route in self.routes:
+            if route.matches(path):
+                return route
+        return None
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] == "websocket":
+            # Not proxied: refuse the handshake rather than leave the client waiting
+            await receive()  # websocket.connect
+            await send({"type": "websocket.close", "code": 1003})
+            return
+        if scope["type"] != "http":
+            raise RuntimeError(f"the proxy does not handle {scope['type']!r} scopes")
+        route = self.match(scope["path"])
+        if route is None:
+            await PlainTextResponse("Not Found", status_code=404)(scope, receive, send)
+            return
+        scope["route"] = route
+
+        state = scope["app"].state
+        headers = {k.decode("latin-1"): v.decode("latin-1") for k, v in scope["headers"]}
+        q = route.bucket_request(scope, headers)
+        decision = await decide(state.limiter, q)
+
+        if not decision.allowed:
+            RATE_LIMIT_PROXY_REQUESTS_TOTAL.labels(route=route.name, result="limited").inc()
+            # cost > capacity is also refused, without Retry-After: retrying never helps
+            response = JSONResponse(decision_body(q, decision), status_code=429)
+            set_rate_limit_headers(response, q.capacity, decision)
+            await response(scope, receive, send)
+            return
+
+        response = await self._forward(state.proxy_client, route, scope, receive)
+        if response is not None:
+            set_rate_limit_headers(response, q.capacity, decision)
+            await response(scope, receive, send)
+
+    async def _forward(
+        self, client: httpx.AsyncClient, route: ProxyRoute, scope: Scope, receive: Receive
+    ):
+        path = scope["path"]
+        if route.strip_prefix:
+            path = path[len(route.prefix) :] or "/"
+        url = httpx.URL(route.upstream.rstrip("/") + path)
+        if scope.get("query_string"):
+            url = url.copy_with(query=scope["query_string"])
+
+        has_body = any(k in (b"content-length", b"transfer-encoding") for k, _ in scope["headers"])
+        request = client.build_request(
+            scope["method"],
+            url,
+            headers=_forward_headers(scope),
+            content=_request_body(receive) if has_body else None,
+        )
+
+        start = monotonic_s()
+        try:
+            upstream = await client.send(request, stream=True)
+        except httpx.TimeoutException:
+            RATE_LIMIT_PROXY_REQUESTS_TOTAL.labels(route=route.name, result="upstream_error").inc()
+            return PlainTextResponse("Upstream timed out", status_code=504)
+        except httpx.TransportError:
+            RATE_LIMIT_PROXY_REQUESTS_TOTAL.labels(route=route.name, result="upstream_error").inc()
+            return PlainTextResponse("Upstream unavailable", status_code=502)
+        RATE_LIMIT_PROXY_UPSTREAM_LATENCY_SECONDS.labels(route=route.name).observe(
+            monotonic_s() - start
+        )
+        RATE_LIMIT_PROXY_REQUESTS_TOTAL.labels(route=route.name, result="forwarded").inc()
+
+        response = StreamingResponse(_response_body(upstream), status_code=upstream.status_code)
+        # Raw pairs keep repeated headers (Set-Cookie); the body is passed through undecoded
+        response.raw_headers = [
+            (k, v) for k, v in upstream.headers.raw if k.decode("latin-1").lower() not in HOP_BY_HOP
+        ]
+        return response
+
+
+async def _response_body(upstream: httpx.Response) -> AsyncIterator[bytes]:
+    try:
+        async for chunk in upstream.aiter_raw():
+            yield chunk
+    finally:
+        # Hands the connection back to the pool (or drops it if the body was cut short)
+        await upstream.aclose()
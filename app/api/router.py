@@ -1,6 +1,7 @@
-from fastapi import APIRouter
+from fastapi import APIRouter, Depends
 
-from app.api.routes import checks, enforce, health, readiness, version
+from app.api.deps import require_admin
+from app.api.routes import admin, checks, enforce, health, readiness, version
 
 api_router = APIRouter()
 api_router.include_router(health.router, prefix="/health", tags=["Health"])
@@ -8,3 +9,6 @@ api_router.include_router(readiness.router, prefix="/readyz", tags=["Health"])
 api_router.include_router(checks.router, prefix="/check", tags=["RateLimit"])
 api_router.include_router(version.router, prefix="/version", tags=["Meta"])
 api_router.include_router(enforce.router, prefix="/enforce", tags=["RateLimit"])
+api_router.include_router(
+    admin.router, prefix="/admin", tags=["Admin"], dependencies=[Depends(require_admin)]
+)
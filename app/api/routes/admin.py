@@ -0,0 +1,144 @@
+import asyncio
+from typing import Literal
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.responses import PlainTextResponse, StreamingResponse
+
+from app.api.deps import get_policy_store, get_redis, get_redis_shards
+from app.core import hotkeys
+from app.core.config import settings
+from app.core.profiler import collapsed, profile_event_loop
+from app.db.redis_client import shard_name
+from app.metrics import monotonic_s
+from app.ratelimit.sharding import shard_key_counts
+from app.ratelimit.snapshot import SnapshotError, restore_snapshot, snapshot_chunks
+from app.ratelimit.storage import sample_storage
+
+router = APIRouter()
+
+# One profile at a time per worker
+_profiling = asyncio.Lock()
+
+
+@router.get("/shards", summary="Redis shards and their bucket key counts (sampled)")
+async def shards(
+    samples: int = Query(default=1000, gt=0, le=100_000),
+    shards=Depends(get_redis_shards),
+):
+    counts = await shard_key_counts(shards, settings.REDIS_KEY_PREFIX, samples) if shards else {}
+    return {
+        "shards": [
+            {"name": name, "keys": keys, "exact": exact} for name, (keys, exact) in counts.items()
+        ]
+    }
+
+
+@router.get("/storage", summary="Sampled bytes per bucket key, by storage format")
+async def storage(
+    samples: int = Query(default=1000, gt=0, le=100_000),
+    r=Depends(get_redis),
+    shards=Depends(get_redis_shards),
+):
+    clients = shards or {shard_name(settings.REDIS_URL): r}
+    reports = await asyncio.gather(
+        *(sample_storage(c, settings.REDIS_KEY_PREFIX, samples) for c in clients.values())
+    )
+    return {"redis": [{"name": name, **rep} for name, rep in zip(clients, reports)]}
+
+
+@router.get(
+    "/snapshot",
+    response_class=StreamingResponse,
+    summary="Stream every bucket as a snapshot file (see app.ratelimit.snapshot)",
+)
+async def snapshot(
+    batch: int = Query(default=5000, gt=0, le=100_000),
+    r=Depends(get_redis),
+    shards=Depends(get_redis_shards),
+):
+    clients = shards or {shard_name(settings.REDIS_URL): r}
+    return StreamingResponse(
+        snapshot_chunks(clients.values(), settings.REDIS_KEY_PREFIX, batch=batch),
+        media_type="application/octet-stream",
+        headers={"Content-Disposition": 'attachment; filename="buckets.snap"'},
+    )
+
+
+@router.post("/snapshot/restore", summary="Restore buckets from a snapshot in the request body")
+async def restore(
+    request: Request,
+    rebase: bool = True,
+    r=Depends(get_redis),
+    shards=Depends(get_redis_shards),
+):
+    clients = shards or {shard_name(settings.REDIS_URL): r}
+    try:
+        return await restore_snapshot(
+            request.stream(), clients, settings.REDIS_KEY_PREFIX, rebase=rebase
+        )
+    except SnapshotError as e:
+        raise HTTPException(status_code=422, detail=str(e)) from e
+
+
+@router.get("/hotkeys", summary="Heaviest bucket keys of this worker, over rolling windows")
+async def hot_keys(
+    by: Literal["requests", "denied", "cost"] = "requests",
+    limit: int = Query(default=20, gt=0, le=1000),
+    windows: int = Query(default=1, gt=0),
+):
+    tracker = hotkeys.tracker
+    if tracker is None:
+        raise HTTPException(status_code=404, detail="hot-keys tracking is off (HOTKEYS_ENABLED)")
+    if windows > settings.HOTKEYS_WINDOWS + 1:
+        raise HTTPException(
+            status_code=422, detail=f"windows must be <= {settings.HOTKEYS_WINDOWS + 1}"
+        )
+    return tracker.top(by, min(limit, tracker.capacity), windows, monotonic_s())
+
+
+def _require_policies(store):
+    if store is None:
+        raise HTTPException(status_code=404, detail="no policy file configured (POLICY_FILE)")
+    return store
+
+
+@router.get("/policies", summary="Active policy file")
+async def policies(key: str | None = None, store=Depends(get_policy_store)):
+    engine = _require_policies(store).engine
+    body = {"file": store.path, "rules": engine.rule_count}
+    if key is not None:
+        # Which rule applies to a key, and the limits it gets
+        body["resolved"] = engine.resolve(key)._asdict()
+    return body
+
+
+@router.post("/policies/reload", summary="Reload the policy file now")
+async def reload_policies(store=Depends(get_policy_store)):
+    store = _require_policies(store)
+    try:
+        await store.reload(force=True)
+    except Exception as e:
+        raise HTTPException(status_code=422, detail=f"policy file rejected: {e}") from e
+    return {"file": store.path, "rules": store.engine.rule_count}
+
+
+@router.get(
+    "/profile",
+    response_class=PlainTextResponse,
+    summary="Sample this worker's event loop; collapsed stacks for flame graphs",
+)
+async def profile(
+    seconds: float = Query(default=10.0, gt=0),
+    hz: float = Query(default=100.0, gt=0, le=1000),
+):
+    if seconds > settings.PROFILE_MAX_SECONDS:
+        raise HTTPException(
+            status_code=422, detail=f"seconds must be <= {settings.PROFILE_MAX_SECONDS}"
+        )
+    if _profiling.locked():
+        raise HTTPException(status_code=409, detail="a profile is already running")
+    async with _profiling:
+        counts = await profile_event_loop(seconds, hz)
+    return PlainTextResponse(
+        collapsed(counts), headers={"X-Profile-Samples": str(sum(counts.values()))}
+    )
@@ -1,17 +1,23 @@
-import math
+from typing import Optional
 
-from fastapi import APIRouter, Depends, Response
+from fastapi import APIRouter, Depends, HTTPException, Response
 from pydantic import BaseModel, Field
 
-from app.api.deps import get_redis
-from app.core.config import settings
-from app.metrics import (
-    RATE_LIMIT_CHECKS_TOTAL,
-    RATE_LIMIT_DECISION_LATENCY_SECONDS,
-    RATE_LIMIT_REDIS_ERRORS_TOTAL,
-    monotonic_s,
+from app.api.decisions import (
+    binding_index,
+    bucket_request,
+    decide,
+    decide_all,
+    decide_many,
+    decision_body,
+    multi_binding_index,
+    peek,
+    set_rate_limit_headers,
 )
-from app.ratelimit.redis_bucket import Decision, try_consume_redis
+from app.api.deps import get_limiter, get_policies
+from app.core.config import settings
+from app.ratelimit.policy import PolicyEngine
+from app.ratelimit.redis_bucket import BucketRequest
 
 router = APIRouter()
 
@@ -24,6 +30,16 @@ class CheckRequest(BaseModel):
     capacity: float | None = Field(default=None, gt=0)
     refill_rate_per_sec: float | None = Field(default=None, gt=0)
 
+    def to_bucket_request(self, policies: Optional[PolicyEngine] = None) -> BucketRequest:
+        return bucket_request(
+            self.key, self.cost, self.capacity, self.refill_rate_per_sec, policies
+        )
+
+
+class SingleCheckRequest(CheckRequest):
+    # Answer as if `cost` were taken, but leave the bucket untouched
+    dry_run: bool = False
+
 
 class CheckResponse(BaseModel):
     allowed: bool
@@ -31,65 +47,124 @@ class CheckResponse(BaseModel):
     retry_after_s: float | None
 
 
-@router.post("", response_model=CheckResponse, summary="Rate-limit decision (token bucket)")
-async def check_rate_limit(req: CheckRequest, response: Response, r=Depends(get_redis)):
-    cap = req.capacity if req.capacity is not None else settings.BUCKET_CAPACITY
-    rate = (
-        req.refill_rate_per_sec
-        if req.refill_rate_per_sec is not None
-        else settings.BUCKET_REFILL_RATE_PER_SEC
-    )
+class CheckBatchRequest(BaseModel):
+    items: list[CheckRequest] = Field(min_length=1, max_length=settings.BATCH_MAX_ITEMS)
 
-    # Run the Redis atomic decision (and measure it)
-    start = monotonic_s()
-    try:
-        decision: Decision = await try_consume_redis(
-            r,
-            req.key,
-            capacity=cap,
-            refill_rate_per_sec=rate,
-            cost=req.cost,
-            ttl_sec=settings.BUCKET_KEY_TTL_SEC,
-            prefix=settings.REDIS_KEY_PREFIX,
-        )
-    except Exception:
-        RATE_LIMIT_REDIS_ERRORS_TOTAL.inc()
-        raise
-    finally:
-        RATE_LIMIT_DECISION_LATENCY_SECONDS.observe(monotonic_s() - start)
-
-    # Update counters (allowed/denied/impossible)
-    if req.cost > cap:
-        RATE_LIMIT_CHECKS_TOTAL.labels(result="impossible").inc()
-    elif decision.allowed:
-        RATE_LIMIT_CHECKS_TOTAL.labels(result="allowed").inc()
+
+class CheckBatchResponse(BaseModel):
+    # True only if every item was allowed
+    allowed: bool
+    results: list[CheckResponse]
+
+
+class StatusItem(CheckRequest):
+    # The balance a request of this cost would see; 0 reports it as is
+    cost: float = Field(default=0, ge=0)
+
+
+class CheckStatusRequest(BaseModel):
+    items: list[StatusItem] = Field(min_length=1, max_length=settings.BATCH_MAX_ITEMS)
+
+
+class CheckMultiRequest(BaseModel):
+    # Nested limits of ONE request, e.g. user, org, endpoint, global
+    limits: list[CheckRequest] = Field(min_length=1, max_length=settings.MULTI_MAX_LIMITS)
+
+
+class CheckMultiResponse(BaseModel):
+    # True only if every limit had room (and then each one was charged)
+    allowed: bool
+    # Index of the limit that decided: the denying one with the longest wait,
+    # else the one with the fewest tokens left
+    binding_index: int
+    retry_after_s: float | None
+    results: list[CheckResponse]
+
+
+@router.post("", response_model=CheckResponse, summary="Rate-limit decision (token bucket)")
+async def check_rate_limit(
+    req: SingleCheckRequest,
+    response: Response,
+    limiter=Depends(get_limiter),
+    policies=Depends(get_policies),
+):
+    q = req.to_bucket_request(policies)
+    if req.dry_run:
+        (decision,) = await peek(limiter, [q])
     else:
-        RATE_LIMIT_CHECKS_TOTAL.labels(result="denied").inc()
-
-    # Standard-ish rate limit headers
-    response.headers["RateLimit-Limit"] = str(cap)
-    remaining = max(0, int(math.floor(decision.remaining_tokens)))
-    response.headers["RateLimit-Remaining"] = str(remaining)
-
-    reset_s = 0
-    if (not decision.allowed) and decision.retry_after_s is not None:
-        reset_s = int(math.ceil(decision.retry_after_s))
-    response.headers["RateLimit-Reset"] = str(reset_s)
-
-    if not decision.allowed and decision.retry_after_s is not None:
-        response.headers["Retry-After"] = str(reset_s)
-
-    # Response body
-    if req.cost > cap:
-        # cost > capacity is impossible; we return retry_after_s=None for clarity
-        return CheckResponse(
-            allowed=False,
-            remaining_tokens=decision.remaining_tokens,
-            retry_after_s=None,
-        )
+        decision = await decide(limiter, q)
+    set_rate_limit_headers(response, q.capacity, decision)
+    return CheckResponse(**decision_body(q, decision))
 
-    return CheckResponse(
-        allowed=decision.allowed,
-        remaining_tokens=decision.remaining_tokens,
-        retry_after_s=decision.retry_after_s,
+
+@router.post(
+    "/batch",
+    response_model=CheckBatchResponse,
+    summary="Rate-limit decisions for many keys (one Redis round trip)",
+)
+async def check_rate_limit_batch(
+    req: CheckBatchRequest,
+    response: Response,
+    limiter=Depends(get_limiter),
+    policies=Depends(get_policies),
+):
+    qs = [item.to_bucket_request(policies) for item in req.items]
+    decisions = await decide_many(limiter, qs)
+
+    # Aggregate headers describe the most restrictive item
+    i = binding_index(decisions)
+    set_rate_limit_headers(response, qs[i].capacity, decisions[i])
+
+    results = [CheckResponse(**decision_body(q, d)) for q, d in zip(qs, decisions)]
+    return CheckBatchResponse(allowed=all(res.allowed for res in results), results=results)
+
+
+@router.post(
+    "/status",
+    response_model=CheckBatchResponse,
+    summary="Current balances of many keys, read-only (replicas when configured)",
+)
+async def check_status(
+    req: CheckStatusRequest,
+    response: Response,
+    limiter=Depends(get_limiter),
+    policies=Depends(get_policies),
+):
+    qs = [item.to_bucket_request(policies) for item in req.items]
+    decisions = await peek(limiter, qs)
+
+    i = binding_index(decisions)
+    set_rate_limit_headers(response, qs[i].capacity, decisions[i])
+
+    results = [CheckResponse(**decision_body(q, d)) for q, d in zip(qs, decisions)]
+    return CheckBatchResponse(allowed=all(res.allowed for res in results), results=results)
+
+
+@router.post(
+    "/multi",
+    response_model=CheckMultiResponse,
+    summary="Nested rate limits for one request, all or nothing (one Redis round trip)",
+)
+async def check_rate_limit_multi(
+    req: CheckMultiRequest,
+    response: Response,
+    limiter=Depends(get_limiter),
+    policies=Depends(get_policies),
+):
+    qs = [limit.to_bucket_request(policies) for limit in req.limits]
+    try:
+        decisions = await decide_all(limiter, qs)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e)) from e
+
+    i = multi_binding_index(qs, decisions)
+    set_rate_limit_headers(response, qs[i].capacity, decisions[i])
+
+    results = [CheckResponse(**decision_body(q, d)) for q, d in zip(qs, decisions)]
+    allowed = all(res.allowed for res in results)
+    return CheckMultiResponse(
+        allowed=allowed,
+        binding_index=i,
+        retry_after_s=None if allowed else results[i].retry_after_s,
+        results=results,
     )
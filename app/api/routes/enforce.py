@@ -1,17 +1,23 @@
-import math
+from typing import Optional
 
-from fastapi import APIRouter, Depends, Response
+from fastapi import APIRouter, Depends, HTTPException, Response
 from pydantic import BaseModel, Field
 
-from app.api.deps import get_redis
-from app.core.config import settings
-from app.metrics import (
-    RATE_LIMIT_CHECKS_TOTAL,
-    RATE_LIMIT_DECISION_LATENCY_SECONDS,
-    RATE_LIMIT_REDIS_ERRORS_TOTAL,
-    monotonic_s,
+from app.api.decisions import (
+    binding_index,
+    bucket_request,
+    decide,
+    decide_all,
+    decide_many,
+    decision_body,
+    is_impossible,
+    multi_binding_index,
+    set_rate_limit_headers,
 )
-from app.ratelimit.redis_bucket import Decision, try_consume_redis
+from app.api.deps import get_limiter, get_policies
+from app.core.config import settings
+from app.ratelimit.policy import PolicyEngine
+from app.ratelimit.redis_bucket import BucketRequest
 
 router = APIRouter()
 
@@ -23,6 +29,11 @@ class EnforceRequest(BaseModel):
     capacity: float | None = Field(default=None, gt=0)
     refill_rate_per_sec: float | None = Field(default=None, gt=0)
 
+    def to_bucket_request(self, policies: Optional[PolicyEngine] = None) -> BucketRequest:
+        return bucket_request(
+            self.key, self.cost, self.capacity, self.refill_rate_per_sec, policies
+        )
+
 
 class EnforceResponse(BaseModel):
     allowed: bool
@@ -30,66 +41,98 @@ class EnforceResponse(BaseModel):
     retry_after_s: float | None
 
 
-@router.post("", response_model=EnforceResponse, summary="Enforced rate limit (429 on deny)")
-async def enforce_rate_limit(req: EnforceRequest, response: Response, r=Depends(get_redis)):
-    cap = req.capacity if req.capacity is not None else settings.BUCKET_CAPACITY
-    rate = (
-        req.refill_rate_per_sec
-        if req.refill_rate_per_sec is not None
-        else settings.BUCKET_REFILL_RATE_PER_SEC
-    )
+class EnforceBatchRequest(BaseModel):
+    items: list[EnforceRequest] = Field(min_length=1, max_length=settings.BATCH_MAX_ITEMS)
 
-    start = monotonic_s()
-    try:
-        decision: Decision = await try_consume_redis(
-            r,
-            req.key,
-            capacity=cap,
-            refill_rate_per_sec=rate,
-            cost=req.cost,
-            ttl_sec=settings.BUCKET_KEY_TTL_SEC,
-            prefix=settings.REDIS_KEY_PREFIX,
-        )
-    except Exception:
-        RATE_LIMIT_REDIS_ERRORS_TOTAL.inc()
-        raise
-    finally:
-        RATE_LIMIT_DECISION_LATENCY_SECONDS.observe(monotonic_s() - start)
-
-    # metrics label
-    if req.cost > cap:
-        RATE_LIMIT_CHECKS_TOTAL.labels(result="impossible").inc()
-    elif decision.allowed:
-        RATE_LIMIT_CHECKS_TOTAL.labels(result="allowed").inc()
-    else:
-        RATE_LIMIT_CHECKS_TOTAL.labels(result="denied").inc()
-
-    # headers
-    response.headers["RateLimit-Limit"] = str(cap)
-    remaining = max(0, int(math.floor(decision.remaining_tokens)))
-    response.headers["RateLimit-Remaining"] = str(remaining)
-
-    reset_s = 0
-    if (not decision.allowed) and decision.retry_after_s is not None:
-        reset_s = int(math.ceil(decision.retry_after_s))
-    response.headers["RateLimit-Reset"] = str(reset_s)
-
-    if not decision.allowed and decision.retry_after_s is not None:
-        response.headers["Retry-After"] = str(reset_s)
+
+class EnforceBatchResponse(BaseModel):
+    allowed: bool
+    results: list[EnforceResponse]
+
+
+class EnforceMultiRequest(BaseModel):
+    limits: list[EnforceRequest] = Field(min_length=1, max_length=settings.MULTI_MAX_LIMITS)
+
+
+class EnforceMultiResponse(BaseModel):
+    allowed: bool
+    binding_index: int
+    retry_after_s: float | None
+    results: list[EnforceResponse]
+
+
+@router.post("", response_model=EnforceResponse, summary="Enforced rate limit (429 on deny)")
+async def enforce_rate_limit(
+    req: EnforceRequest,
+    response: Response,
+    limiter=Depends(get_limiter),
+    policies=Depends(get_policies),
+):
+    q = req.to_bucket_request(policies)
+    decision = await decide(limiter, q)
+    set_rate_limit_headers(response, q.capacity, decision)
 
     # enforce 429 when denied and it was not "impossible"
-    if req.cost <= cap and not decision.allowed:
+    if not is_impossible(q) and not decision.allowed:
         response.status_code = 429
 
-    if req.cost > cap:
-        return EnforceResponse(
-            allowed=False,
-            remaining_tokens=decision.remaining_tokens,
-            retry_after_s=None,
-        )
+    return EnforceResponse(**decision_body(q, decision))
+
+
+@router.post(
+    "/batch",
+    response_model=EnforceBatchResponse,
+    summary="Enforced rate limit for many keys (429 if any item is denied)",
+)
+async def enforce_rate_limit_batch(
+    req: EnforceBatchRequest,
+    response: Response,
+    limiter=Depends(get_limiter),
+    policies=Depends(get_policies),
+):
+    qs = [item.to_bucket_request(policies) for item in req.items]
+    decisions = await decide_many(limiter, qs)
+
+    i = binding_index(decisions)
+    set_rate_limit_headers(response, qs[i].capacity, decisions[i])
+
+    # Same rule as the single endpoint, applied to any item
+    if any(not is_impossible(q) and not d.allowed for q, d in zip(qs, decisions)):
+        response.status_code = 429
+
+    results = [EnforceResponse(**decision_body(q, d)) for q, d in zip(qs, decisions)]
+    return EnforceBatchResponse(allowed=all(res.allowed for res in results), results=results)
+
+
+@router.post(
+    "/multi",
+    response_model=EnforceMultiResponse,
+    summary="Enforced nested rate limits for one request (429 unless all pass)",
+)
+async def enforce_rate_limit_multi(
+    req: EnforceMultiRequest,
+    response: Response,
+    limiter=Depends(get_limiter),
+    policies=Depends(get_policies),
+):
+    qs = [limit.to_bucket_request(policies) for limit in req.limits]
+    try:
+        decisions = await decide_all(limiter, qs)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e)) from e
+
+    i = multi_binding_index(qs, decisions)
+    set_rate_limit_headers(response, qs[i].capacity, decisions[i])
+
+    # As the single endpoint: an impossible limit is not a 429
+    if not is_impossible(qs[i]) and not decisions[i].allowed:
+        response.status_code = 429
 
-    return EnforceResponse(
-        allowed=decision.allowed,
-        remaining_tokens=decision.remaining_tokens,
-        retry_after_s=decision.retry_after_s,
+    results = [EnforceResponse(**decision_body(q, d)) for q, d in zip(qs, decisions)]
+    allowed = all(res.allowed for res in results)
+    return EnforceMultiResponse(
+        allowed=allowed,
+        binding_index=i,
+        retry_after_s=None if allowed else results[i].retry_after_s,
+        results=results,
     )
@@ -1,12 +1,21 @@
+import asyncio
+
 from fastapi import APIRouter, Depends
 
-from app.api.deps import get_redis
+from app.api.deps import get_redis, get_redis_shards
+from app.core.config import settings
 
 router = APIRouter()
 
 
 @router.get("", summary="Readiness (checks Redis)")
-async def readyz(r=Depends(get_redis)):
+async def readyz(r=Depends(get_redis), shards=Depends(get_redis_shards)):
+    if settings.LIMITER_BACKEND == "memory":
+        return {"ready": True, "backend": "memory"}
     # If Redis is down, this will raise and return 500 by default
     pong = await r.ping()
-    return {"ready": True, "redis": pong}
+    body = {"ready": True, "redis": pong}
+    if shards:
+        pongs = await asyncio.gather(*(s.ping() for s in shards.values()))
+        body["shards"] = dict(zip(shards, pongs))
+    return body
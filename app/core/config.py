@@ -5,7 +5,28 @@ class Settings(BaseSettings):
     APP_NAME: str = "Rate Limiter Gateway"
     APP_ENV: str = "dev"
     REDIS_URL: str = "redis://localhost:6379/0"
+    # Treat REDIS_URL as a Redis Cluster endpoint
+    REDIS_CLUSTER: bool = False
+    # Comma-separated Redis URLs; when set, buckets are spread over them by consistent hashing
+    REDIS_SHARD_URLS: str = ""
+    # Comma-separated read replicas of REDIS_URL: dry runs and status queries read there
+    # (round robin). Not used with REDIS_SHARD_URLS: peeks then read each shard's primary
+    REDIS_REPLICA_URLS: str = ""
+    # Connection pool per Redis (main and each shard) and per process
+    REDIS_MAX_CONNECTIONS: int = 0  # 0 = unbounded
+    # At the cap, wait up to REDIS_POOL_TIMEOUT_MS for a free connection instead of failing
+    REDIS_POOL_BLOCKING: bool = False
+    REDIS_POOL_TIMEOUT_MS: int = 1000
+    REDIS_SOCKET_TIMEOUT_MS: int = 0  # 0 = none
+    REDIS_SOCKET_CONNECT_TIMEOUT_MS: int = 0  # 0 = none
+    REDIS_SOCKET_KEEPALIVE: bool = False
+    # PING connections idle for this long before reuse (0 = never)
+    REDIS_HEALTH_CHECK_INTERVAL_S: int = 0
+    # 2 = RESP2, 3 = RESP3
+    REDIS_PROTOCOL: int = 2
     LOG_LEVEL: str = "INFO"
+    # Worker processes started by `python -m app.serve` (0 = one per CPU)
+    WORKERS: int = 0
     GIT_SHA: str = "dev"
     APP_VERSION: str = "0.1.0"
 
@@ -13,6 +34,100 @@ class Settings(BaseSettings):
     BUCKET_REFILL_RATE_PER_SEC: float = 1.0
     BUCKET_KEY_TTL_SEC: int = 3600
     REDIS_KEY_PREFIX: str = "bucket:"
+    # Redis state per bucket: "token_bucket" (hash tokens/last) | "gcra" (one value)
+    # | "token_bucket_compact" (hash t/l of integers, expires when full again)
+    RATE_LIMIT_ALGORITHM: str = "token_bucket"
+
+    # Per-key limits from a policy file (YAML/JSON), reloaded when it changes
+    POLICY_FILE: str = ""
+    POLICY_RELOAD_INTERVAL_S: float = 2.0
+    POLICY_CACHE_SIZE: int = 100_000
+    # Whether capacity/refill_rate_per_sec sent by callers win over the policy
+    POLICY_ALLOW_OVERRIDES: bool = True
+
+    # Where buckets live: "redis" (shared) | "memory" (this process only, no Redis)
+    LIMITER_BACKEND: str = "redis"
+    # Cap on the in-memory bucket arrays (memory backend and breaker "local" fallback)
+    MEMORY_STORE_MAX_MB: int = 512
+    # Keys the memory backend's table is sized for at startup. Each growth rehashes
+    # every key at once, blocking the event loop (seconds at millions of keys)
+    MEMORY_STORE_INITIAL_KEYS: int = 0
+
+    # Upper bound on items per /check/batch or /enforce/batch call
+    BATCH_MAX_ITEMS: int = 500
+    # Upper bound on nested limits per /check/multi or /enforce/multi call
+    MULTI_MAX_LIMITS: int = 16
+
+    # Opt-in micro-batching of concurrent decisions into one Redis pipeline
+    COALESCE_ENABLED: bool = False
+    COALESCE_WINDOW_US: int = 200
+    COALESCE_MAX_BATCH: int = 64
+
+    # Two-tier mode: serve decisions from token leases taken from Redis
+    LEASE_ENABLED: bool = False
+    LEASE_FRACTION: float = 0.1
+    LEASE_TTL_MS: int = 1000
+
+    # In-process cache of denied buckets, consulted before Redis (opt-in: tokens handed
+    # back to Redis, by leases or a snapshot restore, are not seen until entries expire)
+    DENY_CACHE_ENABLED: bool = False
+    DENY_CACHE_MAX_ENTRIES: int = 100_000
+
+    # Count-min sketch in front of Redis: keys spending little over the window are
+    # allowed in-process, only heavier ones reach their token bucket. Error per
+    # estimate <= e/WIDTH of the traffic in two windows, with probability 1 - e^-DEPTH.
+    # Memory: 8 * WIDTH * DEPTH bytes (32 MB by default), whatever the number of keys
+    SKETCH_ENABLED: bool = False
+    SKETCH_WIDTH: int = 1 << 20
+    SKETCH_DEPTH: int = 4
+    SKETCH_WINDOW_S: float = 10.0
+    # A key is promoted past this fraction of min(capacity, refill rate * window), per
+    # process: N workers/instances can allow up to (1 + N * fraction) times a limit
+    SKETCH_PROMOTE_FRACTION: float = 0.5
+
+    # Reverse-proxy mode: routes to upstreams (YAML/JSON), empty = disabled
+    PROXY_CONFIG_FILE: str = ""
+    PROXY_MAX_CONNECTIONS: int = 200
+    PROXY_MAX_KEEPALIVE_CONNECTIONS: int = 100
+    PROXY_TIMEOUT_MS: int = 30_000
+
+    # Latency budget + circuit breaker around Redis decisions
+    BREAKER_ENABLED: bool = False
+    REDIS_DECISION_TIMEOUT_MS: int = 50
+    BREAKER_FAILURE_THRESHOLD: int = 5
+    BREAKER_SLOW_CALL_MS: int = 25
+    BREAKER_OPEN_MS: int = 2000
+    # Answer while Redis is unavailable: "local" | "fail_open" | "fail_closed"
+    DEGRADED_MODE: str = "local"
+
+    # Per-stage latency histograms (parse, decision, redis, redis_pool, response)
+    STAGE_TIMING_ENABLED: bool = False
+    # Comma-separated bucket bounds in milliseconds
+    STAGE_LATENCY_BUCKETS_MS: str = "0.025,0.05,0.1,0.25,0.5,1,2.5,5,10,25,50,100"
+    # Attach the X-Request-Id to stage observations (visible in OpenMetrics scrapes)
+    STAGE_EXEMPLARS: bool = False
+    # Bearer token of /api/admin (snapshots, restore, policy reload, profiles...);
+    # empty = admin API off. Never served in proxy mode: that listener is public
+    ADMIN_TOKEN: str = ""
+    # Longest run of /api/admin/profile
+    PROFILE_MAX_SECONDS: float = 60.0
+    # Hottest keys by requests, denials and cost (/api/admin/hotkeys), per worker
+    HOTKEYS_ENABLED: bool = True
+    # Keys kept per dimension and window (up to twice as many between prunes)
+    HOTKEYS_CAPACITY: int = 1000
+    HOTKEYS_WINDOW_S: float = 60.0
+    # Completed windows kept besides the current one
+    HOTKEYS_WINDOWS: int = 5
+    # Ranks exported as rate_limit_hot_key_share{dimension,rank}
+    HOTKEYS_EXPORT_RANKS: int = 5
+
+    # Binary decision protocol for sidecars (app.wire), off unless a port or path is set
+    WIRE_HOST: str = "127.0.0.1"
+    WIRE_PORT: int = 0
+    # Unix socket path; one process only (not with several `app.serve` workers)
+    WIRE_UNIX_PATH: str = ""
+    # Undecided requests per connection before it stops reading
+    WIRE_MAX_INFLIGHT: int = 4096
     model_config = SettingsConfigDict(env_file=".env", env_file_encoding="utf-8")
 
 
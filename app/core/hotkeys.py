@@ -0,0 +1,198 @@
+"""
+Hottest bucket keys, by requests, denials and consumed cost, in bounded memory.
+
+Every decision of /api/check, /api/enforce and the proxy is recorded here
+(`record`); /api/admin/hotkeys lists the heaviest keys and
+`rate_limit_hot_key_share{dimension,rank}` exports how much of the last window
+the top few took (ranks, never key names, as labels).
+
+One space-saving summary (Metwally et al.) per window of HOTKEYS_WINDOW_S,
+HOTKEYS_WINDOWS completed ones kept. A summary holds up to 4 * HOTKEYS_CAPACITY
+keys; when full, it keeps the heaviest HOTKEYS_CAPACITY of each dimension and
+remembers, per dimension, the largest count it dropped (its floor). A key seen
+again starts from the floors, so a count is never under the key's real total and
+overcounts by at most its reported `error`; a key not listed got at most the floor.
+Pruning in batches keeps a record at one dict lookup and a few list updates.
+
+Per worker: each `app.serve` worker tracks the requests it served.
+"""
+
+from __future__ import annotations
+
+import heapq
+from collections import deque
+from typing import Optional
+
+from app.core.config import settings
+from app.metrics import RATE_LIMIT_HOT_KEY_SHARE, monotonic_s
+
+DIMENSIONS = ("requests", "denied", "cost")
+
+
+class Summary:
+    """
+    Heaviest keys of one window, space-saving style. One row per key: its counts
+    [requests, denied, cost], then the floors it (re)entered at, which bound how
+    much of those counts may belong to other keys. Keys in none of the columns'
+    top `capacity` are dropped in batches, holding at most 4 * capacity rows.
+    """
+
+    __slots__ = ("capacity", "rows", "floors", "totals")
+
+    def __init__(self, capacity: int):
+        if capacity < 1:
+            raise ValueError("capacity must be > 0")
+        self.capacity = capacity
+        self.rows: dict[str, list[float]] = {}
+        self.floors = [0.0] * len(DIMENSIONS)
+        self.totals = [0.0] * len(DIMENSIONS)
+
+    def insert(self, key: str) -> list[float]:
+        """A row for a key not in `rows`, starting from the floors."""
+        if len(self.rows) >= 4 * self.capacity:
+            self._prune()
+        row = self.rows[key] = self.floors * 2
+        return row
+
+    def _prune(self) -> None:
+        # Per column, the (capacity + 1)-th largest count: whatever is dropped is at
+        # or under it in every column, and at most `capacity` keys are above it
+        rows = self.rows
+        cut = [
+            sorted([row[c] for row in rows.values()], reverse=True)[self.capacity]
+            for c in range(len(DIMENSIONS))
+        ]
+        r, d, s = cut
+        self.rows = {k: row for k, row in rows.items() if row[0] > r or row[1] > d or row[2] > s}
+        self.floors = [max(f, c) for f, c in zip(self.floors, cut)]
+
+    def estimate(self, key: str) -> tuple[list[float], list[float]]:
+        """(counts, errors) per column: the key's total is within [count - error, count]."""
+        row = self.rows.get(key)
+        if row is None:
+            return self.floors, self.floors
+        return row[:3], row[3:]
+
+
+class HotKeys:
+    """Rolling windows of summaries; `record` is the per-decision hot path."""
+
+    def __init__(self, *, capacity: int, window_s: float, windows: int, now_s: float):
+        if window_s <= 0 or windows < 1:
+            raise ValueError("window_s and windows must be > 0")
+        self.capacity = capacity
+        self.window_s = window_s
+        self._current = Summary(capacity)
+        self._rows = self._current.rows
+        self._totals = self._current.totals
+        # Completed windows, oldest first
+        self._history: deque[Summary] = deque(maxlen=windows)
+        self._window_end = now_s + window_s
+
+    def record(self, key: str, cost: float, allowed: bool, now_s: float) -> None:
+        if now_s >= self._window_end:
+            self._rotate(now_s)
+        row = self._rows.get(key)
+        if row is None:
+            row = self._current.insert(key)
+            # A prune replaces the dict
+            self._rows = self._current.rows
+        totals = self._totals
+        row[0] += 1
+        totals[0] += 1
+        if allowed:
+            row[2] += cost
+            totals[2] += cost
+        else:
+            row[1] += 1
+            totals[1] += 1
+
+    def _rotate(self, now_s: float) -> None:
+        self._history.append(self._current)
+        # Windows without any traffic
+        skipped = int((now_s - self._window_end) // self.window_s)
+        for _ in range(min(skipped, self._history.maxlen)):
+            self._history.append(Summary(self.capacity))
+        self._current = Summary(self.capacity)
+        self._rows = self._current.rows
+        self._totals = self._current.totals
+        self._window_end += (skipped + 1) * self.window_s
+        self._export(self._history[-1])
+
+    def _export(self, window: Summary) -> None:
+        ranks = settings.HOTKEYS_EXPORT_RANKS
+        for c, dimension in enumerate(DIMENSIONS):
+            total = window.totals[c]
+            top = heapq.nlargest(ranks, (row[c] for row in window.rows.values()))
+            top += [0.0] * (ranks - len(top))
+            for rank, count in enumerate(top, 1):
+                share = min(1.0, count / total) if total else 0.0
+                RATE_LIMIT_HOT_KEY_SHARE.labels(dimension=dimension, rank=str(rank)).set(share)
+
+    def top(self, by: str, n: int, windows: int, now_s: float) -> dict:
+        """
+        The `n` heaviest keys by `by` over the current window and the `windows - 1`
+        completed ones before it; a window missing a key counts its floors.
+        """
+        if now_s >= self._window_end:
+            self._rotate(now_s)
+        picked = [self._current]
+        if windows > 1:
+            picked += list(self._history)[-(windows - 1) :]
+        c = DIMENSIONS.index(by)
+        width = len(DIMENSIONS)
+
+        merged = []
+        for key in set().union(*(s.rows for s in picked)):
+            counts, errors = [0.0] * width, [0.0] * width
+            for s in picked:
+                row, error = s.estimate(key)
+                for i in range(width):
+                    counts[i] += row[i]
+                    errors[i] += error[i]
+            merged.append((key, counts, errors))
+
+        total = sum(s.totals[c] for s in picked)
+        heaviest = heapq.nlargest(n + 1, merged, key=lambda m: m[1][c])
+        # Upper bound on the `by` count of any key not listed: a tracked key past
+        # the limit, else the floors
+        unlisted_max = sum(s.floors[c] for s in picked)
+        if len(heaviest) > n:
+            unlisted_max = max(unlisted_max, heaviest.pop()[1][c])
+        keys = []
+        for key, counts, errors in heaviest:
+            keys.append(
+                {
+                    "key": key,
+                    "share": counts[c] / total if total else 0.0,
+                    **dict(zip(DIMENSIONS, counts)),
+                    "error": dict(zip(DIMENSIONS, errors)),
+                }
+            )
+        elapsed = self.window_s - (self._window_end - now_s)
+        return {
+            "by": by,
+            "window_s": self.window_s,
+            "windows": len(picked),
+            "span_s": (len(picked) - 1) * self.window_s + elapsed,
+            "totals": dict(
+                zip(DIMENSIONS, (sum(s.totals[i] for s in picked) for i in range(width)))
+            ),
+            "unlisted_max": unlisted_max,
+            "keys": keys,
+        }
+
+
+def create_tracker() -> Optional[HotKeys]:
+    if not settings.HOTKEYS_ENABLED:
+        return None
+    return HotKeys(
+        capacity=settings.HOTKEYS_CAPACITY,
+        window_s=settings.HOTKEYS_WINDOW_S,
+        windows=settings.HOTKEYS_WINDOWS,
+        now_s=monotonic_s(),
+    )
+
+
+# This process' tracker; None when HOTKEYS_ENABLED is off
+tracker = create_tracker()
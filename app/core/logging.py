@@ -13,6 +13,8 @@ def setup_logging(level: str = "INFO") -> None:
         format="%(asctime)s %(levelname)s %(name)s :: %(message)s",
         stream=sys.stdout,
     )
+    # httpx logs every proxied request at INFO: far too costly on the hot path
+    logging.getLogger("httpx").setLevel(logging.WARNING)
 
 
 class RequestIdMiddleware(BaseHTTPMiddleware):
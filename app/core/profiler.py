@@ -0,0 +1,85 @@
+"""
+Sampling profiler for a live worker, for /api/admin/profile.
+
+A background thread snapshots the stack of one thread (the event loop's) `hz`
+times per second via `sys._current_frames()`. Nothing is traced between samples,
+so the loop runs at full speed apart from the short GIL hold per sample, and
+nothing at all runs when no profile is being taken.
+
+Output is the collapsed ("folded") stack format, one `frame;frame;frame count`
+line per distinct stack, root first, as read by flamegraph.pl, speedscope and
+inferno. Frames are `function (file:first_line)`, so one function is one frame.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import os
+import sys
+import threading
+from collections import Counter
+from types import CodeType, FrameType
+from typing import Optional
+
+_SITE_MARKERS = ("site-packages" + os.sep, "dist-packages" + os.sep)
+
+
+def _frame_label(code: CodeType, cache: dict[CodeType, str]) -> str:
+    label = cache.get(code)
+    if label is None:
+        path = code.co_filename
+        for marker in _SITE_MARKERS:
+            idx = path.rfind(marker)
+            if idx != -1:
+                path = path[idx + len(marker) :]
+                break
+        else:
+            cwd = os.getcwd() + os.sep
+            if path.startswith(cwd):
+                path = path[len(cwd) :]
+        name = getattr(code, "co_qualname", code.co_name)
+        label = cache[code] = f"{name} ({path}:{code.co_firstlineno})"
+    return label
+
+
+def _stack(frame: Optional[FrameType], cache: dict[CodeType, str]) -> str:
+    labels = []
+    while frame is not None:
+        labels.append(_frame_label(frame.f_code, cache))
+        frame = frame.f_back
+    labels.reverse()
+    return ";".join(labels)
+
+
+def sample_thread(
+    thread_id: int, seconds: float, hz: float, stop: Optional[threading.Event] = None
+) -> Counter[str]:
+    """Collapsed stacks of `thread_id` sampled `hz` times a second for `seconds` (blocking)."""
+    stop = stop or threading.Event()
+    interval = 1.0 / hz
+    cache: dict[CodeType, str] = {}
+    counts: Counter[str] = Counter()
+    for _ in range(max(1, int(seconds * hz))):
+        frame = sys._current_frames().get(thread_id)
+        if frame is None:
+            break  # the thread is gone
+        counts[_stack(frame, cache)] += 1
+        del frame
+        if stop.wait(interval):
+            break
+    return counts
+
+
+def collapsed(counts: Counter[str]) -> str:
+    return "".join(f"{stack} {n}\n" for stack, n in sorted(counts.items()))
+
+
+async def profile_event_loop(seconds: float, hz: float) -> Counter[str]:
+    """Sample the thread running this event loop while it keeps serving requests."""
+    loop_thread = threading.get_ident()
+    stop = threading.Event()
+    try:
+        return await asyncio.to_thread(sample_thread, loop_thread, seconds, hz, stop)
+    finally:
+        # Cancelled (client went away): let the sampler thread end early
+        stop.set()
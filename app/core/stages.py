@@ -0,0 +1,79 @@
+"""
+Where the time of a decision request goes (`rate_limit_stage_latency_seconds`):
+
+- parse: request arrival -> limiter called (routing, body, JSON, validation, policies)
+- decision: the limiter call (deny cache, breaker, leases, Redis or memory store)
+- redis: one script call or pipeline round trip, Lua execution included
+- redis_pool: waiting for a pooled connection (part of redis)
+- response: limiter answered -> response headers sent (headers, body model, JSON)
+
+Redis cannot tell network time from script time to a client; the server's own
+per-call script time is `cmdstat_evalsha` in `INFO commandstats`.
+
+Off unless STAGE_TIMING_ENABLED; every hook then costs one settings lookup. With
+STAGE_EXEMPLARS, observations made while serving a request carry its request id.
+"""
+
+from __future__ import annotations
+
+from contextvars import ContextVar, Token
+from typing import Optional
+
+from app.core.config import settings
+from app.metrics import RATE_LIMIT_STAGE_LATENCY_SECONDS, monotonic_s
+
+STAGES = ("parse", "decision", "redis", "redis_pool", "response")
+
+_children = {stage: RATE_LIMIT_STAGE_LATENCY_SECONDS.labels(stage=stage) for stage in STAGES}
+
+
+class RequestClock:
+    __slots__ = ("start", "request_id", "decided")
+
+    def __init__(self, start: float, request_id: str):
+        self.start = start
+        self.request_id = request_id
+        self.decided: Optional[float] = None
+
+
+_clock: ContextVar[Optional[RequestClock]] = ContextVar("stage_clock", default=None)
+
+
+def start_request(start: float, request_id: bytes) -> Optional[Token]:
+    """Called by the instrumentation middleware; None when stage timing is off."""
+    if not settings.STAGE_TIMING_ENABLED:
+        return None
+    # Exemplar labels are capped at 128 characters in total
+    return _clock.set(RequestClock(start, request_id.decode("latin-1")[:64]))
+
+
+def response_started(token: Token) -> None:
+    clock = token.var.get()
+    if clock is not None and clock.decided is not None:
+        observe("response", monotonic_s() - clock.decided)
+
+
+def end_request(token: Token) -> None:
+    _clock.reset(token)
+
+
+def limiter_called(now: float) -> None:
+    clock = _clock.get()
+    if clock is not None:
+        observe("parse", now - clock.start)
+
+
+def limiter_answered(start: float, end: float) -> None:
+    observe("decision", end - start)
+    clock = _clock.get()
+    if clock is not None:
+        clock.decided = end
+
+
+def observe(stage: str, seconds: float) -> None:
+    if settings.STAGE_EXEMPLARS:
+        clock = _clock.get()
+        if clock is not None:
+            _children[stage].observe(seconds, exemplar={"request_id": clock.request_id})
+            return
+    _children[stage].observe(seconds)
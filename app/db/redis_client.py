@@ -1,8 +1,162 @@
+import functools
+from typing import Optional
+
 import redis.asyncio as redis
+from redis.asyncio.connection import parse_url
 
+from app.core import stages
 from app.core.config import settings
+from app.metrics import (
+    RATE_LIMIT_REDIS_CONNECTIONS_TOTAL,
+    RATE_LIMIT_REDIS_POOL_CONNECTIONS,
+    RATE_LIMIT_REDIS_POOL_WAIT_SECONDS,
+    monotonic_s,
+)
 
 
-def create_redis():
+class _CountedConnection:
+    """Mixed into the pool's connection class: counts sockets opened and closed."""
+
+    counters = None  # (connect, disconnect) counter children, set by the pool
+
+    async def _connect(self):
+        await super()._connect()
+        if self.counters is not None:
+            self.counters[0].inc()
+
+    async def disconnect(self, nowait: bool = False) -> None:
+        was_connected = self.is_connected
+        await super().disconnect(nowait)
+        if was_connected and self.counters is not None:
+            self.counters[1].inc()
+
+
+@functools.cache
+def _counted(connection_class: type) -> type:
+    # One subclass per class the URL picks (TCP, SSL, Unix socket)
+    return type(connection_class.__name__, (_CountedConnection, connection_class), {})
+
+
+class _PoolInstrumentation:
+    """
+    Pool metrics under the `pool` label: connections in use / idle, checkout time
+    (also the redis_pool stage), connects and disconnects.
+    """
+
+    def __init__(self, *args, name: str = "default", **kwargs):
+        super().__init__(*args, **kwargs)
+        self.connection_class = _counted(self.connection_class)
+        self._counters = (
+            RATE_LIMIT_REDIS_CONNECTIONS_TOTAL.labels(pool=name, event="connect"),
+            RATE_LIMIT_REDIS_CONNECTIONS_TOTAL.labels(pool=name, event="disconnect"),
+        )
+        self._in_use = RATE_LIMIT_REDIS_POOL_CONNECTIONS.labels(pool=name, state="in_use")
+        self._idle = RATE_LIMIT_REDIS_POOL_CONNECTIONS.labels(pool=name, state="idle")
+        self._wait = RATE_LIMIT_REDIS_POOL_WAIT_SECONDS.labels(pool=name)
+
+    def make_connection(self):
+        connection = super().make_connection()
+        connection.counters = self._counters
+        return connection
+
+    async def get_connection(self, *args, **kwargs):
+        start = monotonic_s()
+        try:
+            connection = await super().get_connection(*args, **kwargs)
+        finally:
+            elapsed = monotonic_s() - start
+            self._wait.observe(elapsed)
+            if settings.STAGE_TIMING_ENABLED:
+                stages.observe("redis_pool", elapsed)
+        self._report()
+        return connection
+
+    async def release(self, connection) -> None:
+        await super().release(connection)
+        self._report()
+
+    def _report(self) -> None:
+        self._in_use.set(len(self._in_use_connections))
+        self._idle.set(len(self._available_connections))
+
+
+class InstrumentedConnectionPool(_PoolInstrumentation, redis.ConnectionPool):
+    """Fails with ConnectionError once REDIS_MAX_CONNECTIONS are in use."""
+
+
+class InstrumentedBlockingConnectionPool(_PoolInstrumentation, redis.BlockingConnectionPool):
+    """Waits up to REDIS_POOL_TIMEOUT_MS for a connection once REDIS_MAX_CONNECTIONS are in use."""
+
+
+def _seconds(ms: int) -> Optional[float]:
+    return ms / 1000 if ms else None
+
+
+def _client_options() -> dict:
     # decode_responses=True gives you str; numbers from Lua come back as float/int cleanly
-    return redis.from_url(settings.REDIS_URL, encoding="utf-8", decode_responses=True)
+    return dict(
+        encoding="utf-8",
+        decode_responses=True,
+        socket_timeout=_seconds(settings.REDIS_SOCKET_TIMEOUT_MS),
+        socket_connect_timeout=_seconds(settings.REDIS_SOCKET_CONNECT_TIMEOUT_MS),
+        socket_keepalive=settings.REDIS_SOCKET_KEEPALIVE,
+        health_check_interval=settings.REDIS_HEALTH_CHECK_INTERVAL_S,
+        protocol=settings.REDIS_PROTOCOL,
+    )
+
+
+def _from_url(url: str) -> "redis.Redis":
+    options = dict(_client_options(), name=shard_name(url))
+    if settings.REDIS_POOL_BLOCKING:
+        if settings.REDIS_MAX_CONNECTIONS <= 0:
+            raise ValueError("REDIS_POOL_BLOCKING requires REDIS_MAX_CONNECTIONS > 0")
+        pool = InstrumentedBlockingConnectionPool.from_url(
+            url,
+            max_connections=settings.REDIS_MAX_CONNECTIONS,
+            timeout=_seconds(settings.REDIS_POOL_TIMEOUT_MS),
+            **options,
+        )
+    else:
+        pool = InstrumentedConnectionPool.from_url(
+            url, max_connections=settings.REDIS_MAX_CONNECTIONS or None, **options
+        )
+    return redis.Redis.from_pool(pool)
+
+
+def create_redis():
+    if settings.REDIS_CLUSTER:
+        # Cluster routes each command by key slot; multi-key scripts need hash tags.
+        # It keeps one pool per node of its own: options apply, pool metrics do not
+        options = _client_options()
+        if settings.REDIS_MAX_CONNECTIONS:
+            options["max_connections"] = settings.REDIS_MAX_CONNECTIONS
+        return redis.RedisCluster.from_url(settings.REDIS_URL, **options)
+    return _from_url(settings.REDIS_URL)
+
+
+def shard_name(url: str) -> str:
+    """
+    Stable, credential-free shard id ("host:port/db", or "unix:<path>/db" for a
+    socket), used for hashing and labels.
+    """
+    parts = parse_url(url)
+    if "path" in parts:
+        return f"unix:{parts['path']}/{parts.get('db', 0)}"
+    return f"{parts.get('host', 'localhost')}:{parts.get('port', 6379)}/{parts.get('db', 0)}"
+
+
+def create_redis_shards() -> dict[str, "redis.Redis"]:
+    """One client per entry of REDIS_SHARD_URLS (comma-separated); empty if unset."""
+    urls = [u.strip() for u in settings.REDIS_SHARD_URLS.split(",") if u.strip()]
+    names = [shard_name(url) for url in urls]
+    for name in names:
+        if names.count(name) > 1:
+            # Both URLs would share one hash-ring node: half the keys on one client
+            raise ValueError(f"REDIS_SHARD_URLS lists {name} more than once")
+    return {name: _from_url(url) for name, url in zip(names, urls)}
+
+
+def create_redis_replicas() -> list["redis.Redis"]:
+    """One client per entry of REDIS_REPLICA_URLS (comma-separated); empty if unset."""
+    urls = [u.strip() for u in settings.REDIS_REPLICA_URLS.split(",") if u.strip()]
+    return [_from_url(url) for url in urls]
@@ -1,33 +1,109 @@
+import logging
+import os
 from contextlib import asynccontextmanager
 
-from fastapi import FastAPI, Response
-from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
+from fastapi import FastAPI, Request, Response
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    generate_latest,
+    multiprocess,
+)
+from prometheus_client.openmetrics import exposition as openmetrics
 
+from app.api.proxy import ProxyApp, create_proxy_client, load_proxy_routes
 from app.api.router import api_router
 from app.core.config import settings
-from app.core.logging import RequestIdMiddleware, setup_logging
-from app.core.metrics_middleware import MetricsMiddleware
-from app.db.redis_client import create_redis
+from app.core.instrumentation import InstrumentationMiddleware
+from app.core.logging import setup_logging
+from app.db.redis_client import create_redis, create_redis_replicas, create_redis_shards
+from app.ratelimit.limiter import create_limiter
+from app.ratelimit.policy import PolicyStore, TierSpec
+from app.ratelimit.scripts import load_scripts
+from app.serve import WORKERS_ENV
+from app.wire.server import WireServer
+
+logger = logging.getLogger(__name__)
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # startup
+    # Set by app.serve in the workers it starts
+    workers = int(os.environ.get(WORKERS_ENV, "1"))
+    if settings.WIRE_UNIX_PATH and workers > 1:
+        # Binding unlinks the path: every worker would take it over from the last
+        raise RuntimeError("WIRE_UNIX_PATH cannot be served by several app.serve workers")
     app.state.redis = create_redis()
+    app.state.redis_shards = create_redis_shards()
+    app.state.redis_replicas = create_redis_replicas()
+    if settings.LIMITER_BACKEND == "redis":
+        for client in (app.state.redis, *app.state.redis_shards.values()):
+            try:
+                await load_scripts(client)
+            except Exception:
+                # Not fatal: calls reload on NOSCRIPT once Redis is reachable
+                logger.warning("could not preload Lua scripts into Redis", exc_info=True)
+    app.state.limiter = create_limiter(
+        app.state.redis, app.state.redis_shards, app.state.redis_replicas
+    )
+    app.state.policies = None
+    if settings.POLICY_FILE:
+        app.state.policies = PolicyStore(
+            settings.POLICY_FILE,
+            defaults=TierSpec(
+                capacity=settings.BUCKET_CAPACITY,
+                refill_rate_per_sec=settings.BUCKET_REFILL_RATE_PER_SEC,
+            ),
+            cache_size=settings.POLICY_CACHE_SIZE,
+            reload_every_s=settings.POLICY_RELOAD_INTERVAL_S,
+        )
+        app.state.policies.start()
+    app.state.proxy_client = create_proxy_client() if settings.PROXY_CONFIG_FILE else None
+    app.state.wire = None
+    if settings.WIRE_PORT or settings.WIRE_UNIX_PATH:
+        app.state.wire = WireServer(app.state.limiter, app.state.policies)
+        if settings.WIRE_PORT:
+            await app.state.wire.start_tcp(
+                settings.WIRE_HOST, settings.WIRE_PORT, reuse_port=workers > 1
+            )
+        if settings.WIRE_UNIX_PATH:
+            await app.state.wire.start_unix(settings.WIRE_UNIX_PATH)
     try:
         yield
     finally:
         # shutdown
+        if app.state.wire is not None:
+            await app.state.wire.aclose()
+        if app.state.policies is not None:
+            await app.state.policies.aclose()
+        if app.state.proxy_client is not None:
+            await app.state.proxy_client.aclose()
+        await app.state.limiter.aclose()
+        for client in (*app.state.redis_shards.values(), *app.state.redis_replicas):
+            await client.aclose()
         await app.state.redis.aclose()
 
 
+def metrics_registry() -> CollectorRegistry:
+    """
+    This process' metrics, or under `app.serve` (PROMETHEUS_MULTIPROC_DIR set) the
+    sum over every worker, read from their metric files at scrape time.
+    """
+    if not os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        return REGISTRY
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    return registry
+
+
 def create_app() -> FastAPI:
     setup_logging(settings.LOG_LEVEL)
     app = FastAPI(title=settings.APP_NAME, lifespan=lifespan)
 
-    # Middlewares
-    app.add_middleware(RequestIdMiddleware)
-    app.add_middleware(MetricsMiddleware)
+    # Middlewares: request id + metrics in a single pure-ASGI layer
+    app.add_middleware(InstrumentationMiddleware)
 
     # Health for infra probes
     @app.get("/healthz", tags=["Health"])
@@ -35,13 +111,23 @@ def create_app() -> FastAPI:
         return {"ok": True}
 
     # Prometheus scrape endpoint
+    registry = metrics_registry()
+
     @app.get("/metrics", tags=["Observability"])
-    async def metrics():
-        data = generate_latest()
+    async def metrics(request: Request):
+        # Exemplars only exist in the OpenMetrics format, which Prometheus asks for
+        if "application/openmetrics-text" in request.headers.get("accept", ""):
+            data = openmetrics.generate_latest(registry)
+            return Response(content=data, media_type=openmetrics.CONTENT_TYPE_LATEST)
+        data = generate_latest(registry)
         return Response(content=data, media_type=CONTENT_TYPE_LATEST)
 
     # Versioned API
     app.include_router(api_router, prefix="/api")
+
+    # Reverse proxy: every path not matched above is looked up in the proxy routes
+    if settings.PROXY_CONFIG_FILE:
+        app.mount("", ProxyApp(load_proxy_routes(settings.PROXY_CONFIG_FILE)), name="proxy")
     return app
 
 
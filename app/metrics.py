@@ -1,6 +1,8 @@
 import time
 
-from prometheus_client import Counter, Histogram
+from prometheus_client import Counter, Gauge, Histogram
+
+from app.core.config import settings
 
 # --- Request-level ---
 HTTP_REQUESTS_TOTAL = Counter(
@@ -32,6 +34,186 @@ RATE_LIMIT_DECISION_LATENCY_SECONDS = Histogram(
     "Latency for Redis token-bucket decision",
 )
 
+RATE_LIMIT_SCRIPT_RELOADS_TOTAL = Counter(
+    "rate_limit_script_reloads_total",
+    "Lua scripts reloaded after Redis answered NOSCRIPT (restart/failover/flush)",
+    ["script"],
+)
+
+RATE_LIMIT_COALESCE_BATCH_SIZE = Histogram(
+    "rate_limit_coalesce_batch_size",
+    "Decisions sent per coalesced Redis pipeline",
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256, 512),
+)
+
+RATE_LIMIT_COALESCE_QUEUE_DELAY_SECONDS = Histogram(
+    "rate_limit_coalesce_queue_delay_seconds",
+    "Time a decision waited in the coalescing window before being sent",
+    buckets=(10e-6, 25e-6, 50e-6, 100e-6, 200e-6, 500e-6, 1e-3, 2.5e-3, 5e-3, 10e-3),
+)
+
+RATE_LIMIT_LEASE_DECISIONS_TOTAL = Counter(
+    "rate_limit_lease_decisions_total",
+    "Decisions in lease mode by where they were answered",
+    ["source"],  # "local" | "redis"
+)
+
+RATE_LIMIT_LEASE_GRANTS_TOTAL = Counter(
+    "rate_limit_lease_grants_total",
+    "Lease grant calls to Redis by outcome",
+    ["result"],  # "granted" | "empty"
+)
+
+RATE_LIMIT_DENY_CACHE_TOTAL = Counter(
+    "rate_limit_deny_cache_total",
+    "Deny-cache lookups by outcome",
+    ["result"],  # "hit" | "miss"
+)
+
+RATE_LIMIT_DENY_CACHE_EVICTIONS_TOTAL = Counter(
+    "rate_limit_deny_cache_evictions_total",
+    "Deny-cache entries dropped",
+    ["reason"],  # "expired" | "lru"
+)
+
+RATE_LIMIT_SHARD_DECISIONS_TOTAL = Counter(
+    "rate_limit_shard_decisions_total",
+    "Decisions routed to each Redis shard",
+    ["shard"],
+)
+
+RATE_LIMIT_SHARD_LATENCY_SECONDS = Histogram(
+    "rate_limit_shard_latency_seconds",
+    "Latency of Redis calls per shard (single call or per-shard pipeline)",
+    ["shard"],
+)
+
+RATE_LIMIT_SHARD_KEYS = Gauge(
+    "rate_limit_shard_keys",
+    "Bucket keys per Redis shard (sampled estimate, refreshed by /api/admin/shards)",
+    ["shard"],
+    multiprocess_mode="livemostrecent",
+)
+
+RATE_LIMIT_BREAKER_STATE = Gauge(
+    "rate_limit_breaker_state",
+    "Redis circuit breaker state (0=closed, 1=open, 2=half-open)",
+    multiprocess_mode="liveall",
+)
+
+RATE_LIMIT_BREAKER_TRANSITIONS_TOTAL = Counter(
+    "rate_limit_breaker_transitions_total",
+    "Redis circuit breaker state changes",
+    ["to"],
+)
+
+RATE_LIMIT_DEGRADED_DECISIONS_TOTAL = Counter(
+    "rate_limit_degraded_decisions_total",
+    "Decisions answered without Redis by the degraded policy",
+    ["policy"],  # "local" | "fail_open" | "fail_closed"
+)
+
+RATE_LIMIT_MEMORY_STORE_KEYS = Gauge(
+    "rate_limit_memory_store_keys",
+    "Buckets held by the in-memory bucket store",
+    multiprocess_mode="livesum",
+)
+
+RATE_LIMIT_MEMORY_STORE_BYTES = Gauge(
+    "rate_limit_memory_store_bytes",
+    "Array memory of the in-memory bucket store",
+    multiprocess_mode="livesum",
+)
+
+RATE_LIMIT_MEMORY_STORE_EVICTIONS_TOTAL = Counter(
+    "rate_limit_memory_store_evictions_total",
+    "Buckets dropped from the in-memory bucket store",
+    ["reason"],  # "expired" | "capacity"
+)
+
+RATE_LIMIT_PROXY_REQUESTS_TOTAL = Counter(
+    "rate_limit_proxy_requests_total",
+    "Requests handled by the reverse proxy",
+    ["route", "result"],  # "forwarded" | "limited" | "upstream_error"
+)
+
+RATE_LIMIT_PROXY_UPSTREAM_LATENCY_SECONDS = Histogram(
+    "rate_limit_proxy_upstream_latency_seconds",
+    "Time until the upstream answered with response headers",
+    ["route"],
+)
+
+RATE_LIMIT_POLICY_RULES = Gauge(
+    "rate_limit_policy_rules",
+    "Rules in the active policy file",
+    multiprocess_mode="livemax",
+)
+
+RATE_LIMIT_POLICY_RELOADS_TOTAL = Counter(
+    "rate_limit_policy_reloads_total",
+    "Policy file reloads",
+    ["result"],  # "ok" | "error"
+)
+
+RATE_LIMIT_STAGE_LATENCY_SECONDS = Histogram(
+    "rate_limit_stage_latency_seconds",
+    "Latency per stage of a decision request (STAGE_TIMING_ENABLED)",
+    ["stage"],  # "parse" | "decision" | "redis" | "redis_pool" | "response"
+    buckets=tuple(float(ms) / 1000 for ms in settings.STAGE_LATENCY_BUCKETS_MS.split(",")),
+)
+
+
+RATE_LIMIT_WIRE_CONNECTIONS = Gauge(
+    "rate_limit_wire_connections",
+    "Open connections to the binary decision protocol server",
+    multiprocess_mode="livesum",
+)
+
+RATE_LIMIT_WIRE_REQUESTS_TOTAL = Counter(
+    "rate_limit_wire_requests_total",
+    "Requests answered over the binary decision protocol",
+    ["result"],  # "allowed" | "denied" | "impossible" | "bad_request" | "unavailable"
+)
+
+
+RATE_LIMIT_REDIS_POOL_CONNECTIONS = Gauge(
+    "rate_limit_redis_pool_connections",
+    "Connections of a Redis connection pool",
+    ["pool", "state"],  # state: "in_use" | "idle"
+    multiprocess_mode="livesum",
+)
+
+RATE_LIMIT_REDIS_POOL_WAIT_SECONDS = Histogram(
+    "rate_limit_redis_pool_wait_seconds",
+    "Time to check a connection out of a Redis pool (incl. connecting, waiting when blocking)",
+    ["pool"],
+    buckets=(0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.005, 0.025, 0.1, 1.0),
+)
+
+RATE_LIMIT_REDIS_CONNECTIONS_TOTAL = Counter(
+    "rate_limit_redis_connections_total",
+    "Redis connections opened and closed by a pool",
+    ["pool", "event"],  # "connect" | "disconnect"
+)
+
+RATE_LIMIT_PEEKS_TOTAL = Counter(
+    "rate_limit_peeks_total",
+    "Buckets read without consuming (dry runs and status queries)",
+)
+
+RATE_LIMIT_SKETCH_DECISIONS_TOTAL = Counter(
+    "rate_limit_sketch_decisions_total",
+    "Decisions of the count-min sketch pre-filter",
+    ["path"],  # "local" (under the promotion threshold) | "promoted" (exact limiter)
+)
+
+RATE_LIMIT_HOT_KEY_SHARE = Gauge(
+    "rate_limit_hot_key_share",
+    "Share of the last hot-keys window taken by the rank-th heaviest key (key names: admin API)",
+    ["dimension", "rank"],  # "requests" | "denied" | "cost", "1".."HOTKEYS_EXPORT_RANKS"
+    multiprocess_mode="livemax",
+)
+
 
 def now_s() -> float:
     return time.time()
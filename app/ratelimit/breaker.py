@@ -0,0 +1,185 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from typing import Optional, Sequence
+
+from app.metrics import (
+    RATE_LIMIT_BREAKER_STATE,
+    RATE_LIMIT_BREAKER_TRANSITIONS_TOTAL,
+    RATE_LIMIT_DEGRADED_DECISIONS_TOTAL,
+    RATE_LIMIT_REDIS_ERRORS_TOTAL,
+    monotonic_s,
+)
+from app.ratelimit.memory_store import InMemoryBucketStore
+from app.ratelimit.redis_bucket import BucketRequest, Decision
+
+logger = logging.getLogger(__name__)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+_STATE_VALUE = {CLOSED: 0, OPEN: 1, HALF_OPEN: 2}
+
+
+class CircuitBreaker:
+    """
+    Consecutive-failure breaker. Errors, timeouts and calls slower than
+    `slow_call_s` count as failures; `failure_threshold` of them in a row open the
+    circuit for `open_for_s`, after which a single probe call is let through
+    (half-open). A successful probe closes the circuit, a failed one re-opens it.
+    """
+
+    def __init__(self, *, failure_threshold: int, slow_call_s: float, open_for_s: float):
+        self.failure_threshold = failure_threshold
+        self.slow_call_s = slow_call_s
+        self.open_for_s = open_for_s
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probing = False
+        RATE_LIMIT_BREAKER_STATE.set(_STATE_VALUE[CLOSED])
+
+    def allow_request(self, now: float) -> bool:
+        if self.state == CLOSED:
+            return True
+        if self.state == OPEN and now - self.opened_at >= self.open_for_s:
+            self._transition(HALF_OPEN)
+        if self.state == HALF_OPEN and not self._probing:
+            self._probing = True
+            return True
+        return False
+
+    def retry_after_s(self, now: float) -> float:
+        """Seconds until the breaker will try Redis again."""
+        return max(0.0, self.opened_at + self.open_for_s - now)
+
+    def record_success(self, elapsed_s: float, now: float) -> None:
+        if elapsed_s > self.slow_call_s:
+            self.record_failure(now)
+            return
+        self._probing = False
+        self.failures = 0
+        if self.state != CLOSED:
+            self._transition(CLOSED)
+
+    def abandon(self) -> None:
+        """The allowed call was cancelled before it finished: let another probe through."""
+        self._probing = False
+
+    def record_failure(self, now: float) -> None:
+        self._probing = False
+        self.failures += 1
+        if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+            self.opened_at = now
+            if self.state != OPEN:
+                self._transition(OPEN)
+
+    def _transition(self, state: str) -> None:
+        logger.warning("redis circuit breaker %s -> %s", self.state, state)
+        self.state = state
+        RATE_LIMIT_BREAKER_STATE.set(_STATE_VALUE[state])
+        RATE_LIMIT_BREAKER_TRANSITIONS_TOTAL.labels(to=state).inc()
+
+
+class BreakerLimiter:
+    """
+    Puts a latency budget and a circuit breaker in front of the wrapped limiter.
+    When a call fails or times out, or the circuit is open, the decision comes
+    from the degraded policy instead of raising:
+
+    - "local": in-process token buckets (per instance, so the global limit is
+      approximately multiplied by the number of instances)
+    - "fail_open": allow everything
+    - "fail_closed": deny everything, Retry-After = time until Redis is retried
+    """
+
+    def __init__(
+        self,
+        inner,
+        breaker: CircuitBreaker,
+        *,
+        timeout_s: float,
+        degraded_mode: str,
+        local: Optional[InMemoryBucketStore] = None,
+    ):
+        if degraded_mode not in ("local", "fail_open", "fail_closed"):
+            raise ValueError(f"unknown degraded mode: {degraded_mode}")
+        self.inner = inner
+        self.breaker = breaker
+        self.timeout_s = timeout_s
+        self.degraded_mode = degraded_mode
+        if local is None:
+            local = InMemoryBucketStore(ttl_s=3600, max_bytes=64 * 1024 * 1024)
+        self.local = local
+
+    async def consume(self, q: BucketRequest) -> Decision:
+        return await self._call(self.inner.consume(q), lambda: self._degraded(q))
+
+    async def consume_many(self, qs: Sequence[BucketRequest]) -> list[Decision]:
+        return await self._call(
+            self.inner.consume_many(qs), lambda: [self._degraded(q) for q in qs]
+        )
+
+    async def consume_all(self, qs: Sequence[BucketRequest]) -> list[Decision]:
+        return await self._call(self.inner.consume_all(qs), lambda: self._degraded_all(qs))
+
+    async def peek_many(self, qs: Sequence[BucketRequest]) -> list[Decision]:
+        # Peeks are served by replicas when there are any: their failures and latency
+        # say nothing about the primary, so they fall back without feeding the breaker
+        if self.breaker.state == OPEN:
+            return self._degraded_peeks(qs)
+        try:
+            return await asyncio.wait_for(self.inner.peek_many(qs), self.timeout_s)
+        except (asyncio.CancelledError, ValueError):
+            raise
+        except Exception:
+            RATE_LIMIT_REDIS_ERRORS_TOTAL.inc()
+            return self._degraded_peeks(qs)
+
+    async def _call(self, coro, degraded):
+        now = monotonic_s()
+        if not self.breaker.allow_request(now):
+            coro.close()
+            return degraded()
+
+        try:
+            res = await asyncio.wait_for(coro, self.timeout_s)
+        except (asyncio.CancelledError, ValueError):
+            # Cancelled, or a bad call (limits on different shards): says nothing about Redis
+            self.breaker.abandon()
+            raise
+        except Exception:
+            RATE_LIMIT_REDIS_ERRORS_TOTAL.inc()
+            self.breaker.record_failure(monotonic_s())
+            return degraded()
+
+        end = monotonic_s()
+        self.breaker.record_success(end - now, end)
+        return res
+
+    def _degraded(self, q: BucketRequest) -> Decision:
+        RATE_LIMIT_DEGRADED_DECISIONS_TOTAL.labels(policy=self.degraded_mode).inc()
+        if self.degraded_mode == "fail_open":
+            return Decision(True, q.capacity, 0.0)
+        if self.degraded_mode == "fail_closed":
+            return Decision(False, 0.0, max(1.0, self.breaker.retry_after_s(monotonic_s())))
+        return self.local.consume(q.key, q.capacity, q.refill_rate_per_sec, q.cost, time.time())
+
+    def _degraded_all(self, qs: Sequence[BucketRequest]) -> list[Decision]:
+        if self.degraded_mode == "local":
+            RATE_LIMIT_DEGRADED_DECISIONS_TOTAL.labels(policy="local").inc(len(qs))
+            return self.local.consume_all(qs, time.time())
+        return [self._degraded(q) for q in qs]
+
+    def _degraded_peeks(self, qs: Sequence[BucketRequest]) -> list[Decision]:
+        if self.degraded_mode == "local":
+            RATE_LIMIT_DEGRADED_DECISIONS_TOTAL.labels(policy="local").inc(len(qs))
+            now = time.time()
+            return [self.local.peek(q, now) for q in qs]
+        return [self._degraded(q) for q in qs]
+
+    async def aclose(self) -> None:
+        await self.inner.aclose()
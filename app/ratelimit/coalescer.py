@@ -0,0 +1,95 @@
+from __future__ import annotations
+
+import asyncio
+from typing import Optional, Sequence
+
+import redis.asyncio as redis
+
+from app.metrics import (
+    RATE_LIMIT_COALESCE_BATCH_SIZE,
+    RATE_LIMIT_COALESCE_QUEUE_DELAY_SECONDS,
+    monotonic_s,
+)
+from app.ratelimit.limiter import RedisLimiter
+from app.ratelimit.redis_bucket import BucketRequest, Decision, try_consume_redis_many
+
+
+class CoalescingLimiter(RedisLimiter):
+    """
+    Micro-batches concurrent single decisions into one pipelined round trip.
+
+    A decision waits at most `window_s` (or until `max_batch` decisions are queued),
+    then the whole batch goes out via `try_consume_redis_many` and each caller's
+    future gets its own Decision. Order within a batch is arrival order, so the
+    result for a key is the same as if the calls had been made one by one.
+    """
+
+    def __init__(
+        self,
+        r: "redis.Redis",
+        *,
+        ttl_sec: int,
+        prefix: str,
+        window_s: float,
+        max_batch: int,
+        algorithm: str = "token_bucket",
+        replicas: Sequence["redis.Redis"] = (),
+    ):
+        super().__init__(r, ttl_sec=ttl_sec, prefix=prefix, algorithm=algorithm, replicas=replicas)
+        self.window_s = window_s
+        self.max_batch = max(1, max_batch)
+        self._pending: list[tuple[BucketRequest, asyncio.Future, float]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._inflight: set[asyncio.Task] = set()
+
+    async def consume(self, q: BucketRequest) -> Decision:
+        loop = asyncio.get_running_loop()
+        fut = loop.create_future()
+        self._pending.append((q, fut, monotonic_s()))
+
+        if len(self._pending) >= self.max_batch:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window_s, self._flush)
+        return await fut
+
+    def _flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if not batch:
+            return
+        task = asyncio.create_task(self._send(batch))
+        self._inflight.add(task)
+        task.add_done_callback(self._inflight.discard)
+
+    async def _send(self, batch: list[tuple[BucketRequest, asyncio.Future, float]]) -> None:
+        sent_at = monotonic_s()
+        RATE_LIMIT_COALESCE_BATCH_SIZE.observe(len(batch))
+        for _, _, queued_at in batch:
+            RATE_LIMIT_COALESCE_QUEUE_DELAY_SECONDS.observe(sent_at - queued_at)
+
+        try:
+            decisions = await try_consume_redis_many(
+                self.r,
+                [q for q, _, _ in batch],
+                ttl_sec=self.ttl_sec,
+                prefix=self.prefix,
+                algorithm=self.algorithm,
+            )
+        except Exception as e:
+            for _, fut, _ in batch:
+                if not fut.done():
+                    fut.set_exception(e)
+            return
+
+        for (_, fut, _), decision in zip(batch, decisions):
+            # A caller may have been cancelled while waiting
+            if not fut.done():
+                fut.set_result(decision)
+
+    async def aclose(self) -> None:
+        self._flush()
+        if self._inflight:
+            await asyncio.gather(*self._inflight, return_exceptions=True)
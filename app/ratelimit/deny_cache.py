@@ -0,0 +1,119 @@
+from __future__ import annotations
+
+import time
+from collections import OrderedDict
+from typing import Optional, Sequence
+
+from app.metrics import RATE_LIMIT_DENY_CACHE_EVICTIONS_TOTAL, RATE_LIMIT_DENY_CACHE_TOTAL
+from app.ratelimit.redis_bucket import BucketRequest, Decision
+
+
+class DenyCache:
+    """
+    Bounded LRU of recently denied buckets, so repeat offenders are answered
+    without a Redis round trip until their Retry-After has passed.
+
+    Each entry keeps the balance Redis reported at the denial. As long as other
+    callers only take tokens away, `tokens + elapsed * rate` (capped at capacity)
+    is an upper bound on the real balance: if even that is short of the cost, the
+    request is certainly denied and the Retry-After computed from it is never
+    later than the true one. Anything else is a miss and goes to Redis.
+
+    Tokens handed back to Redis (lease leftovers, a snapshot restore) break that
+    bound until the entry expires, which is why the cache is opt-in.
+    """
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        # (prefix, key, capacity, rate) -> (tokens, at_s, expires_at_s)
+        self._entries: OrderedDict[tuple, tuple[float, float, float]] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def lookup(self, prefix: str, q: BucketRequest, now_s: float) -> Optional[Decision]:
+        k = (prefix, q.key, q.capacity, q.refill_rate_per_sec)
+        entry = self._entries.get(k)
+        if entry is None:
+            RATE_LIMIT_DENY_CACHE_TOTAL.labels(result="miss").inc()
+            return None
+
+        tokens, at_s, expires_at_s = entry
+        if now_s >= expires_at_s:
+            del self._entries[k]
+            RATE_LIMIT_DENY_CACHE_EVICTIONS_TOTAL.labels(reason="expired").inc()
+            RATE_LIMIT_DENY_CACHE_TOTAL.labels(result="miss").inc()
+            return None
+
+        est = min(q.capacity, tokens + max(0.0, now_s - at_s) * q.refill_rate_per_sec)
+        if q.cost <= 0 or q.cost > q.capacity or est + 1e-12 >= q.cost:
+            # Might be allowed (or is not a plain deny): Redis decides
+            RATE_LIMIT_DENY_CACHE_TOTAL.labels(result="miss").inc()
+            return None
+
+        self._entries.move_to_end(k)
+        RATE_LIMIT_DENY_CACHE_TOTAL.labels(result="hit").inc()
+        return Decision(False, est, (q.cost - est) / q.refill_rate_per_sec)
+
+    def forget(self, prefix: str, q: BucketRequest) -> None:
+        self._entries.pop((prefix, q.key, q.capacity, q.refill_rate_per_sec), None)
+
+    def remember(self, prefix: str, q: BucketRequest, decision: Decision, now_s: float) -> None:
+        k = (prefix, q.key, q.capacity, q.refill_rate_per_sec)
+        if decision.allowed or decision.retry_after_s is None:
+            # Allowed (or impossible): whatever we cached is stale now
+            self._entries.pop(k, None)
+            return
+
+        self._entries[k] = (decision.remaining_tokens, now_s, now_s + decision.retry_after_s)
+        self._entries.move_to_end(k)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            RATE_LIMIT_DENY_CACHE_EVICTIONS_TOTAL.labels(reason="lru").inc()
+
+
+class DenyCachingLimiter:
+    """Consults a DenyCache before delegating to the wrapped limiter."""
+
+    def __init__(self, inner, cache: DenyCache, *, prefix: str):
+        self.inner = inner
+        self.cache = cache
+        self.prefix = prefix
+
+    async def consume(self, q: BucketRequest) -> Decision:
+        now = time.time()
+        cached = self.cache.lookup(self.prefix, q, now)
+        if cached is not None:
+            return cached
+
+        decision = await self.inner.consume(q)
+        self.cache.remember(self.prefix, q, decision, now)
+        return decision
+
+    async def consume_many(self, qs: Sequence[BucketRequest]) -> list[Decision]:
+        now = time.time()
+        decisions = [self.cache.lookup(self.prefix, q, now) for q in qs]
+        misses = [i for i, d in enumerate(decisions) if d is None]
+        if misses:
+            remote = await self.inner.consume_many([qs[i] for i in misses])
+            for i, decision in zip(misses, remote):
+                self.cache.remember(self.prefix, qs[i], decision, now)
+                decisions[i] = decision
+        return decisions
+
+    async def consume_all(self, qs: Sequence[BucketRequest]) -> list[Decision]:
+        # Always asks the inner limiter (a cached denial would not carry the other
+        # limits' balances), and remembers nothing: a limit's balance there can count
+        # deductions that were never committed (the same key twice, another limit
+        # denying), so it is no upper bound. Entries of these keys are dropped.
+        decisions = await self.inner.consume_all(qs)
+        for q in qs:
+            self.cache.forget(self.prefix, q)
+        return decisions
+
+    async def peek_many(self, qs: Sequence[BucketRequest]) -> list[Decision]:
+        # Peeks report the stored balance; they neither read nor feed the cache
+        return await self.inner.peek_many(qs)
+
+    async def aclose(self) -> None:
+        await self.inner.aclose()
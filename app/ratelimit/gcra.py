@@ -0,0 +1,63 @@
+from __future__ import annotations
+
+import math
+from dataclasses import dataclass
+from typing import Optional, Tuple
+
+from app.ratelimit.token_bucket import BucketConfig, Decision
+
+
+@dataclass(frozen=True)
+class GcraState:
+    """
+    tat: theoretical arrival time (epoch seconds) - when the bucket would be full
+         again. A bucket with tat <= now is full and needs no stored state at all.
+    """
+
+    tat: float
+
+
+def tokens_at(config: BucketConfig, state: Optional[GcraState], now_s: float) -> float:
+    """Tokens the equivalent token bucket holds at `now_s`."""
+    if state is None or state.tat <= now_s:
+        return config.capacity
+    return max(0.0, config.capacity - (state.tat - now_s) * config.refill_rate_per_sec)
+
+
+def try_consume_gcra(
+    config: BucketConfig,
+    state: Optional[GcraState],
+    cost: float,
+    now_s: float,
+) -> Tuple[Decision, Optional[GcraState]]:
+    """
+    GCRA (generic cell rate algorithm) with token-bucket parameters: each token
+    pushes the theoretical arrival time back by 1/refill_rate_per_sec, and up to
+    `capacity` tokens may be ahead of `now_s` (the burst tolerance).
+
+    Same contract as `token_bucket.try_consume`: returns a Decision and the NEW
+    state (None = full bucket), cost <= 0 is always allowed, cost > capacity is
+    denied with retry_after_s=None.
+    """
+    if not math.isfinite(cost):
+        raise ValueError("cost must be finite")
+    if cost < 0:
+        raise ValueError("cost must be >= 0")
+
+    tat = state.tat if state is not None and state.tat > now_s else now_s
+    tokens = tokens_at(config, state, now_s)
+
+    if cost == 0:
+        return Decision(True, tokens, 0.0), state
+
+    if cost > config.capacity:
+        return Decision(False, tokens, None), state
+
+    if tokens + 1e-12 >= cost:
+        new_state = GcraState(tat=tat + cost / config.refill_rate_per_sec)
+        return Decision(True, max(0.0, tokens - cost), 0.0), new_state
+
+    retry_after = (cost - tokens) / config.refill_rate_per_sec
+    if retry_after < 0 and retry_after > -1e-12:
+        retry_after = 0.0
+    return Decision(False, tokens, retry_after), state
@@ -0,0 +1,288 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from dataclasses import dataclass
+from typing import Optional, Sequence
+
+import redis.asyncio as redis
+
+from app.metrics import RATE_LIMIT_LEASE_DECISIONS_TOTAL, RATE_LIMIT_LEASE_GRANTS_TOTAL, monotonic_s
+from app.ratelimit.limiter import RedisLimiter
+from app.ratelimit.redis_bucket import BucketRequest, Decision
+from app.ratelimit.scripts import register_script
+from app.ratelimit.token_bucket import BucketConfig, BucketState, try_consume
+
+# Lease grant on the SAME bucket hash as LUA_TOKEN_BUCKET (fields tokens/last).
+# KEYS[1] = bucket key
+# ARGV: capacity, rate_per_sec, want, need, returned, now_s, ttl_sec
+#   returned: unused tokens of a previous lease, added back before granting
+#   want: tokens to lease; need: minimum acceptable grant (the caller's cost)
+# Returns: {allowed(0/1), granted(float), remaining_tokens(float), retry_after(float or -1)}
+LUA_LEASE_GRANT = r"""
+local key = KEYS[1]
+local capacity = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local want = tonumber(ARGV[3])
+local need = tonumber(ARGV[4])
+local returned = tonumber(ARGV[5])
+local now = tonumber(ARGV[6])
+local ttl = tonumber(ARGV[7])
+
+local state = redis.call('HMGET', key, 'tokens', 'last')
+local tokens = tonumber(state[1])
+local last = tonumber(state[2])
+
+if tokens == nil or last == nil then
+  tokens = capacity
+  last = now
+end
+
+if now > last then
+  tokens = math.min(capacity, tokens + (now - last) * rate)
+end
+tokens = math.min(capacity, tokens + returned)
+
+local function persist()
+  redis.call('HSET', key, 'tokens', tokens, 'last', now)
+  if ttl ~= nil and ttl > 0 then
+    redis.call('EXPIRE', key, ttl)
+  end
+end
+
+if need > capacity then
+  persist()
+  return {0, 0, tostring(tokens), -1}
+end
+
+if tokens + 1e-12 >= need then
+  local granted = math.max(need, math.min(tokens, want))
+  tokens = math.max(0, tokens - granted)
+  persist()
+  return {1, tostring(granted), tostring(tokens), 0}
+end
+
+persist()
+return {0, 0, tostring(tokens), tostring((need - tokens) / rate)}
+"""
+
+LEASE_GRANT_SCRIPT = register_script("lease_grant", LUA_LEASE_GRANT)
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class _Lease:
+    # Leased tokens live in a local bucket that never refills: every local
+    # try_consume is evaluated at state.last_refill_ts, so refill stays in Redis.
+    config: BucketConfig
+    state: BucketState
+    redis_tokens: float
+    expires_at: float
+    renewing: bool = False
+
+
+class LeaseLimiter(RedisLimiter):
+    """
+    Two-tier limiter: each instance leases a slice of a bucket from Redis and
+    serves decisions locally from it until it runs out or expires.
+
+    - A lease is `lease_fraction * capacity` tokens (at least the triggering cost),
+      taken atomically from the Redis bucket by LUA_LEASE_GRANT.
+    - Below `renew_below` of the lease, a renewal is requested in the background.
+    - Leases expire after `lease_ttl_s`; unused tokens are handed back to Redis
+      (with the next grant, or by the periodic sweep).
+
+    Over-admission bound: tokens are always taken from Redis before being spent,
+    but a lease can be spent up to `lease_ttl_s` after it was granted, while the
+    Redis bucket keeps refilling. Over any window each instance can therefore
+    admit at most about one lease (`lease_fraction * capacity`) per key more than
+    a single global bucket would. Tune LEASE_FRACTION / LEASE_TTL_MS accordingly.
+    """
+
+    def __init__(
+        self,
+        r: "redis.Redis",
+        *,
+        ttl_sec: int,
+        prefix: str,
+        lease_fraction: float,
+        lease_ttl_s: float,
+        renew_below: float = 0.25,
+        replicas: Sequence["redis.Redis"] = (),
+    ):
+        # Peeks read the Redis bucket: tokens leased to instances count as taken
+        super().__init__(r, ttl_sec=ttl_sec, prefix=prefix, replicas=replicas)
+        self.lease_fraction = lease_fraction
+        self.lease_ttl_s = lease_ttl_s
+        self.renew_below = renew_below
+        self._leases: dict[tuple[str, float, float], _Lease] = {}
+        self._tasks: set[asyncio.Task] = set()
+        self._sweeper: Optional[asyncio.Task] = None
+
+    async def consume(self, q: BucketRequest) -> Decision:
+        decision = self._consume_local(q)
+        if decision is not None:
+            return decision
+        if q.cost <= 0 or q.cost > q.capacity:
+            # Probes and impossible requests carry no tokens worth leasing
+            return await super().consume(q)
+
+        # No usable lease: hand back the leftover and ask for a new one (one call)
+        RATE_LIMIT_LEASE_DECISIONS_TOTAL.labels(source="redis").inc()
+        lk = (q.key, q.capacity, q.refill_rate_per_sec)
+        returned = self._take_leftover(lk)
+        want = max(q.cost, q.capacity * self.lease_fraction)
+        allowed, granted, remaining, retry_after = await self._grant(q, want, q.cost, returned)
+        if not allowed:
+            return Decision(False, remaining, retry_after)
+
+        leftover = max(0.0, granted - q.cost)
+        self._add_lease(lk, q, leftover, remaining)
+        return Decision(True, leftover + remaining, 0.0)
+
+    async def consume_many(self, qs: Sequence[BucketRequest]) -> list[Decision]:
+        # Serve what the leases can; the rest goes out as one plain pipelined batch
+        decisions = [self._consume_local(q) for q in qs]
+        misses = [i for i, d in enumerate(decisions) if d is None]
+        if misses:
+            remote = await super().consume_many([qs[i] for i in misses])
+            for i, decision in zip(misses, remote):
+                decisions[i] = decision
+        return decisions
+
+    def _consume_local(self, q: BucketRequest) -> Optional[Decision]:
+        """Decision from a live lease, or None if Redis has to be asked."""
+        if q.cost <= 0 or q.cost > q.capacity:
+            return None
+
+        self._ensure_sweeper()
+        lk = (q.key, q.capacity, q.refill_rate_per_sec)
+        lease = self._leases.get(lk)
+        if lease is None or monotonic_s() >= lease.expires_at:
+            return None
+
+        decision, state = try_consume(
+            lease.config, lease.state, q.cost, now_s=lease.state.last_refill_ts
+        )
+        if not decision.allowed:
+            return None
+
+        lease.state = state
+        RATE_LIMIT_LEASE_DECISIONS_TOTAL.labels(source="local").inc()
+        if state.tokens < lease.config.capacity * self.renew_below:
+            self._renew(lk, q)
+        return Decision(True, state.tokens + lease.redis_tokens, 0.0)
+
+    async def _grant(
+        self, q: BucketRequest, want: float, need: float, returned: float
+    ) -> tuple[bool, float, float, Optional[float]]:
+        res = await LEASE_GRANT_SCRIPT(
+            self.r,
+            (f"{self.prefix}{q.key}",),
+            (q.capacity, q.refill_rate_per_sec, want, need, returned, time.time(), self.ttl_sec),
+        )
+        allowed, granted, remaining, retry_after = (float(v) for v in res)
+        RATE_LIMIT_LEASE_GRANTS_TOTAL.labels(result="granted" if granted > 0 else "empty").inc()
+        return bool(allowed), granted, remaining, (None if retry_after == -1 else retry_after)
+
+    def _add_lease(self, lk, q: BucketRequest, tokens: float, redis_tokens: float) -> None:
+        lease = self._leases.get(lk)
+        now = monotonic_s()
+        expires_at = now + self.lease_ttl_s
+        if lease is not None and now < lease.expires_at:
+            # Concurrent grants for the same key merge into one lease, which keeps its
+            # expiry: renewing cannot keep tokens away from other instances forever
+            tokens += lease.state.tokens
+            expires_at = lease.expires_at
+        if tokens <= 0:
+            self._leases.pop(lk, None)
+            return
+        self._leases[lk] = _Lease(
+            config=BucketConfig(
+                capacity=max(tokens, q.capacity * self.lease_fraction),
+                refill_rate_per_sec=q.refill_rate_per_sec,
+            ),
+            state=BucketState(tokens=tokens, last_refill_ts=0.0),
+            redis_tokens=redis_tokens,
+            expires_at=expires_at,
+        )
+
+    def _take_leftover(self, lk) -> float:
+        lease = self._leases.pop(lk, None)
+        return lease.state.tokens if lease is not None else 0.0
+
+    def _renew(self, lk, q: BucketRequest) -> None:
+        lease = self._leases[lk]
+        if lease.renewing:
+            return
+        lease.renewing = True
+        self._spawn(self._renew_task(lk, q))
+
+    async def _renew_task(self, lk, q: BucketRequest) -> None:
+        try:
+            _, granted, remaining, _ = await self._grant(
+                q, q.capacity * self.lease_fraction, 0.0, 0.0
+            )
+        except Exception:
+            lease = self._leases.get(lk)
+            if lease is not None:
+                lease.renewing = False
+            return
+        if granted > 0:
+            self._add_lease(lk, q, granted, remaining)
+        lease = self._leases.get(lk)
+        if lease is not None and granted < q.cost:
+            # Redis is (next to) empty too: back off, leaving `renewing` set so this
+            # lease is spent locally and then expires, leftover handed back, with no
+            # Redis call per local decision
+            lease.redis_tokens = remaining
+            lease.renewing = True
+
+    async def _sweep_forever(self) -> None:
+        while True:
+            await asyncio.sleep(self.lease_ttl_s)
+            try:
+                await self.release_expired()
+            except Exception:
+                logger.warning("could not return expired leases to Redis", exc_info=True)
+
+    async def release_expired(self, *, all_leases: bool = False) -> None:
+        """Hand unused tokens of expired (or all) leases back to Redis in one pipeline."""
+        now = monotonic_s()
+        expired = [
+            lk for lk, lease in self._leases.items() if all_leases or now >= lease.expires_at
+        ]
+        calls = []
+        for lk in expired:
+            leftover = self._take_leftover(lk)
+            if leftover > 0:
+                key, cap, rate = lk
+                calls.append(
+                    (
+                        (f"{self.prefix}{key}",),
+                        (cap, rate, 0, 0, leftover, time.time(), self.ttl_sec),
+                    )
+                )
+        if calls:
+            await LEASE_GRANT_SCRIPT.many(self.r, calls)
+
+    def _ensure_sweeper(self) -> None:
+        if self._sweeper is None:
+            self._sweeper = asyncio.create_task(self._sweep_forever())
+
+    def _spawn(self, coro) -> None:
+        task = asyncio.create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def aclose(self) -> None:
+        if self._sweeper is not None:
+            self._sweeper.cancel()
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+        try:
+            await self.release_expired(all_leases=True)
+        except Exception:
+            logger.warning("could not return leases to Redis on shutdown", exc_info=True)
@@ -0,0 +1,195 @@
+from __future__ import annotations
+
+import itertools
+import time
+from typing import Mapping, Sequence
+
+import redis.asyncio as redis
+
+from app.core.config import settings
+from app.ratelimit.redis_bucket import (
+    ALGORITHMS,
+    BucketRequest,
+    Decision,
+    peek_redis_many,
+    redis_key,
+    try_consume_redis,
+    try_consume_redis_all,
+    try_consume_redis_many,
+)
+
+
+class RedisLimiter:
+    """
+    Decides each request with its own script call against one Redis. Peeks are
+    plain reads, spread over `replicas` when there are any.
+    """
+
+    def __init__(
+        self,
+        r: "redis.Redis",
+        *,
+        ttl_sec: int,
+        prefix: str,
+        algorithm: str = "token_bucket",
+        replicas: Sequence["redis.Redis"] = (),
+    ):
+        if algorithm not in ALGORITHMS:
+            raise ValueError(f"unknown rate-limit algorithm: {algorithm}")
+        self.r = r
+        self.ttl_sec = ttl_sec
+        self.prefix = prefix
+        self.algorithm = algorithm
+        self._readers = itertools.cycle(replicas) if replicas else itertools.repeat(r)
+
+    async def consume(self, q: BucketRequest) -> Decision:
+        return await try_consume_redis(
+            self.r,
+            q.key,
+            capacity=q.capacity,
+            refill_rate_per_sec=q.refill_rate_per_sec,
+            cost=q.cost,
+            ttl_sec=self.ttl_sec,
+            prefix=self.prefix,
+            algorithm=self.algorithm,
+        )
+
+    async def consume_many(self, qs: Sequence[BucketRequest]) -> list[Decision]:
+        return await try_consume_redis_many(
+            self.r, qs, ttl_sec=self.ttl_sec, prefix=self.prefix, algorithm=self.algorithm
+        )
+
+    async def consume_all(self, qs: Sequence[BucketRequest]) -> list[Decision]:
+        if isinstance(self.r, redis.RedisCluster):
+            slots = {self.r.keyslot(redis_key(self.prefix, q.key, self.algorithm)) for q in qs}
+            if len(slots) > 1:
+                raise ValueError(
+                    "limits checked together must share a hash tag in Redis Cluster mode"
+                )
+        return await try_consume_redis_all(
+            self.r, qs, ttl_sec=self.ttl_sec, prefix=self.prefix, algorithm=self.algorithm
+        )
+
+    async def peek_many(self, qs: Sequence[BucketRequest]) -> list[Decision]:
+        return await peek_redis_many(
+            next(self._readers), qs, prefix=self.prefix, algorithm=self.algorithm
+        )
+
+    async def aclose(self) -> None:
+        pass
+
+
+def create_limiter(
+    r: "redis.Redis",
+    shards: Mapping[str, "redis.Redis"] | None = None,
+    replicas: Sequence["redis.Redis"] = (),
+):
+    """Build the limiter the routes decide with, according to settings."""
+    if settings.LIMITER_BACKEND == "memory":
+        # No Redis round trip to protect or save: no breaker, no deny cache
+        from app.ratelimit.memory_store import InMemoryBucketStore, MemoryLimiter
+
+        return MemoryLimiter(
+            InMemoryBucketStore(
+                ttl_s=settings.BUCKET_KEY_TTL_SEC,
+                max_bytes=settings.MEMORY_STORE_MAX_MB * 1024 * 1024,
+                initial_keys=settings.MEMORY_STORE_INITIAL_KEYS,
+            )
+        )
+    if settings.LIMITER_BACKEND != "redis":
+        raise ValueError(f"unknown limiter backend: {settings.LIMITER_BACKEND}")
+
+    limiter = _create_base_limiter(r, shards, replicas)
+    if settings.BREAKER_ENABLED:
+        from app.ratelimit.breaker import BreakerLimiter, CircuitBreaker
+        from app.ratelimit.memory_store import InMemoryBucketStore
+
+        limiter = BreakerLimiter(
+            limiter,
+            CircuitBreaker(
+                failure_threshold=settings.BREAKER_FAILURE_THRESHOLD,
+                slow_call_s=settings.BREAKER_SLOW_CALL_MS / 1000,
+                open_for_s=settings.BREAKER_OPEN_MS / 1000,
+            ),
+            timeout_s=settings.REDIS_DECISION_TIMEOUT_MS / 1000,
+            degraded_mode=settings.DEGRADED_MODE,
+            local=InMemoryBucketStore(
+                ttl_s=settings.BUCKET_KEY_TTL_SEC,
+                max_bytes=settings.MEMORY_STORE_MAX_MB * 1024 * 1024,
+            ),
+        )
+    if settings.DENY_CACHE_ENABLED:
+        from app.ratelimit.deny_cache import DenyCache, DenyCachingLimiter
+
+        limiter = DenyCachingLimiter(
+            limiter, DenyCache(settings.DENY_CACHE_MAX_ENTRIES), prefix=settings.REDIS_KEY_PREFIX
+        )
+    if settings.SKETCH_ENABLED:
+        # Outermost: one-off keys of a flood never reach Redis nor the deny cache
+        from app.ratelimit.sketch import CountMinSketch, SketchLimiter
+
+        limiter = SketchLimiter(
+            limiter,
+            CountMinSketch(
+                width=settings.SKETCH_WIDTH,
+                depth=settings.SKETCH_DEPTH,
+                window_s=settings.SKETCH_WINDOW_S,
+                now_s=time.time(),
+            ),
+            promote_fraction=settings.SKETCH_PROMOTE_FRACTION,
+        )
+    return limiter
+
+
+def _create_base_limiter(
+    r: "redis.Redis",
+    shards: Mapping[str, "redis.Redis"] | None,
+    replicas: Sequence["redis.Redis"],
+):
+    if shards:
+        from app.ratelimit.sharding import ShardedRedisLimiter
+
+        # Both wrap a single client (leases and batches are per connection pool)
+        for flag in ("LEASE_ENABLED", "COALESCE_ENABLED"):
+            if getattr(settings, flag):
+                raise ValueError(f"{flag} is not supported with REDIS_SHARD_URLS")
+        return ShardedRedisLimiter(
+            shards,
+            ttl_sec=settings.BUCKET_KEY_TTL_SEC,
+            prefix=settings.REDIS_KEY_PREFIX,
+            algorithm=settings.RATE_LIMIT_ALGORITHM,
+        )
+    if settings.LEASE_ENABLED:
+        from app.ratelimit.lease import LeaseLimiter
+
+        if settings.RATE_LIMIT_ALGORITHM != "token_bucket":
+            # Leases are carved out of the token-bucket hash (LUA_LEASE_GRANT)
+            raise ValueError("LEASE_ENABLED requires RATE_LIMIT_ALGORITHM=token_bucket")
+
+        return LeaseLimiter(
+            r,
+            ttl_sec=settings.BUCKET_KEY_TTL_SEC,
+            prefix=settings.REDIS_KEY_PREFIX,
+            lease_fraction=settings.LEASE_FRACTION,
+            lease_ttl_s=settings.LEASE_TTL_MS / 1000,
+            replicas=replicas,
+        )
+    if settings.COALESCE_ENABLED:
+        from app.ratelimit.coalescer import CoalescingLimiter
+
+        return CoalescingLimiter(
+            r,
+            ttl_sec=settings.BUCKET_KEY_TTL_SEC,
+            prefix=settings.REDIS_KEY_PREFIX,
+            window_s=settings.COALESCE_WINDOW_US / 1_000_000,
+            max_batch=settings.COALESCE_MAX_BATCH,
+            algorithm=settings.RATE_LIMIT_ALGORITHM,
+            replicas=replicas,
+        )
+    return RedisLimiter(
+        r,
+        ttl_sec=settings.BUCKET_KEY_TTL_SEC,
+        prefix=settings.REDIS_KEY_PREFIX,
+        algorithm=settings.RATE_LIMIT_ALGORITHM,
+        replicas=replicas,
+    )
@@ -0,0 +1,291 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import math
+import random
+import time
+from array import array
+from typing import Optional, Sequence
+
+from app.metrics import (
+    RATE_LIMIT_MEMORY_STORE_BYTES,
+    RATE_LIMIT_MEMORY_STORE_EVICTIONS_TOTAL,
+    RATE_LIMIT_MEMORY_STORE_KEYS,
+)
+from app.ratelimit.redis_bucket import BucketRequest, Decision
+from app.ratelimit.token_bucket import BucketConfig, BucketState, try_consume
+
+logger = logging.getLogger(__name__)
+
+# hash, tokens, last: one 8-byte item each per slot
+BYTES_PER_SLOT = 24
+MAX_LOAD = 0.75
+MIN_SLOTS = 1024
+# Keys looked at when the store is full; the least recently used one is evicted
+EVICTION_SAMPLES = 5
+
+
+class InMemoryBucketStore:
+    """
+    Token buckets for many keys in three flat arrays (key hash, tokens, last
+    refill time) indexed by open addressing with linear probing. No Python object
+    is kept per key, so 10M keys take about 400 MB.
+
+    Decisions are those of `token_bucket.try_consume`, with the same float
+    operations. Keys are identified by their 64-bit `hash()` only: two keys with
+    equal hashes share a bucket (about a 1e-6 chance across 10M keys).
+
+    - Idle eviction: a bucket untouched for `ttl_s` is dropped, like the Redis
+      EXPIRE on bucket keys. Expired buckets are reset lazily on access and
+      reclaimed by `sweep()`.
+    - Memory cap: the table never grows beyond `max_bytes`. When it holds
+      `max_keys`, inserting a key evicts the least recently used of a few
+      sampled keys (as Redis' approximated LRU does).
+    """
+
+    def __init__(self, *, ttl_s: float, max_bytes: int, initial_keys: int = 0):
+        if max_bytes < MIN_SLOTS * BYTES_PER_SLOT:
+            raise ValueError(f"max_bytes must be >= {MIN_SLOTS * BYTES_PER_SLOT}")
+        self.ttl_s = ttl_s
+        self.max_slots = 1 << ((max_bytes // BYTES_PER_SLOT).bit_length() - 1)
+        self.max_keys = int(self.max_slots * MAX_LOAD)
+        self._count = 0
+        self._cursor = 0
+        slots = MIN_SLOTS
+        while slots < self.max_slots and slots * MAX_LOAD < initial_keys:
+            slots *= 2
+        self._allocate(slots)
+
+    def __len__(self) -> int:
+        return self._count
+
+    @property
+    def memory_bytes(self) -> int:
+        return len(self._hashes) * BYTES_PER_SLOT
+
+    def consume(
+        self, key: str, capacity: float, refill_rate_per_sec: float, cost: float, now_s: float
+    ) -> Decision:
+        if not math.isfinite(cost):
+            raise ValueError("cost must be finite")
+        if cost < 0:
+            raise ValueError("cost must be >= 0")
+        if capacity <= 0 or refill_rate_per_sec <= 0:
+            raise ValueError("capacity and refill_rate_per_sec must be > 0")
+
+        h = hash(key) or 1  # 0 marks an empty slot
+        i = self._find(h)
+        if i < 0:
+            i = self._insert(h, now_s)
+            tokens, last = capacity, now_s
+        else:
+            tokens, last = self._tokens[i], self._last[i]
+            if now_s - last >= self.ttl_s:
+                # Expired: starts over as a full bucket, as if Redis had dropped it
+                tokens, last = capacity, now_s
+
+        # Same steps as token_bucket._refill / try_consume
+        if now_s > last:
+            tokens = min(capacity, tokens + (now_s - last) * refill_rate_per_sec)
+            if tokens < 0 and tokens > -1e-12:
+                tokens = 0.0
+            last = now_s
+        self._last[i] = last
+
+        if cost == 0:
+            self._tokens[i] = tokens
+            return Decision(True, tokens, 0.0)
+        if cost > capacity:
+            self._tokens[i] = tokens
+            return Decision(False, tokens, None)
+        if tokens + 1e-12 >= cost:
+            tokens = max(0.0, tokens - cost)
+            self._tokens[i] = tokens
+            return Decision(True, tokens, 0.0)
+
+        self._tokens[i] = tokens
+        retry_after = (cost - tokens) / refill_rate_per_sec
+        if retry_after < 0 and retry_after > -1e-12:
+            retry_after = 0.0
+        return Decision(False, tokens, retry_after)
+
+    def consume_all(self, qs: Sequence[BucketRequest], now_s: float) -> list[Decision]:
+        """
+        All-or-nothing `consume` of several buckets, as `try_consume_redis_all`:
+        every bucket is checked first, and only if all have room are the costs taken.
+        """
+        states: dict[str, BucketState] = {}
+        pending = []
+        for q in qs:
+            config = BucketConfig(q.capacity, q.refill_rate_per_sec)
+            # A cost of 0 only refills: the balance each limit is checked against
+            _, state = try_consume(config, states.get(q.key) or self._peek(q, now_s), 0.0, now_s)
+            decision, states[q.key] = try_consume(config, state, q.cost, now_s)
+            pending.append((decision, state.tokens))
+
+        if all(d.allowed for d, _ in pending):
+            consume = self.consume
+            return [consume(q.key, q.capacity, q.refill_rate_per_sec, q.cost, now_s) for q in qs]
+        # Nothing was taken: every limit reports its unchanged balance
+        return [Decision(d.allowed, tokens, d.retry_after_s) for d, tokens in pending]
+
+    def peek(self, q: BucketRequest, now_s: float) -> Decision:
+        """The decision `consume` would make for `q`, without taking anything."""
+        decision, _ = try_consume(
+            BucketConfig(q.capacity, q.refill_rate_per_sec), self._peek(q, now_s), q.cost, now_s
+        )
+        return decision
+
+    def _peek(self, q: BucketRequest, now_s: float) -> BucketState:
+        """Stored state of `q.key` without touching it (a full bucket if absent or expired)."""
+        i = self._find(hash(q.key) or 1)
+        if i < 0 or now_s - self._last[i] >= self.ttl_s:
+            return BucketState(q.capacity, now_s)
+        return BucketState(self._tokens[i], self._last[i])
+
+    def sweep(self, now_s: float, max_slots: int = 65_536) -> int:
+        """Drop expired buckets from the next `max_slots` slots (round robin). Returns count."""
+        mask = len(self._hashes) - 1
+        i = self._cursor & mask
+        removed = 0
+        for _ in range(min(max_slots, mask + 1)):
+            # Deleting shifts a later entry into slot i: look at it again
+            while self._hashes[i] and now_s - self._last[i] >= self.ttl_s:
+                self._delete(i)
+                removed += 1
+            i = (i + 1) & mask
+        self._cursor = i
+        if removed:
+            RATE_LIMIT_MEMORY_STORE_EVICTIONS_TOTAL.labels(reason="expired").inc(removed)
+        RATE_LIMIT_MEMORY_STORE_KEYS.set(self._count)
+        RATE_LIMIT_MEMORY_STORE_BYTES.set(self.memory_bytes)
+        return removed
+
+    def _allocate(self, slots: int) -> None:
+        self._hashes = array("q", bytes(8 * slots))
+        self._tokens = array("d", bytes(8 * slots))
+        self._last = array("d", bytes(8 * slots))
+
+    def _find(self, h: int) -> int:
+        hashes = self._hashes
+        mask = len(hashes) - 1
+        i = h & mask
+        while True:
+            slot = hashes[i]
+            if slot == h:
+                return i
+            if slot == 0:
+                return -1
+            i = (i + 1) & mask
+
+    def _insert(self, h: int, now_s: float) -> int:
+        if self._count + 1 > len(self._hashes) * MAX_LOAD:
+            if len(self._hashes) < self.max_slots:
+                self._resize(len(self._hashes) * 2)
+            else:
+                self._evict_one(now_s)
+
+        hashes = self._hashes
+        mask = len(hashes) - 1
+        i = h & mask
+        while hashes[i]:
+            i = (i + 1) & mask
+        hashes[i] = h
+        self._count += 1
+        return i
+
+    def _evict_one(self, now_s: float) -> None:
+        hashes, last = self._hashes, self._last
+        mask = len(hashes) - 1
+        victim = -1
+        for _ in range(EVICTION_SAMPLES):
+            i = random.getrandbits(63) & mask
+            while not hashes[i]:
+                i = (i + 1) & mask
+            if victim < 0 or last[i] < last[victim]:
+                victim = i
+        expired = now_s - last[victim] >= self.ttl_s
+        self._delete(victim)
+        RATE_LIMIT_MEMORY_STORE_EVICTIONS_TOTAL.labels(
+            reason="expired" if expired else "capacity"
+        ).inc()
+
+    def _delete(self, i: int) -> None:
+        # Backward-shift deletion keeps probe chains intact without tombstones
+        hashes, tokens, last = self._hashes, self._tokens, self._last
+        mask = len(hashes) - 1
+        j = i
+        while True:
+            j = (j + 1) & mask
+            h = hashes[j]
+            if h == 0:
+                break
+            home = h & mask
+            # Move j back into the hole unless its home lies cyclically in (i, j]
+            if (i < j and (home <= i or home > j)) or (i > j and home <= i and home > j):
+                hashes[i], tokens[i], last[i] = h, tokens[j], last[j]
+                i = j
+        hashes[i] = 0
+        self._count -= 1
+
+    def _resize(self, slots: int) -> None:
+        # Blocks the event loop for the whole rehash: MEMORY_STORE_INITIAL_KEYS avoids it
+        logger.info("growing in-memory bucket table to %d slots (%d keys)", slots, self._count)
+        old = (self._hashes, self._tokens, self._last)
+        self._allocate(slots)
+        hashes, tokens, last = self._hashes, self._tokens, self._last
+        mask = slots - 1
+        for h, t, ts in zip(*old):
+            if h:
+                i = h & mask
+                while hashes[i]:
+                    i = (i + 1) & mask
+                hashes[i], tokens[i], last[i] = h, t, ts
+        self._cursor = 0
+
+
+class MemoryLimiter:
+    """
+    Limiter deciding from an `InMemoryBucketStore` in this process: no Redis, so
+    limits are per instance (single-node deployments, tests, local tiers).
+    """
+
+    def __init__(self, store: InMemoryBucketStore, *, sweep_every_s: float = 1.0):
+        self.store = store
+        self.sweep_every_s = sweep_every_s
+        self._sweeper: Optional[asyncio.Task] = None
+
+    async def consume(self, q: BucketRequest) -> Decision:
+        self._ensure_sweeper()
+        return self.store.consume(q.key, q.capacity, q.refill_rate_per_sec, q.cost, time.time())
+
+    async def consume_many(self, qs: Sequence[BucketRequest]) -> list[Decision]:
+        self._ensure_sweeper()
+        now = time.time()
+        consume = self.store.consume
+        return [consume(q.key, q.capacity, q.refill_rate_per_sec, q.cost, now) for q in qs]
+
+    async def consume_all(self, qs: Sequence[BucketRequest]) -> list[Decision]:
+        self._ensure_sweeper()
+        return self.store.consume_all(qs, time.time())
+
+    async def peek_many(self, qs: Sequence[BucketRequest]) -> list[Decision]:
+        now = time.time()
+        return [self.store.peek(q, now) for q in qs]
+
+    async def _sweep_forever(self) -> None:
+        while True:
+            await asyncio.sleep(self.sweep_every_s)
+            try:
+                self.store.sweep(time.time())
+            except Exception:
+                logger.warning("in-memory bucket sweep failed", exc_info=True)
+
+    def _ensure_sweeper(self) -> None:
+        if self._sweeper is None:
+            self._sweeper = asyncio.create_task(self._sweep_forever())
+
+    async def aclose(self) -> None:
+        if self._sweeper is not None:
+            self._sweeper.cancel()
@@ -0,0 +1,303 @@
+"""
+Per-key limits from a policy file instead of per-call overrides.
+
+    tiers:
+      free: {capacity: 10, refill_rate_per_sec: 1}
+      pro:  {capacity: 200, refill_rate_per_sec: 50}
+    default: {tier: free}                  # optional, else BUCKET_* settings
+    rules:
+      - key: "tenant:acme:admin"           # exact key
+        tier: pro
+      - prefix: "tenant:acme:"             # key prefix
+        tier: pro
+        cost_multiplier: 2
+      - glob: "tenant:*:export"            # shell-style pattern
+        capacity: 1
+        refill_rate_per_sec: 0.01
+      - regex: "user:[0-9]+"               # full match
+        tier: free
+
+Rules are compiled into one `PolicyEngine`:
+- exact keys: a dict
+- prefixes and globs: a character trie keyed by the literal prefix (globs by the
+  text before their first wildcard), so only rules along the key's path are tried
+- regexes: combined into alternations, tried last
+
+Resolution order: exact key, then the deepest trie node on the key's path (its
+globs in file order, then its prefix rule), then the first matching regex, then
+the default. Results are cached per engine (bounded LRU).
+
+`PolicyStore` reloads the file when it changes: the new engine is compiled
+completely before it replaces the old one, so a request resolves against one
+consistent rule set and a bad file leaves the previous rules in place.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import fnmatch
+import logging
+import os
+import re
+from collections import OrderedDict
+from typing import NamedTuple, Optional
+
+import yaml
+from pydantic import BaseModel, Field, model_validator
+
+from app.metrics import RATE_LIMIT_POLICY_RELOADS_TOTAL, RATE_LIMIT_POLICY_RULES
+
+logger = logging.getLogger(__name__)
+
+# Regex rules per combined alternation (keeps each compiled pattern small)
+REGEX_CHUNK = 100
+# Backreferences, global inline flags and named groups (two rules may use the same name)
+# change meaning or fail inside a combined pattern
+_NOT_COMBINABLE = re.compile(r"\\[1-9]|\(\?P[=<]|\(\?[aiLmsux]+\)")
+
+
+class Policy(NamedTuple):
+    capacity: float
+    refill_rate_per_sec: float
+    cost_multiplier: float
+    rule: str  # which rule matched, "default" if none
+
+
+class TierSpec(BaseModel):
+    capacity: float = Field(gt=0)
+    refill_rate_per_sec: float = Field(gt=0)
+
+
+class LimitSpec(BaseModel):
+    tier: Optional[str] = None
+    capacity: Optional[float] = Field(default=None, gt=0)
+    refill_rate_per_sec: Optional[float] = Field(default=None, gt=0)
+    cost_multiplier: float = Field(default=1.0, ge=0)
+
+
+class RuleSpec(LimitSpec):
+    name: Optional[str] = None
+    key: Optional[str] = None
+    prefix: Optional[str] = None
+    glob: Optional[str] = None
+    regex: Optional[str] = None
+
+    @model_validator(mode="after")
+    def _one_matcher(self):
+        matchers = [m for m in (self.key, self.prefix, self.glob, self.regex) if m is not None]
+        if len(matchers) != 1:
+            raise ValueError("a rule needs exactly one of key, prefix, glob, regex")
+        return self
+
+    def label(self, index: int) -> str:
+        if self.name:
+            return self.name
+        kind = next(k for k in ("key", "prefix", "glob", "regex") if getattr(self, k) is not None)
+        return f"{kind}:{getattr(self, kind)}#{index}"
+
+
+class PolicyFile(BaseModel):
+    tiers: dict[str, TierSpec] = {}
+    default: Optional[LimitSpec] = None
+    rules: list[RuleSpec] = []
+
+
+class _Node:
+    __slots__ = ("children", "rule", "globs")
+
+    def __init__(self):
+        self.children: dict[str, _Node] = {}
+        self.rule: Optional[Policy] = None
+        self.globs: list[tuple[re.Pattern, Policy]] = []
+
+
+class PolicyEngine:
+    """Compiled rule set; `resolve(key)` is the hot path."""
+
+    def __init__(self, spec: PolicyFile, *, defaults: TierSpec, cache_size: int = 100_000):
+        self.cache_size = cache_size
+        self.rule_count = len(spec.rules)
+        self.default = _policy(spec.default or LimitSpec(), spec.tiers, defaults, "default")
+        self._exact: dict[str, Policy] = {}
+        self._root = _Node()
+        # (combined regex, policy per wrapper group; {0: policy} for a lone pattern)
+        self._regexes: list[tuple[re.Pattern, dict[int, Policy]]] = []
+        self._cache: OrderedDict[str, Policy] = OrderedDict()
+
+        regex_rules: list[tuple[str, Policy]] = []
+        for i, rule in enumerate(spec.rules):
+            policy = _policy(rule, spec.tiers, self.default, rule.label(i))
+            if rule.key is not None:
+                self._exact.setdefault(rule.key, policy)
+            elif rule.prefix is not None:
+                node = self._node(rule.prefix)
+                if node.rule is None:
+                    node.rule = policy
+            elif rule.glob is not None:
+                literal = re.split(r"[*?\[]", rule.glob, maxsplit=1)[0]
+                compiled = re.compile(fnmatch.translate(rule.glob), re.DOTALL)
+                self._node(literal).globs.append((compiled, policy))
+            else:
+                re.compile(rule.regex)  # reject a bad pattern with its own error
+                regex_rules.append((rule.regex, policy))
+
+        for chunk in _regex_chunks(regex_rules):
+            if len(chunk) == 1:
+                pattern, policy = chunk[0]
+                self._regexes.append((re.compile(pattern), {0: policy}))
+                continue
+            groups: dict[int, Policy] = {}
+            parts = []
+            group = 1
+            for pattern, policy in chunk:
+                groups[group] = policy
+                parts.append(f"({pattern})")
+                # The rule's own groups are numbered after its wrapper group
+                group += 1 + re.compile(pattern).groups
+            self._regexes.append((re.compile("|".join(parts)), groups))
+
+    def resolve(self, key: str) -> Policy:
+        cache = self._cache
+        policy = cache.get(key)
+        if policy is not None:
+            cache.move_to_end(key)
+            return policy
+
+        policy = self._match(key)
+        cache[key] = policy
+        if len(cache) > self.cache_size:
+            cache.popitem(last=False)
+        return policy
+
+    def _match(self, key: str) -> Policy:
+        policy = self._exact.get(key)
+        if policy is not None:
+            return policy
+
+        node = self._root
+        path = [node] if node.rule or node.globs else []
+        for ch in key:
+            node = node.children.get(ch)
+            if node is None:
+                break
+            if node.rule is not None or node.globs:
+                path.append(node)
+        for node in reversed(path):
+            for compiled, policy in node.globs:
+                if compiled.fullmatch(key):
+                    return policy
+            if node.rule is not None:
+                return node.rule
+
+        for compiled, groups in self._regexes:
+            m = compiled.fullmatch(key)
+            if m is not None:
+                if 0 in groups:
+                    return groups[0]
+                # The matching alternative's wrapper group closes last
+                return groups[m.lastindex]
+        return self.default
+
+    def _node(self, literal: str) -> _Node:
+        node = self._root
+        for ch in literal:
+            child = node.children.get(ch)
+            if child is None:
+                child = node.children[ch] = _Node()
+            node = child
+        return node
+
+
+def _regex_chunks(rules: list[tuple[str, Policy]]) -> list[list[tuple[str, Policy]]]:
+    """Split regex rules, in file order, into runs that can share one alternation."""
+    chunks: list[list[tuple[str, Policy]]] = []
+    run: list[tuple[str, Policy]] = []
+    for pattern, policy in rules:
+        if _NOT_COMBINABLE.search(pattern):
+            if run:
+                chunks.append(run)
+                run = []
+            chunks.append([(pattern, policy)])
+            continue
+        run.append((pattern, policy))
+        if len(run) == REGEX_CHUNK:
+            chunks.append(run)
+            run = []
+    if run:
+        chunks.append(run)
+    return chunks
+
+
+def _policy(spec: LimitSpec, tiers: dict[str, TierSpec], base, label: str) -> Policy:
+    capacity, rate = base.capacity, base.refill_rate_per_sec
+    if spec.tier is not None:
+        if spec.tier not in tiers:
+            raise ValueError(f"{label}: unknown tier {spec.tier!r}")
+        capacity, rate = tiers[spec.tier].capacity, tiers[spec.tier].refill_rate_per_sec
+    return Policy(
+        capacity=spec.capacity if spec.capacity is not None else capacity,
+        refill_rate_per_sec=(
+            spec.refill_rate_per_sec if spec.refill_rate_per_sec is not None else rate
+        ),
+        cost_multiplier=spec.cost_multiplier,
+        rule=label,
+    )
+
+
+def load_policy_engine(path: str, *, defaults: TierSpec, cache_size: int) -> PolicyEngine:
+    with open(path, encoding="utf-8") as f:
+        # YAML is a superset of JSON, so one loader reads both
+        spec = PolicyFile.model_validate(yaml.safe_load(f) or {})
+    return PolicyEngine(spec, defaults=defaults, cache_size=cache_size)
+
+
+class PolicyStore:
+    """Current `PolicyEngine` for a file, swapped atomically when the file changes."""
+
+    def __init__(self, path: str, *, defaults: TierSpec, cache_size: int, reload_every_s: float):
+        self.path = path
+        self.defaults = defaults
+        self.cache_size = cache_size
+        self.reload_every_s = reload_every_s
+        self._mtime = os.stat(path).st_mtime_ns
+        # A broken file at startup is fatal; later ones only keep the old rules
+        self.engine = load_policy_engine(path, defaults=defaults, cache_size=cache_size)
+        RATE_LIMIT_POLICY_RULES.set(self.engine.rule_count)
+        self._watcher: Optional[asyncio.Task] = None
+
+    async def reload(self, *, force: bool = False) -> bool:
+        """Recompile if the file changed (or `force`). Returns whether rules were swapped."""
+        mtime = os.stat(self.path).st_mtime_ns
+        if mtime == self._mtime and not force:
+            return False
+        try:
+            # Compiling tens of thousands of rules must not stall the event loop
+            engine = await asyncio.to_thread(
+                load_policy_engine, self.path, defaults=self.defaults, cache_size=self.cache_size
+            )
+        except Exception:
+            self._mtime = mtime  # do not retry the same broken file every tick
+            RATE_LIMIT_POLICY_RELOADS_TOTAL.labels(result="error").inc()
+            raise
+        self._mtime = mtime
+        self.engine = engine
+        RATE_LIMIT_POLICY_RELOADS_TOTAL.labels(result="ok").inc()
+        RATE_LIMIT_POLICY_RULES.set(engine.rule_count)
+        logger.info("loaded %d policy rules from %s", engine.rule_count, self.path)
+        return True
+
+    async def _watch_forever(self) -> None:
+        while True:
+            await asyncio.sleep(self.reload_every_s)
+            try:
+                await self.reload()
+            except Exception:
+                logger.warning("could not reload policies, keeping the old ones", exc_info=True)
+
+    def start(self) -> None:
+        if self._watcher is None and self.reload_every_s > 0:
+            self._watcher = asyncio.create_task(self._watch_forever())
+
+    async def aclose(self) -> None:
+        if self._watcher is not None:
+            self._watcher.cancel()
@@ -1,14 +1,20 @@
 from __future__ import annotations
 
+import math
 import time
-from typing import Optional
+from typing import NamedTuple, Optional, Sequence
 
 import redis.asyncio as redis
 
+from app.ratelimit.gcra import GcraState, try_consume_gcra
+from app.ratelimit.scripts import register_script
+from app.ratelimit.token_bucket import BucketConfig, BucketState, try_consume
+
 # Atomic token-bucket in Lua:
 # KEYS[1] = bucket key
 # ARGV: capacity, rate_per_sec, cost, now_s, ttl_sec
 # Returns: {allowed(0/1), remaining_tokens(float), retry_after(float or -1)}
+# Floats are returned as strings: Redis truncates Lua numbers to integer replies.
 LUA_TOKEN_BUCKET = r"""
 local key = KEYS[1]
 local capacity = tonumber(ARGV[1])
@@ -17,15 +23,9 @@ local cost = tonumber(ARGV[3])
 local now = tonumber(ARGV[4])
 local ttl = tonumber(ARGV[5])
 
-local function persist(tokens, last)
-  redis.call('HSET', key, 'tokens', tokens, 'last', last)
-  if ttl ~= nil and ttl > 0 then
-    redis.call('EXPIRE', key, ttl)
-  end
-end
-
-local tokens = tonumber(redis.call('HGET', key, 'tokens'))
-local last = tonumber(redis.call('HGET', key, 'last'))
+local state = redis.call('HMGET', key, 'tokens', 'last')
+local tokens = tonumber(state[1])
+local last = tonumber(state[2])
 
 if tokens == nil or last == nil then
   tokens = capacity
@@ -37,24 +37,392 @@ if now > last then
   tokens = math.min(capacity, tokens + elapsed * rate)
 end
 
+-- Probes, impossible requests and denials write nothing: the refilled balance
+-- follows from the stored one, so persisting it would change no later decision
+if cost == 0 then
+  return {1, tostring(tokens), 0}
+end
+
 if cost > capacity then
-  -- impossible request, still write back refilled state
-  persist(tokens, now)
-  return {0, tokens, -1}
+  return {0, tostring(tokens), -1}
 end
 
 if tokens + 1e-12 >= cost then
   tokens = tokens - cost
-  persist(tokens, now)
-  return {1, tokens, 0}
-else
-  local needed = cost - tokens
-  local retry_after = needed / rate
-  persist(tokens, now)
-  return {0, tokens, retry_after}
+  redis.call('HSET', key, 'tokens', tokens, 'last', now)
+  if ttl ~= nil and ttl > 0 then
+    redis.call('EXPIRE', key, ttl)
+  end
+  return {1, tostring(tokens), 0}
+end
+
+return {0, tostring(tokens), tostring((cost - tokens) / rate)}
+"""
+
+TOKEN_BUCKET_SCRIPT = register_script("token_bucket", LUA_TOKEN_BUCKET)
+
+# Same decision as GCRA (see gcra.py) on ONE string value: the theoretical arrival
+# time. A denial writes nothing; an allowed call is a single SET ... PX whose
+# expiry is the moment the bucket is full again, so idle keys vanish by themselves.
+# KEYS[1] = bucket key
+# ARGV: capacity, rate_per_sec, cost, now_s
+# Returns: same as LUA_TOKEN_BUCKET
+LUA_GCRA = r"""
+local key = KEYS[1]
+local capacity = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local cost = tonumber(ARGV[3])
+local now = tonumber(ARGV[4])
+
+local tat = tonumber(redis.call('GET', key))
+if tat == nil or tat < now then
+  tat = now
+end
+local tokens = math.max(0, capacity - (tat - now) * rate)
+
+if cost == 0 then
+  return {1, tostring(tokens), 0}
+end
+
+if cost > capacity then
+  return {0, tostring(tokens), -1}
+end
+
+if tokens + 1e-12 >= cost then
+  local new_tat = tat + cost / rate
+  redis.call('SET', key, new_tat, 'PX', math.max(1, math.ceil((new_tat - now) * 1000)))
+  return {1, tostring(math.max(0, tokens - cost)), 0}
+end
+
+return {0, tostring(tokens), tostring((cost - tokens) / rate)}
+"""
+
+GCRA_SCRIPT = register_script("gcra", LUA_GCRA)
+
+# All-or-nothing token buckets (user + org + global...): every bucket is refilled
+# and checked first, and the costs are deducted from all of them only if each one
+# has room. A denial writes nothing. A key listed twice sees the earlier deduction.
+# KEYS = bucket keys, in limit order
+# ARGV: now_s, ttl_sec, then capacity, rate_per_sec, cost for each key
+# Returns: {allowed, remaining_tokens, retry_after} per key, as LUA_TOKEN_BUCKET.
+# `allowed` is whether that limit had room; remaining_tokens is after the
+# deduction if everything passed, else the unchanged balance.
+LUA_MULTI_TOKEN_BUCKET = r"""
+local now = tonumber(ARGV[1])
+local ttl = tonumber(ARGV[2])
+
+local balance = {}
+local before = {}
+local ok = {}
+local retry = {}
+local all_ok = true
+
+for i, key in ipairs(KEYS) do
+  local capacity = tonumber(ARGV[3 * i])
+  local rate = tonumber(ARGV[3 * i + 1])
+  local cost = tonumber(ARGV[3 * i + 2])
+
+  local tokens = balance[key]
+  if tokens == nil then
+    local state = redis.call('HMGET', key, 'tokens', 'last')
+    tokens = tonumber(state[1])
+    local last = tonumber(state[2])
+    if tokens == nil or last == nil then
+      tokens = capacity
+      last = now
+    end
+    if now > last then
+      tokens = math.min(capacity, tokens + (now - last) * rate)
+    end
+  end
+
+  before[i] = tokens
+  if cost > capacity then
+    ok[i] = 0
+    retry[i] = -1
+  elseif tokens + 1e-12 >= cost then
+    ok[i] = 1
+    retry[i] = 0
+    tokens = math.max(0, tokens - cost)
+  else
+    ok[i] = 0
+    retry[i] = tostring((cost - tokens) / rate)
+  end
+  if ok[i] == 0 then
+    all_ok = false
+  end
+  balance[key] = tokens
+end
+
+if all_ok then
+  for key, tokens in pairs(balance) do
+    redis.call('HSET', key, 'tokens', tokens, 'last', now)
+    if ttl ~= nil and ttl > 0 then
+      redis.call('EXPIRE', key, ttl)
+    end
+  end
+end
+
+local out = {}
+for i, key in ipairs(KEYS) do
+  local remaining = before[i]
+  if all_ok then
+    remaining = before[i] - tonumber(ARGV[3 * i + 2])
+    if remaining < 0 then
+      remaining = 0
+    end
+  end
+  out[#out + 1] = ok[i]
+  out[#out + 1] = tostring(remaining)
+  out[#out + 1] = retry[i]
+end
+return out
+"""
+
+MULTI_TOKEN_BUCKET_SCRIPT = register_script("multi_token_bucket", LUA_MULTI_TOKEN_BUCKET)
+
+# LUA_MULTI_TOKEN_BUCKET for GCRA keys: same arguments (the TTL is ignored, keys
+# expire when full again) and the same reply.
+LUA_MULTI_GCRA = r"""
+local now = tonumber(ARGV[1])
+
+local tats = {}
+local dirty = {}
+local before = {}
+local ok = {}
+local retry = {}
+local all_ok = true
+
+for i, key in ipairs(KEYS) do
+  local capacity = tonumber(ARGV[3 * i])
+  local rate = tonumber(ARGV[3 * i + 1])
+  local cost = tonumber(ARGV[3 * i + 2])
+
+  local tat = tats[key]
+  if tat == nil then
+    tat = tonumber(redis.call('GET', key))
+    if tat == nil or tat < now then
+      tat = now
+    end
+  end
+  local tokens = math.max(0, capacity - (tat - now) * rate)
+
+  before[i] = tokens
+  if cost == 0 then
+    ok[i] = 1
+    retry[i] = 0
+  elseif cost > capacity then
+    ok[i] = 0
+    retry[i] = -1
+  elseif tokens + 1e-12 >= cost then
+    ok[i] = 1
+    retry[i] = 0
+    tat = tat + cost / rate
+    dirty[key] = true
+  else
+    ok[i] = 0
+    retry[i] = tostring((cost - tokens) / rate)
+  end
+  if ok[i] == 0 then
+    all_ok = false
+  end
+  tats[key] = tat
 end
+
+if all_ok then
+  for key in pairs(dirty) do
+    local tat = tats[key]
+    redis.call('SET', key, tat, 'PX', math.max(1, math.ceil((tat - now) * 1000)))
+  end
+end
+
+local out = {}
+for i, key in ipairs(KEYS) do
+  local remaining = before[i]
+  if all_ok and ok[i] == 1 then
+    remaining = math.max(0, before[i] - tonumber(ARGV[3 * i + 2]))
+  end
+  out[#out + 1] = ok[i]
+  out[#out + 1] = tostring(remaining)
+  out[#out + 1] = retry[i]
+end
+return out
 """
 
+MULTI_GCRA_SCRIPT = register_script("multi_gcra", LUA_MULTI_GCRA)
+
+# Compact token-bucket storage ("token_bucket_compact"): same decisions as
+# LUA_TOKEN_BUCKET, with the hash fields t = balance in micro-tokens and
+# l = refill time in ms, both integers. A missing key is a full bucket: every key
+# expires when it would be full again (BUCKET_KEY_TTL_SEC does not apply), and
+# nothing is stored for a bucket left full. Denials, probes (cost 0) and impossible
+# requests write nothing. Keys in the tokens/last format are read too (the newer
+# state wins) and rewritten compactly on their next write.
+LUA_COMPACT_STATE = r"""
+local SCALE = 1000000
+
+local function load_state(key)
+  local s = redis.call('HMGET', key, 't', 'l', 'tokens', 'last')
+  local tokens, last = nil, nil
+  if s[1] and s[2] then
+    tokens = tonumber(s[1]) / SCALE
+    last = tonumber(s[2])
+  end
+  if s[3] and s[4] and (last == nil or tonumber(s[4]) * 1000 > last) then
+    tokens = tonumber(s[3])
+    last = tonumber(s[4]) * 1000
+  end
+  return tokens, last, s[3] ~= false
+end
+
+local function store(key, tokens, capacity, rate, now_ms, legacy)
+  local t = math.floor(tokens * SCALE)
+  local missing = capacity * SCALE - t
+  if missing <= 0 then
+    redis.call('DEL', key)
+    return
+  end
+  redis.call('HSET', key, 't', string.format('%d', t), 'l', string.format('%d', now_ms))
+  if legacy then
+    redis.call('HDEL', key, 'tokens', 'last')
+  end
+  redis.call('PEXPIRE', key, math.ceil(missing / SCALE / rate * 1000))
+end
+"""
+
+# KEYS[1] = bucket key
+# ARGV: capacity, rate_per_sec, cost, now_s
+# Returns: same as LUA_TOKEN_BUCKET
+LUA_COMPACT_TOKEN_BUCKET = (
+    LUA_COMPACT_STATE
+    + r"""
+local key = KEYS[1]
+local capacity = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local cost = tonumber(ARGV[3])
+local now_ms = math.floor(tonumber(ARGV[4]) * 1000)
+
+local tokens, last, legacy = load_state(key)
+if tokens == nil then
+  tokens = capacity
+  last = now_ms
+end
+if now_ms > last then
+  tokens = math.min(capacity, tokens + (now_ms - last) / 1000 * rate)
+end
+
+if cost > capacity then
+  return {0, tostring(tokens), -1}
+end
+if cost == 0 then
+  return {1, tostring(tokens), 0}
+end
+if tokens + 1e-12 >= cost then
+  tokens = math.max(0, tokens - cost)
+  store(key, tokens, capacity, rate, now_ms, legacy)
+  return {1, tostring(tokens), 0}
+end
+return {0, tostring(tokens), tostring((cost - tokens) / rate)}
+"""
+)
+
+COMPACT_TOKEN_BUCKET_SCRIPT = register_script("compact_token_bucket", LUA_COMPACT_TOKEN_BUCKET)
+
+# LUA_MULTI_TOKEN_BUCKET on compact keys: same arguments (the TTL is ignored) and reply
+LUA_MULTI_COMPACT_TOKEN_BUCKET = (
+    LUA_COMPACT_STATE
+    + r"""
+local now_ms = math.floor(tonumber(ARGV[1]) * 1000)
+
+local balance = {}
+local legacy = {}
+local limits = {}
+local dirty = {}
+local before = {}
+local ok = {}
+local retry = {}
+local all_ok = true
+
+for i, key in ipairs(KEYS) do
+  local capacity = tonumber(ARGV[3 * i])
+  local rate = tonumber(ARGV[3 * i + 1])
+  local cost = tonumber(ARGV[3 * i + 2])
+
+  local tokens = balance[key]
+  if tokens == nil then
+    local last
+    tokens, last, legacy[key] = load_state(key)
+    if tokens == nil then
+      tokens = capacity
+      last = now_ms
+    end
+    if now_ms > last then
+      tokens = math.min(capacity, tokens + (now_ms - last) / 1000 * rate)
+    end
+  end
+
+  before[i] = tokens
+  if cost > capacity then
+    ok[i] = 0
+    retry[i] = -1
+  elseif tokens + 1e-12 >= cost then
+    ok[i] = 1
+    retry[i] = 0
+    if cost > 0 then
+      tokens = math.max(0, tokens - cost)
+      dirty[key] = true
+      limits[key] = {capacity, rate}
+    end
+  else
+    ok[i] = 0
+    retry[i] = tostring((cost - tokens) / rate)
+  end
+  if ok[i] == 0 then
+    all_ok = false
+  end
+  balance[key] = tokens
+end
+
+if all_ok then
+  for key in pairs(dirty) do
+    store(key, balance[key], limits[key][1], limits[key][2], now_ms, legacy[key])
+  end
+end
+
+local out = {}
+for i, key in ipairs(KEYS) do
+  local remaining = before[i]
+  if all_ok then
+    remaining = math.max(0, before[i] - tonumber(ARGV[3 * i + 2]))
+  end
+  out[#out + 1] = ok[i]
+  out[#out + 1] = tostring(remaining)
+  out[#out + 1] = retry[i]
+end
+return out
+"""
+)
+
+MULTI_COMPACT_TOKEN_BUCKET_SCRIPT = register_script(
+    "multi_compact_token_bucket", LUA_MULTI_COMPACT_TOKEN_BUCKET
+)
+
+ALGORITHMS = ("token_bucket", "gcra", "token_bucket_compact")
+# GCRA keeps a different value type under its own key namespace, so switching
+# RATE_LIMIT_ALGORITHM starts from full buckets instead of hitting WRONGTYPE
+GCRA_KEY_INFIX = "gcra:"
+
+SCRIPTS = {
+    "token_bucket": TOKEN_BUCKET_SCRIPT,
+    "gcra": GCRA_SCRIPT,
+    "token_bucket_compact": COMPACT_TOKEN_BUCKET_SCRIPT,
+}
+MULTI_SCRIPTS = {
+    "token_bucket": MULTI_TOKEN_BUCKET_SCRIPT,
+    "gcra": MULTI_GCRA_SCRIPT,
+    "token_bucket_compact": MULTI_COMPACT_TOKEN_BUCKET_SCRIPT,
+}
+
 
 class Decision:
     def __init__(self, allowed: bool, remaining_tokens: float, retry_after_s: Optional[float]):
@@ -63,6 +431,15 @@ class Decision:
         self.retry_after_s = retry_after_s
 
 
+class BucketRequest(NamedTuple):
+    """One decision in a batch (see `try_consume_redis_many`)."""
+
+    key: str
+    capacity: float
+    refill_rate_per_sec: float
+    cost: float
+
+
 async def try_consume_redis(
     r: "redis.Redis",
     key: str,
@@ -73,23 +450,151 @@ async def try_consume_redis(
     ttl_sec: int,
     now_s: Optional[float] = None,
     prefix: str = "bucket:",
+    algorithm: str = "token_bucket",
 ) -> Decision:
     if now_s is None:
         now_s = time.time()
-    redis_key = f"{prefix}{key}"
-
-    # eval <script> numkeys key argv...
-    res = await r.eval(
-        LUA_TOKEN_BUCKET,
-        1,
-        redis_key,
-        str(capacity),
-        str(refill_rate_per_sec),
-        str(cost),
-        str(now_s),
-        str(ttl_sec),
+    q = BucketRequest(key, capacity, refill_rate_per_sec, cost)
+
+    # evalsha <sha> numkeys key argv... (redis-py encodes int/float args itself)
+    res = await SCRIPTS[algorithm](r, *_script_call(q, now_s, ttl_sec, prefix, algorithm))
+
+    return _to_decision(res)
+
+
+async def try_consume_redis_many(
+    r: "redis.Redis",
+    requests: Sequence[BucketRequest],
+    *,
+    ttl_sec: int,
+    now_s: Optional[float] = None,
+    prefix: str = "bucket:",
+    algorithm: str = "token_bucket",
+) -> list[Decision]:
+    """
+    Decide every request in ONE Redis round trip (pipelined EVALSHA).
+
+    Each item is still its own atomic script call, applied in order, so repeated
+    keys in a batch see each other's consumption. Items are independent: a denied
+    item does not roll back the others.
+    """
+    if not requests:
+        return []
+    if now_s is None:
+        now_s = time.time()
+
+    results = await SCRIPTS[algorithm].many(
+        r, [_script_call(q, now_s, ttl_sec, prefix, algorithm) for q in requests]
     )
+    return [_to_decision(res) for res in results]
+
+
+async def try_consume_redis_all(
+    r: "redis.Redis",
+    requests: Sequence[BucketRequest],
+    *,
+    ttl_sec: int,
+    now_s: Optional[float] = None,
+    prefix: str = "bucket:",
+    algorithm: str = "token_bucket",
+) -> list[Decision]:
+    """
+    Decide nested limits (e.g. user, org, global) together, atomically, in ONE
+    script call: the costs are taken from every bucket or from none.
+
+    Returns one Decision per request. The call is allowed iff every decision is;
+    on a denial no bucket changes, and the decisions that had room report their
+    untouched balance. All keys must live on the same Redis node (in Cluster
+    mode: share a hash tag, see `sharding.hash_tag`).
+    """
+    if not requests:
+        return []
+    if now_s is None:
+        now_s = time.time()
+
+    keys = [redis_key(prefix, q.key, algorithm) for q in requests]
+    args: list = [now_s, ttl_sec]
+    for q in requests:
+        args += (q.capacity, q.refill_rate_per_sec, q.cost)
+    res = await MULTI_SCRIPTS[algorithm](r, keys, args)
+    return [_to_decision(res[i : i + 3]) for i in range(0, len(res), 3)]
+
+
+async def peek_redis_many(
+    r: "redis.Redis",
+    requests: Sequence[BucketRequest],
+    *,
+    now_s: Optional[float] = None,
+    prefix: str = "bucket:",
+    algorithm: str = "token_bucket",
+) -> list[Decision]:
+    """
+    What `try_consume_redis_many` would answer, without changing any bucket.
+
+    Plain reads in one pipeline (no script), so any replica can serve them; the
+    decision is made here by the pure functions the scripts mirror. A cost of 0
+    reports the current balance.
+    """
+    if not requests:
+        return []
+    if now_s is None:
+        now_s = time.time()
+    if algorithm == "token_bucket_compact":
+        now_s = math.floor(now_s * 1000) / 1000  # the script's clock has ms resolution
+
+    async with r.pipeline(transaction=False) as pipe:
+        for q in requests:
+            key = redis_key(prefix, q.key, algorithm)
+            if algorithm == "gcra":
+                pipe.get(key)
+            else:
+                pipe.hmget(key, "tokens", "last", "t", "l")
+        replies = await pipe.execute()
+
+    decisions = []
+    for q, reply in zip(requests, replies):
+        config = BucketConfig(q.capacity, q.refill_rate_per_sec)
+        if algorithm == "gcra":
+            state = GcraState(float(reply)) if reply is not None else None
+            d, _ = try_consume_gcra(config, state, q.cost, now_s)
+        else:
+            d, _ = try_consume(config, _stored_state(reply, q, now_s, algorithm), q.cost, now_s)
+        decisions.append(Decision(d.allowed, d.remaining_tokens, d.retry_after_s))
+    return decisions
+
+
+def _stored_state(reply, q: BucketRequest, now_s: float, algorithm: str) -> BucketState:
+    tokens, last, t, ms = reply
+    state = None
+    if tokens is not None and last is not None:
+        state = BucketState(max(0.0, float(tokens)), float(last))
+    if algorithm == "token_bucket_compact" and t is not None and ms is not None:
+        # The newer of the two formats, as LUA_COMPACT_STATE picks it
+        if state is None or int(ms) / 1000 >= state.last_refill_ts:
+            state = BucketState(int(t) / 1_000_000, int(ms) / 1000)
+    return state if state is not None else BucketState(q.capacity, now_s)
+
+
+def redis_key(prefix: str, key: str, algorithm: str = "token_bucket") -> str:
+    """Redis key holding the bucket state of `key` for `algorithm`."""
+    if algorithm == "gcra":
+        return f"{prefix}{GCRA_KEY_INFIX}{key}"
+    return f"{prefix}{key}"
+
+
+def _script_call(q: BucketRequest, now_s: float, ttl_sec: int, prefix: str, algorithm: str):
+    if algorithm != "token_bucket":
+        # No TTL argument: the key expires when the bucket is full again
+        return (redis_key(prefix, q.key, algorithm),), (
+            q.capacity,
+            q.refill_rate_per_sec,
+            q.cost,
+            now_s,
+        )
+    return (redis_key(prefix, q.key),), (q.capacity, q.refill_rate_per_sec, q.cost, now_s, ttl_sec)
+
 
+def _to_decision(res) -> Decision:
     # res is [allowed_int, remaining, retry_after]
     allowed_int, remaining, retry_after = res
     if isinstance(allowed_int, str):
@@ -0,0 +1,101 @@
+from __future__ import annotations
+
+import hashlib
+from typing import Sequence
+
+import redis.asyncio as redis
+from redis.exceptions import NoScriptError
+
+from app.core import stages
+from app.core.config import settings
+from app.metrics import RATE_LIMIT_SCRIPT_RELOADS_TOTAL, monotonic_s
+
+
+class LuaScript:
+    """
+    A Lua script invoked by SHA1 (EVALSHA) instead of shipping its source per call.
+
+    The SHA is computed locally, so calls never depend on a prior SCRIPT LOAD having
+    succeeded: if Redis answers NOSCRIPT (restart, failover, SCRIPT FLUSH) the source
+    is loaded once and the call is retried.
+    """
+
+    def __init__(self, name: str, source: str):
+        self.name = name
+        self.source = source
+        self.sha = hashlib.sha1(source.encode("utf-8")).hexdigest()
+
+    async def load(self, r: "redis.Redis") -> str:
+        return await r.script_load(self.source)
+
+    async def __call__(self, r: "redis.Redis", keys: Sequence[str], args: Sequence):
+        if settings.STAGE_TIMING_ENABLED:
+            start = monotonic_s()
+            try:
+                return await self._call(r, keys, args)
+            finally:
+                stages.observe("redis", monotonic_s() - start)
+        return await self._call(r, keys, args)
+
+    async def _call(self, r: "redis.Redis", keys: Sequence[str], args: Sequence):
+        try:
+            return await r.evalsha(self.sha, len(keys), *keys, *args)
+        except NoScriptError:
+            RATE_LIMIT_SCRIPT_RELOADS_TOTAL.labels(script=self.name).inc()
+            await self.load(r)
+            return await r.evalsha(self.sha, len(keys), *keys, *args)
+
+    async def many(self, r: "redis.Redis", calls: Sequence[tuple[Sequence[str], Sequence]]) -> list:
+        """
+        Run one EVALSHA per (keys, args) pair in a single non-transactional pipeline,
+        i.e. one round trip. Calls that hit NOSCRIPT are retried (once) after a reload;
+        any other error is raised.
+        """
+        results = await self._pipeline(r, calls)
+        missing = [i for i, res in enumerate(results) if isinstance(res, NoScriptError)]
+        if missing:
+            RATE_LIMIT_SCRIPT_RELOADS_TOTAL.labels(script=self.name).inc()
+            await self.load(r)
+            retried = await self._pipeline(r, [calls[i] for i in missing])
+            for i, res in zip(missing, retried):
+                results[i] = res
+
+        for res in results:
+            if isinstance(res, Exception):
+                raise res
+        return results
+
+    async def _pipeline(self, r: "redis.Redis", calls) -> list:
+        if settings.STAGE_TIMING_ENABLED:
+            start = monotonic_s()
+            try:
+                return await self._send_pipeline(r, calls)
+            finally:
+                stages.observe("redis", monotonic_s() - start)
+        return await self._send_pipeline(r, calls)
+
+    async def _send_pipeline(self, r: "redis.Redis", calls) -> list:
+        async with r.pipeline(transaction=False) as pipe:
+            for keys, args in calls:
+                pipe.evalsha(self.sha, len(keys), *keys, *args)
+            return await pipe.execute(raise_on_error=False)
+
+
+_REGISTRY: dict[str, LuaScript] = {}
+
+
+def register_script(name: str, source: str) -> LuaScript:
+    """Register a script so `load_scripts` preloads it at startup."""
+    script = LuaScript(name, source)
+    _REGISTRY[name] = script
+    return script
+
+
+def registered_scripts() -> list[LuaScript]:
+    return list(_REGISTRY.values())
+
+
+async def load_scripts(r: "redis.Redis") -> None:
+    """SCRIPT LOAD every registered script (idempotent; called from the app lifespan)."""
+    for script in _REGISTRY.values():
+        await script.load(r)
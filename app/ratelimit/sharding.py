@@ -0,0 +1,228 @@
+from __future__ import annotations
+
+import asyncio
+import bisect
+import hashlib
+from typing import Iterable, Mapping, Sequence
+
+import redis.asyncio as redis
+
+from app.metrics import (
+    RATE_LIMIT_SHARD_DECISIONS_TOTAL,
+    RATE_LIMIT_SHARD_KEYS,
+    RATE_LIMIT_SHARD_LATENCY_SECONDS,
+    monotonic_s,
+)
+from app.ratelimit.redis_bucket import (
+    BucketRequest,
+    Decision,
+    peek_redis_many,
+    try_consume_redis,
+    try_consume_redis_all,
+    try_consume_redis_many,
+)
+
+
+def hash_tag(key: str) -> str:
+    """
+    Redis Cluster hash-tag rule: if the key contains "{...}" with a non-empty body,
+    only that body is hashed, so related keys ("{org1}:user:7", "{org1}:global")
+    land on the same shard and can be used together by one multi-key script.
+    """
+    start = key.find("{")
+    if start != -1:
+        end = key.find("}", start + 1)
+        if end > start + 1:
+            return key[start + 1 : end]
+    return key
+
+
+def _hash64(data: str) -> int:
+    return int.from_bytes(hashlib.md5(data.encode("utf-8")).digest()[:8], "big")
+
+
+class HashRing:
+    """
+    Consistent-hash ring with virtual nodes.
+
+    Adding or removing a node only moves the keys between it and its ring
+    neighbours (about 1/N of all keys), never reshuffles the rest.
+    """
+
+    def __init__(self, nodes: Iterable[str] = (), vnodes: int = 160):
+        self.vnodes = vnodes
+        self._points: list[int] = []
+        self._owners: list[str] = []
+        self._nodes: set[str] = set()
+        for node in nodes:
+            self.add_node(node)
+
+    @property
+    def nodes(self) -> list[str]:
+        return sorted(self._nodes)
+
+    def add_node(self, node: str) -> None:
+        if node in self._nodes:
+            return
+        self._nodes.add(node)
+        for i in range(self.vnodes):
+            point = _hash64(f"{node}#{i}")
+            idx = bisect.bisect(self._points, point)
+            self._points.insert(idx, point)
+            self._owners.insert(idx, node)
+
+    def remove_node(self, node: str) -> None:
+        if node not in self._nodes:
+            return
+        self._nodes.discard(node)
+        keep = [(p, o) for p, o in zip(self._points, self._owners) if o != node]
+        self._points = [p for p, _ in keep]
+        self._owners = [o for _, o in keep]
+
+    def node_for(self, key: str) -> str:
+        if not self._points:
+            raise LookupError("hash ring has no nodes")
+        idx = bisect.bisect(self._points, _hash64(hash_tag(key)))
+        if idx == len(self._points):
+            idx = 0
+        return self._owners[idx]
+
+
+class ShardedRedisLimiter:
+    """
+    Routes each bucket to one of several independent Redis primaries by consistent
+    hashing of its key (hash tags respected). Batches are split per shard and the
+    per-shard pipelines run concurrently, so a batch still costs one RTT.
+    """
+
+    def __init__(
+        self,
+        shards: Mapping[str, "redis.Redis"],
+        *,
+        ttl_sec: int,
+        prefix: str,
+        vnodes: int = 160,
+        algorithm: str = "token_bucket",
+    ):
+        if not shards:
+            raise ValueError("at least one shard is required")
+        self.shards = dict(shards)
+        self.ring = HashRing(self.shards, vnodes=vnodes)
+        self.ttl_sec = ttl_sec
+        self.prefix = prefix
+        self.algorithm = algorithm
+
+    def shard_for(self, key: str) -> str:
+        return self.ring.node_for(key)
+
+    async def consume(self, q: BucketRequest) -> Decision:
+        shard = self.shard_for(q.key)
+        start = monotonic_s()
+        try:
+            return await try_consume_redis(
+                self.shards[shard],
+                q.key,
+                capacity=q.capacity,
+                refill_rate_per_sec=q.refill_rate_per_sec,
+                cost=q.cost,
+                ttl_sec=self.ttl_sec,
+                prefix=self.prefix,
+                algorithm=self.algorithm,
+            )
+        finally:
+            RATE_LIMIT_SHARD_LATENCY_SECONDS.labels(shard=shard).observe(monotonic_s() - start)
+            RATE_LIMIT_SHARD_DECISIONS_TOTAL.labels(shard=shard).inc()
+
+    async def consume_many(self, qs: Sequence[BucketRequest]) -> list[Decision]:
+        async def run(shard: str, shard_qs: list[BucketRequest]) -> list[Decision]:
+            start = monotonic_s()
+            try:
+                return await try_consume_redis_many(
+                    self.shards[shard],
+                    shard_qs,
+                    ttl_sec=self.ttl_sec,
+                    prefix=self.prefix,
+                    algorithm=self.algorithm,
+                )
+            finally:
+                RATE_LIMIT_SHARD_LATENCY_SECONDS.labels(shard=shard).observe(monotonic_s() - start)
+                RATE_LIMIT_SHARD_DECISIONS_TOTAL.labels(shard=shard).inc(len(shard_qs))
+
+        return await self._per_shard(qs, run)
+
+    async def peek_many(self, qs: Sequence[BucketRequest]) -> list[Decision]:
+        async def run(shard: str, shard_qs: list[BucketRequest]) -> list[Decision]:
+            return await peek_redis_many(
+                self.shards[shard], shard_qs, prefix=self.prefix, algorithm=self.algorithm
+            )
+
+        return await self._per_shard(qs, run)
+
+    async def _per_shard(self, qs: Sequence[BucketRequest], run) -> list[Decision]:
+        groups: dict[str, list[int]] = {}
+        for i, q in enumerate(qs):
+            groups.setdefault(self.shard_for(q.key), []).append(i)
+
+        results = await asyncio.gather(
+            *(run(s, [qs[i] for i in idxs]) for s, idxs in groups.items())
+        )
+        decisions: list[Decision] = [None] * len(qs)  # type: ignore[list-item]
+        for idxs, shard_decisions in zip(groups.values(), results):
+            for i, decision in zip(idxs, shard_decisions):
+                decisions[i] = decision
+        return decisions
+
+    async def consume_all(self, qs: Sequence[BucketRequest]) -> list[Decision]:
+        if not qs:
+            return []
+        # One script on one primary: atomicity across shards is not available
+        shards = {self.shard_for(q.key) for q in qs}
+        if len(shards) > 1:
+            raise ValueError("limits checked together must share a hash tag when sharded")
+        shard = shards.pop()
+        start = monotonic_s()
+        try:
+            return await try_consume_redis_all(
+                self.shards[shard],
+                qs,
+                ttl_sec=self.ttl_sec,
+                prefix=self.prefix,
+                algorithm=self.algorithm,
+            )
+        finally:
+            RATE_LIMIT_SHARD_LATENCY_SECONDS.labels(shard=shard).observe(monotonic_s() - start)
+            RATE_LIMIT_SHARD_DECISIONS_TOTAL.labels(shard=shard).inc(len(qs))
+
+    async def aclose(self) -> None:
+        pass
+
+
+async def bucket_key_count(r: "redis.Redis", prefix: str, samples: int = 1000) -> tuple[int, bool]:
+    """
+    Keys under `prefix` in one database, and whether the count is exact. Up to
+    `samples` keys it is a SCAN; beyond, the share of `samples` RANDOMKEYs under
+    `prefix` times DBSIZE (one pipeline), so a shared Redis is not walked whole.
+    """
+    size = await r.dbsize()
+    if size <= samples:
+        matched = 0
+        async for key in r.scan_iter(match=f"{prefix}*", count=1000):
+            matched += 1
+        return matched, True
+    async with r.pipeline(transaction=False) as pipe:
+        for _ in range(samples):
+            pipe.randomkey()
+        keys = await pipe.execute()
+    matched = sum(1 for k in keys if k is not None and k.startswith(prefix))
+    return round(size * matched / samples), False
+
+
+async def shard_key_counts(
+    shards: Mapping[str, "redis.Redis"], prefix: str, samples: int = 1000
+) -> dict[str, tuple[int, bool]]:
+    """Bucket keys of every shard (also exported as rate_limit_shard_keys)."""
+    names = list(shards)
+    counts = await asyncio.gather(*(bucket_key_count(shards[n], prefix, samples) for n in names))
+    for name, (keys, _) in zip(names, counts):
+        RATE_LIMIT_SHARD_KEYS.labels(shard=name).set(keys)
+    return dict(zip(names, counts))
@@ -0,0 +1,362 @@
+"""
+Offline trace replay / capacity planning for the token bucket.
+
+Replays request traces against one or many (capacity, refill_rate) configs in a
+single pass and reports allow/deny rates and per-key denial histograms. The
+recurrence is evaluated with NumPy, bit-for-bit identical to
+`token_bucket.try_consume` (same float operations in the same order).
+
+Trace formats
+- JSONL: one object per line, {"ts": <epoch s>, "key": "<key>", "cost": <float, default 1>}
+- RLT (compact, columnar, streamable): b"RLT1", then chunks of
+  u32 n | n x f64 ts | n x f64 cost | n x u32 key_id | u32 len | len bytes of
+  "\\n"-joined keys first seen in this chunk (ids are assigned in order of appearance)
+
+CLI
+    python -m app.ratelimit.simulate convert trace.jsonl trace.rlt
+    python -m app.ratelimit.simulate run trace.rlt --capacity 5 10 20 --rate 1 2
+"""
+
+from __future__ import annotations
+
+import argparse
+import itertools
+import json
+import struct
+import sys
+from typing import BinaryIO, Iterator, Sequence
+
+import numpy as np
+
+from app.ratelimit.token_bucket import BucketConfig
+
+RLT_MAGIC = b"RLT1"
+DEFAULT_CHUNK = 1_000_000
+# Waves smaller than this cost more in NumPy call overhead than a scalar loop
+MIN_WAVE = 64
+
+
+class TraceChunk:
+    """A slice of a trace: parallel arrays plus the key names first seen in it."""
+
+    def __init__(self, ts: np.ndarray, cost: np.ndarray, key_id: np.ndarray, new_keys: list[str]):
+        self.ts = ts
+        self.cost = cost
+        self.key_id = key_id
+        self.new_keys = new_keys
+
+
+def iter_jsonl(f, chunk_size: int = DEFAULT_CHUNK) -> Iterator[TraceChunk]:
+    ids: dict[str, int] = {}
+    while True:
+        lines = list(itertools.islice(f, chunk_size))
+        if not lines:
+            return
+        ts, cost, key_id, new_keys = [], [], [], []
+        for line in lines:
+            if not line.strip():
+                continue
+            ev = json.loads(line)
+            key = ev["key"]
+            kid = ids.get(key)
+            if kid is None:
+                kid = ids[key] = len(ids)
+                new_keys.append(key)
+            ts.append(float(ev["ts"]))
+            cost.append(float(ev.get("cost", 1.0)))
+            key_id.append(kid)
+        yield TraceChunk(
+            np.array(ts, dtype=np.float64),
+            np.array(cost, dtype=np.float64),
+            np.array(key_id, dtype=np.uint32),
+            new_keys,
+        )
+
+
+def write_rlt(out: BinaryIO, chunks: Iterator[TraceChunk]) -> int:
+    out.write(RLT_MAGIC)
+    n_events = 0
+    for chunk in chunks:
+        n = len(chunk.ts)
+        keys = "\n".join(chunk.new_keys).encode("utf-8")
+        out.write(struct.pack("<I", n))
+        out.write(chunk.ts.astype("<f8").tobytes())
+        out.write(chunk.cost.astype("<f8").tobytes())
+        out.write(chunk.key_id.astype("<u4").tobytes())
+        out.write(struct.pack("<I", len(keys)))
+        out.write(keys)
+        n_events += n
+    return n_events
+
+
+def iter_rlt(f: BinaryIO) -> Iterator[TraceChunk]:
+    if f.read(4) != RLT_MAGIC:
+        raise ValueError("not an RLT1 trace")
+    while True:
+        header = f.read(4)
+        if not header:
+            return
+        (n,) = struct.unpack("<I", header)
+        ts = np.frombuffer(f.read(8 * n), dtype="<f8")
+        cost = np.frombuffer(f.read(8 * n), dtype="<f8")
+        key_id = np.frombuffer(f.read(4 * n), dtype="<u4")
+        (klen,) = struct.unpack("<I", f.read(4))
+        raw = f.read(klen).decode("utf-8")
+        yield TraceChunk(ts, cost, key_id, raw.split("\n") if raw else [])
+
+
+def open_trace(path: str, chunk_size: int = DEFAULT_CHUNK) -> Iterator[TraceChunk]:
+    with open(path, "rb") as f:
+        if f.read(4) == RLT_MAGIC:
+            f.seek(0)
+            yield from iter_rlt(f)
+            return
+    with open(path, "r", encoding="utf-8") as f:
+        yield from iter_jsonl(f, chunk_size)
+
+
+class SweepSimulator:
+    """
+    Token-bucket replay for C configs at once.
+
+    State is struct-of-arrays: tokens[K, C] per key and config, last[K] per key
+    (the refill timestamp does not depend on the config). Each chunk is split into
+    "waves" in which every key occurs at most once; waves run in order, and within
+    a wave all keys and all configs are updated with whole-array operations.
+    Once waves get small (only a few hot keys left in the chunk) the remaining
+    events are replayed per key with a plain scalar loop, which is cheaper than
+    many tiny array operations.
+    """
+
+    def __init__(self, configs: Sequence[BucketConfig]):
+        if not configs:
+            raise ValueError("at least one config is required")
+        self.configs = list(configs)
+        self.cap = np.array([c.capacity for c in configs], dtype=np.float64)
+        self.rate = np.array([c.refill_rate_per_sec for c in configs], dtype=np.float64)
+        n = len(configs)
+        self.keys: list[str] = []
+        self.tokens = np.zeros((0, n), dtype=np.float64)
+        self.last = np.zeros(0, dtype=np.float64)
+        self.seen = np.zeros(0, dtype=bool)
+        self.denials = np.zeros((0, n), dtype=np.int64)
+        self.requests = np.zeros(0, dtype=np.int64)
+        self.allowed = np.zeros(n, dtype=np.int64)
+        self.denied = np.zeros(n, dtype=np.int64)
+        self.impossible = np.zeros(n, dtype=np.int64)
+        self.events = 0
+
+    def _grow(self, n_keys: int) -> None:
+        size = len(self.last)
+        if n_keys <= size:
+            return
+        new = max(n_keys, 2 * size, 1024)
+        c = len(self.configs)
+        self.tokens = np.concatenate([self.tokens, np.zeros((new - size, c))])
+        self.last = np.concatenate([self.last, np.zeros(new - size)])
+        self.seen = np.concatenate([self.seen, np.zeros(new - size, dtype=bool)])
+        self.denials = np.concatenate([self.denials, np.zeros((new - size, c), dtype=np.int64)])
+        self.requests = np.concatenate([self.requests, np.zeros(new - size, dtype=np.int64)])
+
+    def feed(self, chunk: TraceChunk, record: bool = False) -> np.ndarray | None:
+        """
+        Replay one chunk. With record=True, returns allowed[n_events, C] (for
+        verification); otherwise only the aggregates are updated.
+        """
+        self.keys.extend(chunk.new_keys)
+        self._grow(len(self.keys))
+        n = len(chunk.ts)
+        if n == 0:
+            return np.zeros((0, len(self.configs)), dtype=bool) if record else None
+        key_id = chunk.key_id.astype(np.int64)
+        ts = chunk.ts
+        cost = chunk.cost
+
+        # Occurrence rank of each event within its key, in trace order
+        order = np.argsort(key_id, kind="stable")
+        sorted_keys = key_id[order]
+        starts = np.r_[0, np.flatnonzero(np.diff(sorted_keys)) + 1]
+        group_len = np.diff(np.r_[starts, n])
+        rank_sorted = np.arange(n) - np.repeat(starts, group_len)
+        rank = np.empty(n, dtype=np.int64)
+        rank[order] = rank_sorted
+
+        waves = np.argsort(rank, kind="stable")
+        bounds = np.r_[0, np.cumsum(np.bincount(rank))]
+        out = np.zeros((n, len(self.configs)), dtype=bool) if record else None
+
+        w = 0
+        while w < len(bounds) - 1 and bounds[w + 1] - bounds[w] >= MIN_WAVE:
+            ev = waves[bounds[w] : bounds[w + 1]]
+            allowed = self._step(key_id[ev], ts[ev], cost[ev])
+            if record:
+                out[ev] = allowed
+            w += 1
+
+        # The tail is a handful of hot keys: replay each one with a scalar loop
+        rest = waves[bounds[w] :]
+        if len(rest):
+            rest = rest[np.lexsort((rest, key_id[rest]))]
+            split = np.flatnonzero(np.diff(key_id[rest])) + 1
+            for ev in np.split(rest, split):
+                allowed = self._replay_key(int(key_id[ev[0]]), ts[ev], cost[ev])
+                if record:
+                    out[ev] = allowed
+
+        np.add.at(self.requests, key_id, 1)
+        self.events += n
+        return out
+
+    def _step(self, idx: np.ndarray, now: np.ndarray, cost: np.ndarray) -> np.ndarray:
+        cap, rate = self.cap, self.rate
+        tokens = self.tokens[idx]
+        last = self.last[idx]
+
+        # New key: a full bucket stamped at its first request (as in Redis)
+        new = ~self.seen[idx]
+        if new.any():
+            tokens[new] = cap
+            last = np.where(new, now, last)
+            self.seen[idx] = True
+
+        # _refill: only when time moved forward
+        adv = now > last
+        refilled = np.minimum(cap, tokens + (now - last)[:, None] * rate)
+        refilled = np.where((refilled < 0) & (refilled > -1e-12), 0.0, refilled)
+        tokens = np.where(adv[:, None], refilled, tokens)
+        last = np.where(adv, now, last)
+
+        c = cost[:, None]
+        impossible = c > cap
+        ok = (tokens + 1e-12 >= c) & ~impossible
+        tokens = np.where(ok, np.maximum(0.0, tokens - c), tokens)
+
+        self.tokens[idx] = tokens
+        self.last[idx] = last
+
+        denied = ~ok & ~impossible
+        self.allowed += ok.sum(axis=0)
+        self.denied += denied.sum(axis=0)
+        self.impossible += impossible.sum(axis=0)
+        self.denials[idx] += denied
+        return ok
+
+    def _replay_key(self, k: int, ts: np.ndarray, cost: np.ndarray) -> np.ndarray:
+        """Sequential replay of one key's events (same float ops as try_consume)."""
+        ts_l = ts.tolist()
+        cost_l = cost.tolist()
+        out = np.zeros((len(ts_l), len(self.configs)), dtype=bool)
+        last_out = 0.0
+        for j in range(len(self.configs)):
+            cap = float(self.cap[j])
+            rate = float(self.rate[j])
+            tokens = float(self.tokens[k, j])
+            last = float(self.last[k])
+            seen = bool(self.seen[k])
+            allowed_col = out[:, j]
+            n_ok = n_denied = n_impossible = 0
+            for i, (now, c) in enumerate(zip(ts_l, cost_l)):
+                if not seen:
+                    tokens, last, seen = cap, now, True
+                if now > last:
+                    tokens = min(cap, tokens + (now - last) * rate)
+                    last = now
+                if c > cap:
+                    n_impossible += 1
+                elif tokens + 1e-12 >= c:
+                    tokens = max(0.0, tokens - c)
+                    allowed_col[i] = True
+                    n_ok += 1
+                else:
+                    n_denied += 1
+            self.tokens[k, j] = tokens
+            self.allowed[j] += n_ok
+            self.denied[j] += n_denied
+            self.impossible[j] += n_impossible
+            self.denials[k, j] += n_denied
+            last_out = last
+        self.last[k] = last_out
+        self.seen[k] = True
+        return out
+
+    def report(self, top: int = 10) -> dict:
+        n_keys = len(self.keys)
+        denials = self.denials[:n_keys]
+        results = []
+        for j, cfg in enumerate(self.configs):
+            per_key = denials[:, j]
+            # log2 buckets of denials per key: "0", "1", "2-3", "4-7", ...
+            hist: dict[str, int] = {"0": int((per_key == 0).sum())}
+            nz = per_key[per_key > 0]
+            if len(nz):
+                b = np.floor(np.log2(nz)).astype(np.int64)
+                for k, count in enumerate(np.bincount(b)):
+                    if count:
+                        lo, hi = 1 << k, (1 << (k + 1)) - 1
+                        hist[str(lo) if lo == hi else f"{lo}-{hi}"] = int(count)
+            worst = np.argsort(-per_key, kind="stable")[:top]
+            results.append(
+                {
+                    "capacity": cfg.capacity,
+                    "refill_rate_per_sec": cfg.refill_rate_per_sec,
+                    "allowed": int(self.allowed[j]),
+                    "denied": int(self.denied[j]),
+                    "impossible": int(self.impossible[j]),
+                    "deny_rate": float(self.denied[j] + self.impossible[j]) / max(1, self.events),
+                    "keys_with_denials": int((per_key > 0).sum()),
+                    "denials_per_key_histogram": hist,
+                    "top_denied_keys": [
+                        {
+                            "key": self.keys[i],
+                            "denied": int(per_key[i]),
+                            "requests": int(self.requests[i]),
+                        }
+                        for i in worst
+                        if per_key[i] > 0
+                    ],
+                }
+            )
+        return {"events": self.events, "keys": n_keys, "configs": results}
+
+
+def simulate(chunks: Iterator[TraceChunk], configs: Sequence[BucketConfig], top: int = 10) -> dict:
+    sim = SweepSimulator(configs)
+    for chunk in chunks:
+        sim.feed(chunk)
+    return sim.report(top=top)
+
+
+def main(argv: Sequence[str] | None = None) -> int:
+    from app.core.config import settings
+
+    parser = argparse.ArgumentParser(prog="python -m app.ratelimit.simulate")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+
+    conv = sub.add_parser("convert", help="JSONL trace -> compact RLT trace")
+    conv.add_argument("src")
+    conv.add_argument("dst")
+    conv.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK)
+
+    run = sub.add_parser("run", help="replay a trace against a sweep of configs")
+    run.add_argument("trace")
+    run.add_argument("--capacity", type=float, nargs="+", default=[settings.BUCKET_CAPACITY])
+    run.add_argument("--rate", type=float, nargs="+", default=[settings.BUCKET_REFILL_RATE_PER_SEC])
+    run.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK)
+    run.add_argument("--top", type=int, default=10)
+
+    args = parser.parse_args(argv)
+    if args.cmd == "convert":
+        with open(args.src, "r", encoding="utf-8") as src, open(args.dst, "wb") as dst:
+            n = write_rlt(dst, iter_jsonl(src, args.chunk_size))
+        print(json.dumps({"events": n, "output": args.dst}))
+        return 0
+
+    configs = [BucketConfig(c, r) for c, r in itertools.product(args.capacity, args.rate)]
+    report = simulate(open_trace(args.trace, args.chunk_size), configs, top=args.top)
+    json.dump(report, sys.stdout, indent=2)
+    sys.stdout.write("\n")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
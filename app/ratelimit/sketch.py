@@ -0,0 +1,186 @@
+from __future__ import annotations
+
+import ctypes
+import math
+import time
+from array import array
+from typing import Sequence
+
+from app.metrics import RATE_LIMIT_SKETCH_DECISIONS_TOTAL
+from app.ratelimit.redis_bucket import BucketRequest, Decision
+
+_MASK64 = (1 << 64) - 1
+
+
+class CountMinSketch:
+    """
+    Approximate cost spent per key over a sliding window, in fixed memory.
+
+    `depth` rows of `width` float32 counters, for two windows of `window_s`: the
+    current one, and the previous one weighted by the share of it still inside
+    the sliding window. Every key, seen or not, maps to one counter per row;
+    nothing is ever allocated per key, so memory is `8 * width * depth` bytes
+    however many distinct keys arrive.
+
+    Error bound (Cormode and Muthukrishnan): with N the total cost added over the
+    two windows, an estimate is never below the key's (weighted) cost, and
+    exceeds it by more than e/width * N with probability at most e^-depth.
+    Conservative update (raise only the counters at the minimum) keeps the
+    actual error well below that.
+    """
+
+    def __init__(self, *, width: int, depth: int, window_s: float, now_s: float = 0.0):
+        if width < 1 or depth < 1 or window_s <= 0:
+            raise ValueError("width, depth and window_s must be > 0")
+        self.width = width
+        self.depth = depth
+        self.window_s = window_s
+        self._cur = self._zeroed()
+        self._prev = self._zeroed()
+        self._window_start = now_s
+
+    @property
+    def memory_bytes(self) -> int:
+        return 2 * 4 * self.width * self.depth
+
+    @property
+    def epsilon(self) -> float:
+        return math.e / self.width
+
+    @property
+    def delta(self) -> float:
+        return math.exp(-self.depth)
+
+    def _zeroed(self) -> array:
+        return array("f", [0.0]) * (self.width * self.depth)
+
+    @staticmethod
+    def _clear(counters: array) -> None:
+        # In place: a new 16 MB array (the default size) stalls the loop ~10x longer
+        address, length = counters.buffer_info()
+        ctypes.memset(address, 0, length * counters.itemsize)
+
+    def _cells(self, key: str) -> list[int]:
+        # Double hashing off one 64-bit hash (salted per process for str keys)
+        h = hash(key) & _MASK64
+        h1, h2 = h & 0xFFFFFFFF, (h >> 32) | 1
+        w = self.width
+        return [row * w + (h1 + row * h2) % w for row in range(self.depth)]
+
+    def _advance(self, now_s: float) -> float:
+        """Rotate windows as needed; returns the weight of the previous window."""
+        elapsed = now_s - self._window_start
+        if elapsed >= self.window_s:
+            # Two buffers for the sketch's lifetime: the stale one is cleared and reused
+            if elapsed >= 2 * self.window_s:
+                self._clear(self._prev)
+                self._window_start = now_s
+            else:
+                self._prev, self._cur = self._cur, self._prev
+                self._window_start += self.window_s
+            self._clear(self._cur)
+            elapsed = now_s - self._window_start
+        return max(0.0, 1.0 - elapsed / self.window_s)
+
+    def add(self, key: str, cost: float, now_s: float) -> float:
+        """Count `cost` for `key`; returns its estimated cost over the sliding window."""
+        weight = self._advance(now_s)
+        cells = self._cells(key)
+        cur = self._cur
+        current = min([cur[i] for i in cells]) + cost
+        for i in cells:
+            if cur[i] < current:
+                cur[i] = current
+        if weight:
+            prev = self._prev
+            return current + weight * min([prev[i] for i in cells])
+        return current
+
+    def estimate(self, key: str, now_s: float) -> float:
+        weight = self._advance(now_s)
+        cells = self._cells(key)
+        cur, prev = self._cur, self._prev
+        current = min([cur[i] for i in cells])
+        if weight:
+            return current + weight * min([prev[i] for i in cells])
+        return current
+
+
+class SketchLimiter:
+    """
+    First-line filter in front of the exact limiter, for floods of one-off keys.
+
+    Each request adds its cost to a CountMinSketch. A key whose estimated cost over
+    the sliding window stays within `promote_fraction * min(capacity,
+    refill_rate_per_sec * window_s)` could not have emptied its bucket, so it is
+    allowed here without a Redis round trip or a Redis key. Keys above it are
+    promoted: decided by the wrapped limiter, exactly. Since estimates never fall
+    below the real cost, a key really over the threshold is always promoted; keys
+    under it are promoted by mistake only when sketch error lifts them over (which
+    costs a Redis call, not a wrong answer).
+
+    A promoted bucket starts with what it had in Redis (full if new), so a key
+    gets up to its threshold on top of its limit during the window it crosses it.
+    The sketch is per process: with N workers and instances, each allowing its own
+    threshold locally, that is up to (1 + N * promote_fraction) times the limit.
+    Impossible requests (cost > capacity) are denied here too.
+    """
+
+    def __init__(self, inner, sketch: CountMinSketch, *, promote_fraction: float = 0.5):
+        if not 0 < promote_fraction <= 1:
+            raise ValueError("promote_fraction must be in (0, 1]")
+        self.inner = inner
+        self.sketch = sketch
+        self.promote_fraction = promote_fraction
+        self._local = RATE_LIMIT_SKETCH_DECISIONS_TOTAL.labels(path="local")
+        self._promoted = RATE_LIMIT_SKETCH_DECISIONS_TOTAL.labels(path="promoted")
+
+    def _screen(self, q: BucketRequest, now_s: float):
+        """The local decision for `q`, or None when it must go to the inner limiter."""
+        if q.cost > q.capacity:
+            # Impossible whatever the balance: no need to ask
+            spent = self.sketch.estimate(q.key, now_s)
+            return Decision(False, max(0.0, q.capacity - spent), None)
+        spent = self.sketch.add(q.key, q.cost, now_s)
+        threshold = self.promote_fraction * min(
+            q.capacity, q.refill_rate_per_sec * self.sketch.window_s
+        )
+        if spent > threshold:
+            return None
+        return Decision(True, max(0.0, q.capacity - spent), 0.0)
+
+    async def consume(self, q: BucketRequest) -> Decision:
+        decision = self._screen(q, time.time())
+        if decision is not None:
+            self._local.inc()
+            return decision
+        self._promoted.inc()
+        return await self.inner.consume(q)
+
+    async def consume_many(self, qs: Sequence[BucketRequest]) -> list[Decision]:
+        now = time.time()
+        decisions = [self._screen(q, now) for q in qs]
+        promoted = [i for i, d in enumerate(decisions) if d is None]
+        self._local.inc(len(qs) - len(promoted))
+        if promoted:
+            self._promoted.inc(len(promoted))
+            exact = await self.inner.consume_many([qs[i] for i in promoted])
+            for i, decision in zip(promoted, exact):
+                decisions[i] = decision
+        return decisions
+
+    async def consume_all(self, qs: Sequence[BucketRequest]) -> list[Decision]:
+        # All or nothing: one promoted limit sends every limit to the exact limiter
+        now = time.time()
+        decisions = [self._screen(q, now) for q in qs]
+        if all(d is not None for d in decisions):
+            self._local.inc(len(qs))
+            return decisions
+        self._promoted.inc(len(qs))
+        return await self.inner.consume_all(qs)
+
+    async def peek_many(self, qs: Sequence[BucketRequest]) -> list[Decision]:
+        return await self.inner.peek_many(qs)
+
+    async def aclose(self) -> None:
+        await self.inner.aclose()
@@ -0,0 +1,309 @@
+"""
+Snapshot and restore of bucket state, to carry it over to a new Redis.
+
+A snapshot streams every bucket key under the prefix, SCAN batch by SCAN batch:
+each batch is read with one pipeline (HMGET or GET, and PTTL per key) and
+written as one zlib-compressed chunk, so memory stays bounded by the batch size
+whatever the number of keys. Restore replays the chunks with one pipeline each.
+
+File layout (big-endian):
+
+    b"RLSNAP" version:u8
+    chunk*: length:u32 zlib(taken_at:f64 count:u32 record*)
+    end: length 0
+    record: key_len:u16 key kind:u8 v1:f64 v2:f64 pttl_ms:i64
+
+Keys are stored without the prefix, so a restore may use another prefix, and
+routed by the hash ring when restoring into shards. `kind` is the storage format:
+- hash: v1 = tokens, v2 = last refill (s)
+- compact: v1 = t (micro-tokens), v2 = l (ms)
+- gcra: v1 = theoretical arrival time (s)
+
+`taken_at` is when the chunk was read. By default a restore rebases every
+timestamp and keeps every remaining TTL, as if no time had passed since then:
+each bucket continues from the balance it had, instead of refilling over the
+time the copy took. With rebase off, timestamps are kept and the TTLs shortened
+by that time (keys that would have expired are skipped), as if the data had
+stayed in Redis.
+
+CLI (uses REDIS_URL / REDIS_SHARD_URLS and REDIS_KEY_PREFIX)
+    python -m app.ratelimit.snapshot save --out FILE|-
+    REDIS_URL=redis://new:6379/0 python -m app.ratelimit.snapshot restore --in FILE|- [--no-rebase]
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import struct
+import sys
+import time
+import zlib
+from typing import AsyncIterable, AsyncIterator, Iterable, Mapping, Optional, Sequence
+
+import redis.asyncio as redis
+from redis.exceptions import ResponseError
+
+from app.ratelimit.redis_bucket import GCRA_KEY_INFIX
+from app.ratelimit.sharding import HashRing
+
+MAGIC = b"RLSNAP"
+VERSION = 1
+HEADER = MAGIC + bytes([VERSION])
+# Chunks above this are rejected on restore: a corrupt length must not allocate GBs
+MAX_CHUNK_BYTES = 64 * 1024 * 1024
+
+KIND_HASH, KIND_COMPACT, KIND_GCRA = 0, 1, 2
+
+_LEN = struct.Struct(">I")
+_CHUNK_HEAD = struct.Struct(">dI")
+_KEY_LEN = struct.Struct(">H")
+_RECORD = struct.Struct(">Bddq")
+
+
+class SnapshotError(ValueError):
+    """Not a snapshot, an unknown version, or a truncated one."""
+
+
+async def snapshot_chunks(
+    clients: Iterable["redis.Redis"],
+    prefix: str,
+    *,
+    batch: int = 5000,
+    stats: Optional[dict] = None,
+) -> AsyncIterator[bytes]:
+    """
+    The snapshot of every bucket under `prefix` in `clients`, as byte strings to
+    write out in order. `stats`, if given, gets the keys, chunks and bytes written.
+    """
+    if stats is None:
+        stats = {}
+    stats.update(keys=0, chunks=0, bytes=len(HEADER) + _LEN.size)
+    gcra_prefix = prefix + GCRA_KEY_INFIX
+    yield HEADER
+    for r in clients:
+        cursor = 0
+        while True:
+            cursor, keys = await r.scan(cursor, match=f"{prefix}*", count=batch)
+            if keys:
+                taken_at = time.time()
+                async with r.pipeline(transaction=False) as pipe:
+                    for key in keys:
+                        if key.startswith(gcra_prefix):
+                            pipe.get(key)
+                        else:
+                            pipe.hmget(key, "tokens", "last", "t", "l")
+                        pipe.pttl(key)
+                    replies = await pipe.execute(raise_on_error=False)
+                count, payload = _encode(keys, replies, prefix, gcra_prefix)
+                if count:
+                    body = zlib.compress(_CHUNK_HEAD.pack(taken_at, count) + payload, 1)
+                    stats["keys"] += count
+                    stats["chunks"] += 1
+                    stats["bytes"] += _LEN.size + len(body)
+                    yield _LEN.pack(len(body)) + body
+            if cursor == 0:
+                break
+    yield _LEN.pack(0)
+
+
+def _encode(keys: Sequence[str], replies: list, prefix: str, gcra_prefix: str):
+    out = bytearray()
+    count = 0
+    skip = len(prefix)
+    for i, key in enumerate(keys):
+        value, pttl = replies[2 * i], replies[2 * i + 1]
+        if isinstance(value, ResponseError) or isinstance(pttl, ResponseError) or pttl == -2:
+            continue  # not a bucket (wrong type), or expired since the SCAN
+        if key.startswith(gcra_prefix):
+            if value is None:
+                continue
+            kind, v1, v2, name = KIND_GCRA, float(value), 0.0, key[len(gcra_prefix) :]
+        else:
+            tokens, last, t, ms = value
+            if t is not None and ms is not None and (last is None or int(ms) / 1000 >= float(last)):
+                # Both formats during a rolling switch: the newer one, as LUA_COMPACT_STATE
+                kind, v1, v2 = KIND_COMPACT, float(t), float(ms)
+            elif tokens is not None and last is not None:
+                kind, v1, v2 = KIND_HASH, float(tokens), float(last)
+            else:
+                continue
+            name = key[skip:]
+        encoded = name.encode("utf-8")
+        if len(encoded) > 0xFFFF:
+            continue
+        out += _KEY_LEN.pack(len(encoded))
+        out += encoded
+        out += _RECORD.pack(kind, v1, v2, pttl)
+        count += 1
+    return count, bytes(out)
+
+
+def _decode(body: bytes):
+    """(taken_at, [(key, kind, v1, v2, pttl_ms)]) of one chunk body."""
+    try:
+        data = zlib.decompress(body)
+        taken_at, count = _CHUNK_HEAD.unpack_from(data)
+        records = []
+        pos = _CHUNK_HEAD.size
+        for _ in range(count):
+            (n,) = _KEY_LEN.unpack_from(data, pos)
+            pos += _KEY_LEN.size
+            key = data[pos : pos + n].decode("utf-8")
+            pos += n
+            records.append((key, *_RECORD.unpack_from(data, pos)))
+            pos += _RECORD.size
+    except (zlib.error, struct.error, UnicodeDecodeError) as e:
+        raise SnapshotError(f"corrupt snapshot chunk: {e}") from e
+    return taken_at, records
+
+
+async def _chunk_bodies(stream: AsyncIterable[bytes]) -> AsyncIterator[bytes]:
+    buf = bytearray()
+    header = False
+    async for data in stream:
+        buf += data
+        if not header:
+            if len(buf) < len(HEADER):
+                continue
+            if bytes(buf[: len(MAGIC)]) != MAGIC:
+                raise SnapshotError("not a bucket snapshot")
+            if buf[len(MAGIC)] != VERSION:
+                raise SnapshotError(f"unsupported snapshot version {buf[len(MAGIC)]}")
+            del buf[: len(HEADER)]
+            header = True
+        while len(buf) >= _LEN.size:
+            (n,) = _LEN.unpack_from(buf)
+            if n == 0:
+                return
+            if n > MAX_CHUNK_BYTES:
+                raise SnapshotError(f"snapshot chunk of {n} bytes")
+            if len(buf) < _LEN.size + n:
+                break
+            body = bytes(buf[_LEN.size : _LEN.size + n])
+            del buf[: _LEN.size + n]
+            yield body
+    raise SnapshotError("snapshot truncated: no end marker")
+
+
+async def restore_snapshot(
+    stream: AsyncIterable[bytes],
+    clients: Mapping[str, "redis.Redis"],
+    prefix: str,
+    *,
+    rebase: bool = True,
+) -> dict[str, int]:
+    """
+    Write the buckets of a snapshot into `clients` (one Redis, or shards routed
+    as `ShardedRedisLimiter` does), replacing keys of the same name. Returns
+    counts of keys restored and skipped (expired, with rebase off).
+    """
+    if not clients:
+        raise ValueError("no Redis to restore into")
+    ring = HashRing(clients) if len(clients) > 1 else None
+    only = next(iter(clients.values()))
+    restored = skipped = chunks = 0
+
+    async for body in _chunk_bodies(stream):
+        taken_at, records = _decode(body)
+        elapsed = max(0.0, time.time() - taken_at)
+        shift = elapsed if rebase else 0.0
+        lost_ms = 0 if rebase else int(elapsed * 1000)
+
+        pipes = {}
+        for key, kind, v1, v2, pttl in records:
+            ttl_ms = pttl - lost_ms if pttl > 0 else pttl
+            if pttl > 0 and ttl_ms <= 0:
+                skipped += 1
+                continue
+            name = ring.node_for(key) if ring is not None else None
+            pipe = pipes.get(name)
+            if pipe is None:
+                pipe = pipes[name] = (clients[name] if name else only).pipeline(transaction=False)
+            if kind == KIND_GCRA:
+                full = f"{prefix}{GCRA_KEY_INFIX}{key}"
+                pipe.set(full, f"{v1 + shift:.17g}", px=ttl_ms if ttl_ms > 0 else None)
+            else:
+                full = f"{prefix}{key}"
+                if kind == KIND_COMPACT:
+                    fields = {"t": str(int(v1)), "l": str(int(v2) + round(shift * 1000))}
+                else:
+                    fields = {"tokens": f"{v1:.17g}", "last": f"{v2 + shift:.17g}"}
+                pipe.delete(full)
+                pipe.hset(full, mapping=fields)
+                if ttl_ms > 0:
+                    pipe.pexpire(full, ttl_ms)
+            restored += 1
+
+        await asyncio.gather(*(p.execute() for p in pipes.values()))
+        chunks += 1
+    return {"keys": restored, "skipped": skipped, "chunks": chunks}
+
+
+async def _read_blocks(f, size: int = 1 << 20) -> AsyncIterator[bytes]:
+    while True:
+        block = f.read(size)
+        if not block:
+            return
+        yield block
+
+
+def main(argv: Sequence[str] | None = None) -> int:
+    from app.core.config import settings
+    from app.db.redis_client import create_redis, create_redis_shards, shard_name
+
+    parser = argparse.ArgumentParser(prog="python -m app.ratelimit.snapshot")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    save = sub.add_parser("save", help="write every bucket to a snapshot file")
+    save.add_argument("--out", required=True, help="file, or - for stdout")
+    save.add_argument("--batch", type=int, default=5000, help="keys per SCAN batch and chunk")
+    load = sub.add_parser("restore", help="write the buckets of a snapshot into Redis")
+    load.add_argument("--in", dest="path", required=True, help="file, or - for stdin")
+    load.add_argument(
+        "--no-rebase",
+        dest="rebase",
+        action="store_false",
+        help="keep timestamps, shorten TTLs by the time since the snapshot",
+    )
+    args = parser.parse_args(argv)
+
+    async def run() -> dict:
+        clients = create_redis_shards() or {shard_name(settings.REDIS_URL): create_redis()}
+        prefix = settings.REDIS_KEY_PREFIX
+        try:
+            if args.cmd == "save":
+                stats: dict = {}
+                out = sys.stdout.buffer if args.out == "-" else open(args.out, "wb")
+                try:
+                    chunks = snapshot_chunks(
+                        clients.values(), prefix, batch=args.batch, stats=stats
+                    )
+                    async for data in chunks:
+                        out.write(data)
+                finally:
+                    if out is not sys.stdout.buffer:
+                        out.close()
+                return stats
+            f = sys.stdin.buffer if args.path == "-" else open(args.path, "rb")
+            try:
+                return await restore_snapshot(_read_blocks(f), clients, prefix, rebase=args.rebase)
+            finally:
+                if f is not sys.stdin.buffer:
+                    f.close()
+        finally:
+            for client in clients.values():
+                await client.aclose()
+
+    start = time.perf_counter()
+    result = asyncio.run(run())
+    result["seconds"] = round(time.perf_counter() - start, 3)
+    # The snapshot itself may be on stdout
+    report = sys.stderr if args.cmd == "save" and args.out == "-" else sys.stdout
+    json.dump(result, report, indent=2)
+    report.write("\n")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,178 @@
+"""
+Bucket storage in Redis: sampled footprint report and format migration.
+
+`sample_storage` SCANs up to N bucket keys and reports, per storage format,
+how many were seen and their average MEMORY USAGE:
+- hash: token bucket, fields tokens/last
+- compact: token_bucket_compact, fields t/l
+- gcra: one string value
+
+`migrate_storage` rewrites token-bucket hashes in place between the hash and
+compact formats, keeping their remaining TTL. Each key is converted by one
+script call, and calls are pipelined per SCAN batch. Switching
+RATE_LIMIT_ALGORITHM to token_bucket_compact already migrates keys as they are
+written, so running this ahead of time is optional. Going back to token_bucket
+needs it, though: the hash script sees compact keys as full buckets.
+
+CLI (uses REDIS_URL / REDIS_SHARD_URLS and REDIS_KEY_PREFIX)
+    python -m app.ratelimit.storage report [--samples 1000]
+    python -m app.ratelimit.storage migrate --to token_bucket_compact|token_bucket
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import sys
+from typing import Mapping, Sequence
+
+import redis.asyncio as redis
+from redis.exceptions import ResponseError
+
+from app.ratelimit.redis_bucket import GCRA_KEY_INFIX, LUA_COMPACT_STATE
+from app.ratelimit.scripts import register_script
+
+FORMATS = ("hash", "compact", "gcra")
+
+# KEYS[1] = bucket key
+# ARGV[1] = target format: "token_bucket_compact" | "token_bucket"
+# Returns 1 if the key was rewritten, 0 if it was already in that format (or not a bucket)
+LUA_CONVERT_STORAGE = (
+    LUA_COMPACT_STATE
+    + r"""
+local key = KEYS[1]
+if redis.call('TYPE', key).ok ~= 'hash' then
+  return 0
+end
+local tokens, last, legacy = load_state(key)
+if tokens == nil then
+  return 0
+end
+if ARGV[1] == 'token_bucket_compact' then
+  if not legacy then
+    return 0
+  end
+  redis.call('HSET', key, 't', string.format('%d', math.floor(tokens * SCALE)),
+    'l', string.format('%d', math.floor(last)))
+  redis.call('HDEL', key, 'tokens', 'last')
+  return 1
+end
+if redis.call('HEXISTS', key, 't') == 0 then
+  return 0
+end
+redis.call('HSET', key, 'tokens', tostring(tokens), 'last', tostring(last / 1000))
+redis.call('HDEL', key, 't', 'l')
+return 1
+"""
+)
+
+CONVERT_STORAGE_SCRIPT = register_script("convert_storage", LUA_CONVERT_STORAGE)
+
+
+async def _scan_batches(r: "redis.Redis", prefix: str, count: int):
+    cursor = 0
+    while True:
+        cursor, keys = await r.scan(cursor, match=f"{prefix}*", count=count)
+        if keys:
+            yield keys
+        if cursor == 0:
+            return
+
+
+async def sample_storage(r: "redis.Redis", prefix: str, samples: int = 1000) -> dict:
+    """Formats and average bytes per key of up to `samples` bucket keys."""
+    keys: list[str] = []
+    async for batch in _scan_batches(r, prefix, count=min(samples, 1000)):
+        keys += batch[: samples - len(keys)]
+        if len(keys) >= samples:
+            break
+
+    async with r.pipeline(transaction=False) as pipe:
+        for key in keys:
+            pipe.type(key)
+            pipe.hexists(key, "t")
+            pipe.memory_usage(key)
+        replies = await pipe.execute(raise_on_error=False)
+
+    seen = {fmt: 0 for fmt in FORMATS}
+    sizes: dict[str, list[int]] = {fmt: [] for fmt in FORMATS}
+    measured = True
+    for i in range(len(keys)):
+        kind, compact, size = replies[3 * i : 3 * i + 3]
+        if kind == "string":
+            fmt = "gcra"
+        elif kind == "hash":
+            fmt = "compact" if compact is True else "hash"
+        else:
+            continue  # expired since the SCAN, or not a bucket
+        seen[fmt] += 1
+        if isinstance(size, ResponseError):
+            measured = False  # servers without MEMORY USAGE
+        elif size is not None:
+            sizes[fmt].append(size)
+
+    def avg(values: Sequence[int]):
+        return sum(values) / len(values) if measured and values else None
+
+    return {
+        "sampled": sum(seen.values()),
+        "bytes_per_key": avg([s for fmt in FORMATS for s in sizes[fmt]]),
+        "formats": {fmt: {"keys": seen[fmt], "bytes_per_key": avg(sizes[fmt])} for fmt in FORMATS},
+    }
+
+
+async def migrate_storage(
+    r: "redis.Redis", prefix: str, to: str, *, batch: int = 1000
+) -> dict[str, int]:
+    """Rewrite every bucket hash under `prefix` in the `to` format; returns counts."""
+    if to not in ("token_bucket", "token_bucket_compact"):
+        raise ValueError(f"cannot migrate to {to}: token_bucket | token_bucket_compact")
+    scanned = converted = 0
+    async for keys in _scan_batches(r, prefix, count=batch):
+        keys = [k for k in keys if not k.startswith(prefix + GCRA_KEY_INFIX)]
+        results = await CONVERT_STORAGE_SCRIPT.many(r, [((k,), (to,)) for k in keys])
+        scanned += len(keys)
+        converted += sum(results)
+    return {"scanned": scanned, "converted": converted}
+
+
+async def _per_redis(clients: Mapping[str, "redis.Redis"], fn) -> dict:
+    names = list(clients)
+    results = await asyncio.gather(*(fn(clients[n]) for n in names))
+    return dict(zip(names, results))
+
+
+def main(argv: Sequence[str] | None = None) -> int:
+    from app.core.config import settings
+    from app.db.redis_client import create_redis, create_redis_shards, shard_name
+
+    parser = argparse.ArgumentParser(prog="python -m app.ratelimit.storage")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    report = sub.add_parser("report", help="sampled bytes per key and storage formats")
+    report.add_argument("--samples", type=int, default=1000)
+    migrate = sub.add_parser("migrate", help="rewrite token-bucket keys in another format")
+    migrate.add_argument("--to", required=True, choices=["token_bucket_compact", "token_bucket"])
+    migrate.add_argument("--batch", type=int, default=1000)
+    args = parser.parse_args(argv)
+
+    async def run() -> dict:
+        clients = create_redis_shards() or {shard_name(settings.REDIS_URL): create_redis()}
+        prefix = settings.REDIS_KEY_PREFIX
+        try:
+            if args.cmd == "report":
+                return await _per_redis(clients, lambda r: sample_storage(r, prefix, args.samples))
+            return await _per_redis(
+                clients, lambda r: migrate_storage(r, prefix, args.to, batch=args.batch)
+            )
+        finally:
+            for client in clients.values():
+                await client.aclose()
+
+    json.dump(asyncio.run(run()), sys.stdout, indent=2)
+    sys.stdout.write("\n")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
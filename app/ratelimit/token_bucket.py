@@ -92,7 +92,8 @@ def try_consume(
         return Decision(False, s.tokens, None), s
 
     if s.tokens + 1e-12 >= cost:
-        new_tokens = s.tokens - cost
+        # clamp the epsilon-tolerance case so the new state stays non-negative
+        new_tokens = max(0.0, s.tokens - cost)
         new_state = BucketState(tokens=new_tokens, last_refill_ts=s.last_refill_ts)
         return Decision(True, new_tokens, 0.0), new_state
 
@@ -0,0 +1,164 @@
+"""
+Multi-worker launcher: N uvicorn worker processes accepting on one listening
+socket, with Prometheus metrics aggregated across them.
+
+    python -m app.serve [--workers N] [--host 0.0.0.0] [--port 8000]
+
+The socket is bound once here and shared by every worker (the kernel spreads new
+connections over the accepting processes). Before any worker starts,
+PROMETHEUS_MULTIPROC_DIR is pointed at an emptied directory, so each worker
+writes its metrics to memory-mapped files there and `/metrics`, on whichever
+worker serves it, sums counters and histograms over all of them. Gauges declare
+their own aggregation (per worker or summed, live processes only).
+
+Workers that die are restarted and their gauge files dropped. SIGTERM/SIGINT
+stop all workers gracefully.
+"""
+
+from __future__ import annotations
+
+import argparse
+import logging
+import multiprocessing
+import os
+import signal
+import socket
+import sys
+import tempfile
+import time
+from typing import Optional
+
+from app.core.config import settings
+from app.core.logging import setup_logging
+
+logger = logging.getLogger("app.serve")
+
+# A worker dying this soon after start is broken (import error, bad config):
+# restarting it forever would only hide that
+MIN_UPTIME_S = 5.0
+STOP_TIMEOUT_S = 30.0
+# Worker count, for the workers (settings they cannot share, see app.main)
+WORKERS_ENV = "RATELIMIT_SERVE_WORKERS"
+
+
+def _worker(sock: socket.socket, log_level: str) -> None:
+    import uvicorn
+
+    config = uvicorn.Config("app.main:app", log_level=log_level.lower(), access_log=False)
+    uvicorn.Server(config).run(sockets=[sock])
+
+
+class Supervisor:
+    def __init__(self, sock: socket.socket, workers: int, *, metrics_dir: str, log_level: str):
+        self.sock = sock
+        self.workers = workers
+        self.metrics_dir = metrics_dir
+        self.log_level = log_level
+        self._ctx = multiprocessing.get_context("spawn")
+        self._procs: list[Optional[multiprocessing.process.BaseProcess]] = [None] * workers
+        self._started: list[float] = [0.0] * workers
+        self._stopping = False
+
+    def _spawn(self, i: int) -> None:
+        proc = self._ctx.Process(
+            target=_worker, args=(self.sock, self.log_level), name=f"worker-{i}"
+        )
+        proc.start()
+        self._procs[i] = proc
+        self._started[i] = time.monotonic()
+        logger.info("started worker %d (pid %d)", i, proc.pid)
+
+    def _reap(self, proc) -> None:
+        from prometheus_client import multiprocess
+
+        # Drops the dead worker's live-gauge files; its counters keep counting
+        multiprocess.mark_process_dead(proc.pid, self.metrics_dir)
+
+    def stop(self, *_) -> None:
+        self._stopping = True
+
+    def run(self) -> int:
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+        for i in range(self.workers):
+            self._spawn(i)
+
+        status = 0
+        while not self._stopping:
+            time.sleep(0.5)
+            for i, proc in enumerate(self._procs):
+                if proc is None or proc.is_alive() or self._stopping:
+                    continue
+                self._reap(proc)
+                if time.monotonic() - self._started[i] < MIN_UPTIME_S:
+                    logger.error("worker %d exited with %s right after start", i, proc.exitcode)
+                    status = 1
+                    self._stopping = True
+                    break
+                logger.warning("worker %d exited with %s, restarting", i, proc.exitcode)
+                self._spawn(i)
+
+        for proc in self._procs:
+            if proc is not None and proc.is_alive():
+                proc.terminate()  # SIGTERM: uvicorn finishes in-flight requests
+        deadline = time.monotonic() + STOP_TIMEOUT_S
+        for proc in self._procs:
+            if proc is None:
+                continue
+            proc.join(max(0.0, deadline - time.monotonic()))
+            if proc.is_alive():
+                proc.kill()
+                proc.join()
+            self._reap(proc)
+        return status
+
+
+def _listen(host: str, port: int) -> socket.socket:
+    family = socket.AF_INET6 if ":" in host else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+    return sock
+
+
+def _prepare_metrics_dir() -> str:
+    path = os.environ.get("PROMETHEUS_MULTIPROC_DIR")
+    if not path:
+        path = tempfile.mkdtemp(prefix="ratelimit-metrics-")
+        os.environ["PROMETHEUS_MULTIPROC_DIR"] = path
+    os.makedirs(path, exist_ok=True)
+    # Files of an earlier run would be summed into this one
+    for name in os.listdir(path):
+        if name.endswith(".db"):
+            os.unlink(os.path.join(path, name))
+    return path
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--workers", type=int, default=settings.WORKERS, help="0 = one per CPU")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    args = parser.parse_args(argv)
+
+    setup_logging(settings.LOG_LEVEL)
+    workers = args.workers or os.cpu_count() or 1
+    if settings.WIRE_UNIX_PATH and workers > 1:
+        # Each worker would unlink and rebind the path: only the last one would serve it
+        parser.error("WIRE_UNIX_PATH needs --workers 1; use WIRE_PORT with several workers")
+    os.environ[WORKERS_ENV] = str(workers)
+    metrics_dir = _prepare_metrics_dir()
+    sock = _listen(args.host, args.port)
+    logger.info("serving on %s:%d with %d workers", args.host, args.port, workers)
+    try:
+        return Supervisor(
+            sock, workers, metrics_dir=metrics_dir, log_level=settings.LOG_LEVEL
+        ).run()
+    finally:
+        sock.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,138 @@
+"""
+Client for the binary decision protocol (see `app.wire.protocol`).
+
+One connection serves any number of concurrent callers: each request gets an id,
+is written as soon as it is made, and its future is resolved when the response
+with that id arrives.
+
+    client = await WireClient.connect(host="127.0.0.1", port=9091)  # or path="/run/rl.sock"
+    decision = await client.check("user:42", 1)
+    await client.aclose()
+"""
+
+from __future__ import annotations
+
+import asyncio
+import math
+from typing import Iterable, Optional
+
+from app.ratelimit.redis_bucket import Decision
+from app.wire import protocol
+
+
+class WireError(Exception):
+    """The server rejected the request (bad_request) or could not decide it (unavailable)."""
+
+    def __init__(self, status: int):
+        self.status = status
+        super().__init__("bad request" if status == protocol.BAD_REQUEST else "unavailable")
+
+
+class WireClient:
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self._reader = reader
+        self._writer = writer
+        self._next_id = 0
+        self._pending: dict[int, asyncio.Future] = {}
+        self._reading = asyncio.get_running_loop().create_task(self._read_loop())
+
+    @classmethod
+    async def connect(
+        cls, host: str = "127.0.0.1", port: int = 0, *, path: Optional[str] = None
+    ) -> WireClient:
+        if path:
+            reader, writer = await asyncio.open_unix_connection(path)
+        else:
+            reader, writer = await asyncio.open_connection(host, port)
+        return cls(reader, writer)
+
+    def _encode(
+        self,
+        key: str,
+        cost: float,
+        capacity: Optional[float],
+        refill_rate_per_sec: Optional[float],
+    ) -> tuple[int, bytes]:
+        request_id = self._next_id
+        self._next_id = (request_id + 1) & 0xFFFFFFFF
+        return request_id, protocol.encode_request(
+            request_id, key, cost, capacity, refill_rate_per_sec
+        )
+
+    def _register(self, request_ids: Iterable[int]) -> list[asyncio.Future]:
+        # Only once every frame is encoded: a bad item leaves nothing pending
+        if self._reading.done():
+            raise ConnectionError("wire connection is closed")
+        loop = asyncio.get_running_loop()
+        futs = []
+        for request_id in request_ids:
+            fut = self._pending[request_id] = loop.create_future()
+            futs.append(fut)
+        return futs
+
+    async def check(
+        self,
+        key: str,
+        cost: float = 1.0,
+        capacity: Optional[float] = None,
+        refill_rate_per_sec: Optional[float] = None,
+    ) -> Decision:
+        """Same decision as POST /api/check; raises WireError when there is none."""
+        request_id, frame = self._encode(key, cost, capacity, refill_rate_per_sec)
+        (fut,) = self._register([request_id])
+        self._writer.write(frame)
+        return await fut
+
+    async def check_many(self, items: Iterable[tuple]) -> list[Decision]:
+        """
+        Items are (key, cost[, capacity[, refill_rate_per_sec]]); written in one go,
+        answered in order of the items.
+        """
+        encoded = [self._encode(*item, *(None,) * (4 - len(item))) for item in items]
+        futs = self._register(request_id for request_id, _ in encoded)
+        self._writer.write(b"".join(frame for _, frame in encoded))
+        return list(await asyncio.gather(*futs))
+
+    async def _read_loop(self) -> None:
+        buf = bytearray()
+        size = protocol.RESPONSE_SIZE
+        try:
+            while True:
+                data = await self._reader.read(65536)
+                if not data:
+                    break
+                buf += data
+                n = len(buf) - len(buf) % size
+                for offset in range(0, n, size):
+                    _, request_id, status, remaining, retry = protocol.RESPONSE.unpack_from(
+                        buf, offset
+                    )
+                    fut = self._pending.pop(request_id, None)
+                    if fut is None or fut.done():
+                        continue
+                    if status in (protocol.BAD_REQUEST, protocol.UNAVAILABLE):
+                        fut.set_exception(WireError(status))
+                    else:
+                        fut.set_result(
+                            Decision(
+                                status == protocol.ALLOWED,
+                                remaining,
+                                None if math.isnan(retry) else retry,
+                            )
+                        )
+                del buf[:n]
+        except ConnectionError:
+            pass
+        finally:
+            for fut in self._pending.values():
+                if not fut.done():
+                    fut.set_exception(ConnectionError("wire connection closed"))
+            self._pending.clear()
+
+    async def aclose(self) -> None:
+        self._writer.close()
+        try:
+            await self._writer.wait_closed()
+        except ConnectionError:
+            pass
+        await self._reading
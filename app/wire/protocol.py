@@ -0,0 +1,131 @@
+"""
+Length-prefixed binary decision protocol for sidecars (TCP or Unix socket).
+
+Every frame starts with a big-endian u32: the number of bytes that follow.
+
+Request (client -> server):
+
+    u32 length | u32 request_id | u8 flags | f64 cost
+    [f64 capacity if flags & HAS_CAPACITY] [f64 refill_rate_per_sec if flags & HAS_RATE]
+    key (UTF-8, the rest of the frame)
+
+Response (server -> client), 25 bytes:
+
+    u32 length (=21) | u32 request_id | u8 status | f64 remaining_tokens | f64 retry_after_s
+
+retry_after_s is NaN when there is none (impossible request, errors). Requests on
+one connection may be pipelined: responses carry the request id and can come
+back in any order, so one connection multiplexes any number of callers.
+"""
+
+from __future__ import annotations
+
+import math
+import struct
+from typing import NamedTuple, Optional
+
+HAS_CAPACITY = 0x01
+HAS_RATE = 0x02
+
+ALLOWED = 0
+DENIED = 1
+IMPOSSIBLE = 2  # cost > capacity: never allowed, no retry
+BAD_REQUEST = 3  # invalid cost/capacity/rate or key
+UNAVAILABLE = 4  # the limiter failed (e.g. Redis down without a degraded mode)
+
+MAX_FRAME = 4096
+
+LENGTH = struct.Struct(">I")
+REQUEST_HEAD = struct.Struct(">IBd")
+F64 = struct.Struct(">d")
+RESPONSE = struct.Struct(">IIBdd")
+RESPONSE_SIZE = RESPONSE.size
+RESPONSE_LENGTH = RESPONSE_SIZE - LENGTH.size
+
+
+class WireRequest(NamedTuple):
+    request_id: int
+    key: str
+    cost: float
+    capacity: Optional[float]
+    refill_rate_per_sec: Optional[float]
+
+
+class ProtocolError(Exception):
+    """The peer sent bytes that are not a frame: the connection cannot continue."""
+
+
+def encode_request(
+    request_id: int,
+    key: str,
+    cost: float,
+    capacity: Optional[float] = None,
+    refill_rate_per_sec: Optional[float] = None,
+) -> bytes:
+    flags = 0
+    tail = b""
+    if capacity is not None:
+        flags |= HAS_CAPACITY
+        tail += F64.pack(capacity)
+    if refill_rate_per_sec is not None:
+        flags |= HAS_RATE
+        tail += F64.pack(refill_rate_per_sec)
+    body = REQUEST_HEAD.pack(request_id, flags, cost) + tail + key.encode("utf-8")
+    if len(body) > MAX_FRAME:
+        raise ValueError(f"key too long: frames are limited to {MAX_FRAME} bytes")
+    return LENGTH.pack(len(body)) + body
+
+
+def decode_request(frame: memoryview) -> WireRequest:
+    """
+    One request frame body (without its length prefix). Raises ValueError for a
+    well-framed but invalid request (answered with BAD_REQUEST).
+    """
+    if len(frame) < REQUEST_HEAD.size:
+        raise ProtocolError("request frame too short")
+    request_id, flags, cost = REQUEST_HEAD.unpack_from(frame)
+    offset = REQUEST_HEAD.size
+    capacity = rate = None
+    if flags & HAS_CAPACITY:
+        if len(frame) < offset + 8:
+            raise ProtocolError("request frame too short")
+        (capacity,) = F64.unpack_from(frame, offset)
+        offset += 8
+    if flags & HAS_RATE:
+        if len(frame) < offset + 8:
+            raise ProtocolError("request frame too short")
+        (rate,) = F64.unpack_from(frame, offset)
+        offset += 8
+
+    req = WireRequest(request_id, "", cost, capacity, rate)
+    try:
+        key = bytes(frame[offset:]).decode("utf-8")
+    except UnicodeDecodeError:
+        raise InvalidRequest(req, "key is not UTF-8") from None
+    req = req._replace(key=key)
+    if not key:
+        raise InvalidRequest(req, "empty key")
+    if not (math.isfinite(cost) and cost >= 0):
+        raise InvalidRequest(req, "cost must be finite and >= 0")
+    for value in (capacity, rate):
+        if value is not None and not (math.isfinite(value) and value > 0):
+            raise InvalidRequest(req, "capacity and refill_rate_per_sec must be > 0")
+    return req
+
+
+class InvalidRequest(ValueError):
+    def __init__(self, request: WireRequest, reason: str):
+        super().__init__(reason)
+        self.request = request
+
+
+def encode_response(
+    request_id: int, status: int, remaining_tokens: float, retry_after_s: Optional[float]
+) -> bytes:
+    return RESPONSE.pack(
+        RESPONSE_LENGTH,
+        request_id,
+        status,
+        remaining_tokens,
+        math.nan if retry_after_s is None else retry_after_s,
+    )
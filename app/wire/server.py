@@ -0,0 +1,180 @@
+"""
+asyncio server for the binary decision protocol (see `app.wire.protocol`).
+
+Each connection parses every complete frame of a read and decides them together
+with one `decide_many` (one Redis round trip), the same decision core and policy
+lookup as POST /api/check. Reads keep going while decisions are in flight, so a
+client pipelines freely; past WIRE_MAX_INFLIGHT undecided requests the connection
+stops reading until half of them are answered.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+from collections import Counter
+from typing import Optional
+
+from app.api.decisions import bucket_request, decide_many, is_impossible
+from app.core.config import settings
+from app.metrics import RATE_LIMIT_WIRE_CONNECTIONS, RATE_LIMIT_WIRE_REQUESTS_TOTAL
+from app.ratelimit.policy import PolicyStore
+from app.wire import protocol
+from app.wire.protocol import InvalidRequest, ProtocolError, WireRequest
+
+logger = logging.getLogger(__name__)
+
+RESULTS = {
+    protocol.ALLOWED: "allowed",
+    protocol.DENIED: "denied",
+    protocol.IMPOSSIBLE: "impossible",
+    protocol.BAD_REQUEST: "bad_request",
+    protocol.UNAVAILABLE: "unavailable",
+}
+
+
+class WireConnection(asyncio.Protocol):
+    def __init__(self, server: WireServer):
+        self.server = server
+        self.transport: Optional[asyncio.Transport] = None
+        self.buffer = bytearray()
+        self.inflight = 0
+        self.paused = False
+        self.tasks: set[asyncio.Task] = set()
+
+    def connection_made(self, transport) -> None:
+        self.transport = transport
+        self.server.connections.add(self)
+        RATE_LIMIT_WIRE_CONNECTIONS.inc()
+
+    def connection_lost(self, exc) -> None:
+        self.server.connections.discard(self)
+        RATE_LIMIT_WIRE_CONNECTIONS.dec()
+
+    def data_received(self, data: bytes) -> None:
+        buf = self.buffer
+        buf += data
+        batch: list[WireRequest] = []
+        rejected: list[bytes] = []
+        offset = 0
+        try:
+            with memoryview(buf) as view:
+                while len(buf) - offset >= protocol.LENGTH.size:
+                    (length,) = protocol.LENGTH.unpack_from(view, offset)
+                    if length > protocol.MAX_FRAME:
+                        raise ProtocolError(f"frame of {length} bytes")
+                    end = offset + protocol.LENGTH.size + length
+                    if end > len(buf):
+                        break
+                    try:
+                        batch.append(protocol.decode_request(view[end - length : end]))
+                    except InvalidRequest as e:
+                        rejected.append(
+                            protocol.encode_response(
+                                e.request.request_id, protocol.BAD_REQUEST, 0.0, None
+                            )
+                        )
+                    offset = end
+        except ProtocolError as e:
+            # Framing is lost: nothing after this point can be trusted
+            logger.warning("closing wire connection: %s", e)
+            self.transport.close()
+            return
+        del buf[:offset]
+
+        if rejected:
+            RATE_LIMIT_WIRE_REQUESTS_TOTAL.labels(result="bad_request").inc(len(rejected))
+            self.transport.write(b"".join(rejected))
+        if batch:
+            self.inflight += len(batch)
+            if self.inflight >= self.server.max_inflight and not self.paused:
+                self.paused = True
+                self.transport.pause_reading()
+            task = asyncio.get_running_loop().create_task(self._decide(batch))
+            self.tasks.add(task)
+            task.add_done_callback(self.tasks.discard)
+
+    async def _decide(self, batch: list[WireRequest]) -> None:
+        policies = self.server.policies
+        engine = policies.engine if policies is not None else None
+        qs = [
+            bucket_request(r.key, r.cost, r.capacity, r.refill_rate_per_sec, engine) for r in batch
+        ]
+        statuses: list[int] = []
+        out: list[bytes] = []
+        try:
+            decisions = await decide_many(self.server.limiter, qs)
+        except Exception:
+            logger.warning("wire decisions failed", exc_info=True)
+            for r in batch:
+                statuses.append(protocol.UNAVAILABLE)
+                out.append(protocol.encode_response(r.request_id, protocol.UNAVAILABLE, 0.0, None))
+        else:
+            for r, q, d in zip(batch, qs, decisions):
+                if is_impossible(q):
+                    status, retry = protocol.IMPOSSIBLE, None
+                else:
+                    status = protocol.ALLOWED if d.allowed else protocol.DENIED
+                    retry = d.retry_after_s
+                statuses.append(status)
+                out.append(
+                    protocol.encode_response(r.request_id, status, d.remaining_tokens, retry)
+                )
+        finally:
+            self.inflight -= len(batch)
+
+        for status, n in Counter(statuses).items():
+            RATE_LIMIT_WIRE_REQUESTS_TOTAL.labels(result=RESULTS[status]).inc(n)
+        if self.transport.is_closing():
+            return
+        self.transport.write(b"".join(out))
+        if self.paused and self.inflight <= self.server.max_inflight // 2:
+            self.paused = False
+            self.transport.resume_reading()
+
+
+class WireServer:
+    """Serves `limiter` over TCP and/or a Unix socket until `aclose()`."""
+
+    def __init__(
+        self,
+        limiter,
+        policies: Optional[PolicyStore] = None,
+        *,
+        max_inflight: int = settings.WIRE_MAX_INFLIGHT,
+    ):
+        self.limiter = limiter
+        self.policies = policies
+        self.max_inflight = max_inflight
+        self.connections: set[WireConnection] = set()
+        self._servers: list[asyncio.AbstractServer] = []
+
+    async def start_tcp(self, host: str, port: int, *, reuse_port: bool = False) -> tuple[str, int]:
+        """
+        Listen on host:port (0 = any free port); returns the bound address.
+        `reuse_port` lets several `app.serve` workers bind the same port, the kernel
+        spreading connections; otherwise a port already taken fails to bind.
+        """
+        server = await asyncio.get_running_loop().create_server(
+            lambda: WireConnection(self), host, port, reuse_port=reuse_port
+        )
+        self._servers.append(server)
+        return server.sockets[0].getsockname()[:2]
+
+    async def start_unix(self, path: str) -> None:
+        server = await asyncio.get_running_loop().create_unix_server(
+            lambda: WireConnection(self), path
+        )
+        self._servers.append(server)
+
+    async def aclose(self) -> None:
+        tasks = [t for conn in self.connections for t in conn.tasks]
+        for server in self._servers:
+            server.close()
+        for conn in list(self.connections):
+            conn.transport.close()
+        for server in self._servers:
+            await server.wait_closed()
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+        self._servers.clear()
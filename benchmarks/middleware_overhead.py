@@ -0,0 +1,94 @@
+"""
+Per-request cost of the HTTP instrumentation middleware, before and after fusing
+it into one pure-ASGI layer.
+
+Requests are driven straight through the ASGI interface (no sockets, no Redis)
+against a handler that does nothing, so the difference to the bare app is the
+middleware overhead.
+
+    python -m benchmarks.middleware_overhead [--requests 20000]
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import time
+
+from fastapi import FastAPI
+
+from app.core.instrumentation import InstrumentationMiddleware
+from app.core.logging import RequestIdMiddleware
+from app.core.metrics_middleware import MetricsMiddleware
+
+
+def build_app(stack: str) -> FastAPI:
+    app = FastAPI()
+
+    @app.post("/api/check")
+    async def check():
+        return {"allowed": True}
+
+    if stack == "base_http":
+        app.add_middleware(RequestIdMiddleware)
+        app.add_middleware(MetricsMiddleware)
+    elif stack == "fused":
+        app.add_middleware(InstrumentationMiddleware)
+    return app
+
+
+async def run(app: FastAPI, n: int) -> float:
+    """Mean seconds per request over `n` sequential requests."""
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "POST",
+        "scheme": "http",
+        "path": "/api/check",
+        "raw_path": b"/api/check",
+        "query_string": b"",
+        "root_path": "",
+        "headers": [(b"host", b"bench"), (b"content-type", b"application/json")],
+        "client": ("127.0.0.1", 1234),
+        "server": ("bench", 80),
+    }
+    request = {"type": "http.request", "body": b"{}", "more_body": False}
+
+    async def receive():
+        return request
+
+    async def send(message):
+        pass
+
+    for _ in range(min(n, 1_000)):  # warm-up: route caches, label children
+        await app(dict(scope), receive, send)
+    start = time.perf_counter()
+    for _ in range(n):
+        await app(dict(scope), receive, send)
+    return (time.perf_counter() - start) / n
+
+
+async def main_async(n: int) -> dict[str, float]:
+    results = {}
+    for stack in ("none", "base_http", "fused"):
+        results[stack] = await run(build_app(stack), n)
+    return results
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--requests", type=int, default=20_000)
+    args = parser.parse_args(argv)
+
+    results = asyncio.run(main_async(args.requests))
+    base = results["none"]
+    for stack, per_request in results.items():
+        print(
+            f"{stack:>10}: {per_request * 1e6:8.1f} us/request"
+            f"  (middleware: {(per_request - base) * 1e6:+7.1f} us)"
+        )
+
+
+if __name__ == "__main__":
+    main()
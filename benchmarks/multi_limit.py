@@ -0,0 +1,67 @@
+"""
+Nested limits (user + org + endpoint + global) per request against a real Redis:
+N sequential single checks vs one all-or-nothing script call.
+
+    python -m benchmarks.multi_limit [--requests 2000] [--limits 4]
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import time
+import uuid
+
+from app.db.redis_client import create_redis
+from app.ratelimit.redis_bucket import BucketRequest, try_consume_redis, try_consume_redis_all
+
+
+async def bench(n_requests: int, n_limits: int) -> dict:
+    r = create_redis()
+    prefix = f"bench:{uuid.uuid4().hex[:8]}:"
+    qs = [BucketRequest(f"limit{i}", 1e9, 1e6, 1) for i in range(n_limits)]
+
+    try:
+        start = time.perf_counter()
+        for _ in range(n_requests):
+            for q in qs:
+                d = await try_consume_redis(
+                    r,
+                    q.key,
+                    capacity=q.capacity,
+                    refill_rate_per_sec=q.refill_rate_per_sec,
+                    cost=q.cost,
+                    ttl_sec=3600,
+                    prefix=prefix,
+                )
+                if not d.allowed:
+                    break
+        sequential = n_requests / (time.perf_counter() - start)
+
+        start = time.perf_counter()
+        for _ in range(n_requests):
+            await try_consume_redis_all(r, qs, ttl_sec=3600, prefix=prefix)
+        atomic = n_requests / (time.perf_counter() - start)
+    finally:
+        await r.delete(*(f"{prefix}{q.key}" for q in qs))
+        await r.aclose()
+
+    return {"sequential_requests_per_s": sequential, "atomic_requests_per_s": atomic}
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--requests", type=int, default=2_000)
+    parser.add_argument("--limits", type=int, default=4)
+    args = parser.parse_args(argv)
+
+    res = asyncio.run(bench(args.requests, args.limits))
+    print(
+        f"{args.limits} limits/request: "
+        f"{res['sequential_requests_per_s']:8.0f} req/s as {args.limits} round trips, "
+        f"{res['atomic_requests_per_s']:8.0f} req/s as one script call"
+    )
+
+
+if __name__ == "__main__":
+    main()
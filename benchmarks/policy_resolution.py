@@ -0,0 +1,81 @@
+"""
+Policy resolution cost with tens of thousands of rules.
+
+Builds a synthetic policy (exact keys, prefixes, globs, a few regexes), then
+times `PolicyEngine.resolve` on cache misses (every key new) and cache hits.
+
+    python -m benchmarks.policy_resolution [--rules 50000] [--lookups 200000]
+"""
+
+from __future__ import annotations
+
+import argparse
+import random
+import time
+
+from app.ratelimit.policy import PolicyEngine, PolicyFile, RuleSpec, TierSpec
+
+
+def build_policy(n_rules: int, seed: int = 0) -> PolicyFile:
+    rng = random.Random(seed)
+    rules = []
+    for i in range(n_rules):
+        kind = rng.random()
+        if kind < 0.5:
+            rules.append(RuleSpec(prefix=f"tenant:{i}:", capacity=rng.randint(1, 1000)))
+        elif kind < 0.8:
+            rules.append(RuleSpec(key=f"user:{i}", capacity=rng.randint(1, 1000)))
+        else:
+            rules.append(RuleSpec(glob=f"tenant:{i}:*:export", capacity=1))
+    rules += [RuleSpec(regex=f"svc{j}:[a-z]+:[0-9]+", capacity=50) for j in range(50)]
+    return PolicyFile(
+        tiers={"free": TierSpec(capacity=10, refill_rate_per_sec=1)},
+        rules=rules,
+    )
+
+
+def time_lookups(engine: PolicyEngine, keys: list[str]) -> float:
+    resolve = engine.resolve
+    start = time.perf_counter()
+    for key in keys:
+        resolve(key)
+    return (time.perf_counter() - start) / len(keys)
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--rules", type=int, default=50_000)
+    parser.add_argument("--lookups", type=int, default=200_000)
+    args = parser.parse_args(argv)
+
+    spec = build_policy(args.rules)
+    start = time.perf_counter()
+    engine = PolicyEngine(spec, defaults=TierSpec(capacity=5, refill_rate_per_sec=1))
+    compile_s = time.perf_counter() - start
+
+    rng = random.Random(1)
+    n = args.rules
+    keys = [
+        rng.choice(
+            (
+                f"tenant:{rng.randrange(n)}:user:{i}",
+                f"tenant:{rng.randrange(n)}:x:export",
+                f"user:{rng.randrange(n)}",
+                f"svc{rng.randrange(60)}:abc:{i}",
+                f"anon:{i}",
+            )
+        )
+        for i in range(args.lookups)
+    ]
+    miss = time_lookups(engine, keys)
+    hot = keys[:1_000] * (args.lookups // 1_000)
+    time_lookups(engine, hot[:1_000])
+    hit = time_lookups(engine, hot)
+
+    print(f"compile {len(spec.rules)} rules: {compile_s * 1e3:.0f} ms")
+    print(f"resolve, cache miss: {miss * 1e6:.2f} us")
+    print(f"resolve, cache hit:  {hit * 1e6:.2f} us")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,164 @@
+"""
+Throughput of reverse-proxy mode against a local stand-in upstream.
+
+Starts the upstream and the gateway as uvicorn subprocesses, then drives
+concurrent keep-alive clients for a fixed time in three setups:
+
+- direct:   client -> upstream (no limiting; the ceiling)
+- proxy:    client -> gateway proxy route -> upstream
+- two_hops: client -> POST /api/enforce, then client -> upstream (the pre-proxy pattern)
+
+    python -m benchmarks.proxy_throughput [--seconds 5] [--concurrency 8] [--backend memory]
+
+The default backend is Redis (REDIS_URL must be reachable); `--backend memory`
+measures the proxy path without it.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+
+import httpx
+from fastapi import FastAPI
+
+UPSTREAM_PORT = 18081
+GATEWAY_PORT = 18080
+
+upstream_app = FastAPI()
+
+
+@upstream_app.get("/v1/items/{item_id}")
+async def item(item_id: str):
+    return {"id": item_id}
+
+
+def _start(module_app: str, port: int, env: dict[str, str]) -> subprocess.Popen:
+    return subprocess.Popen(
+        [
+            sys.executable,
+            "-m",
+            "uvicorn",
+            module_app,
+            "--port",
+            str(port),
+            "--log-level",
+            "warning",
+            "--no-access-log",
+        ],
+        env={**os.environ, **env},
+    )
+
+
+async def _wait_ready(url: str, timeout_s: float = 15.0) -> None:
+    deadline = time.monotonic() + timeout_s
+    async with httpx.AsyncClient() as c:
+        while True:
+            try:
+                await c.get(url)
+                return
+            except httpx.TransportError:
+                if time.monotonic() > deadline:
+                    raise
+                await asyncio.sleep(0.1)
+
+
+async def _drive(request_once, seconds: float, concurrency: int) -> tuple[float, int]:
+    """Run `request_once(client, i)` from `concurrency` workers; returns (req/s, errors)."""
+    done = 0
+    errors = 0
+    deadline = time.perf_counter() + seconds
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async with httpx.AsyncClient(limits=limits, timeout=10.0) as client:
+
+        async def worker(w: int) -> None:
+            nonlocal done, errors
+            i = 0
+            while time.perf_counter() < deadline:
+                i += 1
+                try:
+                    if not await request_once(client, w * 1_000_000 + i):
+                        errors += 1
+                except httpx.HTTPError:
+                    errors += 1
+                done += 1
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker(w) for w in range(concurrency)))
+        elapsed = time.perf_counter() - start
+    return done / elapsed, errors
+
+
+async def main_async(seconds: float, concurrency: int) -> dict[str, tuple[float, int]]:
+    upstream = f"http://127.0.0.1:{UPSTREAM_PORT}"
+    gateway = f"http://127.0.0.1:{GATEWAY_PORT}"
+    run = uuid.uuid4().hex[:8]
+
+    async def direct(c: httpx.AsyncClient, i: int) -> bool:
+        return (await c.get(f"{upstream}/v1/items/{i}")).status_code == 200
+
+    async def proxy(c: httpx.AsyncClient, i: int) -> bool:
+        r = await c.get(f"{gateway}/items/{i}", headers={"X-User-Id": f"{run}-{i % 1000}"})
+        return r.status_code == 200
+
+    async def two_hops(c: httpx.AsyncClient, i: int) -> bool:
+        body = {"key": f"bench:{run}-{i % 1000}", "cost": 1, "capacity": 1e9}
+        r = await c.post(f"{gateway}/api/enforce", json=body)
+        if r.status_code != 200:
+            return False
+        return (await c.get(f"{upstream}/v1/items/{i}")).status_code == 200
+
+    results = {}
+    for name, fn in (("direct", direct), ("proxy", proxy), ("two_hops", two_hops)):
+        results[name] = await _drive(fn, seconds, concurrency)
+    return results
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--seconds", type=float, default=5.0)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--backend", choices=["redis", "memory"], default="redis")
+    args = parser.parse_args(argv)
+
+    with tempfile.NamedTemporaryFile("w", suffix=".yaml", delete=False) as f:
+        f.write(
+            "routes:\n"
+            "  - name: items\n"
+            "    prefix: /items\n"
+            f"    upstream: http://127.0.0.1:{UPSTREAM_PORT}/v1/items\n"
+            "    key: header:X-User-Id\n"
+            "    capacity: 1000000000\n"
+            "    refill_rate_per_sec: 1000000\n"
+        )
+    procs = [
+        _start("benchmarks.proxy_throughput:upstream_app", UPSTREAM_PORT, {}),
+        _start(
+            "app.main:app",
+            GATEWAY_PORT,
+            {"PROXY_CONFIG_FILE": f.name, "LIMITER_BACKEND": args.backend},
+        ),
+    ]
+    try:
+        asyncio.run(_wait_ready(f"http://127.0.0.1:{UPSTREAM_PORT}/v1/items/0"))
+        asyncio.run(_wait_ready(f"http://127.0.0.1:{GATEWAY_PORT}/healthz"))
+        results = asyncio.run(main_async(args.seconds, args.concurrency))
+    finally:
+        for p in procs:
+            p.terminate()
+            p.wait()
+        os.unlink(f.name)
+
+    for name, (rps, errors) in results.items():
+        print(f"{name:>9}: {rps:9.0f} req/s  ({errors} errors)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""
+Token bucket (LUA_TOKEN_BUCKET), its compact storage (LUA_COMPACT_TOKEN_BUCKET)
+and GCRA (LUA_GCRA) against a real Redis.
+
+For each algorithm: decisions/sec for single calls and for pipelined batches,
+Redis commands per decision, and bytes per key (MEMORY USAGE, sampled).
+
+    python -m benchmarks.redis_algorithms [--keys 10000] [--calls 5000] [--batch 100]
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import time
+import uuid
+
+from redis.exceptions import ResponseError
+
+from app.db.redis_client import create_redis
+from app.ratelimit.redis_bucket import (
+    ALGORITHMS,
+    BucketRequest,
+    redis_key,
+    try_consume_redis,
+    try_consume_redis_many,
+)
+
+# Per allowed decision: HMGET + HSET + (P)EXPIRE vs GET + SET PX. A denial is
+# just the read
+COMMANDS_PER_DECISION = {"token_bucket": 3, "gcra": 2, "token_bucket_compact": 3}
+
+
+async def bench(algorithm: str, n_keys: int, calls: int, batch: int) -> dict:
+    r = create_redis()
+    prefix = f"bench:{uuid.uuid4().hex[:8]}:"
+    keys = [f"k{i}" for i in range(n_keys)]
+    cap, rate = 1e9, 1e6  # never deny: measure the write path
+
+    try:
+        start = time.perf_counter()
+        for i in range(calls):
+            await try_consume_redis(
+                r,
+                keys[i % n_keys],
+                capacity=cap,
+                refill_rate_per_sec=rate,
+                cost=1,
+                ttl_sec=3600,
+                prefix=prefix,
+                algorithm=algorithm,
+            )
+        single = calls / (time.perf_counter() - start)
+
+        start = time.perf_counter()
+        for lo in range(0, n_keys, batch):
+            qs = [BucketRequest(k, cap, rate, 1) for k in keys[lo : lo + batch]]
+            await try_consume_redis_many(r, qs, ttl_sec=3600, prefix=prefix, algorithm=algorithm)
+        pipelined = n_keys / (time.perf_counter() - start)
+
+        sample = keys[:: max(1, n_keys // 200)]
+        try:
+            sizes = [await r.memory_usage(redis_key(prefix, k, algorithm)) for k in sample]
+            bytes_per_key: float | str = sum(s or 0 for s in sizes) / len(sizes)
+        except ResponseError:
+            bytes_per_key = "n/a (no MEMORY USAGE on this server)"
+    finally:
+        cursor = 0
+        while True:
+            cursor, found = await r.scan(cursor, match=f"{prefix}*", count=1000)
+            if found:
+                await r.delete(*found)
+            if cursor == 0:
+                break
+        await r.aclose()
+
+    return {
+        "single_calls_per_s": single,
+        "pipelined_decisions_per_s": pipelined,
+        "commands_per_decision": COMMANDS_PER_DECISION[algorithm],
+        "bytes_per_key": bytes_per_key,
+    }
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--keys", type=int, default=10_000)
+    parser.add_argument("--calls", type=int, default=5_000)
+    parser.add_argument("--batch", type=int, default=100)
+    args = parser.parse_args(argv)
+
+    for algorithm in ALGORITHMS:
+        res = asyncio.run(bench(algorithm, args.keys, args.calls, args.batch))
+        per_key = res["bytes_per_key"]
+        print(
+            f"{algorithm:>20}: {res['single_calls_per_s']:8.0f} calls/s single, "
+            f"{res['pipelined_decisions_per_s']:8.0f} decisions/s pipelined, "
+            f"{res['commands_per_decision']} commands/decision, "
+            f"{per_key if isinstance(per_key, str) else f'{per_key:.0f}'} bytes/key"
+        )
+
+
+if __name__ == "__main__":
+    main()
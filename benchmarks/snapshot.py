@@ -0,0 +1,105 @@
+"""
+Snapshot and restore throughput (app.ratelimit.snapshot).
+
+Fills N token-bucket keys, snapshots them into memory, restores them into
+another database, and reports keys/sec of each step and snapshot bytes per key.
+Also times the file encoding and decoding alone (no Redis), the ceiling of this
+process whatever the server.
+
+    python -m benchmarks.snapshot [--keys 100000] [--batch 5000]
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import time
+import uuid
+import zlib
+
+import redis.asyncio as redis
+
+from app.core.config import settings
+from app.ratelimit.snapshot import (
+    _CHUNK_HEAD,
+    _decode,
+    _encode,
+    restore_snapshot,
+    snapshot_chunks,
+)
+
+
+def _db_url(db: int) -> str:
+    return settings.REDIS_URL.rsplit("/", 1)[0] + f"/{db}"
+
+
+async def _blocks(data: bytes, size: int = 1 << 20):
+    for i in range(0, len(data), size):
+        yield data[i : i + size]
+
+
+def codec(n_keys: int, batch: int) -> float:
+    prefix = "bucket:"
+    keys = [f"{prefix}user-{i}" for i in range(batch)]
+    replies: list = []
+    for i in range(batch):
+        replies += [[str(i % 10), "1700000000.25", None, None], 3_600_000]
+    start = time.perf_counter()
+    for _ in range(max(1, n_keys // batch)):
+        _, payload = _encode(keys, replies, prefix, prefix + "gcra:")
+        _decode(zlib.compress(_CHUNK_HEAD.pack(0.0, batch) + payload, 1))
+    return max(1, n_keys // batch) * batch / (time.perf_counter() - start)
+
+
+async def bench(n_keys: int, batch: int) -> dict:
+    src = redis.from_url(_db_url(12), decode_responses=True)
+    dst = redis.from_url(_db_url(13), decode_responses=True)
+    prefix = f"bench:{uuid.uuid4().hex[:8]}:"
+    try:
+        for lo in range(0, n_keys, batch):
+            async with src.pipeline(transaction=False) as pipe:
+                for i in range(lo, min(n_keys, lo + batch)):
+                    pipe.hset(f"{prefix}k{i}", mapping={"tokens": i % 10, "last": time.time()})
+                    pipe.expire(f"{prefix}k{i}", 3600)
+                await pipe.execute()
+
+        stats: dict = {}
+        start = time.perf_counter()
+        data = b"".join([c async for c in snapshot_chunks([src], prefix, batch=batch, stats=stats)])
+        save_s = time.perf_counter() - start
+
+        start = time.perf_counter()
+        res = await restore_snapshot(_blocks(data), {"dst": dst}, prefix)
+        restore_s = time.perf_counter() - start
+    finally:
+        for r in (src, dst):
+            found = [k async for k in r.scan_iter(match=f"{prefix}*", count=10_000)]
+            for lo in range(0, len(found), 10_000):
+                await r.delete(*found[lo : lo + 10_000])
+            await r.aclose()
+
+    return {
+        "keys": stats["keys"],
+        "save_keys_per_s": stats["keys"] / save_s,
+        "restore_keys_per_s": res["keys"] / restore_s,
+        "bytes_per_key": len(data) / max(1, stats["keys"]),
+    }
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--keys", type=int, default=100_000)
+    parser.add_argument("--batch", type=int, default=5000)
+    args = parser.parse_args(argv)
+
+    print(f"encode+decode only: {codec(args.keys, args.batch):10.0f} keys/s")
+    res = asyncio.run(bench(args.keys, args.batch))
+    print(
+        f"{res['keys']} keys: save {res['save_keys_per_s']:8.0f} keys/s, "
+        f"restore {res['restore_keys_per_s']:8.0f} keys/s, "
+        f"{res['bytes_per_key']:.1f} snapshot bytes/key"
+    )
+
+
+if __name__ == "__main__":
+    main()
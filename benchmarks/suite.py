@@ -0,0 +1,343 @@
+"""
+Reproducible benchmark suite with JSON results and regression checks.
+
+Cases:
+- token_bucket.try_consume: pure decision function, ops/sec
+- redis.try_consume_redis: one script call per decision, latency and ops/sec
+- asgi.check / asgi.enforce: end-to-end `create_app()` throughput and latency over
+  the ASGI interface (no sockets), with the configured middleware and limiter
+
+Redis cases use REDIS_URL; if nothing answers there and `redis-server` is on PATH,
+a throwaway server is started on a free local port. Without either, the Redis case
+is skipped and the ASGI cases run on the in-memory backend. Case names carry the
+backend, so only like-for-like runs are compared.
+
+    python -m benchmarks.suite [--quick] [--repeat 3] [--out results.json]
+    python -m benchmarks.suite --compare baseline.json [--threshold 0.10]
+
+With --compare the exit status is 1 when a metric got worse than the baseline by
+more than --threshold (relative). Metrics ending in `_per_s` are better higher,
+those ending in `_us` are better lower.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import contextlib
+import datetime
+import json
+import os
+import platform
+import shutil
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import uuid
+from typing import Iterator, Optional
+
+SCHEMA = 1
+
+
+def _percentile(sorted_values: list[float], pct: float) -> float:
+    if not sorted_values:
+        return 0.0
+    idx = min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))
+    return sorted_values[idx]
+
+
+def _latency_metrics(samples_s: list[float], elapsed_s: float) -> dict[str, float]:
+    samples = sorted(samples_s)
+    return {
+        "ops_per_s": len(samples) / elapsed_s,
+        "p50_us": _percentile(samples, 50) * 1e6,
+        "p99_us": _percentile(samples, 99) * 1e6,
+    }
+
+
+def bench_try_consume(n: int) -> dict[str, float]:
+    from app.ratelimit.token_bucket import BucketConfig, BucketState, try_consume
+
+    cfg = BucketConfig(capacity=1e9, refill_rate_per_sec=1e6)
+    state = BucketState(cfg.capacity, 0.0)
+    start = time.perf_counter()
+    for i in range(n):
+        _, state = try_consume(cfg, state, 1.0, i * 1e-6)
+    return {"ops_per_s": n / (time.perf_counter() - start)}
+
+
+async def bench_try_consume_redis(n: int) -> dict[str, float]:
+    from app.db.redis_client import create_redis
+    from app.ratelimit.redis_bucket import try_consume_redis
+
+    r = create_redis()
+    prefix = f"bench:{uuid.uuid4().hex[:8]}:"
+    keys = [f"k{i}" for i in range(1000)]
+    samples = []
+    try:
+        # Warm up the connection and the script cache
+        for k in keys[:10]:
+            await try_consume_redis(
+                r, k, capacity=1e9, refill_rate_per_sec=1e6, cost=1, ttl_sec=60, prefix=prefix
+            )
+        start = time.perf_counter()
+        for i in range(n):
+            t = time.perf_counter()
+            await try_consume_redis(
+                r,
+                keys[i % len(keys)],
+                capacity=1e9,
+                refill_rate_per_sec=1e6,
+                cost=1,
+                ttl_sec=60,
+                prefix=prefix,
+            )
+            samples.append(time.perf_counter() - t)
+        elapsed = time.perf_counter() - start
+    finally:
+        await _delete_prefix(r, prefix)
+        await r.aclose()
+    return _latency_metrics(samples, elapsed)
+
+
+async def bench_asgi(path: str, n: int, concurrency: int) -> dict[str, float]:
+    import httpx
+    from asgi_lifespan import LifespanManager
+
+    from app.main import create_app
+
+    app = create_app()
+    samples: list[float] = []
+    async with LifespanManager(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as c:
+
+            async def worker(w: int, count: int) -> None:
+                for i in range(count):
+                    body = {"key": f"u{w}-{i % 100}", "cost": 1, "capacity": 1e9}
+                    t = time.perf_counter()
+                    res = await c.post(path, json=body)
+                    samples.append(time.perf_counter() - t)
+                    if res.status_code != 200:
+                        raise RuntimeError(f"{path} answered {res.status_code}: {res.text}")
+
+            await worker(0, 50)  # warm up
+            samples.clear()
+            per_worker = max(1, n // concurrency)
+            start = time.perf_counter()
+            await asyncio.gather(*(worker(w, per_worker) for w in range(concurrency)))
+            elapsed = time.perf_counter() - start
+    return _latency_metrics(samples, elapsed)
+
+
+async def _delete_prefix(r, prefix: str) -> None:
+    found = [k async for k in r.scan_iter(match=f"{prefix}*", count=1000)]
+    for i in range(0, len(found), 1000):
+        await r.delete(*found[i : i + 1000])
+
+
+async def _redis_answers(url: str) -> bool:
+    import redis.asyncio as redis
+
+    r = redis.from_url(url, socket_connect_timeout=0.5, socket_timeout=0.5)
+    try:
+        return bool(await r.ping())
+    except Exception:
+        return False
+    finally:
+        await r.aclose()
+
+
+@contextlib.contextmanager
+def _local_redis(url: str) -> Iterator[Optional[str]]:
+    """A Redis URL to benchmark against (`url` or a throwaway redis-server), or None."""
+    if asyncio.run(_redis_answers(url)):
+        yield url
+        return
+    binary = shutil.which("redis-server")
+    if binary is None:
+        yield None
+        return
+
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    proc = subprocess.Popen(
+        [binary, "--port", str(port), "--bind", "127.0.0.1", "--save", "", "--appendonly", "no"],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    local = f"redis://127.0.0.1:{port}/0"
+    try:
+        deadline = time.monotonic() + 5
+        while not asyncio.run(_redis_answers(local)):
+            if time.monotonic() > deadline or proc.poll() is not None:
+                yield None
+                return
+            time.sleep(0.05)
+        yield local
+    finally:
+        proc.terminate()
+        proc.wait(timeout=5)
+
+
+def _median_metrics(runs: list[dict[str, float]]) -> dict[str, float]:
+    return {m: statistics.median(run[m] for run in runs) for m in runs[0]}
+
+
+def run_suite(*, quick: bool, repeat: int, only: Optional[str] = None) -> dict:
+    from app.core.config import settings
+
+    scale = 0.1 if quick else 1.0
+    results: dict[str, dict[str, float]] = {}
+    skipped: dict[str, str] = {}
+
+    def record(name: str, fn) -> None:
+        if only and only not in name:
+            return
+        print(f"  {name} ...", file=sys.stderr, flush=True)
+        results[name] = _median_metrics([fn() for _ in range(repeat)])
+
+    record("token_bucket.try_consume", lambda: bench_try_consume(int(200_000 * scale)))
+
+    with _local_redis(settings.REDIS_URL) as url:
+        saved = (settings.REDIS_URL, settings.LIMITER_BACKEND, settings.REDIS_KEY_PREFIX)
+        settings.REDIS_KEY_PREFIX = f"bench:{uuid.uuid4().hex[:8]}:"
+        if url is None:
+            backend = "memory"
+            settings.LIMITER_BACKEND = "memory"
+            skipped["redis.try_consume_redis"] = "no Redis at REDIS_URL and no redis-server"
+        else:
+            backend = "redis"
+            settings.REDIS_URL = url
+            record(
+                "redis.try_consume_redis",
+                lambda: asyncio.run(bench_try_consume_redis(int(5_000 * scale))),
+            )
+        try:
+            for route in ("check", "enforce"):
+                record(
+                    f"asgi.{route}.{backend}",
+                    lambda route=route: asyncio.run(
+                        bench_asgi(f"/api/{route}", int(5_000 * scale), concurrency=16)
+                    ),
+                )
+        finally:
+            if url is not None:
+                asyncio.run(_cleanup_prefix(settings.REDIS_KEY_PREFIX))
+            settings.REDIS_URL, settings.LIMITER_BACKEND, settings.REDIS_KEY_PREFIX = saved
+
+    return {
+        "schema": SCHEMA,
+        "meta": _meta(quick=quick, repeat=repeat, backend=backend),
+        "results": results,
+        "skipped": skipped,
+    }
+
+
+async def _cleanup_prefix(prefix: str) -> None:
+    from app.db.redis_client import create_redis
+
+    r = create_redis()
+    try:
+        await _delete_prefix(r, prefix)
+    finally:
+        await r.aclose()
+
+
+def _meta(**extra) -> dict:
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+        "commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        **extra,
+    }
+
+
+def higher_is_better(metric: str) -> bool:
+    if metric.endswith("_per_s"):
+        return True
+    if metric.endswith("_us"):
+        return False
+    raise ValueError(f"unknown metric direction: {metric}")
+
+
+def compare(baseline: dict, current: dict, threshold: float) -> list[dict]:
+    """
+    Every metric present in both runs, with its relative change (positive = better).
+    Entries whose change is worse than -threshold have regression=True.
+    """
+    rows = []
+    for case, metrics in current["results"].items():
+        base_metrics = baseline["results"].get(case)
+        if base_metrics is None:
+            continue
+        for metric, value in metrics.items():
+            base = base_metrics.get(metric)
+            if not base:
+                continue
+            change = (value - base) / base
+            if not higher_is_better(metric):
+                change = -change
+            rows.append(
+                {
+                    "case": case,
+                    "metric": metric,
+                    "baseline": base,
+                    "current": value,
+                    "change": change,
+                    "regression": change < -threshold,
+                }
+            )
+    return rows
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--quick", action="store_true", help="10x fewer iterations")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per case (median kept)")
+    parser.add_argument("--only", help="run cases whose name contains this")
+    parser.add_argument("--out", help="write results JSON here")
+    parser.add_argument("--compare", help="baseline results JSON to check against")
+    parser.add_argument("--threshold", type=float, default=0.10)
+    args = parser.parse_args(argv)
+
+    current = run_suite(quick=args.quick, repeat=args.repeat, only=args.only)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(current, f, indent=2, sort_keys=True)
+            f.write("\n")
+
+    for case, metrics in current["results"].items():
+        shown = ", ".join(f"{m}={v:,.1f}" for m, v in metrics.items())
+        print(f"{case:>28}: {shown}")
+    for case, reason in current["skipped"].items():
+        print(f"{case:>28}: skipped ({reason})")
+
+    if not args.compare:
+        return 0
+    with open(args.compare, encoding="utf-8") as f:
+        baseline = json.load(f)
+    rows = compare(baseline, current, args.threshold)
+    print(f"\nvs {args.compare} (commit {baseline['meta'].get('commit')}):")
+    for row in rows:
+        flag = "  REGRESSION" if row["regression"] else ""
+        print(
+            f"{row['case']:>28} {row['metric']:>10}: {row['baseline']:12,.1f} -> "
+            f"{row['current']:12,.1f} ({row['change']:+.1%}){flag}"
+        )
+    return 1 if any(row["regression"] for row in rows) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,122 @@
+"""
+Decisions per second, and per server CPU-second, over HTTP vs the binary protocol.
+
+Starts the gateway once with the wire server enabled, then for a fixed time:
+
+- http:      concurrent keep-alive clients calling POST /api/check
+- wire:      concurrent callers sharing few connections, one `check` each at a time
+- wire_many: the same callers sending `check_many` batches of --batch items
+
+Server CPU time is read from /proc/<pid>/stat before and after each run (Linux),
+so the figure that matters when clients share the machine is decisions/cpu-s.
+
+    python -m benchmarks.wire_protocol [--seconds 5] [--concurrency 16] [--backend memory]
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import os
+import time
+import uuid
+
+import httpx
+
+from app.wire.client import WireClient
+from benchmarks.proxy_throughput import _drive, _start, _wait_ready
+
+HTTP_PORT = 18091
+WIRE_PORT = 18092
+
+
+def _cpu_s(pid: int) -> float:
+    with open(f"/proc/{pid}/stat") as f:
+        fields = f.read().rsplit(")", 1)[1].split()
+    # utime and stime, fields 14 and 15 of the full line
+    return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+
+
+async def _drive_wire(
+    seconds: float, concurrency: int, connections: int, batch: int
+) -> tuple[float, int]:
+    run = uuid.uuid4().hex[:8]
+    clients = [await WireClient.connect("127.0.0.1", WIRE_PORT) for _ in range(connections)]
+    done = 0
+    deadline = time.perf_counter() + seconds
+
+    async def worker(w: int) -> None:
+        nonlocal done
+        client = clients[w % connections]
+        i = 0
+        while time.perf_counter() < deadline:
+            i += 1
+            if batch == 1:
+                await client.check(f"bench:{run}-{(w * 7919 + i) % 1000}", 1, 1e9)
+            else:
+                items = [(f"bench:{run}-{(w * 7919 + i + j) % 1000}", 1, 1e9) for j in range(batch)]
+                await client.check_many(items)
+            done += batch
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker(w) for w in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    for client in clients:
+        await client.aclose()
+    return done / elapsed, done
+
+
+async def main_async(pid: int, args) -> dict[str, tuple[float, float]]:
+    base = f"http://127.0.0.1:{HTTP_PORT}"
+    run = uuid.uuid4().hex[:8]
+    sent = 0
+
+    async def check(c: httpx.AsyncClient, i: int) -> bool:
+        nonlocal sent
+        sent += 1
+        body = {"key": f"bench:{run}-{i % 1000}", "cost": 1, "capacity": 1e9}
+        return (await c.post(f"{base}/api/check", json=body)).status_code == 200
+
+    results = {}
+    cpu = _cpu_s(pid)
+    rps, _ = await _drive(check, args.seconds, args.concurrency)
+    results["http"] = (rps, sent / (_cpu_s(pid) - cpu))
+
+    for name, batch in (("wire", 1), ("wire_many", args.batch)):
+        cpu = _cpu_s(pid)
+        rps, done = await _drive_wire(args.seconds, args.concurrency, args.connections, batch)
+        results[name] = (rps, done / (_cpu_s(pid) - cpu))
+    return results
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--seconds", type=float, default=5.0)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--connections", type=int, default=4, help="wire connections")
+    parser.add_argument("--batch", type=int, default=32, help="items per check_many")
+    parser.add_argument("--backend", choices=["redis", "memory"], default="memory")
+    args = parser.parse_args(argv)
+
+    proc = _start(
+        "app.main:app",
+        HTTP_PORT,
+        {"LIMITER_BACKEND": args.backend, "WIRE_PORT": str(WIRE_PORT), "LOG_LEVEL": "WARNING"},
+    )
+    try:
+        asyncio.run(_wait_ready(f"http://127.0.0.1:{HTTP_PORT}/healthz"))
+        results = asyncio.run(main_async(proc.pid, args))
+    finally:
+        proc.terminate()
+        proc.wait()
+
+    http_per_cpu = results["http"][1]
+    for name, (rps, per_cpu) in results.items():
+        print(
+            f"{name:>9}: {rps:9.0f} decisions/s  {per_cpu:9.0f} decisions/cpu-s  "
+            f"(x{per_cpu / http_per_cpu:.1f})"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""
+Throughput of `python -m app.serve` as the worker count grows.
+
+For each worker count, starts the launcher, drives POST /api/enforce from several
+client processes for a fixed time, then scrapes /metrics once to check that the
+aggregated request counter matches what the clients sent (whichever worker
+answers the scrape).
+
+    python -m benchmarks.worker_scaling [--workers 1,2,4] [--seconds 5] [--backend memory]
+
+Clients run on the same machine and compete with the workers for CPU, so give
+the box more cores than workers. The default backend is memory, so Redis is not
+the bottleneck; `--backend redis` needs REDIS_URL reachable.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import multiprocessing
+import os
+import re
+import subprocess
+import sys
+import uuid
+
+import httpx
+
+from benchmarks.proxy_throughput import _drive, _wait_ready
+
+PORT = 18090
+
+
+def _client(args: tuple[str, float, int]) -> tuple[float, int, int]:
+    base, seconds, concurrency = args
+    run = uuid.uuid4().hex[:8]
+    sent = 0
+
+    async def enforce(c: httpx.AsyncClient, i: int) -> bool:
+        nonlocal sent
+        sent += 1
+        body = {"key": f"bench:{run}-{i % 1000}", "cost": 1, "capacity": 1e9}
+        return (await c.post(f"{base}/api/enforce", json=body)).status_code == 200
+
+    rps, errors = asyncio.run(_drive(enforce, seconds, concurrency))
+    return rps, errors, sent
+
+
+def _counted(base: str) -> float:
+    text = httpx.get(f"{base}/metrics").text
+    pattern = r'^http_requests_total\{method="POST",path="/api/enforce",status="\d+"\} (\S+)$'
+    return sum(float(v) for v in re.findall(pattern, text, re.MULTILINE))
+
+
+def run(workers: int, seconds: float, clients: int, concurrency: int, backend: str) -> dict:
+    base = f"http://127.0.0.1:{PORT}"
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "app.serve", "--workers", str(workers), "--port", str(PORT)],
+        env={**os.environ, "LIMITER_BACKEND": backend, "LOG_LEVEL": "WARNING"},
+    )
+    try:
+        asyncio.run(_wait_ready(f"{base}/healthz", timeout_s=60))
+        with multiprocessing.get_context("spawn").Pool(clients) as pool:
+            results = pool.map(_client, [(base, seconds, concurrency)] * clients)
+        counted = _counted(base)
+    finally:
+        proc.terminate()
+        proc.wait()
+    return {
+        "rps": sum(r[0] for r in results),
+        "errors": sum(r[1] for r in results),
+        "sent": sum(r[2] for r in results),
+        "counted": counted,
+    }
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    cpus = os.cpu_count() or 1
+    default_workers = ",".join(str(n) for n in (1, 2, 4, 8, 16) if n <= max(1, cpus // 2))
+    parser.add_argument("--workers", default=default_workers or "1")
+    parser.add_argument("--seconds", type=float, default=5.0)
+    parser.add_argument("--clients", type=int, default=max(1, cpus // 2))
+    parser.add_argument("--concurrency", type=int, default=16, help="connections per client")
+    parser.add_argument("--backend", choices=["redis", "memory"], default="memory")
+    args = parser.parse_args(argv)
+
+    base_rps = None
+    for workers in (int(w) for w in args.workers.split(",")):
+        res = run(workers, args.seconds, args.clients, args.concurrency, args.backend)
+        base_rps = base_rps or res["rps"]
+        print(
+            f"{workers:>3} workers: {res['rps']:9.0f} req/s  (x{res['rps'] / base_rps:.2f}, "
+            f"{res['errors']} errors, metrics counted {res['counted']:.0f} of {res['sent']})"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""
+Primary writes of a denial-heavy workload, and read-only peeks.
+
+Hammers a few hot keys with LUA_TOKEN_BUCKET so most calls are denied, then
+reports how many of them wrote. Writes are counted by Redis (INFO commandstats:
+HSET calls made by the script) when the server has it, else inferred from the
+decisions: only allowed calls write now, where every call used to. Also compares
+decisions/sec of `try_consume_redis_many` with `peek_redis_many` (plain HMGETs,
+which a replica can serve), and the replication stream the run produced
+(master_repl_offset, when the server keeps one).
+
+    python -m benchmarks.write_elision [--keys 100] [--calls 20000] [--batch 100]
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import time
+import uuid
+
+from redis.exceptions import ResponseError
+
+from app.db.redis_client import create_redis
+from app.ratelimit.redis_bucket import BucketRequest, peek_redis_many, try_consume_redis_many
+
+
+async def _server_counters(r) -> dict | None:
+    try:
+        stats = await r.info("commandstats")
+        replication = await r.info("replication")
+    except ResponseError:
+        return None  # servers without INFO
+    return {
+        "hset": stats.get("cmdstat_hset", {}).get("calls", 0),
+        "repl_offset": replication.get("master_repl_offset", 0),
+    }
+
+
+async def bench(n_keys: int, calls: int, batch: int) -> dict:
+    r = create_redis()
+    prefix = f"bench:{uuid.uuid4().hex[:8]}:"
+    keys = [f"k{i}" for i in range(n_keys)]
+    # 10 tokens, 1/s per key: after the first burst, nearly every call is denied
+    qs = [BucketRequest(keys[i % n_keys], 10.0, 1.0, 1.0) for i in range(calls)]
+
+    try:
+        before = await _server_counters(r)
+        start = time.perf_counter()
+        allowed = 0
+        for lo in range(0, calls, batch):
+            decisions = await try_consume_redis_many(
+                r, qs[lo : lo + batch], ttl_sec=3600, prefix=prefix
+            )
+            allowed += sum(d.allowed for d in decisions)
+        consume_s = time.perf_counter() - start
+        after = await _server_counters(r)
+
+        start = time.perf_counter()
+        for lo in range(0, calls, batch):
+            await peek_redis_many(r, qs[lo : lo + batch], prefix=prefix)
+        peek_s = time.perf_counter() - start
+    finally:
+        found = [k async for k in r.scan_iter(match=f"{prefix}*")]
+        if found:
+            await r.delete(*found)
+        await r.aclose()
+
+    res = {
+        "calls": calls,
+        "allowed": allowed,
+        "writes_before": calls,
+        "writes_now": allowed,
+        "measured_by": "decisions",
+        "consume_per_s": calls / consume_s,
+        "peek_per_s": calls / peek_s,
+        "repl_bytes": None,
+    }
+    if before is not None and after is not None:
+        res["writes_now"] = after["hset"] - before["hset"]
+        res["measured_by"] = "INFO commandstats"
+        if after["repl_offset"]:
+            res["repl_bytes"] = after["repl_offset"] - before["repl_offset"]
+    return res
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--keys", type=int, default=100)
+    parser.add_argument("--calls", type=int, default=20_000)
+    parser.add_argument("--batch", type=int, default=100)
+    args = parser.parse_args(argv)
+
+    res = asyncio.run(bench(args.keys, args.calls, args.batch))
+    print(
+        f"{res['calls']} calls, {res['allowed']} allowed: "
+        f"{res['writes_now']} writes ({res['measured_by']}), "
+        f"{res['writes_before']} before write elision"
+    )
+    if res["repl_bytes"] is not None:
+        print(f"replication stream: {res['repl_bytes']} bytes")
+    print(
+        f"{res['consume_per_s']:8.0f} decisions/s consuming, "
+        f"{res['peek_per_s']:8.0f} decisions/s peeking"
+    )
+
+
+if __name__ == "__main__":
+    main()
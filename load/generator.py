@@ -0,0 +1,473 @@
+"""
+Open-loop load generator for /api/check and /api/enforce (single and batch).
+
+Requests are started at a fixed arrival rate (evenly spaced, or Poisson), never
+waiting for earlier ones to finish, so a slow server builds up a backlog instead
+of slowing the load down. Latency is measured from when each request was due,
+not from when a connection was free to send it: this is the coordinated-omission
+correction (as in wrk2). The uncorrected time, from send to response, is reported
+separately as the service time.
+
+Keys follow a distribution over `--keys` keys, without storing them:
+- uniform: every key equally likely
+- zipf: key of rank k with probability ~ 1/k^s (rejection-inversion sampling)
+- hotspot: `--hot-keys` (a fraction of the keys) get `--hot-traffic` of the requests
+
+Costs come from a weighted mix, e.g. `--costs 1:90,5:9,50:1`.
+
+The result is JSON: request counts, achieved rate, status codes, allow/deny
+ratios, and both latency distributions as HDR histograms (3 significant digits,
+in microseconds, with the non-empty buckets so runs can be merged or re-plotted).
+Only the standard library is used, HTTP/1.1 included.
+
+    python -m load.generator --url http://127.0.0.1:8000 --endpoint check --rate 2000 \\
+        --duration 30 --keys 1000000 --distribution zipf --zipf-s 1.1 --out result.json
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import math
+import random
+import sys
+from dataclasses import asdict, dataclass
+from typing import Callable, Optional
+from urllib.parse import urlsplit
+
+ENDPOINTS = {
+    "check": "/api/check",
+    "enforce": "/api/enforce",
+    "check_batch": "/api/check/batch",
+    "enforce_batch": "/api/enforce/batch",
+}
+DISTRIBUTIONS = ("uniform", "zipf", "hotspot")
+
+
+class HdrHistogram:
+    """
+    High dynamic range histogram of integers from 0 to `highest`: every value is
+    kept with `significant_figures` decimal digits of precision, in fixed memory
+    (about 23k counters for 3 digits up to an hour in microseconds).
+    """
+
+    def __init__(self, highest: int = 3_600_000_000, significant_figures: int = 3):
+        if not 1 <= significant_figures <= 5:
+            raise ValueError("significant_figures must be 1..5")
+        self.highest = highest
+        self.significant_figures = significant_figures
+        # Smallest power of two giving 1 unit of resolution up to 2 * 10^digits
+        self._sub_bits = math.ceil(math.log2(2 * 10**significant_figures))
+        self._half_bits = self._sub_bits - 1
+        self.counts = [0] * (self._index(highest) + 1)
+        self.total = 0
+        self.min = None
+        self.max = 0
+        self._sum = 0
+
+    def _index(self, value: int) -> int:
+        bucket = max(0, value.bit_length() - self._sub_bits)
+        return (bucket << self._half_bits) + (value >> bucket)
+
+    def _bucket(self, index: int) -> int:
+        return max(0, (index >> self._half_bits) - 1)
+
+    def lowest_equivalent(self, index: int) -> int:
+        bucket = self._bucket(index)
+        return (index - (bucket << self._half_bits)) << bucket
+
+    def highest_equivalent(self, index: int) -> int:
+        return self.lowest_equivalent(index) + (1 << self._bucket(index)) - 1
+
+    def record(self, value: int, count: int = 1) -> None:
+        value = min(max(0, int(value)), self.highest)
+        self.counts[self._index(value)] += count
+        self.total += count
+        self._sum += value * count
+        if self.min is None or value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+
+    def value_at_percentile(self, percentile: float) -> int:
+        if not self.total:
+            return 0
+        target = max(1, math.ceil(percentile / 100 * self.total))
+        seen = 0
+        for i, c in enumerate(self.counts):
+            seen += c
+            if c and seen >= target:
+                return min(self.highest_equivalent(i), self.max)
+        return self.max
+
+    def to_dict(self, ticks_per_half_distance: int = 5) -> dict:
+        """Summary, percentile distribution and non-empty buckets (value, count)."""
+        percentiles = [0.0]
+        k = 1
+        while self.total and 1 / 2 ** (k / ticks_per_half_distance) >= 1 / self.total:
+            percentiles.append(100 * (1 - 1 / 2 ** (k / ticks_per_half_distance)))
+            k += 1
+        percentiles.append(100.0)
+        return {
+            "unit": "us",
+            "significant_figures": self.significant_figures,
+            "count": self.total,
+            "min": self.min or 0,
+            "max": self.max,
+            "mean": self._sum / self.total if self.total else 0.0,
+            "percentiles": {
+                f"p{p:g}": self.value_at_percentile(p) for p in (50, 90, 99, 99.9, 99.99)
+            },
+            "distribution": [[round(p, 6), self.value_at_percentile(p)] for p in percentiles],
+            "buckets": [[self.lowest_equivalent(i), c] for i, c in enumerate(self.counts) if c],
+        }
+
+
+class ZipfSampler:
+    """
+    Ranks 1..n with P(k) ~ 1/k^s, in O(1) memory and expected time: rejection-
+    inversion (Hörmann and Derflinger, 1996), as Apache Commons' Zipf sampler.
+    """
+
+    def __init__(self, n: int, s: float, rng: random.Random):
+        if n < 1 or s <= 0:
+            raise ValueError("zipf needs n >= 1 and s > 0")
+        self.n, self.s, self.rng = n, s, rng
+        self._h_x1 = self._h_integral(1.5) - 1.0
+        self._h_n = self._h_integral(n + 0.5)
+        self._squeeze = 2.0 - self._h_integral_inv(self._h_integral(2.5) - self._h(2.0))
+
+    def _h(self, x: float) -> float:
+        return math.exp(-self.s * math.log(x))
+
+    def _h_integral(self, x: float) -> float:
+        log_x = math.log(x)
+        return _expm1_over_x((1.0 - self.s) * log_x) * log_x
+
+    def _h_integral_inv(self, x: float) -> float:
+        t = max(-1.0, x * (1.0 - self.s))
+        return math.exp(_log1p_over_x(t) * x)
+
+    def __call__(self) -> int:
+        while True:
+            u = self._h_n + self.rng.random() * (self._h_x1 - self._h_n)
+            x = self._h_integral_inv(u)
+            k = min(self.n, max(1, int(x + 0.5)))
+            if k - x <= self._squeeze or u >= self._h_integral(k + 0.5) - self._h(k):
+                return k
+
+
+def _expm1_over_x(x: float) -> float:
+    return (
+        math.expm1(x) / x if abs(x) > 1e-8 else 1.0 + x * 0.5 * (1.0 + x / 3.0 * (1.0 + 0.25 * x))
+    )
+
+
+def _log1p_over_x(x: float) -> float:
+    return math.log1p(x) / x if abs(x) > 1e-8 else 1.0 - x * (0.5 - x * (1.0 / 3.0 - 0.25 * x))
+
+
+def key_sampler(
+    distribution: str,
+    n_keys: int,
+    rng: random.Random,
+    *,
+    zipf_s: float = 1.1,
+    hot_keys: float = 0.01,
+    hot_traffic: float = 0.9,
+) -> Callable[[], int]:
+    """A function returning key indexes in [0, n_keys); index 0 is the hottest."""
+    if distribution == "uniform":
+        return lambda: rng.randrange(n_keys)
+    if distribution == "zipf":
+        zipf = ZipfSampler(n_keys, zipf_s, rng)
+        return lambda: zipf() - 1
+    if distribution == "hotspot":
+        hot = max(1, min(n_keys, int(n_keys * hot_keys)))
+        if hot == n_keys:
+            return lambda: rng.randrange(n_keys)
+        return lambda: (
+            rng.randrange(hot) if rng.random() < hot_traffic else rng.randrange(hot, n_keys)
+        )
+    raise ValueError(f"unknown distribution {distribution}: {', '.join(DISTRIBUTIONS)}")
+
+
+def parse_costs(spec: str) -> tuple[list[float], list[float]]:
+    """'1:90,5:10' -> costs and cumulative weights for `random.choices`."""
+    costs, cum, total = [], [], 0.0
+    for part in spec.split(","):
+        cost, _, weight = part.partition(":")
+        costs.append(float(cost))
+        total += float(weight or 1)
+        cum.append(total)
+    if any(c < 0 for c in costs) or total <= 0:
+        raise ValueError(f"bad cost mix {spec!r}: cost:weight,... with costs >= 0")
+    return costs, cum
+
+
+class _HttpConnection:
+    """One keep-alive HTTP/1.1 connection, one request at a time."""
+
+    def __init__(self, host: str, port: int):
+        self.host, self.port = host, port
+        self._reader: Optional[asyncio.StreamReader] = None
+        self._writer: Optional[asyncio.StreamWriter] = None
+
+    async def post(self, path: str, body: bytes) -> tuple[int, bytes]:
+        if self._writer is None:
+            self._reader, self._writer = await asyncio.open_connection(self.host, self.port)
+        self._writer.write(
+            f"POST {path} HTTP/1.1\r\nHost: {self.host}\r\nContent-Type: application/json\r\n"
+            f"Content-Length: {len(body)}\r\n\r\n".encode("latin-1")
+            + body
+        )
+        status = int((await self._reader.readline()).split(b" ", 2)[1])
+        length, chunked, close = 0, False, False
+        while (line := await self._reader.readline()) not in (b"\r\n", b""):
+            name, _, value = line.partition(b":")
+            name = name.strip().lower()
+            if name == b"content-length":
+                length = int(value)
+            elif name == b"transfer-encoding":
+                chunked = b"chunked" in value.lower()
+            elif name == b"connection":
+                close = b"close" in value.lower()
+        if chunked:
+            payload = b""
+            while size := int((await self._reader.readline()).strip(), 16):
+                payload += (await self._reader.readexactly(size + 2))[:-2]
+            await self._reader.readline()
+        else:
+            payload = await self._reader.readexactly(length)
+        if close:
+            self.close()
+        return status, payload
+
+    def close(self) -> None:
+        if self._writer is not None:
+            self._writer.close()
+        self._reader = self._writer = None
+
+
+@dataclass
+class LoadConfig:
+    url: str = "http://127.0.0.1:8000"
+    endpoint: str = "check"
+    rate: float = 1000.0  # requests/s
+    duration_s: float = 10.0
+    warmup_s: float = 0.0  # sent at the same rate, not recorded
+    arrivals: str = "constant"  # "constant" | "poisson"
+    connections: int = 64
+    max_pending: int = 100_000  # requests started and not finished; more are dropped
+    timeout_s: float = 10.0
+    batch: int = 10  # items per request, batch endpoints only
+    keys: int = 1_000_000
+    key_prefix: str = "load-"
+    distribution: str = "zipf"
+    zipf_s: float = 1.1
+    hot_keys: float = 0.01
+    hot_traffic: float = 0.9
+    costs: str = "1"
+    capacity: Optional[float] = None
+    refill_rate_per_sec: Optional[float] = None
+    seed: int = 1
+
+
+async def run(cfg: LoadConfig) -> dict:
+    """Run the load described by `cfg`; returns the JSON-ready result."""
+    if cfg.endpoint not in ENDPOINTS:
+        raise ValueError(f"unknown endpoint {cfg.endpoint}: {', '.join(ENDPOINTS)}")
+    if cfg.arrivals not in ("constant", "poisson"):
+        raise ValueError("arrivals must be constant or poisson")
+    url = urlsplit(cfg.url)
+    path = ENDPOINTS[cfg.endpoint]
+    batched = cfg.endpoint.endswith("_batch")
+
+    rng = random.Random(cfg.seed)
+    next_key = key_sampler(
+        cfg.distribution,
+        cfg.keys,
+        rng,
+        zipf_s=cfg.zipf_s,
+        hot_keys=cfg.hot_keys,
+        hot_traffic=cfg.hot_traffic,
+    )
+    costs, cum_weights = parse_costs(cfg.costs)
+    overrides: dict = {}
+    if cfg.capacity is not None:
+        overrides["capacity"] = cfg.capacity
+    if cfg.refill_rate_per_sec is not None:
+        overrides["refill_rate_per_sec"] = cfg.refill_rate_per_sec
+
+    def item() -> dict:
+        cost = costs[0] if len(costs) == 1 else rng.choices(costs, cum_weights=cum_weights)[0]
+        return {"key": f"{cfg.key_prefix}{next_key()}", "cost": cost, **overrides}
+
+    def body() -> bytes:
+        doc = {"items": [item() for _ in range(cfg.batch)]} if batched else item()
+        return json.dumps(doc, separators=(",", ":")).encode()
+
+    latency, service = HdrHistogram(), HdrHistogram()
+    counts = {"sent": 0, "completed": 0, "errors": 0, "dropped": 0}
+    statuses: dict[str, int] = {}
+    decisions = {"allowed": 0, "denied": 0, "impossible": 0}
+    pool: asyncio.Queue = asyncio.Queue()
+    for _ in range(cfg.connections):
+        pool.put_nowait(_HttpConnection(url.hostname or "127.0.0.1", url.port or 80))
+    loop = asyncio.get_running_loop()
+    clock = loop.time
+
+    def tally(result: dict) -> None:
+        if result.get("allowed"):
+            decisions["allowed"] += 1
+        elif result.get("retry_after_s") is None:
+            decisions["impossible"] += 1
+        else:
+            decisions["denied"] += 1
+
+    async def one(due: float, data: bytes, recorded: bool) -> None:
+        conn = await pool.get()
+        try:
+            sent = clock()
+            status, payload = await asyncio.wait_for(conn.post(path, data), cfg.timeout_s)
+        except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError, ValueError, IndexError):
+            conn.close()
+            if recorded:
+                counts["errors"] += 1
+            return
+        finally:
+            pool.put_nowait(conn)
+        done = clock()
+        if not recorded:
+            return
+        counts["completed"] += 1
+        # From when the request was due: time spent waiting for a connection counts
+        latency.record((done - due) * 1e6)
+        service.record((done - sent) * 1e6)
+        statuses[str(status)] = statuses.get(str(status), 0) + 1
+        if status in (200, 429):
+            doc = json.loads(payload)
+            for result in doc["results"] if batched else (doc,):
+                tally(result)
+
+    tasks: set[asyncio.Task] = set()
+    start = clock() + 0.01
+    record_from = start + cfg.warmup_s
+    end = record_from + cfg.duration_s
+    due, i = start, 0
+    while True:
+        if cfg.arrivals == "constant":
+            due = start + i / cfg.rate
+        else:
+            due += rng.expovariate(cfg.rate)
+        i += 1
+        if due >= end:
+            break
+        if due > clock():
+            await asyncio.sleep(due - clock())
+        recorded = due >= record_from
+        if len(tasks) >= cfg.max_pending:
+            counts["dropped"] += recorded
+            continue
+        counts["sent"] += recorded
+        task = asyncio.create_task(one(due, body(), recorded))
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+    if tasks:
+        await asyncio.gather(*tasks)
+    elapsed = max(clock(), end) - record_from
+    while not pool.empty():
+        pool.get_nowait().close()
+
+    n_decisions = sum(decisions.values())
+    return {
+        "config": asdict(cfg),
+        "requests": counts,
+        "target_rate": cfg.rate,
+        "achieved_rate": counts["completed"] / elapsed if elapsed > 0 else 0.0,
+        "status": statuses,
+        "decisions": {
+            **decisions,
+            "allow_ratio": decisions["allowed"] / n_decisions if n_decisions else None,
+            "deny_ratio": decisions["denied"] / n_decisions if n_decisions else None,
+        },
+        "latency_us": latency.to_dict(),
+        "service_time_us": service.to_dict(),
+    }
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    d = LoadConfig()
+    parser = argparse.ArgumentParser(
+        prog="python -m load.generator", description=__doc__.split("\n\n")[0]
+    )
+    parser.add_argument("--url", default=d.url)
+    parser.add_argument("--endpoint", choices=list(ENDPOINTS), default=d.endpoint)
+    parser.add_argument("--rate", type=float, default=d.rate, help="requests per second")
+    parser.add_argument("--duration", type=float, default=d.duration_s, help="seconds recorded")
+    parser.add_argument("--warmup", type=float, default=d.warmup_s, help="seconds not recorded")
+    parser.add_argument("--arrivals", choices=["constant", "poisson"], default=d.arrivals)
+    parser.add_argument("--connections", type=int, default=d.connections)
+    parser.add_argument("--max-pending", type=int, default=d.max_pending)
+    parser.add_argument("--timeout", type=float, default=d.timeout_s)
+    parser.add_argument("--batch", type=int, default=d.batch, help="items per batch request")
+    parser.add_argument("--keys", type=int, default=d.keys)
+    parser.add_argument("--key-prefix", default=d.key_prefix)
+    parser.add_argument("--distribution", choices=DISTRIBUTIONS, default=d.distribution)
+    parser.add_argument("--zipf-s", type=float, default=d.zipf_s)
+    parser.add_argument("--hot-keys", type=float, default=d.hot_keys, help="fraction of keys")
+    parser.add_argument(
+        "--hot-traffic", type=float, default=d.hot_traffic, help="fraction of requests"
+    )
+    parser.add_argument("--costs", default=d.costs, help="cost:weight,... e.g. 1:90,5:10")
+    parser.add_argument("--capacity", type=float)
+    parser.add_argument("--refill-rate", type=float)
+    parser.add_argument("--seed", type=int, default=d.seed)
+    parser.add_argument("--out", default="-", help="JSON result file, - for stdout")
+    args = parser.parse_args(argv)
+
+    cfg = LoadConfig(
+        url=args.url,
+        endpoint=args.endpoint,
+        rate=args.rate,
+        duration_s=args.duration,
+        warmup_s=args.warmup,
+        arrivals=args.arrivals,
+        connections=args.connections,
+        max_pending=args.max_pending,
+        timeout_s=args.timeout,
+        batch=args.batch,
+        keys=args.keys,
+        key_prefix=args.key_prefix,
+        distribution=args.distribution,
+        zipf_s=args.zipf_s,
+        hot_keys=args.hot_keys,
+        hot_traffic=args.hot_traffic,
+        costs=args.costs,
+        capacity=args.capacity,
+        refill_rate_per_sec=args.refill_rate,
+        seed=args.seed,
+    )
+    result = asyncio.run(run(cfg))
+
+    lat, req = result["latency_us"], result["requests"]
+    print(
+        f"{req['completed']}/{req['sent']} completed ({req['errors']} errors, "
+        f"{req['dropped']} dropped), {result['achieved_rate']:.0f}/s of {cfg.rate:.0f}/s; "
+        f"latency p50 {lat['percentiles']['p50']} us, p99 {lat['percentiles']['p99']} us, "
+        f"p99.9 {lat['percentiles']['p99.9']} us, max {lat['max']} us; "
+        f"allow ratio {result['decisions']['allow_ratio']}",
+        file=sys.stderr,
+    )
+    if args.out == "-":
+        json.dump(result, sys.stdout, indent=2)
+        sys.stdout.write("\n")
+    else:
+        with open(args.out, "w") as f:
+            json.dump(result, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
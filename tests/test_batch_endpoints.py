@@ -0,0 +1,78 @@
+import uuid
+
+import httpx
+import pytest
+from asgi_lifespan import LifespanManager
+
+from app.core.config import settings
+from app.main import create_app
+
+
+@pytest.mark.asyncio
+async def test_check_batch_returns_per_item_decisions():
+    app = create_app()
+    a, b = f"a-{uuid.uuid4().hex}", f"b-{uuid.uuid4().hex}"
+
+    async with LifespanManager(app):
+        transport = httpx.ASGITransport(app=app)
+
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as c:
+            r = await c.post(
+                "/api/check/batch",
+                json={
+                    "items": [
+                        {"key": a, "cost": 3, "capacity": 5},
+                        # Same key again: sees the previous item's consumption
+                        {"key": a, "cost": 3, "capacity": 5},
+                        {"key": b, "cost": 1, "capacity": 5},
+                        {"key": b, "cost": 10, "capacity": 5},
+                    ]
+                },
+            )
+            assert r.status_code == 200
+            body = r.json()
+            assert body["allowed"] is False
+            assert [res["allowed"] for res in body["results"]] == [True, False, True, False]
+            # cost > capacity is impossible: no retry hint
+            assert body["results"][3]["retry_after_s"] is None
+
+            # Aggregate headers come from the denied item that has a Retry-After
+            assert r.headers["ratelimit-remaining"] == "2"
+            assert "retry-after" in r.headers
+
+
+@pytest.mark.asyncio
+async def test_enforce_batch_returns_429_when_any_item_denied():
+    app = create_app()
+    key = f"e-{uuid.uuid4().hex}"
+
+    async with LifespanManager(app):
+        transport = httpx.ASGITransport(app=app)
+
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as c:
+            items = [{"key": key, "cost": 2, "capacity": 5}] * 2
+            r1 = await c.post("/api/enforce/batch", json={"items": items})
+            assert r1.status_code == 200
+            assert r1.json()["allowed"] is True
+
+            # 1 token left: the first item fits, the second does not
+            items = [{"key": key, "cost": 1, "capacity": 5}, {"key": key, "cost": 2, "capacity": 5}]
+            r2 = await c.post("/api/enforce/batch", json={"items": items})
+            assert r2.status_code == 429
+            assert [res["allowed"] for res in r2.json()["results"]] == [True, False]
+
+
+@pytest.mark.asyncio
+async def test_batch_rejects_oversized_requests():
+    app = create_app()
+
+    async with LifespanManager(app):
+        transport = httpx.ASGITransport(app=app)
+
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as c:
+            items = [{"key": "k", "cost": 1}] * (settings.BATCH_MAX_ITEMS + 1)
+            r = await c.post("/api/check/batch", json={"items": items})
+            assert r.status_code == 422
+
+            r = await c.post("/api/check/batch", json={"items": []})
+            assert r.status_code == 422
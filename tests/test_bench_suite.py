@@ -0,0 +1,38 @@
+import pytest
+
+from benchmarks.suite import bench_try_consume, compare, higher_is_better
+
+
+def _run(**results):
+    return {"meta": {}, "results": results}
+
+
+def test_regressions_are_flagged_by_direction_and_threshold():
+    baseline = _run(
+        a={"ops_per_s": 1000.0, "p99_us": 100.0},
+        gone={"ops_per_s": 1.0},
+    )
+    current = _run(
+        a={"ops_per_s": 950.0, "p99_us": 130.0},
+        new={"ops_per_s": 1.0},
+    )
+    rows = {(r["case"], r["metric"]): r for r in compare(baseline, current, threshold=0.10)}
+
+    # Only cases present in both runs are compared
+    assert set(rows) == {("a", "ops_per_s"), ("a", "p99_us")}
+    assert rows["a", "ops_per_s"]["change"] == pytest.approx(-0.05)
+    assert rows["a", "ops_per_s"]["regression"] is False
+    # Latency going up is a loss
+    assert rows["a", "p99_us"]["change"] == pytest.approx(-0.30)
+    assert rows["a", "p99_us"]["regression"] is True
+
+
+def test_metric_names_carry_their_direction():
+    assert higher_is_better("ops_per_s") is True
+    assert higher_is_better("p50_us") is False
+    with pytest.raises(ValueError):
+        higher_is_better("ops")
+
+
+def test_micro_case_runs():
+    assert bench_try_consume(1000)["ops_per_s"] > 0
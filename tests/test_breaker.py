@@ -0,0 +1,151 @@
+import asyncio
+
+import pytest
+
+from app.ratelimit.breaker import CLOSED, HALF_OPEN, OPEN, BreakerLimiter, CircuitBreaker
+from app.ratelimit.redis_bucket import BucketRequest, Decision
+
+Q = BucketRequest("k", 2.0, 0.001, 1.0)
+
+
+class _Backend:
+    """Stand-in limiter whose behaviour the test switches between calls."""
+
+    def __init__(self):
+        self.mode = "ok"
+        self.replica_mode = "ok"
+        self.calls = 0
+
+    async def consume(self, q):
+        self.calls += 1
+        if self.mode == "error":
+            raise ConnectionError("redis down")
+        if self.mode == "slow":
+            await asyncio.sleep(1)
+        return Decision(True, 42.0, 0.0)
+
+    async def consume_many(self, qs):
+        return [await self.consume(q) for q in qs]
+
+    async def consume_all(self, qs):
+        if self.mode == "cross_shard":
+            raise ValueError("limits checked together must share a hash tag when sharded")
+        return await self.consume_many(qs)
+
+    async def peek_many(self, qs):
+        if self.replica_mode == "error":
+            raise ConnectionError("replica down")
+        if self.replica_mode == "slow":
+            await asyncio.sleep(1)
+        return [Decision(True, 42.0, 0.0) for _ in qs]
+
+    async def aclose(self):
+        pass
+
+
+def _breaker() -> CircuitBreaker:
+    return CircuitBreaker(failure_threshold=2, slow_call_s=0.5, open_for_s=10.0)
+
+
+def test_opens_after_consecutive_failures_and_probes_once():
+    b = _breaker()
+    b.record_failure(0.0)
+    assert b.state == CLOSED
+    b.record_failure(1.0)
+    assert b.state == OPEN
+    assert b.allow_request(5.0) is False
+
+    # After open_for_s a single probe is let through
+    assert b.allow_request(11.0) is True
+    assert b.state == HALF_OPEN
+    assert b.allow_request(11.0) is False
+
+    b.record_success(0.01, 11.1)
+    assert b.state == CLOSED
+
+
+def test_slow_calls_count_as_failures():
+    b = _breaker()
+    b.record_success(0.6, 0.0)
+    b.record_success(0.6, 0.0)
+    assert b.state == OPEN
+
+
+def test_failed_probe_reopens():
+    b = _breaker()
+    b.record_failure(0.0)
+    b.record_failure(0.0)
+    assert b.allow_request(10.0) is True
+    b.record_failure(10.0)
+    assert b.state == OPEN
+    assert b.allow_request(15.0) is False
+
+
+@pytest.mark.asyncio
+async def test_local_fallback_answers_instead_of_raising():
+    backend = _Backend()
+    limiter = BreakerLimiter(backend, _breaker(), timeout_s=0.05, degraded_mode="local")
+
+    assert (await limiter.consume(Q)).remaining_tokens == 42.0
+
+    backend.mode = "error"
+    # Local bucket: capacity 2, so two allowed then denied
+    decisions = [await limiter.consume(Q) for _ in range(3)]
+    assert [d.allowed for d in decisions] == [True, True, False]
+    assert decisions[2].retry_after_s is not None
+
+    # The circuit opened after 2 failures: the third call never reached the backend
+    assert backend.calls == 3
+
+
+@pytest.mark.asyncio
+async def test_timeout_budget_and_fail_policies():
+    backend = _Backend()
+    backend.mode = "slow"
+
+    limiter = BreakerLimiter(backend, _breaker(), timeout_s=0.01, degraded_mode="fail_open")
+    d = await asyncio.wait_for(limiter.consume(Q), timeout=0.5)
+    assert d.allowed is True
+
+    limiter = BreakerLimiter(backend, _breaker(), timeout_s=0.01, degraded_mode="fail_closed")
+    decisions = await limiter.consume_many([Q, Q])
+    assert [d.allowed for d in decisions] == [False, False]
+    assert all(d.retry_after_s >= 1.0 for d in decisions)
+
+
+@pytest.mark.asyncio
+async def test_multi_limit_falls_back_atomically():
+    backend = _Backend()
+    limiter = BreakerLimiter(backend, _breaker(), timeout_s=0.05, degraded_mode="local")
+
+    # A call that cannot be routed is the caller's error, not a Redis failure
+    backend.mode = "cross_shard"
+    for _ in range(3):
+        with pytest.raises(ValueError):
+            await limiter.consume_all([Q, Q])
+    assert limiter.breaker.state == CLOSED
+
+    backend.mode = "error"
+    org = BucketRequest("org", 1.0, 0.001, 1.0)
+    assert [d.allowed for d in await limiter.consume_all([Q, org])] == [True, True]
+    # org is empty now: the user bucket is not charged either
+    assert [d.allowed for d in await limiter.consume_all([Q, org])] == [True, False]
+    assert (await limiter.consume(Q)).remaining_tokens == pytest.approx(0.0, abs=0.01)
+
+
+@pytest.mark.asyncio
+async def test_replica_failures_do_not_open_the_breaker():
+    backend = _Backend()
+    limiter = BreakerLimiter(backend, _breaker(), timeout_s=0.01, degraded_mode="local")
+
+    for mode in ("error", "slow"):
+        backend.replica_mode = mode
+        for _ in range(3):
+            decisions = await limiter.peek_many([Q])
+            assert decisions[0].allowed is True and decisions[0].remaining_tokens == 1.0
+    assert limiter.breaker.state == CLOSED
+
+    # The primary is healthy: consumes still reach it
+    assert (await limiter.consume(Q)).remaining_tokens == 42.0
+    assert (await limiter.consume_many([Q, Q]))[1].remaining_tokens == 42.0
+    assert backend.calls == 3
@@ -0,0 +1,55 @@
+import asyncio
+import uuid
+
+import pytest
+
+from app.db.redis_client import create_redis
+from app.metrics import RATE_LIMIT_COALESCE_BATCH_SIZE
+from app.ratelimit.coalescer import CoalescingLimiter
+from app.ratelimit.redis_bucket import BucketRequest
+
+
+def _batches() -> tuple[float, float]:
+    return RATE_LIMIT_COALESCE_BATCH_SIZE._sum.get(), sum(
+        b.get() for b in RATE_LIMIT_COALESCE_BATCH_SIZE._buckets
+    )
+
+
+@pytest.mark.asyncio
+async def test_concurrent_decisions_share_one_pipeline():
+    r = create_redis()
+    limiter = CoalescingLimiter(r, ttl_sec=60, prefix="bucket:", window_s=0.01, max_batch=64)
+    key = f"co-{uuid.uuid4().hex}"
+    try:
+        items_before, batches_before = _batches()
+
+        q = BucketRequest(key, 5.0, 0.001, 1.0)
+        decisions = await asyncio.gather(*(limiter.consume(q) for _ in range(8)))
+
+        # Arrival order is preserved: first five fit, the rest are denied
+        assert [d.allowed for d in decisions] == [True] * 5 + [False] * 3
+        items_after, batches_after = _batches()
+        assert batches_after - batches_before == 1
+        assert items_after - items_before == 8
+    finally:
+        await limiter.aclose()
+        await r.delete(f"bucket:{key}")
+        await r.aclose()
+
+
+@pytest.mark.asyncio
+async def test_max_batch_flushes_without_waiting_for_the_window():
+    r = create_redis()
+    # A window this long would time the test out if max_batch did not trigger
+    limiter = CoalescingLimiter(r, ttl_sec=60, prefix="bucket:", window_s=30.0, max_batch=4)
+    key = f"co-{uuid.uuid4().hex}"
+    try:
+        q = BucketRequest(key, 10.0, 1.0, 1.0)
+        decisions = await asyncio.wait_for(
+            asyncio.gather(*(limiter.consume(q) for _ in range(4))), timeout=5
+        )
+        assert all(d.allowed for d in decisions)
+    finally:
+        await limiter.aclose()
+        await r.delete(f"bucket:{key}")
+        await r.aclose()
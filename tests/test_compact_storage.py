@@ -0,0 +1,140 @@
+import math
+import random
+import uuid
+
+import httpx
+import pytest
+from asgi_lifespan import LifespanManager
+
+from app.core.config import settings
+from app.db.redis_client import create_redis
+from app.main import create_app
+from app.ratelimit.redis_bucket import BucketRequest, try_consume_redis, try_consume_redis_many
+from app.ratelimit.storage import migrate_storage, sample_storage
+from app.ratelimit.token_bucket import BucketConfig, BucketState, try_consume
+
+T0 = 1_000.0
+COMPACT = "token_bucket_compact"
+
+
+async def _cleanup(r, prefix: str) -> None:
+    found = [k async for k in r.scan_iter(match=f"{prefix}*")]
+    if found:
+        await r.delete(*found)
+    await r.aclose()
+
+
+@pytest.mark.asyncio
+async def test_matches_token_bucket_decisions():
+    # Millisecond steps and binary-exact costs: fixed point loses nothing
+    cfg = BucketConfig(capacity=4.0, refill_rate_per_sec=2.0)
+    rng = random.Random(5)
+    r = create_redis()
+    prefix = f"test-{uuid.uuid4().hex[:8]}:"
+    state = BucketState(cfg.capacity, T0)
+    now = T0
+    try:
+        for _ in range(300):
+            now += rng.choice([0.0, 0.125, 0.25, 0.5, 1.0, 4.0])
+            cost = rng.choice([0.0, 0.5, 1.0, 2.0, 3.0, 5.0])
+            want, state = try_consume(cfg, state, cost, now)
+            got = await try_consume_redis(
+                r,
+                "k",
+                capacity=cfg.capacity,
+                refill_rate_per_sec=cfg.refill_rate_per_sec,
+                cost=cost,
+                ttl_sec=3600,
+                now_s=now,
+                prefix=prefix,
+                algorithm=COMPACT,
+            )
+            assert (got.allowed, got.retry_after_s) == (want.allowed, want.retry_after_s)
+            assert math.isclose(got.remaining_tokens, want.remaining_tokens, abs_tol=1e-6)
+    finally:
+        await _cleanup(r, prefix)
+
+
+@pytest.mark.asyncio
+async def test_writes_only_partial_buckets_until_full():
+    r = create_redis()
+    prefix = f"test-{uuid.uuid4().hex[:8]}:"
+    args = dict(capacity=4.0, refill_rate_per_sec=2.0, ttl_sec=3600, prefix=prefix)
+    try:
+        await try_consume_redis(r, "k", cost=3.0, now_s=T0, algorithm=COMPACT, **args)
+        assert await r.hgetall(f"{prefix}k") == {"t": "1000000", "l": "1000000"}
+        # Expires when full again (3 tokens at 2/s), not after BUCKET_KEY_TTL_SEC
+        assert 1000 < await r.pttl(f"{prefix}k") <= 1500
+
+        stored = await r.dump(f"{prefix}k")
+        for cost in (0.0, 2.0, 9.0):  # probe, denial, impossible: nothing to write
+            await try_consume_redis(r, "k", cost=cost, now_s=T0 + 0.25, algorithm=COMPACT, **args)
+            assert await r.dump(f"{prefix}k") == stored
+
+        # Full buckets have no key: probing one creates none
+        d = await try_consume_redis(r, "new", cost=0.0, now_s=T0, algorithm=COMPACT, **args)
+        assert d.remaining_tokens == 4.0 and await r.exists(f"{prefix}new") == 0
+    finally:
+        await _cleanup(r, prefix)
+
+
+@pytest.mark.asyncio
+async def test_reads_hash_keys_and_migrates_both_ways():
+    r = create_redis()
+    prefix = f"test-{uuid.uuid4().hex[:8]}:"
+    qs = [BucketRequest(f"k{i}", 10.0, 1.0, 4.0) for i in range(20)]
+    args = dict(ttl_sec=3600, prefix=prefix)
+    try:
+        await try_consume_redis_many(r, qs, now_s=T0, **args)
+        assert await r.hgetall(f"{prefix}k0") == {"tokens": "6", "last": "1000"}
+        report = await sample_storage(r, prefix, samples=100)
+        assert report["sampled"] == 20 and report["formats"]["hash"]["keys"] == 20
+
+        # The compact script continues from the hash state and rewrites it compactly
+        d = await try_consume_redis(
+            r,
+            "k0",
+            capacity=10.0,
+            refill_rate_per_sec=1.0,
+            cost=1.0,
+            now_s=T0 + 1,
+            **args,
+            algorithm=COMPACT,
+        )
+        assert math.isclose(d.remaining_tokens, 6.0)
+        assert await r.hgetall(f"{prefix}k0") == {"t": "6000000", "l": "1001000"}
+
+        assert await migrate_storage(r, prefix, COMPACT, batch=7) == {
+            "scanned": 20,
+            "converted": 19,
+        }
+        assert await r.hgetall(f"{prefix}k1") == {"t": "6000000", "l": "1000000"}
+        assert await r.ttl(f"{prefix}k1") > 3500  # the TTL survives the rewrite
+        report = await sample_storage(r, prefix, samples=100)
+        assert report["formats"]["compact"]["keys"] == 20
+
+        assert (await migrate_storage(r, prefix, "token_bucket"))["converted"] == 20
+        assert await r.hgetall(f"{prefix}k0") == {"tokens": "6", "last": "1001"}
+        d = await try_consume_redis(
+            r, "k1", capacity=10.0, refill_rate_per_sec=1.0, cost=0.0, now_s=T0 + 2, **args
+        )
+        assert math.isclose(d.remaining_tokens, 8.0)
+    finally:
+        await _cleanup(r, prefix)
+
+
+@pytest.mark.asyncio
+async def test_admin_storage_report(monkeypatch):
+    monkeypatch.setattr(settings, "ADMIN_TOKEN", "t")
+    app = create_app()
+    async with LifespanManager(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(
+            transport=transport, base_url="http://test", headers={"Authorization": "Bearer t"}
+        ) as c:
+            await c.post("/api/check", json={"key": f"st-{uuid.uuid4().hex}", "cost": 1})
+            r = await c.get("/api/admin/storage", params={"samples": 10})
+            assert r.status_code == 200
+            (report,) = r.json()["redis"]
+            assert 1 <= report["sampled"] <= 10
+            assert set(report["formats"]) == {"hash", "compact", "gcra"}
@@ -0,0 +1,89 @@
+import math
+import uuid
+
+import pytest
+
+from app.ratelimit.deny_cache import DenyCache, DenyCachingLimiter
+from app.ratelimit.memory_store import InMemoryBucketStore, MemoryLimiter
+from app.ratelimit.redis_bucket import BucketRequest, Decision
+
+T0 = 1_000.0
+P = "bucket:"
+
+
+def test_hit_returns_remaining_retry_after():
+    cache = DenyCache(max_entries=10)
+    q = BucketRequest("abuser", 5.0, 2.0, 3.0)
+
+    # Redis said: 1 token left, 1s until the cost of 3 fits
+    cache.remember(P, q, Decision(False, 1.0, 1.0), T0)
+
+    d = cache.lookup(P, q, T0 + 0.25)
+    assert d is not None and d.allowed is False
+    assert math.isclose(d.remaining_tokens, 1.5, rel_tol=1e-9)
+    assert math.isclose(d.retry_after_s, 0.75, rel_tol=1e-9)
+
+
+def test_expires_at_retry_after():
+    cache = DenyCache(max_entries=10)
+    q = BucketRequest("abuser", 5.0, 2.0, 3.0)
+    cache.remember(P, q, Decision(False, 1.0, 1.0), T0)
+
+    assert cache.lookup(P, q, T0 + 1.0) is None
+    assert len(cache) == 0
+
+
+def test_smaller_cost_that_may_fit_goes_to_redis():
+    cache = DenyCache(max_entries=10)
+    cache.remember(P, BucketRequest("k", 5.0, 2.0, 3.0), Decision(False, 1.0, 1.0), T0)
+
+    assert cache.lookup(P, BucketRequest("k", 5.0, 2.0, 1.0), T0) is None
+    assert cache.lookup(P, BucketRequest("k", 5.0, 2.0, 2.0), T0) is not None
+
+
+def test_limits_are_part_of_the_key():
+    cache = DenyCache(max_entries=10)
+    cache.remember(P, BucketRequest("k", 5.0, 2.0, 3.0), Decision(False, 1.0, 1.0), T0)
+
+    assert cache.lookup(P, BucketRequest("k", 10.0, 2.0, 3.0), T0) is None
+    assert cache.lookup("other:", BucketRequest("k", 5.0, 2.0, 3.0), T0) is None
+
+
+def test_allowed_decision_clears_entry():
+    cache = DenyCache(max_entries=10)
+    q = BucketRequest("k", 5.0, 2.0, 3.0)
+    cache.remember(P, q, Decision(False, 1.0, 1.0), T0)
+    cache.remember(P, q, Decision(True, 0.0, 0.0), T0 + 1.0)
+    assert len(cache) == 0
+
+
+def test_lru_eviction_bounds_size():
+    cache = DenyCache(max_entries=2)
+    qa, qb, qc = (BucketRequest(k, 5.0, 1.0, 3.0) for k in "abc")
+    cache.remember(P, qa, Decision(False, 0.0, 3.0), T0)
+    cache.remember(P, qb, Decision(False, 0.0, 3.0), T0)
+
+    # Touch "a" so "b" is the least recently used
+    assert cache.lookup(P, qa, T0) is not None
+    cache.remember(P, qc, Decision(False, 0.0, 3.0), T0)
+
+    assert len(cache) == 2
+    assert cache.lookup(P, qb, T0) is None
+    assert cache.lookup(P, qa, T0) is not None
+
+
+@pytest.mark.asyncio
+async def test_multi_limit_denials_are_not_remembered():
+    store = InMemoryBucketStore(ttl_s=60, max_bytes=1024 * 1024)
+    limiter = DenyCachingLimiter(MemoryLimiter(store), DenyCache(max_entries=10), prefix=P)
+    key = f"dup-{uuid.uuid4().hex}"
+    q = BucketRequest(key, 10.0, 0.01, 6.0)
+    try:
+        # The same key twice: the second limit sees the first one's (uncommitted) 6
+        decisions = await limiter.consume_all([q, q])
+        assert [d.allowed for d in decisions] == [True, False]
+        assert len(limiter.cache) == 0
+        # Nothing was taken: the bucket still has 10
+        assert (await limiter.consume(q)).allowed is True
+    finally:
+        await limiter.aclose()
@@ -0,0 +1,70 @@
+import math
+import random
+import uuid
+
+import pytest
+
+from app.db.redis_client import create_redis
+from app.ratelimit.gcra import GcraState, try_consume_gcra
+from app.ratelimit.redis_bucket import redis_key, try_consume_redis
+from app.ratelimit.token_bucket import BucketConfig, BucketState, try_consume
+
+T0 = 1_000.0
+
+
+def test_matches_token_bucket_decisions():
+    # Binary-exact rates and costs, so both algorithms see identical arithmetic
+    cfg = BucketConfig(capacity=4.0, refill_rate_per_sec=2.0)
+    rng = random.Random(3)
+    tb = BucketState(cfg.capacity, T0)
+    gcra = None
+    now = T0
+    for _ in range(5_000):
+        now += rng.choice([0.0, 0.125, 0.25, 0.5, 1.0, 4.0])
+        cost = rng.choice([0.0, 0.5, 1.0, 2.0, 3.0, 5.0])
+        want, tb = try_consume(cfg, tb, cost, now)
+        got, gcra = try_consume_gcra(cfg, gcra, cost, now)
+        assert got == want
+
+
+def test_burst_then_steady_rate():
+    cfg = BucketConfig(capacity=3.0, refill_rate_per_sec=1.0)
+    state = None
+    for _ in range(3):
+        d, state = try_consume_gcra(cfg, state, 1.0, T0)
+        assert d.allowed
+    assert state == GcraState(tat=T0 + 3.0)
+
+    d, _ = try_consume_gcra(cfg, state, 1.0, T0 + 0.25)
+    assert d.allowed is False
+    assert math.isclose(d.retry_after_s, 0.75)
+
+    d, _ = try_consume_gcra(cfg, state, 4.0, T0 + 100)
+    assert (d.allowed, d.retry_after_s) == (False, None)
+
+
+@pytest.mark.asyncio
+async def test_redis_gcra_single_value_with_expiry():
+    r = create_redis()
+    key = f"test-{uuid.uuid4().hex}"
+    rkey = redis_key("bucket:", key, "gcra")
+    args = dict(capacity=2.0, refill_rate_per_sec=4.0, ttl_sec=60, algorithm="gcra")
+    try:
+        d = await try_consume_redis(r, key, cost=1.5, now_s=T0, **args)
+        assert d.allowed is True
+        assert math.isclose(d.remaining_tokens, 0.5)
+        assert float(await r.get(rkey)) == T0 + 0.375
+        # Expires exactly when the bucket would be full again
+        assert 0 < await r.pttl(rkey) <= 375
+
+        d = await try_consume_redis(r, key, cost=1.0, now_s=T0, **args)
+        assert d.allowed is False
+        assert math.isclose(d.retry_after_s, 0.125)
+        assert float(await r.get(rkey)) == T0 + 0.375  # a denial writes nothing
+
+        d = await try_consume_redis(r, key, cost=1.0, now_s=T0 + 0.125, **args)
+        assert d.allowed is True
+        assert await r.exists(f"bucket:{key}") == 0  # no token-bucket hash
+    finally:
+        await r.delete(rkey)
+        await r.aclose()
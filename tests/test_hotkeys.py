@@ -0,0 +1,139 @@
+import random
+import uuid
+from collections import Counter
+
+import httpx
+import pytest
+from asgi_lifespan import LifespanManager
+
+from app.core import hotkeys
+from app.core.config import settings
+from app.core.hotkeys import HotKeys, Summary
+from app.main import create_app
+from app.metrics import RATE_LIMIT_HOT_KEY_SHARE, monotonic_s
+
+
+def _share(dimension: str, rank: int) -> float:
+    for metric in RATE_LIMIT_HOT_KEY_SHARE.collect():
+        for sample in metric.samples:
+            if sample.labels == {"dimension": dimension, "rank": str(rank)}:
+                return sample.value
+    return -1.0
+
+
+def test_heavy_keys_are_found_with_bounded_error():
+    tracker = HotKeys(capacity=50, window_s=60.0, windows=1, now_s=0.0)
+    rng = random.Random(5)
+    true: dict[str, Counter] = {"requests": Counter(), "denied": Counter(), "cost": Counter()}
+    for i in range(50_000):
+        # Skewed traffic drowned in one-off keys
+        key = f"u{int(rng.paretovariate(1.0))}" if rng.random() < 0.5 else f"once-{i}"
+        cost = 50.0 if key == "u3" else 1.0
+        allowed = key != "u2"
+        tracker.record(key, cost, allowed, 1.0)
+        true["requests"][key] += 1
+        true["denied" if not allowed else "cost"][key] += 1 if not allowed else cost
+
+    assert len(tracker._current.rows) <= 4 * 50
+    for by in ("requests", "denied", "cost"):
+        res = tracker.top(by, 10, 1, 2.0)
+        assert res["totals"][by] == sum(true[by].values())
+        listed = {row["key"]: row for row in res["keys"]}
+        for key, _ in true[by].most_common(3):
+            assert key in listed
+        for key, row in listed.items():
+            assert row[by] >= true[by][key] >= row[by] - row["error"][by]
+        # Anything not listed got at most unlisted_max
+        assert all(v <= res["unlisted_max"] for k, v in true[by].items() if k not in listed)
+
+    assert tracker.top("denied", 1, 1, 2.0)["keys"][0]["key"] == "u2"
+    assert tracker.top("cost", 1, 1, 2.0)["keys"][0]["key"] == "u3"
+
+
+def test_summary_prunes_to_the_top_of_each_column():
+    s = Summary(2)
+    for key, row in {"a": 9, "b": 8, "c": 1, "d": 1, "e": 1, "f": 1, "g": 1, "h": 1}.items():
+        s.insert(key)[0] += row
+    s.insert("new")[0] += 1
+    assert set(s.rows) == {"a", "b", "new"}
+    assert s.floors[0] == 1.0
+    # Re-entered at the floor: counted 2, of which up to 1 may be other keys'
+    assert s.estimate("new") == ([2.0, 0.0, 0.0], [1.0, 0.0, 0.0])
+    assert s.estimate("gone")[0] == [1.0, 0.0, 0.0]
+
+
+def test_windows_roll_and_export_rank_shares():
+    tracker = HotKeys(capacity=10, window_s=10.0, windows=2, now_s=0.0)
+    for _ in range(3):
+        tracker.record("hot", 1.0, False, 1.0)
+    tracker.record("cold", 1.0, True, 2.0)
+
+    # Rotation exports the completed window
+    tracker.record("next", 1.0, True, 11.0)
+    assert _share("requests", 1) == 0.75 and _share("requests", 2) == 0.25
+    assert _share("denied", 1) == 1.0 and _share("denied", 2) == 0.0
+
+    assert [r["key"] for r in tracker.top("requests", 5, 1, 12.0)["keys"]] == ["next"]
+    both = tracker.top("requests", 5, 2, 12.0)
+    assert both["keys"][0]["key"] == "hot" and both["keys"][0]["denied"] == 3
+    assert both["span_s"] == pytest.approx(12.0)
+
+    # After an idle minute, everything has aged out
+    res = tracker.top("requests", 5, 3, 80.0)
+    assert res["keys"] == [] and res["totals"]["requests"] == 0
+
+
+@pytest.mark.asyncio
+async def test_admin_endpoint_lists_denied_keys(monkeypatch):
+    tracker = HotKeys(capacity=100, window_s=60.0, windows=2, now_s=monotonic_s())
+    monkeypatch.setattr(hotkeys, "tracker", tracker)
+    monkeypatch.setattr(settings, "ADMIN_TOKEN", "t")
+    key = f"hk-{uuid.uuid4().hex}"
+    app = create_app()
+    async with LifespanManager(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(
+            transport=transport, base_url="http://test", headers={"Authorization": "Bearer t"}
+        ) as c:
+            for _ in range(4):
+                r = await c.post(
+                    "/api/check",
+                    json={"key": key, "cost": 1, "capacity": 2, "refill_rate_per_sec": 0.001},
+                )
+                assert r.status_code == 200
+            r = await c.get("/api/admin/hotkeys", params={"by": "denied", "limit": 5})
+            assert r.status_code == 200
+            body = r.json()
+            assert body["keys"][0]["key"] == key
+            assert body["keys"][0]["requests"] == 4 and body["keys"][0]["denied"] == 2
+            assert body["keys"][0]["cost"] == 2
+
+            r = await c.get("/api/admin/hotkeys", params={"windows": 10})
+            assert r.status_code == 422
+
+            monkeypatch.setattr(hotkeys, "tracker", None)
+            assert (await c.get("/api/admin/hotkeys")).status_code == 404
+
+
+@pytest.mark.asyncio
+async def test_denied_multi_limit_adds_no_consumed_cost(monkeypatch):
+    tracker = HotKeys(capacity=100, window_s=60.0, windows=2, now_s=monotonic_s())
+    monkeypatch.setattr(hotkeys, "tracker", tracker)
+    user, org = f"hk-{uuid.uuid4().hex}", f"hk-{uuid.uuid4().hex}"
+    app = create_app()
+    async with LifespanManager(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as c:
+            limits = [
+                {"key": user, "cost": 1, "capacity": 10, "refill_rate_per_sec": 0.001},
+                {"key": org, "cost": 1, "capacity": 1, "refill_rate_per_sec": 0.001},
+            ]
+            for _ in range(2):
+                r = await c.post("/api/check/multi", json={"limits": limits})
+                assert r.status_code == 200
+
+    # The second call passed the user limit's own check, but nothing was taken
+    rows = {row["key"]: row for row in tracker.top("requests", 5, 1, monotonic_s())["keys"]}
+    for key in (user, org):
+        assert rows[key]["requests"] == 2
+        assert rows[key]["cost"] == 1 and rows[key]["denied"] == 1
@@ -0,0 +1,48 @@
+import httpx
+import pytest
+from fastapi import FastAPI
+from prometheus_client import REGISTRY
+
+from app.core.instrumentation import InstrumentationMiddleware
+
+
+def _app() -> FastAPI:
+    app = FastAPI()
+
+    @app.get("/items/{item_id}")
+    async def item(item_id: str):
+        return {"id": item_id}
+
+    @app.get("/boom")
+    async def boom():
+        raise RuntimeError("boom")
+
+    app.add_middleware(InstrumentationMiddleware)
+    return app
+
+
+def _count(path: str, status: str) -> float:
+    value = REGISTRY.get_sample_value(
+        "http_requests_total", {"method": "GET", "path": path, "status": status}
+    )
+    return value or 0.0
+
+
+@pytest.mark.asyncio
+async def test_request_id_and_route_template_metrics():
+    transport = httpx.ASGITransport(app=_app(), raise_app_exceptions=False)
+    before = _count("/items/{item_id}", "200")
+
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as c:
+        r = await c.get("/items/1", headers={"X-Request-Id": "abc-123"})
+        assert r.headers["x-request-id"] == "abc-123"
+
+        r = await c.get("/items/2")
+        assert len(r.headers["x-request-id"]) == 36  # generated uuid4
+
+        boom_before = _count("/boom", "500")
+        r = await c.get("/boom")
+        assert r.status_code == 500
+
+    assert _count("/items/{item_id}", "200") == before + 2
+    assert _count("/boom", "500") == boom_before + 1
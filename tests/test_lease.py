@@ -0,0 +1,123 @@
+import asyncio
+import math
+import time
+import uuid
+
+import pytest
+
+from app.db.redis_client import create_redis
+from app.metrics import RATE_LIMIT_LEASE_DECISIONS_TOTAL, RATE_LIMIT_LEASE_GRANTS_TOTAL
+from app.ratelimit.lease import LeaseLimiter
+from app.ratelimit.redis_bucket import BucketRequest
+
+
+def _local() -> float:
+    return RATE_LIMIT_LEASE_DECISIONS_TOTAL.labels(source="local")._value.get()
+
+
+def _limiter(r) -> LeaseLimiter:
+    return LeaseLimiter(r, ttl_sec=60, prefix="bucket:", lease_fraction=0.1, lease_ttl_s=5.0)
+
+
+@pytest.mark.asyncio
+async def test_serves_from_local_lease_after_one_grant():
+    r = create_redis()
+    limiter = _limiter(r)
+    key = f"lease-{uuid.uuid4().hex}"
+    try:
+        q = BucketRequest(key, 100.0, 0.001, 1.0)
+        before = _local()
+
+        # First call leases 10 tokens (10% of capacity) and spends one
+        d = await limiter.consume(q)
+        assert d.allowed is True
+        assert math.isclose(float(await r.hget(f"bucket:{key}", "tokens")), 90.0, abs_tol=0.01)
+
+        # The next 7 are answered locally (the renewal threshold is 2.5 tokens)
+        for _ in range(7):
+            assert (await limiter.consume(q)).allowed is True
+        assert _local() - before == 7
+    finally:
+        await limiter.aclose()
+        await r.delete(f"bucket:{key}")
+        await r.aclose()
+
+
+@pytest.mark.asyncio
+async def test_denies_when_redis_cannot_grant_the_cost():
+    r = create_redis()
+    limiter = _limiter(r)
+    key = f"lease-{uuid.uuid4().hex}"
+    try:
+        d = await limiter.consume(BucketRequest(key, 5.0, 1.0, 5.0))
+        assert d.allowed is True
+
+        d = await limiter.consume(BucketRequest(key, 5.0, 1.0, 2.0))
+        assert d.allowed is False
+        assert d.retry_after_s is not None and d.retry_after_s > 1.0
+    finally:
+        await limiter.aclose()
+        await r.delete(f"bucket:{key}")
+        await r.aclose()
+
+
+@pytest.mark.asyncio
+async def test_unused_lease_tokens_are_returned_on_close():
+    r = create_redis()
+    limiter = _limiter(r)
+    key = f"lease-{uuid.uuid4().hex}"
+    try:
+        await limiter.consume(BucketRequest(key, 100.0, 0.001, 1.0))
+        await limiter.aclose()
+
+        # 9 leased-but-unused tokens went back: only the 1 spent is missing
+        tokens = float(await r.hget(f"bucket:{key}", "tokens"))
+        assert math.isclose(tokens, 99.0, abs_tol=0.01)
+    finally:
+        await r.delete(f"bucket:{key}")
+        await r.aclose()
+
+
+@pytest.mark.asyncio
+async def test_empty_renewal_backs_off_and_keeps_the_expiry():
+    r = create_redis()
+    limiter = _limiter(r)
+    key = f"lease-{uuid.uuid4().hex}"
+    lk = (key, 100.0, 0.001)
+
+    async def settle():
+        # Background renewals done
+        await asyncio.gather(*limiter._tasks)
+
+    def grants() -> float:
+        return sum(
+            RATE_LIMIT_LEASE_GRANTS_TOTAL.labels(result=result)._value.get()
+            for result in ("granted", "empty")
+        )
+
+    try:
+        # 12 tokens left in Redis: a 10-token lease, then a 2-token renewal, then none
+        await r.hset(f"bucket:{key}", mapping={"tokens": 12, "last": time.time()})
+        q = BucketRequest(key, 100.0, 0.001, 1.0)
+        assert (await limiter.consume(q)).allowed
+        expires_at = limiter._leases[lk].expires_at
+
+        # Down to 2 tokens (under 2.5): the renewal merges 2 more into the live lease
+        for _ in range(7):
+            assert (await limiter.consume(q)).allowed
+        await settle()
+        lease = limiter._leases[lk]
+        assert lease.state.tokens == pytest.approx(4.0, abs=0.01)
+        assert lease.expires_at == expires_at and not lease.renewing
+
+        # Under the threshold again, Redis empty (but for refill): one grant, then no more
+        before = grants()
+        for _ in range(4):
+            assert (await limiter.consume(q)).allowed
+            await settle()
+        assert grants() - before == 1
+        lease = limiter._leases[lk]
+        assert lease.renewing and lease.expires_at == expires_at
+    finally:
+        await limiter.aclose()
+        await r.delete(f"bucket:{key}")
@@ -0,0 +1,98 @@
+import asyncio
+import collections
+import random
+
+import pytest
+
+from load.generator import HdrHistogram, LoadConfig, ZipfSampler, key_sampler, parse_costs, run
+
+
+def test_hdr_histogram_keeps_three_digits():
+    rng = random.Random(3)
+    values = sorted(int(rng.expovariate(1 / 2000)) for _ in range(50_000))
+    h = HdrHistogram()
+    for v in values:
+        h.record(v)
+    for p in (50, 90, 99, 99.9):
+        exact = values[int(p / 100 * len(values)) - 1]
+        assert abs(h.value_at_percentile(p) - exact) <= exact / 1000 + 1
+
+    out = h.to_dict()
+    assert out["count"] == 50_000 and out["max"] == values[-1]
+    assert sum(c for _, c in out["buckets"]) == 50_000
+    assert out["distribution"][-1] == [100.0, values[-1]]
+    # Out of range values are clamped, not lost
+    h.record(10**15)
+    assert h.max == h.highest
+
+
+def test_key_distributions():
+    rng = random.Random(7)
+    zipf = ZipfSampler(1_000_000, 1.2, rng)
+    counts = collections.Counter(zipf() for _ in range(100_000))
+    assert min(counts) >= 1 and max(counts) <= 1_000_000
+    # P(1) / P(2) = 2^s
+    assert counts[1] / counts[2] == pytest.approx(2**1.2, rel=0.1)
+
+    hot = key_sampler("hotspot", 10_000, rng, hot_keys=0.01, hot_traffic=0.8)
+    assert sum(hot() < 100 for _ in range(20_000)) / 20_000 == pytest.approx(0.8, abs=0.02)
+    uniform = key_sampler("uniform", 10, rng)
+    assert {uniform() for _ in range(1000)} == set(range(10))
+
+
+def test_cost_mix():
+    assert parse_costs("1:90,5:9,50:1") == ([1.0, 5.0, 50.0], [90.0, 99.0, 100.0])
+    assert parse_costs("2") == ([2.0], [1.0])
+    with pytest.raises(ValueError):
+        parse_costs("-1:5")
+
+
+@pytest.mark.asyncio
+async def test_latency_counts_the_backlog_behind_a_stall():
+    served = 0
+    body = b'{"allowed":false,"remaining_tokens":0.5,"retry_after_s":0.5}'
+
+    async def handle(reader, writer):
+        nonlocal served
+        while await reader.readline():
+            length = 0
+            while (line := await reader.readline()) != b"\r\n":
+                if line.lower().startswith(b"content-length:"):
+                    length = int(line.split(b":")[1])
+            await reader.readexactly(length)
+            served += 1
+            if served == 20:
+                await asyncio.sleep(0.3)  # one slow response, as a GC pause would be
+            writer.write(
+                b"HTTP/1.1 429 Too Many Requests\r\nContent-Type: application/json\r\n"
+                b"Content-Length: %d\r\n\r\n%s" % (len(body), body)
+            )
+            await writer.drain()
+        writer.close()
+
+    server = await asyncio.start_server(handle, "127.0.0.1", 0)
+    port = server.sockets[0].getsockname()[1]
+    try:
+        res = await run(
+            LoadConfig(
+                url=f"http://127.0.0.1:{port}",
+                endpoint="enforce",
+                rate=200,
+                duration_s=1.0,
+                connections=1,
+                keys=1000,
+            )
+        )
+    finally:
+        server.close()
+        await server.wait_closed()
+
+    assert res["requests"]["completed"] == res["requests"]["sent"] == 200
+    assert res["status"] == {"429": 200}
+    assert res["decisions"]["deny_ratio"] == 1.0
+    # A closed-loop client would see one slow call; requests due during the stall
+    # waited for it too, and count from when they were due
+    service, latency = res["service_time_us"], res["latency_us"]
+    assert service["percentiles"]["p90"] < 50_000
+    assert latency["percentiles"]["p90"] > 100_000
+    assert latency["max"] >= 300_000
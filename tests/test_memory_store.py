@@ -0,0 +1,109 @@
+import random
+
+import pytest
+
+from app.core.config import settings
+from app.ratelimit.limiter import create_limiter
+from app.ratelimit.memory_store import BYTES_PER_SLOT, InMemoryBucketStore, MemoryLimiter
+from app.ratelimit.redis_bucket import BucketRequest
+from app.ratelimit.token_bucket import BucketConfig, BucketState, try_consume
+
+MB = 1024 * 1024
+T0 = 1_000.0
+
+
+def test_matches_try_consume():
+    rng = random.Random(7)
+    store = InMemoryBucketStore(ttl_s=1e9, max_bytes=MB)
+    cfg = BucketConfig(capacity=4.0, refill_rate_per_sec=1.5)
+    states: dict[str, BucketState] = {}
+    now = T0
+    for _ in range(20_000):
+        now += rng.expovariate(20.0)
+        # Occasional out-of-order timestamps take the "no refill" branch
+        t = now - rng.random() if rng.random() < 0.05 else now
+        key = f"k{rng.randrange(300)}"
+        cost = rng.choice([0.0, 0.5, 1.0, 2.0, 5.0, rng.random() * 3])
+
+        want, states[key] = try_consume(cfg, states.get(key) or BucketState(4.0, t), cost, t)
+        got = store.consume(key, 4.0, 1.5, cost, t)
+        assert (got.allowed, got.remaining_tokens, got.retry_after_s) == (
+            want.allowed,
+            want.remaining_tokens,
+            want.retry_after_s,
+        )
+    assert len(store) == len(states)
+
+
+def test_rejects_invalid_cost():
+    store = InMemoryBucketStore(ttl_s=60, max_bytes=MB)
+    for cost in (-1.0, float("nan"), float("inf")):
+        with pytest.raises(ValueError):
+            store.consume("k", 1.0, 1.0, cost, T0)
+
+
+def test_idle_buckets_expire_and_are_swept():
+    store = InMemoryBucketStore(ttl_s=10, max_bytes=MB)
+    for i in range(2_000):
+        assert store.consume(f"k{i}", 1.0, 0.001, 1.0, T0).allowed
+    # Idle time counts from the last access
+    assert store.consume("k0", 1.0, 0.001, 1.0, T0 + 5).allowed is False
+
+    # Untouched for ttl: starts over full, like an expired Redis key
+    assert store.consume("k0", 1.0, 0.001, 1.0, T0 + 15).allowed is True
+
+    removed = sum(store.sweep(T0 + 16, max_slots=512) for _ in range(20))
+    assert removed == 1_999
+    assert len(store) == 1
+    assert store.consume("k0", 1.0, 0.001, 1.0, T0 + 16).allowed is False
+
+
+def test_memory_cap_evicts_least_recently_used():
+    store = InMemoryBucketStore(ttl_s=1e9, max_bytes=2048 * BYTES_PER_SLOT)
+    assert store.max_keys == 1536
+    for i in range(10_000):
+        store.consume(f"k{i}", 1.0, 0.001, 1.0, T0 + i)
+    assert len(store) == store.max_keys
+    assert store.memory_bytes == 2048 * BYTES_PER_SLOT
+
+    # The most recent keys survive (still denied); the oldest were evicted
+    recent = sum(
+        not store.consume(f"k{i}", 1.0, 0.001, 1.0, T0 + 10_000).allowed
+        for i in range(9_900, 10_000)
+    )
+    assert recent >= 95
+
+
+def test_growth_keeps_every_bucket():
+    store = InMemoryBucketStore(ttl_s=1e9, max_bytes=64 * MB)
+    for i in range(50_000):
+        store.consume(f"k{i}", 2.0, 0.001, 1.5, T0)
+    assert len(store) == 50_000
+    assert store.memory_bytes / len(store) <= 2 * BYTES_PER_SLOT / 0.75
+    assert all(
+        store.consume(f"k{i}", 2.0, 0.001, 1.0, T0).allowed is False for i in range(0, 50_000, 97)
+    )
+
+
+@pytest.mark.asyncio
+async def test_memory_limiter():
+    limiter = MemoryLimiter(InMemoryBucketStore(ttl_s=60, max_bytes=MB))
+    q = BucketRequest("user-1", 2.0, 0.001, 1.0)
+    try:
+        decisions = await limiter.consume_many([q, q])
+        assert [d.allowed for d in decisions] == [True, True]
+        assert (await limiter.consume(q)).allowed is False
+    finally:
+        await limiter.aclose()
+
+
+@pytest.mark.asyncio
+async def test_memory_backend_is_presized_from_settings(monkeypatch):
+    monkeypatch.setattr(settings, "LIMITER_BACKEND", "memory")
+    monkeypatch.setattr(settings, "MEMORY_STORE_INITIAL_KEYS", 100_000)
+    limiter = create_limiter(None)
+    try:
+        slots = len(limiter.store._hashes)
+        assert slots * 0.75 >= 100_000 and slots < 2 * 100_000 / 0.75
+    finally:
+        await limiter.aclose()
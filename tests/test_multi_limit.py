@@ -0,0 +1,141 @@
+import math
+import random
+import uuid
+
+import httpx
+import pytest
+import redis.asyncio as redis
+from asgi_lifespan import LifespanManager
+
+from app.core.config import settings
+from app.db.redis_client import create_redis
+from app.main import create_app
+from app.ratelimit.memory_store import InMemoryBucketStore
+from app.ratelimit.redis_bucket import BucketRequest, redis_key, try_consume_redis_all
+from app.ratelimit.sharding import ShardedRedisLimiter
+
+T0 = 1_000.0
+
+
+async def _cleanup(r, prefix: str) -> None:
+    found = [k async for k in r.scan_iter(match=f"{prefix}*")]
+    if found:
+        await r.delete(*found)
+    await r.aclose()
+
+
+@pytest.mark.parametrize("algorithm", ["token_bucket", "gcra", "token_bucket_compact"])
+@pytest.mark.asyncio
+async def test_commits_all_limits_or_none(algorithm):
+    r = create_redis()
+    prefix = f"test-{uuid.uuid4().hex[:8]}:"
+    user, org = BucketRequest("user", 10.0, 1.0, 4.0), BucketRequest("org", 6.0, 2.0, 4.0)
+    args = dict(ttl_sec=60, prefix=prefix, algorithm=algorithm)
+    try:
+        d = await try_consume_redis_all(r, [user, org], now_s=T0, **args)
+        assert [x.allowed for x in d] == [True, True]
+        assert [x.remaining_tokens for x in d] == [6.0, 2.0]
+
+        # The org bucket binds: the user bucket is NOT charged
+        stored = await r.dump(redis_key(prefix, "user", algorithm))
+        d = await try_consume_redis_all(r, [user, org], now_s=T0, **args)
+        assert [x.allowed for x in d] == [True, False]
+        assert [x.remaining_tokens for x in d] == [6.0, 2.0]
+        assert math.isclose(d[1].retry_after_s, 1.0)
+        assert await r.dump(redis_key(prefix, "user", algorithm)) == stored
+
+        d = await try_consume_redis_all(r, [user, org], now_s=T0 + 1.0, **args)
+        assert [x.allowed for x in d] == [True, True]
+        assert [x.remaining_tokens for x in d] == [3.0, 0.0]
+
+        # An impossible limit denies the whole call
+        d = await try_consume_redis_all(
+            r, [user._replace(cost=1.0), org._replace(cost=7.0)], now_s=T0 + 10, **args
+        )
+        assert (d[0].allowed, d[1].allowed, d[1].retry_after_s) == (True, False, None)
+    finally:
+        await _cleanup(r, prefix)
+
+
+@pytest.mark.asyncio
+async def test_memory_store_matches_redis_script():
+    r = create_redis()
+    prefix = f"test-{uuid.uuid4().hex[:8]}:"
+    store = InMemoryBucketStore(ttl_s=3600, max_bytes=1 << 20)
+    rng = random.Random(11)
+    limits = {"u1": (4.0, 1.0), "u2": (4.0, 2.0), "org": (8.0, 2.0), "global": (16.0, 4.0)}
+    now = T0
+    try:
+        for _ in range(300):
+            now += rng.choice([0.0, 0.25, 0.5, 1.0])
+            keys = [rng.choice(["u1", "u2"]), "org", "global"]
+            if rng.random() < 0.2:
+                keys.append(keys[0])  # the same bucket twice
+            qs = [BucketRequest(k, *limits[k], rng.choice([0.0, 1.0, 2.0, 3.0])) for k in keys]
+
+            want = await try_consume_redis_all(r, qs, ttl_sec=3600, now_s=now, prefix=prefix)
+            got = store.consume_all(qs, now)
+            for w, g in zip(want, got):
+                assert (g.allowed, g.retry_after_s) == (w.allowed, w.retry_after_s)
+                assert math.isclose(g.remaining_tokens, w.remaining_tokens, abs_tol=1e-9)
+    finally:
+        await _cleanup(r, prefix)
+
+
+def _db_url(db: int) -> str:
+    return settings.REDIS_URL.rsplit("/", 1)[0] + f"/{db}"
+
+
+@pytest.mark.asyncio
+async def test_sharded_limits_must_share_a_shard():
+    shards = {f"db{n}": redis.from_url(_db_url(n), decode_responses=True) for n in (1, 2, 3)}
+    limiter = ShardedRedisLimiter(shards, ttl_sec=60, prefix="bucket:")
+    tag = uuid.uuid4().hex
+    tagged = [BucketRequest(f"{{{tag}}}:{k}", 5.0, 1.0, 1.0) for k in ("user", "org", "global")]
+    try:
+        assert all(d.allowed for d in await limiter.consume_all(tagged))
+
+        keys = [f"sh-{uuid.uuid4().hex}" for _ in range(20)]
+        spread = [k for k in keys if limiter.shard_for(k) != limiter.shard_for(keys[0])]
+        with pytest.raises(ValueError):
+            await limiter.consume_all(
+                [BucketRequest(keys[0], 5.0, 1.0, 1.0), BucketRequest(spread[0], 5.0, 1.0, 1.0)]
+            )
+    finally:
+        owner = shards[limiter.shard_for(tagged[0].key)]
+        await owner.delete(*(f"bucket:{q.key}" for q in tagged))
+        for client in shards.values():
+            await client.aclose()
+
+
+@pytest.mark.asyncio
+async def test_multi_endpoints_report_the_binding_limit():
+    app = create_app()
+    tag = uuid.uuid4().hex
+    limits = [
+        {"key": f"{{{tag}}}:user", "cost": 2, "capacity": 10, "refill_rate_per_sec": 1},
+        {"key": f"{{{tag}}}:org", "cost": 2, "capacity": 3, "refill_rate_per_sec": 0.5},
+        {"key": f"{{{tag}}}:global", "cost": 2, "capacity": 100, "refill_rate_per_sec": 1},
+    ]
+
+    async with LifespanManager(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as c:
+            r = await c.post("/api/check/multi", json={"limits": limits})
+            body = r.json()
+            assert body["allowed"] is True
+            assert body["binding_index"] == 1  # fewest tokens left
+            assert r.headers["ratelimit-remaining"] == "1"
+
+            r = await c.post("/api/enforce/multi", json={"limits": limits})
+            assert r.status_code == 429
+            body = r.json()
+            assert body["binding_index"] == 1
+            assert [res["allowed"] for res in body["results"]] == [True, False, True]
+            assert body["retry_after_s"] == pytest.approx(2.0, abs=0.1)
+            assert r.headers["retry-after"] == "2"
+            # Nothing was charged: the user bucket still holds 8 tokens
+            assert body["results"][0]["remaining_tokens"] == pytest.approx(8.0, abs=0.1)
+
+            r = await c.post("/api/check/multi", json={"limits": []})
+            assert r.status_code == 422
@@ -0,0 +1,180 @@
+import math
+import uuid
+
+import httpx
+import pytest
+import redis.asyncio as redis
+from asgi_lifespan import LifespanManager
+
+from app.core.config import settings
+from app.db.redis_client import create_redis
+from app.main import create_app
+from app.ratelimit.limiter import RedisLimiter
+from app.ratelimit.memory_store import InMemoryBucketStore, MemoryLimiter
+from app.ratelimit.redis_bucket import (
+    ALGORITHMS,
+    BucketRequest,
+    peek_redis_many,
+    redis_key,
+    try_consume_redis,
+    try_consume_redis_many,
+)
+
+T0 = 1_000.0
+
+
+async def _cleanup(r, prefix: str) -> None:
+    found = [k async for k in r.scan_iter(match=f"{prefix}*")]
+    if found:
+        await r.delete(*found)
+    await r.aclose()
+
+
+@pytest.mark.asyncio
+async def test_only_allowed_costs_write():
+    r = create_redis()
+    prefix = f"test-{uuid.uuid4().hex[:8]}:"
+    args = dict(capacity=4.0, refill_rate_per_sec=2.0, ttl_sec=3600, prefix=prefix)
+    try:
+        # Nothing stored yet: a probe creates no key
+        await try_consume_redis(r, "k", cost=0.0, now_s=T0, **args)
+        assert await r.exists(f"{prefix}k") == 0
+
+        await try_consume_redis(r, "k", cost=3.0, now_s=T0, **args)
+        stored = await r.dump(f"{prefix}k")
+        for cost in (0.0, 2.0, 9.0):  # probe, denial, impossible
+            d = await try_consume_redis(r, "k", cost=cost, now_s=T0 + 0.25, **args)
+            assert math.isclose(d.remaining_tokens, 1.5)
+            assert await r.dump(f"{prefix}k") == stored
+
+        # The balance refills from the older timestamp just the same
+        d = await try_consume_redis(r, "k", cost=2.0, now_s=T0 + 0.5, **args)
+        assert d.allowed and math.isclose(d.remaining_tokens, 0.0, abs_tol=1e-9)
+    finally:
+        await _cleanup(r, prefix)
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("algorithm", ALGORITHMS)
+async def test_peek_answers_as_consume_without_writing(algorithm):
+    r = create_redis()
+    prefix = f"test-{uuid.uuid4().hex[:8]}:"
+    keys = ["a", "b", "fresh"]
+    try:
+        await try_consume_redis_many(
+            r,
+            [BucketRequest("a", 4.0, 2.0, 3.0), BucketRequest("b", 4.0, 2.0, 1.0)],
+            ttl_sec=3600,
+            now_s=T0,
+            prefix=prefix,
+            algorithm=algorithm,
+        )
+        before = [await r.dump(redis_key(prefix, k, algorithm)) for k in keys]
+
+        for cost in (0.0, 1.0, 2.0, 9.0):
+            qs = [BucketRequest(k, 4.0, 2.0, cost) for k in keys]
+            peeked = await peek_redis_many(
+                r, qs, now_s=T0 + 0.25, prefix=prefix, algorithm=algorithm
+            )
+            assert [await r.dump(redis_key(prefix, k, algorithm)) for k in keys] == before
+
+            # Consuming a copy of each bucket gives the same answers
+            for q, p, state in zip(qs, peeked, before):
+                other = f"{prefix}copy-{uuid.uuid4().hex[:6]}:"
+                if state is not None:
+                    await r.restore(redis_key(other, q.key, algorithm), 0, state)
+                (d,) = await try_consume_redis_many(
+                    r, [q], ttl_sec=3600, now_s=T0 + 0.25, prefix=other, algorithm=algorithm
+                )
+                await r.delete(redis_key(other, q.key, algorithm))
+                assert (p.allowed, p.retry_after_s is None) == (d.allowed, d.retry_after_s is None)
+                assert math.isclose(p.remaining_tokens, d.remaining_tokens, abs_tol=1e-6)
+                if d.retry_after_s is not None:
+                    assert math.isclose(p.retry_after_s, d.retry_after_s, abs_tol=1e-6)
+    finally:
+        await _cleanup(r, prefix)
+
+
+def _db_url(db: int) -> str:
+    return settings.REDIS_URL.rsplit("/", 1)[0] + f"/{db}"
+
+
+@pytest.mark.asyncio
+async def test_peeks_read_replicas_in_turn():
+    # Separate databases stand in for a primary and its replicas
+    primary, *replicas = (redis.from_url(_db_url(n), decode_responses=True) for n in (5, 6, 7))
+    prefix = f"test-{uuid.uuid4().hex[:8]}:"
+    limiter = RedisLimiter(primary, ttl_sec=60, prefix=prefix, replicas=replicas)
+    try:
+        await limiter.consume(BucketRequest("k", 10.0, 0.001, 1.0))
+        # Each "replica" holds a different copy, so the one that answered shows
+        await replicas[0].hset(f"{prefix}k", mapping={"tokens": 3, "last": 9e9})
+        await replicas[1].hset(f"{prefix}k", mapping={"tokens": 7, "last": 9e9})
+
+        q = BucketRequest("k", 10.0, 0.001, 0.0)
+        seen = [(await limiter.peek_many([q]))[0].remaining_tokens for _ in range(4)]
+        assert seen == [3.0, 7.0, 3.0, 7.0]
+        assert await primary.hget(f"{prefix}k", "tokens") == "9"
+
+        # Without replicas, the primary answers
+        plain = RedisLimiter(primary, ttl_sec=60, prefix=prefix)
+        (d,) = await plain.peek_many([q])
+        assert math.isclose(d.remaining_tokens, 9.0, abs_tol=1e-3)
+    finally:
+        for client in (*replicas, primary):
+            await client.delete(f"{prefix}k")
+            await client.aclose()
+
+
+@pytest.mark.asyncio
+async def test_memory_limiter_peek():
+    limiter = MemoryLimiter(InMemoryBucketStore(ttl_s=60, max_bytes=1 << 20))
+    try:
+        await limiter.consume(BucketRequest("k", 5.0, 0.001, 4.0))
+        peeked = await limiter.peek_many(
+            [BucketRequest("k", 5.0, 0.001, 2.0), BucketRequest("k", 5.0, 0.001, 0.0)]
+        )
+        assert [d.allowed for d in peeked] == [False, True]
+        assert math.isclose(peeked[1].remaining_tokens, 1.0, abs_tol=1e-3)
+        assert (await limiter.consume(BucketRequest("k", 5.0, 0.001, 1.0))).allowed
+    finally:
+        await limiter.aclose()
+
+
+@pytest.mark.asyncio
+async def test_dry_run_and_status_endpoints():
+    app = create_app()
+    key = f"peek-{uuid.uuid4().hex}"
+    async with LifespanManager(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as c:
+            await c.post("/api/check", json={"key": key, "cost": 3, "capacity": 5})
+
+            for _ in range(2):
+                r = await c.post(
+                    "/api/check", json={"key": key, "cost": 2, "capacity": 5, "dry_run": True}
+                )
+                assert r.status_code == 200
+                assert r.json()["allowed"] is True
+                assert r.headers["ratelimit-remaining"] == "0"
+
+            r = await c.post(
+                "/api/check/status",
+                json={
+                    "items": [
+                        {"key": key, "capacity": 5},
+                        {"key": key, "capacity": 5, "cost": 4},
+                        {"key": f"{key}-new", "capacity": 5},
+                    ]
+                },
+            )
+            assert r.status_code == 200
+            body = r.json()
+            assert [res["allowed"] for res in body["results"]] == [True, False, True]
+            assert math.floor(body["results"][0]["remaining_tokens"]) == 2
+            assert body["results"][2]["remaining_tokens"] == 5
+            assert r.headers["retry-after"] == "2"
+
+            # Still 2 tokens: the dry runs and the status query took nothing
+            r = await c.post("/api/check", json={"key": key, "cost": 2, "capacity": 5})
+            assert r.json()["allowed"] is True
@@ -0,0 +1,134 @@
+import os
+import uuid
+
+import httpx
+import pytest
+import yaml
+from asgi_lifespan import LifespanManager
+
+from app.core.config import settings
+from app.main import create_app
+from app.ratelimit.policy import PolicyEngine, PolicyFile, PolicyStore, TierSpec
+
+DEFAULTS = TierSpec(capacity=5, refill_rate_per_sec=1)
+
+POLICIES = """
+tiers:
+  free: {capacity: 10, refill_rate_per_sec: 1}
+  pro: {capacity: 200, refill_rate_per_sec: 50}
+default: {tier: free}
+rules:
+  - {key: "tenant:acme:root", capacity: 1000}
+  - {prefix: "tenant:acme:", tier: pro, cost_multiplier: 2}
+  - {prefix: "tenant:", capacity: 20}
+  - {glob: "tenant:*:export", capacity: 1, refill_rate_per_sec: 0.01}
+  - {name: numeric-users, regex: "user:[0-9]+", tier: pro}
+  - {regex: "user:([a-z])\\\\1.*", capacity: 2}
+  - {regex: "(?i)ADMIN:.*", capacity: 3}
+"""
+
+
+def _engine(text: str = POLICIES) -> PolicyEngine:
+    return PolicyEngine(PolicyFile.model_validate(yaml.safe_load(text)), defaults=DEFAULTS)
+
+
+def test_resolution_order():
+    engine = _engine()
+
+    def limits(key):
+        p = engine.resolve(key)
+        return p.capacity, p.refill_rate_per_sec, p.cost_multiplier
+
+    assert limits("tenant:acme:root") == (1000, 1, 1)  # exact, other limits from default
+    assert limits("tenant:acme:api") == (200, 50, 2)  # longest prefix
+    assert limits("tenant:other:api") == (20, 1, 1)
+    # The glob's literal part "tenant:" is as deep as the prefix rule: the glob is tried first
+    assert limits("tenant:other:export") == (1, 0.01, 1)
+    # ...but a deeper prefix wins over a shallower glob
+    assert limits("tenant:acme:export") == (200, 50, 2)
+
+    assert engine.resolve("user:42").rule == "numeric-users"
+    assert limits("user:aab") == (2, 1, 1)  # backreference kept working
+    assert limits("admin:x") == (3, 1, 1)  # global inline flag kept working
+    assert engine.resolve("user:abc").rule == "default"
+    assert limits("anything") == (10, 1, 1)
+
+
+def test_many_regexes_keep_file_order():
+    rules = "\n".join(f'  - {{regex: "k{i}:.*", capacity: {i + 1}}}' for i in range(250))
+    engine = _engine(f"rules:\n{rules}\n  - {{regex: 'k1.*', capacity: 999}}\n")
+    assert engine.resolve("k7:x").capacity == 8
+    assert engine.resolve("k249:x").capacity == 250
+    assert engine.resolve("k1x").capacity == 999
+
+
+def test_regexes_may_share_group_names():
+    engine = _engine(
+        "rules:\n"
+        '  - {regex: "user:(?P<id>[0-9]+)", capacity: 7}\n'
+        '  - {regex: "org:(?P<id>[0-9]+)", capacity: 8}\n'
+        '  - {regex: "team:[0-9]+", capacity: 9}\n'
+    )
+    assert engine.resolve("user:1").capacity == 7
+    assert engine.resolve("org:2").capacity == 8
+    assert engine.resolve("team:3").capacity == 9
+
+
+def test_bad_rules_are_rejected():
+    with pytest.raises(ValueError):
+        _engine("rules:\n  - {prefix: a, glob: b}\n")
+    with pytest.raises(ValueError):
+        _engine("rules:\n  - {prefix: a, tier: gold}\n")
+
+
+@pytest.mark.asyncio
+async def test_store_swaps_only_valid_files(tmp_path):
+    path = tmp_path / "policies.yaml"
+    path.write_text(POLICIES)
+    store = PolicyStore(str(path), defaults=DEFAULTS, cache_size=100, reload_every_s=0)
+    old = store.engine
+    assert await store.reload() is False
+
+    path.write_text("rules:\n  - {prefix: 'tenant:', capacity: 7}\n")
+    os.utime(path, ns=(1, 1))
+    assert await store.reload() is True
+    assert store.engine.resolve("tenant:acme:x").capacity == 7
+    # The previous engine is untouched for requests still holding it
+    assert old.resolve("tenant:acme:x").capacity == 200
+
+    path.write_text("rules: [{prefix: 'x', tier: nope}]\n")
+    os.utime(path, ns=(2, 2))
+    with pytest.raises(ValueError):
+        await store.reload()
+    assert store.engine.resolve("tenant:acme:x").capacity == 7
+
+
+@pytest.mark.asyncio
+async def test_check_uses_policy_limits(tmp_path, monkeypatch):
+    path = tmp_path / "policies.yaml"
+    path.write_text(POLICIES)
+    monkeypatch.setattr(settings, "POLICY_FILE", str(path))
+    monkeypatch.setattr(settings, "ADMIN_TOKEN", "t")
+    app = create_app()
+    tenant = uuid.uuid4().hex
+
+    async with LifespanManager(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as c:
+            r = await c.post("/api/check", json={"key": f"tenant:acme:{tenant}", "cost": 3})
+            assert r.headers["ratelimit-limit"] == "200.0"
+            assert r.json()["remaining_tokens"] == pytest.approx(194, abs=0.1)  # cost x2
+
+            # Caller overrides still win unless POLICY_ALLOW_OVERRIDES is off
+            body = {"key": f"tenant:{tenant}", "cost": 1, "capacity": 3}
+            assert (await c.post("/api/check", json=body)).headers["ratelimit-limit"] == "3.0"
+            monkeypatch.setattr(settings, "POLICY_ALLOW_OVERRIDES", False)
+            assert (await c.post("/api/check", json=body)).headers["ratelimit-limit"] == "20.0"
+
+            r = await c.get(
+                "/api/admin/policies",
+                params={"key": "user:7"},
+                headers={"Authorization": "Bearer t"},
+            )
+            assert r.json()["resolved"]["rule"] == "numeric-users"
+            assert r.json()["rules"] == 7
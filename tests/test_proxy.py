@@ -0,0 +1,132 @@
+import uuid
+
+import httpx
+import pytest
+from asgi_lifespan import LifespanManager
+from fastapi import FastAPI, Request
+from fastapi.responses import StreamingResponse
+
+from app.api.proxy import ProxyApp
+from app.core.config import settings
+from app.main import create_app
+
+ROUTES = """
+routes:
+  - name: orders
+    prefix: /orders
+    upstream: http://orders.internal/v1
+    key: header:X-User-Id
+    capacity: 2
+    refill_rate_per_sec: 0.001
+    cost_by_method: {DELETE: 5}
+  - name: orders-admin
+    prefix: /orders/admin
+    upstream: http://admin.internal
+    strip_prefix: false
+    key: [api_key, path]
+"""
+
+
+def _upstream() -> FastAPI:
+    app = FastAPI()
+
+    @app.api_route("/v1/{path:path}", methods=["GET", "POST", "DELETE"])
+    async def echo(path: str, request: Request):
+        body = await request.body()
+        return {
+            "path": path,
+            "query": request.url.query,
+            "body": body.decode(),
+            "forwarded_for": request.headers.get("x-forwarded-for"),
+            "user": request.headers.get("x-user-id"),
+        }
+
+    @app.get("/orders/admin/stream")
+    async def stream():
+        async def chunks():
+            for i in range(3):
+                yield f"chunk{i};".encode()
+
+        response = StreamingResponse(chunks(), media_type="text/plain")
+        response.set_cookie("a", "1")
+        response.set_cookie("b", "2")
+        return response
+
+    return app
+
+
+@pytest.fixture
+async def gateway(tmp_path, monkeypatch):
+    config = tmp_path / "proxy.yaml"
+    config.write_text(ROUTES)
+    monkeypatch.setattr(settings, "PROXY_CONFIG_FILE", str(config))
+    app = create_app()
+    async with LifespanManager(app):
+        await app.state.proxy_client.aclose()
+        app.state.proxy_client = httpx.AsyncClient(transport=httpx.ASGITransport(app=_upstream()))
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://gw") as c:
+            yield c
+
+
+@pytest.mark.asyncio
+async def test_forwards_until_limited(gateway):
+    user = {"X-User-Id": f"u-{uuid.uuid4().hex}"}
+
+    r = await gateway.post("/orders/42/items?x=1", content=b"payload", headers=user)
+    assert r.status_code == 200
+    assert r.json() == {
+        "path": "42/items",
+        "query": "x=1",
+        "body": "payload",
+        "forwarded_for": "127.0.0.1",
+        "user": user["X-User-Id"],
+    }
+    assert r.headers["ratelimit-limit"] == "2.0"
+    assert r.headers["ratelimit-remaining"] == "1"
+
+    assert (await gateway.get("/orders/1", headers=user)).status_code == 200
+    r = await gateway.get("/orders/1", headers=user)
+    assert r.status_code == 429
+    assert r.headers["retry-after"] == r.headers["ratelimit-reset"]
+    assert r.json()["allowed"] is False
+
+    # Another identity has its own bucket; cost 5 > capacity 2 is refused outright
+    other = {"X-User-Id": f"u-{uuid.uuid4().hex}"}
+    assert (await gateway.get("/orders/1", headers=other)).status_code == 200
+    r = await gateway.delete("/orders/1", headers=other)
+    assert r.status_code == 429
+    assert "retry-after" not in r.headers
+
+
+@pytest.mark.asyncio
+async def test_longest_prefix_streaming_and_headers(gateway):
+    r = await gateway.get("/orders/admin/stream", headers={"X-Api-Key": uuid.uuid4().hex})
+    assert r.status_code == 200
+    assert r.text == "chunk0;chunk1;chunk2;"
+    assert r.headers.get_list("set-cookie") == [
+        "a=1; Path=/; SameSite=lax",
+        "b=2; Path=/; SameSite=lax",
+    ]
+
+    assert (await gateway.get("/nowhere")).status_code == 404
+    # API routes still take precedence over the proxy
+    assert (await gateway.get("/healthz")).json() == {"ok": True}
+
+
+@pytest.mark.asyncio
+async def test_websockets_are_refused():
+    proxy = ProxyApp([])
+    sent = []
+
+    async def receive():
+        return {"type": "websocket.connect"}
+
+    async def send(message):
+        sent.append(message)
+
+    await proxy({"type": "websocket", "path": "/orders/ws"}, receive, send)
+    assert sent == [{"type": "websocket.close", "code": 1003}]
+
+    with pytest.raises(RuntimeError, match="'other'"):
+        await proxy({"type": "other"}, receive, send)
@@ -0,0 +1,60 @@
+import math
+import uuid
+
+import pytest
+
+from app.db.redis_client import create_redis
+from app.metrics import RATE_LIMIT_SCRIPT_RELOADS_TOTAL
+from app.ratelimit.redis_bucket import TOKEN_BUCKET_SCRIPT, try_consume_redis
+
+T0 = 1_000.0
+
+
+def _reloads() -> float:
+    return RATE_LIMIT_SCRIPT_RELOADS_TOTAL.labels(script=TOKEN_BUCKET_SCRIPT.name)._value.get()
+
+
+@pytest.mark.asyncio
+async def test_recovers_from_noscript_and_counts_reload():
+    r = create_redis()
+    key = f"test-{uuid.uuid4().hex}"
+    try:
+        await r.script_flush()
+        before = _reloads()
+
+        d = await try_consume_redis(
+            r, key, capacity=5.0, refill_rate_per_sec=1.0, cost=1.0, ttl_sec=60, now_s=T0
+        )
+        assert d.allowed is True
+        assert _reloads() == before + 1
+
+        # Script is cached now: no further reloads
+        await try_consume_redis(
+            r, key, capacity=5.0, refill_rate_per_sec=1.0, cost=1.0, ttl_sec=60, now_s=T0
+        )
+        assert _reloads() == before + 1
+    finally:
+        await r.delete(f"bucket:{key}")
+        await r.aclose()
+
+
+@pytest.mark.asyncio
+async def test_fractional_tokens_and_retry_after_survive_the_reply():
+    r = create_redis()
+    key = f"test-{uuid.uuid4().hex}"
+    try:
+        d = await try_consume_redis(
+            r, key, capacity=2.0, refill_rate_per_sec=4.0, cost=1.5, ttl_sec=60, now_s=T0
+        )
+        assert d.allowed is True
+        assert math.isclose(d.remaining_tokens, 0.5, rel_tol=1e-9)
+
+        # Short by 0.5 tokens at 4 tokens/s -> 0.125s
+        d = await try_consume_redis(
+            r, key, capacity=2.0, refill_rate_per_sec=4.0, cost=1.0, ttl_sec=60, now_s=T0
+        )
+        assert d.allowed is False
+        assert math.isclose(d.retry_after_s, 0.125, rel_tol=1e-9)
+    finally:
+        await r.delete(f"bucket:{key}")
+        await r.aclose()
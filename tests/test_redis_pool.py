@@ -0,0 +1,96 @@
+import pytest
+import redis.asyncio as redis
+
+from app.core.config import settings
+from app.db.redis_client import create_redis, shard_name
+from app.metrics import (
+    RATE_LIMIT_REDIS_CONNECTIONS_TOTAL,
+    RATE_LIMIT_REDIS_POOL_CONNECTIONS,
+    RATE_LIMIT_REDIS_POOL_WAIT_SECONDS,
+)
+from app.ratelimit.redis_bucket import try_consume_redis
+
+
+def _value(metric, suffix: str = "", **labels) -> float:
+    for family in metric.collect():
+        for sample in family.samples:
+            if sample.name.endswith(suffix) and sample.labels.items() >= labels.items():
+                return sample.value
+    return 0.0
+
+
+@pytest.mark.asyncio
+async def test_blocking_pool_waits_then_fails_and_reports(monkeypatch):
+    monkeypatch.setattr(settings, "REDIS_POOL_BLOCKING", True)
+    monkeypatch.setattr(settings, "REDIS_MAX_CONNECTIONS", 1)
+    monkeypatch.setattr(settings, "REDIS_POOL_TIMEOUT_MS", 50)
+    pool_name = shard_name(settings.REDIS_URL)
+    connects = _value(RATE_LIMIT_REDIS_CONNECTIONS_TOTAL, pool=pool_name, event="connect")
+    disconnects = _value(RATE_LIMIT_REDIS_CONNECTIONS_TOTAL, pool=pool_name, event="disconnect")
+    waits = _value(RATE_LIMIT_REDIS_POOL_WAIT_SECONDS, "_count", pool=pool_name)
+
+    r = create_redis()
+    pool = r.connection_pool
+    try:
+        held = await pool.get_connection()
+        assert _value(RATE_LIMIT_REDIS_POOL_CONNECTIONS, pool=pool_name, state="in_use") == 1
+        # The only connection is taken: the pool waits REDIS_POOL_TIMEOUT_MS, then gives up
+        with pytest.raises(redis.ConnectionError, match="No connection available"):
+            await r.ping()
+
+        await pool.release(held)
+        assert _value(RATE_LIMIT_REDIS_POOL_CONNECTIONS, pool=pool_name, state="in_use") == 0
+        assert _value(RATE_LIMIT_REDIS_POOL_CONNECTIONS, pool=pool_name, state="idle") == 1
+        assert await r.ping()
+    finally:
+        await r.aclose()
+
+    # One socket, reused: one connect, and one disconnect when the client closed
+    assert _value(RATE_LIMIT_REDIS_CONNECTIONS_TOTAL, pool=pool_name, event="connect") == (
+        connects + 1
+    )
+    assert _value(RATE_LIMIT_REDIS_CONNECTIONS_TOTAL, pool=pool_name, event="disconnect") == (
+        disconnects + 1
+    )
+    assert _value(RATE_LIMIT_REDIS_POOL_WAIT_SECONDS, "_count", pool=pool_name) == waits + 3
+
+
+@pytest.mark.asyncio
+async def test_capped_pool_fails_fast(monkeypatch):
+    monkeypatch.setattr(settings, "REDIS_MAX_CONNECTIONS", 1)
+    r = create_redis()
+    try:
+        held = await r.connection_pool.get_connection()
+        with pytest.raises(redis.ConnectionError, match="Too many connections"):
+            await r.ping()
+        await r.connection_pool.release(held)
+    finally:
+        await r.aclose()
+
+
+def test_blocking_pool_needs_a_cap(monkeypatch):
+    monkeypatch.setattr(settings, "REDIS_POOL_BLOCKING", True)
+    with pytest.raises(ValueError, match="REDIS_MAX_CONNECTIONS"):
+        create_redis()
+
+
+@pytest.mark.asyncio
+async def test_resp3_decisions(monkeypatch):
+    monkeypatch.setattr(settings, "REDIS_PROTOCOL", 3)
+    r = create_redis()
+    key = "resp3"
+    try:
+        for expected in (4.0, 3.0):
+            d = await try_consume_redis(
+                r,
+                key,
+                capacity=5,
+                refill_rate_per_sec=1e-6,
+                cost=1,
+                ttl_sec=60,
+                prefix="test-resp3:",
+            )
+            assert d.allowed and d.remaining_tokens == pytest.approx(expected, abs=1e-3)
+    finally:
+        await r.delete(f"test-resp3:{key}")
+        await r.aclose()
@@ -0,0 +1,64 @@
+import os
+import re
+import signal
+import socket
+import subprocess
+import sys
+import time
+
+import httpx
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _wait_ready(url: str, timeout_s: float = 60.0) -> None:
+    deadline = time.monotonic() + timeout_s
+    while True:
+        try:
+            httpx.get(url)
+            return
+        except httpx.TransportError:
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(0.1)
+
+
+def test_workers_share_the_port_and_aggregate_metrics(tmp_path):
+    port = _free_port()
+    base = f"http://127.0.0.1:{port}"
+    (tmp_path / "counter_999.db").write_bytes(b"stale")
+    env = {
+        **os.environ,
+        "LIMITER_BACKEND": "memory",
+        "LOG_LEVEL": "WARNING",
+        "PROMETHEUS_MULTIPROC_DIR": str(tmp_path),
+    }
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "app.serve", "--workers", "2", "--host", "127.0.0.1"]
+        + ["--port", str(port)],
+        env=env,
+    )
+    try:
+        _wait_ready(f"{base}/healthz")
+        for _ in range(30):
+            # New connection each time, so both workers get some of them
+            r = httpx.post(f"{base}/api/check", json={"key": "k", "cost": 0})
+            assert r.status_code == 200
+
+        text = httpx.get(f"{base}/metrics").text
+        counted = re.findall(
+            r'^http_requests_total\{method="POST",path="/api/check",status="200"\} (\S+)$',
+            text,
+            re.MULTILINE,
+        )
+        # One series summed over both workers, not one per worker
+        assert [float(v) for v in counted] == [30.0]
+        # Metric files of an earlier run were cleared before the workers started
+        assert not (tmp_path / "counter_999.db").exists()
+    finally:
+        proc.send_signal(signal.SIGTERM)
+        assert proc.wait(timeout=60) == 0
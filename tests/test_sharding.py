@@ -0,0 +1,126 @@
+import uuid
+
+import pytest
+import redis.asyncio as redis
+
+from app.core.config import settings
+from app.db.redis_client import create_redis_shards, shard_name
+from app.metrics import RATE_LIMIT_SHARD_KEYS
+from app.ratelimit.limiter import create_limiter
+from app.ratelimit.redis_bucket import BucketRequest
+from app.ratelimit.sharding import (
+    HashRing,
+    ShardedRedisLimiter,
+    bucket_key_count,
+    hash_tag,
+    shard_key_counts,
+)
+
+KEYS = [f"user-{i}" for i in range(20_000)]
+
+
+def test_hash_tag_follows_redis_cluster_rule():
+    assert hash_tag("{org1}:user:7") == "org1"
+    assert hash_tag("plain") == "plain"
+    assert hash_tag("empty{}tag") == "empty{}tag"
+    assert hash_tag("a{b}{c}") == "b"
+
+
+def test_keys_spread_over_all_nodes():
+    ring = HashRing(["a", "b", "c", "d"])
+    counts: dict[str, int] = {}
+    for k in KEYS:
+        node = ring.node_for(k)
+        counts[node] = counts.get(node, 0) + 1
+    assert set(counts) == {"a", "b", "c", "d"}
+    # 160 virtual nodes each keeps shards within a loose +-30% of the mean
+    assert all(0.7 * 5_000 < c < 1.3 * 5_000 for c in counts.values())
+
+
+def test_adding_a_node_moves_only_its_share():
+    ring = HashRing(["a", "b", "c", "d"])
+    before = {k: ring.node_for(k) for k in KEYS}
+    ring.add_node("e")
+    moved = [k for k in KEYS if ring.node_for(k) != before[k]]
+
+    # Every moved key moved to the new node, and roughly 1/5 of keys moved
+    assert all(ring.node_for(k) == "e" for k in moved)
+    assert 0.1 < len(moved) / len(KEYS) < 0.3
+
+    ring.remove_node("e")
+    assert all(ring.node_for(k) == before[k] for k in KEYS)
+
+
+def test_hash_tagged_keys_share_a_node():
+    ring = HashRing(["a", "b", "c"])
+    assert len({ring.node_for(f"{{org-9}}:{suffix}") for suffix in KEYS[:200]}) == 1
+
+
+def _db_url(db: int) -> str:
+    return settings.REDIS_URL.rsplit("/", 1)[0] + f"/{db}"
+
+
+@pytest.mark.asyncio
+async def test_sharded_limiter_routes_and_batches():
+    # Separate databases stand in for separate redis-server processes
+    shards = {f"db{n}": redis.from_url(_db_url(n), decode_responses=True) for n in (1, 2, 3)}
+    limiter = ShardedRedisLimiter(shards, ttl_sec=60, prefix="bucket:")
+    keys = [f"sh-{uuid.uuid4().hex}" for _ in range(30)]
+    try:
+        decisions = await limiter.consume_many([BucketRequest(k, 1.0, 0.001, 1.0) for k in keys])
+        assert all(d.allowed for d in decisions)
+
+        # Each key lives on exactly the shard the ring picked
+        for k in keys:
+            owner = limiter.shard_for(k)
+            for name, client in shards.items():
+                assert bool(await client.exists(f"bucket:{k}")) == (name == owner)
+
+        d = await limiter.consume(BucketRequest(keys[0], 1.0, 0.001, 1.0))
+        assert d.allowed is False
+    finally:
+        for k in keys:
+            await shards[limiter.shard_for(k)].delete(f"bucket:{k}")
+        for client in shards.values():
+            await client.aclose()
+
+
+@pytest.mark.asyncio
+async def test_key_counts_count_bucket_keys_only():
+    # A database of its own: other keys share it with the buckets
+    r = redis.from_url(_db_url(14), decode_responses=True)
+    try:
+        await r.flushdb()
+        async with r.pipeline(transaction=False) as pipe:
+            for i in range(3000):
+                pipe.set(f"bucket:k{i}" if i % 3 == 0 else f"session:{i}", 1)
+            await pipe.execute()
+
+        assert await bucket_key_count(r, "bucket:", samples=10_000) == (1000, True)
+        estimate, exact = await bucket_key_count(r, "bucket:", samples=1000)
+        assert not exact and 800 <= estimate <= 1200
+
+        counts = await shard_key_counts({"db14": r}, "bucket:", samples=10_000)
+        assert counts == {"db14": (1000, True)}
+        assert RATE_LIMIT_SHARD_KEYS.labels(shard="db14")._value.get() == 1000
+    finally:
+        await r.flushdb()
+        await r.aclose()
+
+
+@pytest.mark.parametrize("flag", ["LEASE_ENABLED", "COALESCE_ENABLED"])
+def test_shards_refuse_single_redis_modes(monkeypatch, flag):
+    monkeypatch.setattr(settings, flag, True)
+    shards = {"a": redis.from_url(_db_url(1)), "b": redis.from_url(_db_url(2))}
+    with pytest.raises(ValueError, match=flag):
+        create_limiter(shards["a"], shards)
+
+
+def test_shard_names_tell_sockets_apart_and_duplicates_fail(monkeypatch):
+    assert shard_name("redis://:secret@cache:6380/2") == "cache:6380/2"
+    assert shard_name("unix:///run/a.sock?db=1") == "unix:/run/a.sock/1"
+    assert shard_name("unix:///run/a.sock") != shard_name("unix:///run/b.sock")
+
+    monkeypatch.setattr(settings, "REDIS_SHARD_URLS", "redis://a:1/0,redis://:pw@a:1/0")
+    with pytest.raises(ValueError, match="a:1/0"):
+        create_redis_shards()
@@ -0,0 +1,105 @@
+import math
+import random
+
+import pytest
+
+from app.ratelimit.redis_bucket import BucketRequest, Decision
+from app.ratelimit.sketch import CountMinSketch, SketchLimiter
+
+T0 = 1_000.0
+
+
+def test_estimates_never_under_and_within_bound():
+    sketch = CountMinSketch(width=2048, depth=4, window_s=10.0, now_s=T0)
+    rng = random.Random(11)
+    true: dict[str, float] = {}
+    total = 0.0
+    for _ in range(20_000):
+        key = f"k{int(rng.paretovariate(1.2))}"
+        cost = rng.choice([1.0, 2.0, 5.0])
+        sketch.add(key, cost, T0 + 1)
+        true[key] = true.get(key, 0.0) + cost
+        total += cost
+
+    bound = sketch.epsilon * total
+    over = [sketch.estimate(k, T0 + 1) - v for k, v in true.items()]
+    assert min(over) >= 0
+    # At most a delta share of keys may exceed the bound
+    assert sum(o > bound for o in over) <= max(1, sketch.delta * len(over))
+
+
+def test_memory_is_fixed_whatever_the_keys():
+    sketch = CountMinSketch(width=1024, depth=3, window_s=10.0, now_s=T0)
+    before = sketch.memory_bytes
+    for i in range(50_000):
+        sketch.add(f"random-{i}", 1.0, T0 + i * 1e-3)
+    assert sketch.memory_bytes == before == 2 * 4 * 1024 * 3
+    assert len(sketch._cur) == len(sketch._prev) == 1024 * 3
+
+
+def test_sliding_window_decays():
+    sketch = CountMinSketch(width=1024, depth=3, window_s=10.0, now_s=T0)
+    sketch.add("k", 8.0, T0 + 5)
+    assert sketch.estimate("k", T0 + 9) == 8.0
+    # Next window, a quarter in: three quarters of the previous one still count
+    assert sketch.estimate("k", T0 + 12.5) == pytest.approx(6.0)
+    assert sketch.add("k", 1.0, T0 + 15) == pytest.approx(5.0)
+    # Two windows without traffic: forgotten
+    assert sketch.estimate("k", T0 + 40) == 0.0
+
+
+def test_rotation_reuses_its_two_buffers():
+    sketch = CountMinSketch(width=256, depth=2, window_s=10.0, now_s=T0)
+    buffers = {id(sketch._cur), id(sketch._prev)}
+    for i in range(1, 8):
+        sketch.add("k", 1.0, T0 + 10 * i + 1)
+        assert {id(sketch._cur), id(sketch._prev)} == buffers
+        # Only this window's add and the previous one's remain (one cell per row)
+        assert sum(sketch._cur) == 2.0 and sum(sketch._prev) == 2.0 * (i > 1)
+
+
+class _Recorder:
+    def __init__(self):
+        self.seen: list[str] = []
+
+    async def consume(self, q):
+        self.seen.append(q.key)
+        return Decision(False, 0.0, 1.0)
+
+    async def consume_many(self, qs):
+        self.seen += [q.key for q in qs]
+        return [Decision(False, 0.0, 1.0) for _ in qs]
+
+    async def consume_all(self, qs):
+        return await self.consume_many(qs)
+
+    async def aclose(self):
+        pass
+
+
+@pytest.mark.asyncio
+async def test_one_off_keys_stay_local_and_heavy_keys_are_promoted():
+    inner = _Recorder()
+    limiter = SketchLimiter(
+        inner, CountMinSketch(width=1 << 16, depth=4, window_s=10.0), promote_fraction=0.5
+    )
+    # A flood of distinct keys: allowed in-process, no Redis call, no Redis key
+    flood = [BucketRequest(f"spoofed-{i}", 5.0, 1.0, 1.0) for i in range(5000)]
+    decisions = await limiter.consume_many(flood)
+    assert all(d.allowed for d in decisions) and inner.seen == []
+
+    # Threshold 0.5 * min(5, 1 * 10) = 2.5: the third call goes to the exact limiter
+    q = BucketRequest("heavy", 5.0, 1.0, 1.0)
+    results = [await limiter.consume(q) for _ in range(4)]
+    assert [d.allowed for d in results] == [True, True, False, False]
+    assert inner.seen == ["heavy", "heavy"]
+    assert math.isclose(results[1].remaining_tokens, 3.0)
+
+    # Impossible costs are denied without asking
+    d = await limiter.consume(BucketRequest("x", 5.0, 1.0, 6.0))
+    assert d.allowed is False and d.retry_after_s is None and inner.seen[-1] == "heavy"
+
+    # Nested limits: one promoted limit sends the whole set
+    decisions = await limiter.consume_all([q, BucketRequest("light", 5.0, 1.0, 1.0)])
+    assert [d.allowed for d in decisions] == [False, False]
+    assert inner.seen[-2:] == ["heavy", "light"]
@@ -0,0 +1,188 @@
+import math
+import types
+import uuid
+
+import httpx
+import pytest
+import redis.asyncio as redis
+from asgi_lifespan import LifespanManager
+
+import app.ratelimit.snapshot as snapshot
+from app.core.config import settings
+from app.main import create_app
+from app.ratelimit.redis_bucket import BucketRequest, peek_redis_many, try_consume_redis_many
+from app.ratelimit.sharding import HashRing
+from app.ratelimit.snapshot import SnapshotError, restore_snapshot, snapshot_chunks
+
+T0 = 1_990.0
+
+
+def _db_url(db: int) -> str:
+    return settings.REDIS_URL.rsplit("/", 1)[0] + f"/{db}"
+
+
+def _clock(monkeypatch, now: float) -> None:
+    monkeypatch.setattr(snapshot, "time", types.SimpleNamespace(time=lambda: now))
+
+
+async def _collect(chunks) -> bytes:
+    return b"".join([c async for c in chunks])
+
+
+async def _blocks(data: bytes, size: int = 100):
+    # Frame boundaries never line up with the reads
+    for i in range(0, len(data), size):
+        yield data[i : i + size]
+
+
+async def _cleanup(clients, prefix: str) -> None:
+    for r in clients:
+        found = [k async for k in r.scan_iter(match=f"{prefix}*")]
+        if found:
+            await r.delete(*found)
+        await r.aclose()
+
+
+async def _fill(r, prefix: str) -> dict[str, list[BucketRequest]]:
+    # A few buckets of each storage format, partly drained at T0
+    qs = {
+        algorithm: [BucketRequest(f"{algorithm}-{i}", 10.0, 0.01, 1.0 + i) for i in range(6)]
+        for algorithm in ("token_bucket", "token_bucket_compact", "gcra")
+    }
+    for algorithm, batch in qs.items():
+        await try_consume_redis_many(
+            r, batch, ttl_sec=3600, now_s=T0, prefix=prefix, algorithm=algorithm
+        )
+    return qs
+
+
+@pytest.mark.asyncio
+async def test_round_trip_rebases_timestamps(monkeypatch):
+    src, dst = (redis.from_url(_db_url(n), decode_responses=True) for n in (8, 9))
+    prefix = f"test-{uuid.uuid4().hex[:8]}:"
+    try:
+        qs = await _fill(src, prefix)
+        _clock(monkeypatch, 2_000.0)
+        stats: dict = {}
+        data = await _collect(snapshot_chunks([src], prefix, batch=4, stats=stats))
+        assert stats["keys"] == 18 and stats["chunks"] >= 2 and stats["bytes"] == len(data)
+
+        # Restored 10 minutes later: every bucket continues where it stopped
+        _clock(monkeypatch, 2_600.0)
+        res = await restore_snapshot(_blocks(data), {"dst": dst}, prefix)
+        assert res == {"keys": 18, "skipped": 0, "chunks": stats["chunks"]}
+
+        assert await dst.hget(f"{prefix}token_bucket-0", "last") == "2590"
+        assert await dst.hget(f"{prefix}token_bucket_compact-0", "l") == "2590000"
+        for algorithm, batch in qs.items():
+            before = await peek_redis_many(
+                src, batch, now_s=2_000.0, prefix=prefix, algorithm=algorithm
+            )
+            after = await peek_redis_many(
+                dst, batch, now_s=2_600.0, prefix=prefix, algorithm=algorithm
+            )
+            for b, a in zip(before, after):
+                assert math.isclose(a.remaining_tokens, b.remaining_tokens, abs_tol=1e-9)
+        # Remaining TTLs are kept as they were
+        src_ttl = await src.pttl(f"{prefix}gcra:gcra-3")
+        assert abs(await dst.pttl(f"{prefix}gcra:gcra-3") - src_ttl) < 1000
+    finally:
+        await _cleanup((src, dst), prefix)
+
+
+@pytest.mark.asyncio
+async def test_restore_without_rebase_ages_ttls(monkeypatch):
+    src, dst = (redis.from_url(_db_url(n), decode_responses=True) for n in (8, 9))
+    prefix = f"test-{uuid.uuid4().hex[:8]}:"
+    try:
+        await _fill(src, prefix)
+        _clock(monkeypatch, 2_000.0)
+        data = await _collect(snapshot_chunks([src], prefix))
+
+        # 10 minutes later: GCRA and compact keys (full again within that) are skipped
+        _clock(monkeypatch, 2_600.0)
+        res = await restore_snapshot(_blocks(data), {"dst": dst}, prefix, rebase=False)
+        assert res["keys"] + res["skipped"] == 18 and res["keys"] >= 6
+        assert await dst.hget(f"{prefix}token_bucket-0", "last") == "1990"
+        assert 2_990_000 < await dst.pttl(f"{prefix}token_bucket-0") <= 3_000_000
+    finally:
+        await _cleanup((src, dst), prefix)
+
+
+@pytest.mark.asyncio
+async def test_restore_routes_keys_to_shards():
+    src = redis.from_url(_db_url(8), decode_responses=True)
+    shards = {f"db{n}": redis.from_url(_db_url(n), decode_responses=True) for n in (10, 11)}
+    prefix = f"test-{uuid.uuid4().hex[:8]}:"
+    try:
+        qs = await _fill(src, prefix)
+        data = await _collect(snapshot_chunks([src], prefix))
+        assert (await restore_snapshot(_blocks(data), shards, prefix))["keys"] == 18
+
+        ring = HashRing(shards)
+        for q in qs["token_bucket"]:
+            for name, r in shards.items():
+                assert bool(await r.exists(f"{prefix}{q.key}")) == (name == ring.node_for(q.key))
+    finally:
+        await _cleanup((src, *shards.values()), prefix)
+
+
+@pytest.mark.asyncio
+async def test_rejects_other_and_truncated_input():
+    r = redis.from_url(_db_url(9), decode_responses=True)
+    prefix = f"test-{uuid.uuid4().hex[:8]}:"
+    try:
+        with pytest.raises(SnapshotError, match="not a bucket snapshot"):
+            await restore_snapshot(_blocks(b"GARBAGE" * 10), {"r": r}, prefix)
+        await r.hset(f"{prefix}k", mapping={"tokens": 1, "last": 1})
+        data = await _collect(snapshot_chunks([r], prefix))
+        with pytest.raises(SnapshotError, match="truncated"):
+            await restore_snapshot(_blocks(data[:-4]), {"r": r}, prefix)
+    finally:
+        await _cleanup((r,), prefix)
+
+
+@pytest.mark.asyncio
+async def test_admin_snapshot_and_restore(monkeypatch):
+    monkeypatch.setattr(settings, "ADMIN_TOKEN", "t")
+    app = create_app()
+    key = f"snap-{uuid.uuid4().hex}"
+    async with LifespanManager(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(
+            transport=transport, base_url="http://test", headers={"Authorization": "Bearer t"}
+        ) as c:
+            await c.post("/api/check", json={"key": key, "cost": 3, "capacity": 5})
+            r = await c.get("/api/admin/snapshot", params={"batch": 500})
+            assert r.status_code == 200
+            assert r.content.startswith(snapshot.HEADER)
+
+            await app.state.redis.delete(f"{settings.REDIS_KEY_PREFIX}{key}")
+            r = await c.post("/api/admin/snapshot/restore", content=r.content)
+            assert r.status_code == 200 and r.json()["keys"] >= 1
+            assert await app.state.redis.exists(f"{settings.REDIS_KEY_PREFIX}{key}")
+
+            r = await c.post("/api/admin/snapshot/restore", content=b"not a snapshot")
+            assert r.status_code == 422
+
+
+@pytest.mark.asyncio
+async def test_admin_needs_a_token_and_no_proxy(monkeypatch):
+    app = create_app()
+    async with LifespanManager(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as c:
+            # Off without a token
+            assert (await c.post("/api/admin/snapshot/restore", content=b"")).status_code == 404
+
+            monkeypatch.setattr(settings, "ADMIN_TOKEN", "t")
+            for headers in ({}, {"Authorization": "Bearer nope"}, {"Authorization": "t"}):
+                r = await c.post("/api/admin/snapshot/restore", content=b"", headers=headers)
+                assert r.status_code == 401 and r.headers["www-authenticate"] == "Bearer"
+            r = await c.post("/api/admin/policies/reload", headers={"Authorization": "Bearer t"})
+            assert r.status_code == 404 and "POLICY_FILE" in r.json()["detail"]
+
+            # Never on the public listener of proxy mode
+            monkeypatch.setattr(settings, "PROXY_CONFIG_FILE", "routes.yaml")
+            r = await c.get("/api/admin/profile", headers={"Authorization": "Bearer t"})
+            assert r.status_code == 404
@@ -0,0 +1,86 @@
+import asyncio
+import re
+import uuid
+
+import httpx
+import pytest
+from asgi_lifespan import LifespanManager
+
+from app.core.config import settings
+from app.core.stages import STAGES
+from app.main import create_app
+from app.metrics import RATE_LIMIT_STAGE_LATENCY_SECONDS
+
+
+def _count(stage: str) -> float:
+    for metric in RATE_LIMIT_STAGE_LATENCY_SECONDS.collect():
+        for sample in metric.samples:
+            if sample.name.endswith("_count") and sample.labels["stage"] == stage:
+                return sample.value
+    return 0.0
+
+
+async def _check(app, **headers):
+    async with LifespanManager(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as c:
+            r = await c.post(
+                "/api/check", json={"key": f"st-{uuid.uuid4().hex}", "cost": 1}, headers=headers
+            )
+            assert r.status_code == 200
+            return await c.get(
+                "/metrics", headers={"accept": "application/openmetrics-text; version=1.0.0"}
+            )
+
+
+@pytest.mark.asyncio
+async def test_stages_are_not_observed_when_disabled():
+    before = {stage: _count(stage) for stage in STAGES}
+    await _check(create_app())
+    assert {stage: _count(stage) for stage in STAGES} == before
+
+
+@pytest.mark.asyncio
+async def test_each_stage_observed_with_request_id_exemplar(monkeypatch):
+    monkeypatch.setattr(settings, "STAGE_TIMING_ENABLED", True)
+    monkeypatch.setattr(settings, "STAGE_EXEMPLARS", True)
+    app = create_app()
+    before = {stage: _count(stage) for stage in STAGES}
+
+    scrape = await _check(app, **{"x-request-id": "req-42"})
+    for stage in STAGES:
+        assert _count(stage) > before[stage], stage
+    assert re.search(
+        r'rate_limit_stage_latency_seconds_bucket\{.*\} [0-9.]+ # \{request_id="req-42"\}',
+        scrape.text,
+    )
+
+
+@pytest.mark.asyncio
+async def test_profile_returns_collapsed_stacks(monkeypatch):
+    monkeypatch.setattr(settings, "ADMIN_TOKEN", "t")
+    app = create_app()
+    async with LifespanManager(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(
+            transport=transport, base_url="http://test", headers={"Authorization": "Bearer t"}
+        ) as c:
+            profiling = asyncio.create_task(
+                c.get("/api/admin/profile", params={"seconds": 0.5, "hz": 200})
+            )
+            # Keep the loop busy with decisions while it is being sampled
+            while not profiling.done():
+                await c.post("/api/check", json={"key": "profiled", "cost": 0})
+            r = profiling.result()
+            assert r.status_code == 200
+            lines = r.text.splitlines()
+            assert lines
+            assert all(re.fullmatch(r".+ \(.+:\d+\)(;.+)* \d+", line) for line in lines)
+            assert sum(int(line.rsplit(" ", 1)[1]) for line in lines) == int(
+                r.headers["x-profile-samples"]
+            )
+            # Stacks of the app's own code were caught running on the loop thread
+            assert "(app/" in r.text
+
+            r = await c.get("/api/admin/profile", params={"seconds": 10_000})
+            assert r.status_code == 422
@@ -0,0 +1,160 @@
+import asyncio
+import math
+import uuid
+
+import httpx
+import pytest
+from asgi_lifespan import LifespanManager
+
+from app import serve
+from app.core.config import settings
+from app.main import create_app
+from app.ratelimit.memory_store import InMemoryBucketStore, MemoryLimiter
+from app.serve import WORKERS_ENV
+from app.wire import protocol
+from app.wire.client import WireClient, WireError
+from app.wire.server import WireServer
+
+MB = 1024 * 1024
+
+
+class FailingLimiter:
+    async def consume_many(self, qs):
+        raise ConnectionError("redis down")
+
+
+async def _serve(limiter, **kwargs):
+    server = WireServer(limiter, **kwargs)
+    host, port = await server.start_tcp("127.0.0.1", 0)
+    return server, await WireClient.connect(host, port)
+
+
+@pytest.mark.asyncio
+async def test_decisions_match_the_bucket():
+    limiter = MemoryLimiter(InMemoryBucketStore(ttl_s=60, max_bytes=MB))
+    server, client = await _serve(limiter)
+    try:
+        got = [await client.check("k", 2, capacity=5, refill_rate_per_sec=0.001) for _ in range(3)]
+        assert [d.allowed for d in got] == [True, True, False]
+        assert math.isclose(got[1].remaining_tokens, 1.0, abs_tol=1e-3)
+        assert got[2].retry_after_s > 0
+
+        # cost > capacity: denied with no retry, like the HTTP API
+        d = await client.check("other", 10, capacity=5)
+        assert (d.allowed, d.retry_after_s) == (False, None)
+
+        with pytest.raises(WireError) as e:
+            await client.check("k", -1)
+        assert e.value.status == protocol.BAD_REQUEST
+    finally:
+        await client.aclose()
+        await server.aclose()
+        await limiter.aclose()
+
+
+@pytest.mark.asyncio
+async def test_port_is_shared_only_when_asked():
+    limiter = MemoryLimiter(InMemoryBucketStore(ttl_s=60, max_bytes=MB))
+    first, second = WireServer(limiter), WireServer(limiter)
+    try:
+        host, port = await first.start_tcp("127.0.0.1", 0)
+        # A single process must not quietly share its port with a stray listener
+        with pytest.raises(OSError):
+            await second.start_tcp(host, port)
+    finally:
+        await first.aclose()
+        await second.aclose()
+
+    # Workers of app.serve all pass reuse_port
+    try:
+        host, port = await first.start_tcp("127.0.0.1", 0, reuse_port=True)
+        assert await second.start_tcp(host, port, reuse_port=True) == (host, port)
+    finally:
+        await first.aclose()
+        await second.aclose()
+        await limiter.aclose()
+
+
+@pytest.mark.asyncio
+async def test_pipelined_requests_are_matched_by_id():
+    limiter = MemoryLimiter(InMemoryBucketStore(ttl_s=60, max_bytes=MB))
+    # A tiny in-flight cap forces the server to pause and resume reading
+    server, client = await _serve(limiter, max_inflight=8)
+    try:
+        keys = [f"p-{uuid.uuid4().hex[:6]}" for _ in range(50)]
+        # Every key gets capacity = its index + 1 and asks for index + 1 tokens twice
+        items = [(k, i + 1, i + 1) for i, k in enumerate(keys)] * 2
+        concurrent = [client.check(f"{k}-single", 1, capacity=1) for k in keys]
+        decisions, singles = await asyncio.gather(
+            client.check_many(items), asyncio.gather(*concurrent)
+        )
+        assert [d.allowed for d in decisions] == [True] * 50 + [False] * 50
+        assert all(d.allowed for d in singles)
+
+        # One bad item: nothing sent, nothing left pending
+        with pytest.raises(ValueError, match="too long"):
+            await client.check_many([("ok", 1), ("x" * protocol.MAX_FRAME, 1)])
+        assert client._pending == {}
+        assert (await client.check_many([("ok", 1)]))[0].allowed
+    finally:
+        await client.aclose()
+        await server.aclose()
+        await limiter.aclose()
+
+
+@pytest.mark.asyncio
+async def test_limiter_errors_and_bad_frames():
+    server, client = await _serve(FailingLimiter())
+    try:
+        with pytest.raises(WireError) as e:
+            await client.check("k", 1)
+        assert e.value.status == protocol.UNAVAILABLE
+    finally:
+        await client.aclose()
+
+    # A frame over MAX_FRAME loses the framing: the server hangs up
+    host, port = server._servers[0].sockets[0].getsockname()[:2]
+    reader, writer = await asyncio.open_connection(host, port)
+    writer.write(protocol.LENGTH.pack(protocol.MAX_FRAME + 1))
+    assert await asyncio.wait_for(reader.read(), timeout=5) == b""
+    writer.close()
+    await server.aclose()
+
+
+@pytest.mark.asyncio
+async def test_app_serves_the_unix_socket(monkeypatch, tmp_path):
+    path = str(tmp_path / "rl.sock")
+    monkeypatch.setattr(settings, "LIMITER_BACKEND", "memory")
+    monkeypatch.setattr(settings, "WIRE_UNIX_PATH", path)
+    app = create_app()
+    key = f"wire-{uuid.uuid4().hex}"
+    async with LifespanManager(app):
+        client = await WireClient.connect(path=path)
+        try:
+            d = await client.check(key, 2, capacity=5, refill_rate_per_sec=0.001)
+            assert d.allowed
+        finally:
+            await client.aclose()
+
+        # The same bucket as the HTTP API
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as c:
+            r = await c.post(
+                "/api/check",
+                json={"key": key, "cost": 0, "capacity": 5, "refill_rate_per_sec": 0.001},
+            )
+            assert math.isclose(r.json()["remaining_tokens"], 3.0, abs_tol=1e-2)
+
+
+@pytest.mark.asyncio
+async def test_unix_socket_is_refused_under_several_workers(monkeypatch, tmp_path):
+    monkeypatch.setattr(settings, "LIMITER_BACKEND", "memory")
+    monkeypatch.setattr(settings, "WIRE_UNIX_PATH", str(tmp_path / "rl.sock"))
+    monkeypatch.setenv(WORKERS_ENV, "2")
+    with pytest.raises(RuntimeError, match="WIRE_UNIX_PATH"):
+        async with LifespanManager(create_app()):
+            pass
+    assert not (tmp_path / "rl.sock").exists()
+
+    with pytest.raises(SystemExit):
+        serve.main(["--workers", "2"])